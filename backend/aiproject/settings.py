@@ -57,6 +57,19 @@ OSM_SECRET_KEY = env("OSM_SECRET_KEY")
 EPOCHS_LIMIT = env("EPOCHS_LIMIT", default=30)
 BATCH_SIZE_LIMIT = env("BATCH_SIZE_LIMIT", default=8)
 
+# No of osm labels written per bulk insert while processing raw data api response
+LABEL_INGEST_BATCH_SIZE = env.int("LABEL_INGEST_BATCH_SIZE", default=5000)
+# Page size of bbox label lookup and the max a client can ask with ?limit=
+LABEL_QUERY_PAGE_SIZE = env.int("LABEL_QUERY_PAGE_SIZE", default=5000)
+LABEL_QUERY_MAX_PAGE_SIZE = env.int("LABEL_QUERY_MAX_PAGE_SIZE", default=50000)
+# Label geometries are simplified to about one pixel of a bbox drawn this many pixels wide
+LABEL_QUERY_RESOLUTION = env.int("LABEL_QUERY_RESOLUTION", default=2048)
+
+# Loaded prediction models kept in memory , budget is total checkpoint size on disk
+PREDICTION_MODEL_CACHE_MB = env.int("PREDICTION_MODEL_CACHE_MB", default=1024)
+# Load all published models when web server starts
+PREDICTION_MODEL_CACHE_WARMUP = env.bool("PREDICTION_MODEL_CACHE_WARMUP", default=False)
+
 
 # Application definition
 
@@ -210,3 +223,25 @@ os.environ["RAMP_HOME"] = RAMP_HOME
 TRAINING_WORKSPACE = env(
     "TRAINING_WORKSPACE", default=os.path.join(os.getcwd(), "training")
 )
+
+# imagery tile cache shared by dataset builds and predictions
+TILE_CACHE_DIR = env("TILE_CACHE_DIR", default=os.path.join(os.getcwd(), "tile_cache"))
+TILE_CACHE_MAX_MB = env.int("TILE_CACHE_MAX_MB", default=10240)
+# concurrent tile downloads , per host limit is shared by all workers of one download
+TILE_DOWNLOAD_WORKERS = env.int("TILE_DOWNLOAD_WORKERS", default=32)
+TILE_DOWNLOAD_PER_HOST = env.int("TILE_DOWNLOAD_PER_HOST", default=16)
+TILE_DOWNLOAD_RETRIES = env.int("TILE_DOWNLOAD_RETRIES", default=3)
+TILE_DOWNLOAD_BACKOFF = env.float("TILE_DOWNLOAD_BACKOFF", default=0.5)
+
+# rendered label / aoi vector tiles , shared by web and worker processes so writes
+# from celery tasks invalidate tiles served by web
+VECTOR_TILE_CACHE_URL = env("VECTOR_TILE_CACHE_URL", default="redis://127.0.0.1:6379/1")
+VECTOR_TILE_CACHE_TIMEOUT = env.int("VECTOR_TILE_CACHE_TIMEOUT", default=86400)
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "vector_tiles": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": VECTOR_TILE_CACHE_URL,
+        "TIMEOUT": VECTOR_TILE_CACHE_TIMEOUT,
+    },
+}
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aiproject.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.PREDICTION_MODEL_CACHE_WARMUP:
+    import threading
+
+    from core.prediction import model_cache
+
+    # load published models in background so server starts accepting requests
+    threading.Thread(target=model_cache.warm_up, daemon=True).start()
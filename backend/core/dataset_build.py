@@ -0,0 +1,345 @@
+"""Incremental dataset builds for training
+
+A build directory keeps downloaded tiles with labels.geojson in input/ , preprocessed
+chips , clipped labels and binary masks in preprocessed/ and a manifest.json of the
+inputs they were built from (aoi geometry hashes , zooms , imagery source , label
+checksum and a digest of labels overlapping every tile). On rebuild only tiles whose
+imagery or overlapping labels changed are downloaded and preprocessed again
+
+Chips and masks are also packed into preprocessed/shard , uint8 arrays of all of them
+that solaris data generators memory-map , with an index of their georeferencing
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from uuid import uuid4
+
+from hot_fair_utilities import georeference, preprocess
+from predictor import get_start_end_download_coords
+from solaris.utils.data import make_chip_shard
+
+from .imagery import TileDownloader, tile_coords, tile_url
+from .utils import bbox
+
+MANIFEST_VERSION = 1
+RASTERIZE_OPTIONS = ["binary"]
+TILE_SIZE = 256
+SHARD_CHANNELS = 3
+
+
+def read_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_manifest(path, manifest):
+    temp_path = f"{path}.{uuid4().hex}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def lnglat_to_tile(lng, lat, zoom):
+    """Slippy map tile x , y containing lng , lat , same numbering as tile names"""
+    n = 2**zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def geometry_bounds(geometry):
+    """Gives (min_x, min_y, max_x, max_y) of geojson geometry dict"""
+    xs, ys = [], []
+
+    def walk(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            xs.append(coords[0])
+            ys.append(coords[1])
+        else:
+            for item in coords:
+                walk(item)
+
+    walk(geometry["coordinates"])
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def parse_tile_name(name):
+    """OAM-x-y-z -> (x, y, z)"""
+    _, x, y, z = name.rsplit("-", 3)
+    return int(x), int(y), int(z)
+
+
+def label_digests(features, tile_names):
+    """Digest of labels overlapping each tile , mask of a tile only has to be
+    rasterized again when its digest changes
+
+    Args:
+        features (list): geojson features of labels
+        tile_names (iterable): tile names like OAM-x-y-z
+
+    Returns:
+        dict: tile name -> sha256 of overlapping labels
+    """
+    index = {}
+    for name in tile_names:
+        x, y, z = parse_tile_name(name)
+        index.setdefault(z, {})[(x, y)] = name
+    overlapping = {name: [] for tiles in index.values() for name in tiles.values()}
+    eps = 1e-9  # labels touching a tile edge count for both tiles
+    for feature in features:
+        if not feature.get("geometry"):
+            continue
+        digest = sha256(json.dumps(feature, sort_keys=True).encode())
+        min_x, min_y, max_x, max_y = geometry_bounds(feature["geometry"])
+        for z, tiles in index.items():
+            x0, y0 = lnglat_to_tile(min_x - eps, max_y + eps, z)
+            x1, y1 = lnglat_to_tile(max_x + eps, min_y - eps, z)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(tiles):
+                candidates = (
+                    name
+                    for (x, y), name in tiles.items()
+                    if x0 <= x <= x1 and y0 <= y <= y1
+                )
+            else:
+                candidates = (
+                    tiles[(x, y)]
+                    for x in range(x0, x1 + 1)
+                    for y in range(y0, y1 + 1)
+                    if (x, y) in tiles
+                )
+            for name in candidates:
+                overlapping[name].append(digest)
+    return {
+        name: sha256("".join(sorted(digests)).encode())
+        for name, digests in overlapping.items()
+    }
+
+
+class DatasetBuilder:
+    """Builds preprocessed training data of aois incrementally
+
+    Args:
+        build_path (str): directory of the build , kept between trainings
+        source (str): imagery url template or maxar
+        zooms (list): zoom levels to download
+        aois (iterable): AOI / FeedbackAOI instances
+        labels (dict): labels as geojson featurecollection
+        downloader (TileDownloader, optional): Defaults to new TileDownloader
+    """
+
+    def __init__(self, build_path, source, zooms, aois, labels, downloader=None):
+        self.build_path = build_path
+        self.input_path = os.path.join(build_path, "input")
+        self.preprocessed_path = os.path.join(build_path, "preprocessed")
+        self.shard_path = os.path.join(self.preprocessed_path, "shard")
+        self.manifest_path = os.path.join(build_path, "manifest.json")
+        self.source = source
+        self.zooms = sorted(zooms)
+        self.aois = list(aois)
+        self.labels = labels
+        self.downloader = downloader
+
+    def inputs(self):
+        return {
+            "version": MANIFEST_VERSION,
+            "source": self.source,
+            "zooms": self.zooms,
+            "rasterize_options": RASTERIZE_OPTIONS,
+            "aois": {str(aoi.id): sha256(bytes(aoi.geom.wkb)) for aoi in self.aois},
+            "labels": sha256(json.dumps(self.labels, sort_keys=True).encode()),
+        }
+
+    def download_jobs(self):
+        jobs = []
+        for aoi in self.aois:
+            bbox_coords = bbox(aoi.geom.coords[0])
+            for zoom in self.zooms:
+                start, end = get_start_end_download_coords(bbox_coords, zoom, TILE_SIZE)
+                jobs.append((start, end, zoom, self.input_path, self.source))
+        return jobs
+
+    def tile_paths(self, name):
+        return {
+            "image": os.path.join(self.input_path, f"{name}.png"),
+            "chip": os.path.join(self.preprocessed_path, "chips", f"{name}.tif"),
+            "label": os.path.join(self.preprocessed_path, "labels", f"{name}.geojson"),
+            "mask": os.path.join(
+                self.preprocessed_path, "binarymasks", f"{name}.mask.tif"
+            ),
+        }
+
+    def built_tiles(self):
+        names = set()
+        for path, suffix in (
+            (self.input_path, ".png"),
+            (os.path.join(self.preprocessed_path, "chips"), ".tif"),
+        ):
+            if os.path.isdir(path):
+                names.update(
+                    entry[: -len(suffix)]
+                    for entry in os.listdir(path)
+                    if entry.endswith(suffix)
+                )
+        return names
+
+    def remove_tiles(self, names):
+        for name in names:
+            for path in self.tile_paths(name).values():
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def stage(self, path, names):
+        """Symlinks tiles and labels into a directory for hot_fair_utilities"""
+        os.makedirs(path)
+        for name in names:
+            os.symlink(
+                os.path.abspath(self.tile_paths(name)["image"]),
+                os.path.join(path, f"{name}.png"),
+            )
+        os.symlink(
+            os.path.abspath(os.path.join(self.input_path, "labels.geojson")),
+            os.path.join(path, "labels.geojson"),
+        )
+        return path
+
+    def publish(self, staged_path, name):
+        """Moves staged outputs into preprocessed/ once they are complete"""
+        path = os.path.join(self.preprocessed_path, name)
+        os.makedirs(path, exist_ok=True)
+        for entry in os.scandir(staged_path):
+            os.replace(entry.path, os.path.join(path, entry.name))
+
+    def preprocess(self, chips, masks):
+        staging_path = os.path.join(self.build_path, "staging")
+        shutil.rmtree(staging_path, ignore_errors=True)
+        try:
+            if chips:
+                georeference(
+                    self.stage(os.path.join(staging_path, "chips_input"), chips),
+                    os.path.join(staging_path, "chips"),
+                )
+                self.publish(os.path.join(staging_path, "chips"), "chips")
+            if masks:
+                output_path = os.path.join(staging_path, "masks")
+                preprocess(
+                    input_path=self.stage(
+                        os.path.join(staging_path, "masks_input"), masks
+                    ),
+                    output_path=output_path,
+                    rasterize=True,
+                    rasterize_options=RASTERIZE_OPTIONS,
+                    georeference_images=False,
+                )
+                for name in ("labels", "binarymasks"):
+                    self.publish(os.path.join(output_path, name), name)
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    def pack(self, names):
+        """Packs chips and masks of tiles into the shard , replacing it"""
+        paths = [self.tile_paths(name) for name in names]
+        make_chip_shard(
+            [path["chip"] for path in paths],
+            [path["mask"] for path in paths],
+            self.shard_path,
+            names=names,
+            channels=SHARD_CHANNELS,
+        )
+
+    def build(self):
+        """Brings input/ and preprocessed/ up to date with aois , labels and imagery
+
+        Returns:
+            dict: no of tiles downloaded , removed , georeferenced (chips) and
+                rasterized (masks) with unchanged True if nothing had to be rebuilt
+        """
+        begin = time.perf_counter()
+        manifest = self.inputs()
+        previous = read_manifest(self.manifest_path)
+        report = {
+            "unchanged": False,
+            "downloaded": 0,
+            "removed": 0,
+            "chips": 0,
+            "masks": 0,
+        }
+        if (
+            all(previous.get(key) == value for key, value in manifest.items())
+            and previous.get("tiles")
+            and os.path.isdir(self.preprocessed_path)
+        ):
+            print("Dataset inputs are unchanged , reusing preprocessed data")
+            report["unchanged"] = True
+            if not os.path.isdir(self.shard_path):
+                # built before shards were packed
+                self.pack(sorted(previous["tiles"]))
+            return report
+
+        if any(
+            previous.get(key) != manifest[key]
+            for key in ("version", "source", "rasterize_options")
+        ):
+            # imagery or preprocessing changed , nothing built before is reusable
+            shutil.rmtree(self.input_path, ignore_errors=True)
+            shutil.rmtree(self.preprocessed_path, ignore_errors=True)
+            previous = {}
+        os.makedirs(self.input_path, exist_ok=True)
+        with open(
+            os.path.join(self.input_path, "labels.geojson"), "w", encoding="utf-8"
+        ) as f:
+            f.write(json.dumps(self.labels))
+
+        jobs = self.download_jobs()
+        expected = {
+            tile_url(source, x, y, zoom)[1]
+            for start, end, zoom, _, source in jobs
+            for x, y in tile_coords(start, end)
+        }
+        stale = self.built_tiles() - expected
+        self.remove_tiles(stale)
+        report["removed"] = len(stale)
+
+        download = (self.downloader or TileDownloader()).download(jobs)
+        report["downloaded"] = download["downloaded"]
+        tiles = sorted(
+            name for name in expected if os.path.exists(self.tile_paths(name)["image"])
+        )
+        if not tiles:
+            raise ValueError("No images found in the area")
+
+        digests = label_digests(self.labels["features"], tiles)
+        built = previous.get("tiles", {})
+        chips = [
+            name for name in tiles if not os.path.exists(self.tile_paths(name)["chip"])
+        ]
+        masks = [
+            name
+            for name in tiles
+            if built.get(name) != digests[name]
+            or not os.path.exists(self.tile_paths(name)["mask"])
+            or not os.path.exists(self.tile_paths(name)["label"])
+        ]
+        self.preprocess(chips, masks)
+        report["chips"], report["masks"] = len(chips), len(masks)
+        self.pack(tiles)
+
+        manifest["tiles"] = digests
+        write_manifest(self.manifest_path, manifest)
+        print(
+            f"Dataset built in {time.perf_counter() - begin:.2f} sec : {len(tiles)} tiles , "
+            f"{report['downloaded']} downloaded , {report['removed']} removed , "
+            f"{report['chips']} georeferenced , {report['masks']} rasterized"
+        )
+        return report
@@ -0,0 +1,163 @@
+"""Streaming downloads of training workspace files and directories
+
+Directories are zipped on the fly : entries are written to the response while the
+directory is walked , nothing is staged in a temp file or held in memory beyond one
+chunk. Single files support range requests so interrupted downloads can be resumed
+"""
+
+import os
+import re
+import zipfile
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+CHUNK_SIZE = 1024 * 1024
+
+# already compressed formats are stored as is , deflating them again only costs cpu
+STORED_EXTENSIONS = {
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".tif",
+    ".tiff",
+    ".h5",
+    ".tflite",
+    ".zip",
+    ".gz",
+    ".xz",
+    ".pb",
+}
+
+
+class ZipSink:
+    """Write only file object collecting what ZipFile writes until it is taken"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(base_dir, chunk_size=CHUNK_SIZE):
+    """Yields zip archive of base_dir in chunks while walking it , entries are
+    relative to base_dir like shutil.make_archive gives"""
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for root, dirs, files in os.walk(base_dir):
+            dirs.sort()
+            arc_root = os.path.relpath(root, base_dir)
+            if arc_root != ".":
+                zf.writestr(zipfile.ZipInfo(f"{arc_root}/"), b"")
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                zinfo = zipfile.ZipInfo.from_file(path, os.path.relpath(path, base_dir))
+                if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as src, zf.open(zinfo, "w") as dst:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        data = sink.take()
+                        if data:
+                            yield data
+                data = sink.take()
+                if data:
+                    yield data
+    yield sink.take()  # central directory
+
+
+def zip_response(base_dir, filename):
+    response = StreamingHttpResponse(iter_zip(base_dir), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def iter_file_range(path, start, length, chunk_size=CHUNK_SIZE):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def parse_range(header, size):
+    """Gives (start, end) of single `bytes=` range , None when header is not a
+    single byte range and ValueError when range is not satisfiable"""
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:  # suffix range , last n bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def file_response(request, path):
+    """Serves file as attachment , honours Range and If-Range headers"""
+    stat = os.stat(path)
+    last_modified = http_date(stat.st_mtime)
+    etag = f'"{int(stat.st_mtime)}-{stat.st_size}"'
+    filename = os.path.basename(path)
+
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if (
+        not if_range
+        or if_range in (etag, last_modified)
+        or (parse_http_date_safe(if_range) or 0) >= int(stat.st_mtime)
+    ):
+        try:
+            byte_range = parse_range(request.headers.get("Range"), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(path, start, end - start + 1),
+            status=206,
+            content_type="application/octet-stream",
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    else:
+        response = FileResponse(open(path, "rb"), as_attachment=True, filename=filename)
+    response["Accept-Ranges"] = "bytes"
+    response["Last-Modified"] = last_modified
+    response["ETag"] = etag
+    return response
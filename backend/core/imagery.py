@@ -0,0 +1,316 @@
+"""Imagery tile download shared by dataset builds and predictions
+
+Tiles are fetched through an on disk cache keyed by (source url template, z, x, y)
+so rebuilding a dataset or predicting again on same area doesn't hit the network
+"""
+import concurrent.futures
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from urllib.parse import urlparse
+from uuid import uuid4
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+TILE_REQUEST_TIMEOUT = 30  # sec
+
+
+class TileCache:
+    """Content addressed , size bounded LRU tile cache on disk
+
+    Writes go to a temp file which is atomically renamed in place so
+    concurrent workers never read partial tiles , recency is tracked
+    with file mtime which is touched on every hit
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._size = None  # computed lazily on first write
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, source, z, x, y):
+        key = hashlib.sha256(f"{source}|{z}|{x}|{y}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, source, z, x, y, fetch):
+        """Gives cached tile path , calls fetch() for content on miss
+
+        Args:
+            source (str): imagery url template tile belongs to
+            fetch (callable): returns tile content as bytes or None if not available
+
+        Returns:
+            str: path of tile in cache , None if tile is not available
+        """
+        path = self.path(source, z, x, y)
+        try:
+            os.utime(path)  # mark as recently used
+            with self._lock:
+                self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.misses += 1
+        content = fetch()
+        if content is None:
+            return None
+        self.put(path, content)
+        return path
+
+    def put(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self.scan_size()
+            else:
+                self._size += len(content)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another worker
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def scan_size(self):
+        if not os.path.exists(self.cache_dir):
+            return 0
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Removes least recently used tiles until cache is at 90% of max size"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else None,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
+
+
+tile_cache = TileCache(settings.TILE_CACHE_DIR, settings.TILE_CACHE_MAX_MB * 1024**2)
+
+
+def tile_url(source, x, y, z):
+    """Builds download url & tile name of z/x/y tile same as predictor does
+
+    Args:
+        source (str): url template like https://tiles.openaerialmap.org/.../{z}/{x}/{y} or maxar
+
+    Returns:
+        tuple: (url, file name without extension)
+    """
+    if source == "maxar":
+        connect_id = os.environ.get("MAXAR_CONNECT_ID")
+        url = f"https://services.digitalglobe.com/earthservice/tmsaccess/tms/1.0.0/DigitalGlobe:ImageryTileService@EPSG:3857@jpg/{z}/{x}/{y}.jpg?connectId={connect_id}&flipy=true"
+        return url, f"maxar-{x}-{y}-{z}"
+    if "{-y}" in source:
+        ## negative TMS
+        y = int((2**z) - y - 1)
+        source = source.replace("{-y}", "{y}")
+    return source.format(x=x, y=y, z=z), f"OAM-{x}-{y}-{z}"
+
+
+def tile_coords(start, end):
+    """Tiles from start to end tile coordinate , y goes from start down to end"""
+    for x in range(start[0], end[0] + 1):
+        for y in range(start[1], end[1] - 1, -1):
+            yield x, y
+
+
+def fetch_tile(url, session=requests):
+    response = session.get(url, timeout=TILE_REQUEST_TIMEOUT)
+    if response.status_code != 200:
+        logger.warning(f"Tile {url} responded with {response.status_code}")
+        return None
+    return response.content
+
+
+def link_or_copy(src, dst):
+    """Hardlinks cached tile into dataset , falls back to copy across filesystems"""
+    if os.path.exists(dst):
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class TileDownloader:
+    """Downloads tiles of many areas and zoom levels at once
+
+    One pooled http session is shared by all workers , requests per host
+    are bounded , failed requests are retried with exponential backoff and
+    tiles already present in destination are skipped
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        max_workers=None,
+        per_host=None,
+        retries=None,
+        backoff=None,
+    ):
+        self.cache = cache or tile_cache
+        self.max_workers = max_workers or settings.TILE_DOWNLOAD_WORKERS
+        self.per_host = per_host or settings.TILE_DOWNLOAD_PER_HOST
+        retry = Retry(
+            total=settings.TILE_DOWNLOAD_RETRIES if retries is None else retries,
+            backoff_factor=settings.TILE_DOWNLOAD_BACKOFF
+            if backoff is None
+            else backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_workers,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def fetch(self, url):
+        with self._host_limit(url):
+            try:
+                return fetch_tile(url, self.session)
+            except requests.RequestException as ex:
+                logger.warning(f"Tile {url} failed : {ex}")
+                return None
+
+    def download_tile(self, x, y, z, base_path, source):
+        """Gives (path, state) where state is skipped , downloaded or failed"""
+        url, name = tile_url(source, x, y, z)
+        dst = os.path.join(base_path, f"{name}.png")
+        if os.path.exists(dst):
+            return dst, "skipped"
+        for _ in range(2):  # tile may get evicted between lookup and link
+            path = self.cache.get(source, z, x, y, lambda: self.fetch(url))
+            if path is None:
+                return None, "failed"
+            try:
+                link_or_copy(path, dst)
+                return dst, "downloaded"
+            except FileNotFoundError:
+                continue
+        content = self.fetch(url)
+        if content is None:
+            return None, "failed"
+        with open(dst, "wb") as f:
+            f.write(content)
+        return dst, "downloaded"
+
+    def download(self, jobs):
+        """Downloads tiles of all jobs with one worker pool
+
+        Args:
+            jobs (iterable): (start, end, zm_level, base_path, source) tuples ,
+                start and end are [tile_x, tile_y] like predictor download_imagery
+
+        Returns:
+            dict: paths of tiles and downloaded , skipped , failed counts with tiles/sec
+        """
+        begin = time.perf_counter()
+        counts = {"downloaded": 0, "skipped": 0, "failed": 0}
+        paths = []
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+            futures = []
+            for start, end, zm_level, base_path, source in jobs:
+                print(
+                    f"Download starting from {start} to {end} using source {source} - {zm_level}"
+                )
+                futures.extend(
+                    executor.submit(self.download_tile, x, y, zm_level, base_path, source)
+                    for x, y in tile_coords(start, end)
+                )
+            for future in concurrent.futures.as_completed(futures):
+                path, state = future.result()
+                counts[state] += 1
+                if path:
+                    paths.append(path)
+        seconds = time.perf_counter() - begin
+        report = {
+            "paths": sorted(paths),
+            **counts,
+            "seconds": seconds,
+            "tiles_per_sec": len(futures) / seconds if seconds else None,
+        }
+        print(
+            f"Downloaded {counts['downloaded']} tiles , skipped {counts['skipped']} , "
+            f"failed {counts['failed']} in {seconds:.2f} sec ({report['tiles_per_sec']:.1f} tiles/sec)"
+        )
+        return report
+
+
+def download_imagery(start, end, zm_level, base_path, source="maxar", cache=None):
+    """Downloads imagery from start to end tile coordinate system through tile cache
+
+    Args:
+        start (list):[tile_x,tile_y]
+        end (list): [tile_x,tile_y],
+        zm_level : Zoom level
+        base_path (str): directory tiles are written to
+        source (string): it should be eithre url string or maxar value
+        cache (TileCache, optional): Defaults to shared tile_cache
+
+    Returns:
+        list: paths of downloaded tiles
+    """
+    report = TileDownloader(cache=cache).download(
+        [(start, end, zm_level, base_path, source)]
+    )
+    return report["paths"]
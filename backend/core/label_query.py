@@ -0,0 +1,170 @@
+"""Bbox lookup of labels for map views
+
+Ids of labels in the bbox are selected through the GiST index on geom ( a
+materialized CTE of ids only , run with sequential scans disabled for the query ) ,
+then the page is the first ids after `after` ( keyset pagination on id ) joined back
+to the table , so only the rows of the page are read in full , simplified relative
+to the requested bbox size and serialized. Features are streamed as GeoJSON while
+rows are fetched
+"""
+
+import json
+
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DateTimeField
+
+from .models import AOI, FeedbackAOI, FeedbackLabel, Label
+
+FETCH_SIZE = 2000
+# scoped to the transaction of the query , keeps a small bbox of a large table
+# from being answered by walking the primary key in id order
+PLANNER_SETTINGS = ("SET LOCAL enable_seqscan = off",)
+
+
+def parse_bbox(value):
+    """'min_x,min_y,max_x,max_y' -> tuple of floats"""
+    try:
+        bbox = tuple(float(v) for v in value.split(","))
+    except (AttributeError, ValueError):
+        bbox = ()
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValidationError({"in_bbox": "Expected min_x,min_y,max_x,max_y"})
+    return bbox
+
+
+def simplify_tolerance(bbox, resolution=None):
+    """Tolerance in degrees that keeps detail of about one pixel when bbox is
+    drawn at resolution pixels wide , larger bbox gives coarser geometries"""
+    resolution = resolution or settings.LABEL_QUERY_RESOLUTION
+    return max(bbox[2] - bbox[0], bbox[3] - bbox[1]) / resolution
+
+
+class LabelQuery:
+    """Keyset paginated bbox query of Label or FeedbackLabel
+
+    Args:
+        model: Label or FeedbackLabel
+        parent_field (str): foreign key column to the aoi
+        filters (dict): query param -> sql condition on the label table
+    """
+
+    def __init__(self, model, parent_field, filters):
+        self.model = model
+        self.parent_field = parent_field
+        self.filters = filters
+
+    def sql(self, bbox, params, after, limit, tolerance):
+        """Builds query of one page , raises ValidationError for bad filters so it
+        can be called before the response is started"""
+        conditions = ["geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)"]
+        args = list(bbox)
+        for name, condition in self.filters.items():
+            if params.get(name) not in (None, ""):
+                try:
+                    args.append(int(params[name]))
+                except ValueError:
+                    raise ValidationError({name: "Expected an integer"})
+                conditions.append(condition)
+        geom = "t.geom"
+        if tolerance:
+            geom = "ST_SimplifyPreserveTopology(t.geom, %s)"
+            args.append(tolerance)
+        args.extend([after, limit])
+        # the CTE only holds ids , it keeps postgres from ordering the bbox lookup
+        # by id through the primary key , geometries are read for the page only
+        query = f"""
+            WITH in_bbox AS MATERIALIZED (
+                SELECT id FROM {self.model._meta.db_table}
+                WHERE {" AND ".join(conditions)}
+            )
+            SELECT t.id, ST_AsGeoJSON({geom}, 7), t.{self.parent_field}, t.osm_id,
+                t.tags::text, t.created_at
+            FROM (
+                SELECT id FROM in_bbox WHERE id > %s ORDER BY id LIMIT %s
+            ) AS page
+            JOIN {self.model._meta.db_table} t ON t.id = page.id
+            ORDER BY t.id
+        """
+        return query, args
+
+    def rows(self, sql):
+        query, args = sql
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for setting in PLANNER_SETTINGS:
+                    cursor.execute(setting)
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(query, args)
+                while True:
+                    rows = cursor.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    yield from rows
+
+    def explain(self, sql, analyze=False):
+        """Plan of sql under the planner settings rows() runs it with"""
+        query, args = sql
+        with transaction.atomic(), connection.cursor() as cursor:
+            for setting in PLANNER_SETTINGS:
+                cursor.execute(setting)
+            cursor.execute(f"EXPLAIN {'ANALYZE ' if analyze else ''}{query}", args)
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def gist_index(self):
+        """Name of the GiST index GeoDjango creates on geom"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s "
+                "AND indexdef ILIKE '%%USING gist (geom)%%'",
+                [self.model._meta.db_table],
+            )
+            return cursor.fetchone()[0]
+
+    def stream(self, sql, limit, next_url=None):
+        """Yields GeoJSON FeatureCollection in chunks , same feature layout as the
+        label serializers with `next` url when page is full
+
+        Args:
+            sql (tuple): query and args from sql()
+            limit (int): page size sql was built with
+            next_url (callable): gives url of page after given id
+        """
+        created_at = DateTimeField()
+        parent = self.parent_field[: -len("_id")]
+        last_id, count = None, 0
+        yield '{"type": "FeatureCollection", "features": ['
+        for id, geometry, parent_id, osm_id, tags, created in self.rows(sql):
+            # tags are selected as jsonb text and embedded as is
+            properties = (
+                f'{{"{parent}": {parent_id}, '
+                f'"osm_id": {json.dumps(osm_id)}, "tags": {tags or "null"}, '
+                f'"created_at": {json.dumps(created_at.to_representation(created))}}}'
+            )
+            yield (
+                f'{"," if count else ""}{{"id": {id}, "type": "Feature", '
+                f'"geometry": {geometry}, "properties": {properties}}}'
+            )
+            last_id, count = id, count + 1
+        next_page = next_url(last_id) if next_url and count == limit else None
+        yield f'], "next": {json.dumps(next_page)}}}'
+
+
+label_query = LabelQuery(
+    Label,
+    "aoi_id",
+    {
+        "aoi": "aoi_id = %s",
+        "aoi__dataset": f"aoi_id IN (SELECT id FROM {AOI._meta.db_table} WHERE dataset_id = %s)",
+    },
+)
+
+feedback_label_query = LabelQuery(
+    FeedbackLabel,
+    "feedback_aoi_id",
+    {
+        "feedback_aoi": "feedback_aoi_id = %s",
+        "feedback_aoi__training": f"feedback_aoi_id IN (SELECT id FROM {FeedbackAOI._meta.db_table} WHERE training_id = %s)",
+    },
+)
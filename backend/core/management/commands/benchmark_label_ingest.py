@@ -0,0 +1,102 @@
+import json
+import os
+import random
+import time
+from tempfile import NamedTemporaryFile
+
+from django.contrib.gis.geos import Polygon
+from django.core.management.base import BaseCommand
+from login.models import OsmUser
+
+from core.models import AOI, Dataset, Label
+from core.utils import process_geojson
+
+
+def synthetic_geojson(n_features, bounds, seed=0):
+    """Generates raw data api like geojson with n small square buildings inside bounds"""
+    rng = random.Random(seed)
+    min_x, min_y, max_x, max_y = bounds
+    size = 0.00005
+    features = []
+    for i in range(n_features):
+        x = rng.uniform(min_x, max_x - size)
+        y = rng.uniform(min_y, max_y - size)
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {"osm_id": i + 1, "tags": {"building": "yes"}},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [
+                            [x, y],
+                            [x + size, y],
+                            [x + size, y + size],
+                            [x, y + size],
+                            [x, y],
+                        ]
+                    ],
+                },
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+class Command(BaseCommand):
+    help = "Benchmarks bulk label ingestion against per feature serializer saves"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--features", type=int, default=100000, help="No of synthetic features"
+        )
+        parser.add_argument(
+            "--legacy-features",
+            type=int,
+            default=None,
+            help="No of features for per feature path , defaults to --features",
+        )
+        parser.add_argument(
+            "--skip-legacy",
+            action="store_true",
+            help="Only benchmark the bulk path",
+        )
+
+    def run(self, geojson_path, aoi_id, bulk):
+        start = time.perf_counter()
+        written = process_geojson(geojson_path, aoi_id, bulk=bulk)
+        elapsed = time.perf_counter() - start
+        assert Label.objects.filter(aoi=aoi_id).count() == written
+        return written, elapsed
+
+    def handle(self, *args, **options):
+        bounds = (85.30, 27.70, 85.35, 27.75)
+        user, _ = OsmUser.objects.get_or_create(
+            osm_id=-1, defaults={"username": "label_ingest_benchmark"}
+        )
+        dataset = Dataset.objects.create(name="label ingest benchmark", created_by=user)
+        aoi = AOI.objects.create(dataset=dataset, geom=Polygon.from_bbox(bounds))
+        runs = [("bulk", True, options["features"])]
+        if not options["skip_legacy"]:
+            runs.append(
+                (
+                    "per feature",
+                    False,
+                    options["legacy_features"] or options["features"],
+                )
+            )
+        try:
+            for name, bulk, n_features in runs:
+                with NamedTemporaryFile("w", suffix=".geojson", delete=False) as f:
+                    json.dump(synthetic_geojson(n_features, bounds), f)
+                try:
+                    written, elapsed = self.run(f.name, aoi.id, bulk)
+                finally:
+                    os.unlink(f.name)
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{name}: {written} labels in {elapsed:.2f} sec , {written / elapsed:.0f} rows/sec"
+                    )
+                )
+        finally:
+            dataset.delete()
+            user.delete()
@@ -0,0 +1,125 @@
+import json
+import random
+import time
+
+from django.contrib.gis.geos import Point, Polygon
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from login.models import OsmUser
+
+from core.label_query import label_query, simplify_tolerance
+from core.models import AOI, Dataset, Label
+from core.serializers import LabelSerializer
+
+
+def seed_labels(aoi, n_labels, bounds, batch_size=10000, seed=0):
+    """Creates n buildings inside bounds , every 10th one is a detailed circle"""
+    rng = random.Random(seed)
+    min_x, min_y, max_x, max_y = bounds
+    size = 0.00005
+    labels = []
+    for i in range(n_labels):
+        x = rng.uniform(min_x, max_x - size)
+        y = rng.uniform(min_y, max_y - size)
+        if i % 10:
+            geom = Polygon.from_bbox((x, y, x + size, y + size))
+        else:
+            geom = Point(x, y).buffer(size, quadsegs=16)
+        labels.append(Label(aoi=aoi, osm_id=i + 1, geom=geom))
+        if len(labels) == batch_size:
+            Label.objects.bulk_create(labels)
+            labels = []
+    Label.objects.bulk_create(labels)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {Label._meta.db_table}")
+
+
+class Command(BaseCommand):
+    help = "Benchmarks bbox label lookup against LabelViewSet serializer output on seeded labels"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--labels", type=int, default=200000, help="No of seeded labels"
+        )
+        parser.add_argument(
+            "--sizes",
+            type=float,
+            nargs="+",
+            default=[0.002, 0.01, 0.05],
+            help="Width of queried bboxes in degree",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=50000, help="Page size of bbox lookup"
+        )
+
+    def viewset_path(self, aoi, bbox):
+        """What ?in_bbox= on LabelViewSet does : overlap filter and serializer"""
+        labels = Label.objects.filter(
+            aoi__dataset=aoi.dataset_id, geom__bboverlaps=Polygon.from_bbox(bbox)
+        )
+        return json.dumps(LabelSerializer(labels, many=True).data)
+
+    def query_path(self, aoi, bbox, limit):
+        sql = label_query.sql(
+            bbox, {"aoi__dataset": aoi.dataset_id}, 0, limit, simplify_tolerance(bbox)
+        )
+        return "".join(label_query.stream(sql, limit))
+
+    def explain(self, aoi, bbox, limit):
+        """EXPLAIN ANALYZE of first page , fails unless the GiST index drives it"""
+        sql = label_query.sql(
+            bbox,
+            {"aoi__dataset": aoi.dataset_id},
+            0,
+            limit,
+            simplify_tolerance(bbox),
+        )
+        plan = label_query.explain(sql, analyze=True)
+        if label_query.gist_index() not in plan:
+            raise CommandError(f"bbox lookup does not use the GiST index :\n{plan}")
+        return plan
+
+    def handle(self, *args, **options):
+        bounds = (85.30, 27.70, 85.40, 27.80)
+        user, _ = OsmUser.objects.get_or_create(
+            osm_id=-1, defaults={"username": "label_query_benchmark"}
+        )
+        dataset = Dataset.objects.create(name="label query benchmark", created_by=user)
+        aoi = AOI.objects.create(dataset=dataset, geom=Polygon.from_bbox(bounds))
+        try:
+            start = time.perf_counter()
+            seed_labels(aoi, options["labels"], bounds)
+            self.stdout.write(
+                f"seeded {options['labels']} labels in {time.perf_counter() - start:.2f} sec"
+            )
+            center_x = (bounds[0] + bounds[2]) / 2
+            center_y = (bounds[1] + bounds[3]) / 2
+            for size in options["sizes"]:
+                bbox = (
+                    center_x - size / 2,
+                    center_y - size / 2,
+                    center_x + size / 2,
+                    center_y + size / 2,
+                )
+                results = {}
+                for name, run in (
+                    ("viewset", lambda: self.viewset_path(aoi, bbox)),
+                    ("bbox", lambda: self.query_path(aoi, bbox, options["limit"])),
+                ):
+                    start = time.perf_counter()
+                    body = run()
+                    seconds = time.perf_counter() - start
+                    features = len(json.loads(body)["features"])
+                    results[name] = seconds
+                    self.stdout.write(
+                        f"{size} deg {name}: {features} labels in {seconds:.3f} sec , {len(body) / 1024:.0f} KB"
+                    )
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{size} deg speedup : {results['viewset'] / results['bbox']:.1f}x"
+                    )
+                )
+                self.stdout.write(self.explain(aoi, bbox, options["limit"]))
+        finally:
+            dataset.delete()
+            user.delete()
@@ -0,0 +1,128 @@
+import concurrent.futures
+import io
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+
+import requests
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from core.imagery import TileCache, TileDownloader, tile_coords, tile_url
+
+
+def synthetic_pngs(n, size=256, seed=0):
+    rng = random.Random(seed)
+    pngs = []
+    for _ in range(n):
+        image = Image.frombytes(
+            "RGB", (size, size), bytes(rng.getrandbits(8) for _ in range(size * size * 3))
+        )
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        pngs.append(buffer.getvalue())
+    return pngs
+
+
+def tile_server(pngs, latency):
+    class TileHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep alive so pooled connections are reused
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            z, x, y = (int(v) for v in self.path.strip("/").split("/")[-3:])
+            body = pngs[(x + y + z) % len(pngs)]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TileHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serial_download(jobs):
+    """Previous behaviour : one download_imagery call per aoi and zoom with plain requests"""
+
+    def download_image(url, path):
+        with open(path, "wb") as f:
+            f.write(requests.get(url).content)
+
+    for start, end, zm_level, base_path, source in jobs:
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for x, y in tile_coords(start, end):
+                url, name = tile_url(source, x, y, zm_level)
+                executor.submit(download_image, url, os.path.join(base_path, f"{name}.png"))
+
+
+class Command(BaseCommand):
+    help = "Benchmarks tile downloader against a local tile server serving synthetic pngs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--aois", type=int, default=8, help="No of areas")
+        parser.add_argument(
+            "--tiles", type=int, default=10, help="Tiles per side of each area"
+        )
+        parser.add_argument(
+            "--zooms", type=int, nargs="+", default=[19, 20], help="Zoom levels"
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.02, help="Server latency per tile in sec"
+        )
+
+    def handle(self, *args, **options):
+        server = tile_server(synthetic_pngs(16), options["latency"])
+        source = f"http://127.0.0.1:{server.server_port}/{{z}}/{{x}}/{{y}}"
+        n = options["tiles"]
+        try:
+            with TemporaryDirectory() as tmp_dir:
+                results = {}
+                for name in ("serial", "downloader"):
+                    base_path = os.path.join(tmp_dir, name)
+                    os.makedirs(base_path)
+                    jobs = [
+                        (
+                            [aoi * n, n - 1],
+                            [aoi * n + n - 1, 0],
+                            zoom,
+                            base_path,
+                            source,
+                        )
+                        for aoi in range(options["aois"])
+                        for zoom in options["zooms"]
+                    ]
+                    start = time.perf_counter()
+                    if name == "serial":
+                        serial_download(jobs)
+                    else:
+                        cache = TileCache(os.path.join(tmp_dir, "cache"), 10 * 1024**3)
+                        TileDownloader(cache=cache).download(jobs)
+                    seconds = time.perf_counter() - start
+                    tiles = len(os.listdir(base_path))
+                    results[name] = tiles / seconds
+                    self.stdout.write(
+                        f"{name}: {tiles} tiles in {seconds:.2f} sec , {tiles / seconds:.1f} tiles/sec"
+                    )
+
+                start = time.perf_counter()
+                report = TileDownloader(cache=cache).download(jobs)
+                self.stdout.write(
+                    f"downloader rerun: skipped {report['skipped']} tiles in {time.perf_counter() - start:.2f} sec"
+                )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"speedup : {results['downloader'] / results['serial']:.1f}x"
+                )
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
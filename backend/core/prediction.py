@@ -0,0 +1,271 @@
+"""Prediction on published models with loaded checkpoints kept in memory
+
+predictor.predict loads checkpoint from disk on every call , here the georeference
+and vectorize steps of predictor are reused while the loaded interpreter / keras
+model comes from a process wide LRU cache and tiles come through the tile cache
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from predictor import georeference, get_start_end_download_coords, vectorize
+from predictor.utils import open_images_pillow, remove_files, save_mask
+
+from .imagery import download_imagery
+from .models import Model, Training
+from .utils import get_dir_size
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    from tensorflow.lite import Interpreter
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 8
+IMAGE_SIZE = 256
+
+
+def get_checkpoint_path(dataset_id, training_id):
+    """Gives high priority to tflite model format if not avilable fall back to .h5 if not use default .tf"""
+    output_path = os.path.join(
+        settings.TRAINING_WORKSPACE,
+        f"dataset_{dataset_id}",
+        "output",
+        f"training_{training_id}",
+    )
+    for checkpoint in ("checkpoint.tflite", "checkpoint.h5"):
+        model_path = os.path.join(output_path, checkpoint)
+        if os.path.exists(model_path):
+            return model_path
+    return os.path.join(output_path, "checkpoint.tf")
+
+
+class TFLiteModel:
+    def __init__(self, model_path):
+        self.interpreter = Interpreter(model_path=model_path)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.input_shape = None
+        self.lock = threading.Lock()  # interpreter is not thread safe
+
+    def predict(self, images):
+        with self.lock:
+            if images.shape != self.input_shape:
+                self.interpreter.resize_tensor_input(self.input_index, images.shape)
+                self.interpreter.allocate_tensors()
+                self.input_shape = images.shape
+            self.interpreter.set_tensor(self.input_index, images)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index)
+
+
+class KerasModel:
+    def __init__(self, model_path):
+        from tensorflow import keras
+
+        self.model = keras.models.load_model(model_path)
+        self.lock = threading.Lock()
+
+    def predict(self, images):
+        with self.lock:
+            return self.model.predict(images, verbose=0)
+
+
+def load_model(model_path):
+    if model_path.endswith(".tflite"):
+        return TFLiteModel(model_path)
+    return KerasModel(model_path)
+
+
+def model_size(model_path):
+    """Size of checkpoint on disk , used as estimate of loaded model memory"""
+    if os.path.isdir(model_path):
+        return get_dir_size(model_path)
+    return os.path.getsize(model_path)
+
+
+class ModelCache:
+    """LRU cache of loaded models keyed by training id , entry is reloaded when
+    checkpoint mtime changes and least recently used models are evicted once
+    total checkpoint size exceeds max_bytes"""
+
+    def __init__(self, max_bytes, loader=load_model, sizer=model_size):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.sizer = sizer
+        self._entries = OrderedDict()  # training_id -> (model_path, mtime, size, model)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    def get(self, training_id, model_path):
+        mtime = os.path.getmtime(model_path)
+        with self._lock:
+            entry = self._entries.get(training_id)
+            if entry and entry[0] == model_path and entry[1] == mtime:
+                self._entries.move_to_end(training_id)
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+
+        start = time.perf_counter()
+        model = self.loader(model_path)
+        load_seconds = time.perf_counter() - start
+        size = self.sizer(model_path)
+        logger.info(f"Loaded {model_path} in {load_seconds:.2f} sec")
+
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += load_seconds
+            self._entries.pop(training_id, None)
+            self._entries[training_id] = (model_path, mtime, size, model)
+            self._evict()
+        return model
+
+    def _evict(self):
+        # most recently loaded model is always kept even if it alone exceeds budget
+        while len(self._entries) > 1 and self.size() > self.max_bytes:
+            training_id, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"Evicted model of training {training_id} from cache")
+
+    def size(self):
+        return sum(entry[2] for entry in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "models": list(self._entries.keys()),
+                "size_bytes": self.size(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else None,
+                "evictions": self.evictions,
+                "loads": self.loads,
+                "avg_load_seconds": self.load_seconds / self.loads
+                if self.loads
+                else None,
+            }
+
+    def warm_up(self):
+        """Loads checkpoints of all published models"""
+        published = Model.objects.filter(
+            status=Model.ModelStatus.PUBLISHED, published_training__isnull=False
+        )
+        for model_instance in published:
+            try:
+                training_instance = Training.objects.get(
+                    id=model_instance.published_training
+                )
+                model_path = get_checkpoint_path(
+                    model_instance.dataset.id, training_instance.id
+                )
+                if os.path.exists(model_path):
+                    self.get(training_instance.id, model_path)
+            except Exception as ex:
+                logger.error(f"Model cache warm up failed for {model_instance.id} : {ex}")
+
+
+model_cache = ModelCache(max_bytes=settings.PREDICTION_MODEL_CACHE_MB * 1024**2)
+
+
+def run_prediction(
+    model, input_path, prediction_path, confidence=0.5, tile_overlap_distance=0.15
+):
+    """Predicts downloaded png tiles with loaded model and georeferences the masks"""
+    image_paths = glob(f"{input_path}/*.png")
+    for i in range((len(image_paths) + BATCH_SIZE - 1) // BATCH_SIZE):
+        image_batch = image_paths[BATCH_SIZE * i : BATCH_SIZE * (i + 1)]
+        images = open_images_pillow(image_batch)
+        images = images.reshape(-1, IMAGE_SIZE, IMAGE_SIZE, 3).astype(np.float32)
+        preds = model.predict(images)
+        preds = np.argmax(preds, axis=-1)
+        preds = np.expand_dims(preds, axis=-1)
+        preds = np.where(
+            preds > confidence, 1, 0
+        )  # Filter out low confidence predictions
+        for idx, path in enumerate(image_batch):
+            save_mask(preds[idx], str(f"{prediction_path}/{Path(path).stem}.png"))
+
+    georeference_path = os.path.join(prediction_path, "georeference")
+    georeference(
+        prediction_path,
+        georeference_path,
+        is_mask=True,
+        tile_overlap_distance=tile_overlap_distance,
+    )
+    remove_files(f"{prediction_path}/*.xml")
+    remove_files(f"{prediction_path}/*.png")
+    return georeference_path
+
+
+def predict(
+    bbox,
+    training_id,
+    model_path,
+    zoom_level,
+    tms_url,
+    tile_size=256,
+    confidence=0.5,
+    area_threshold=3,
+    tolerance=0.5,
+    tile_overlap_distance=0.15,
+):
+    """Same as predictor.predict but model is taken from model_cache
+
+    Returns:
+        dict: predictions as geojson featurecollection
+    """
+    model = model_cache.get(training_id, model_path)
+    base_path = os.path.join(os.getcwd(), "prediction", str(uuid.uuid4()))
+    try:
+        download_path = os.path.join(base_path, "image")
+        os.makedirs(download_path, exist_ok=True)
+        start, end = get_start_end_download_coords(bbox, zoom_level, tile_size)
+        download_imagery(
+            start, end, zoom_level, base_path=download_path, source=tms_url
+        )
+
+        prediction_path = os.path.join(base_path, "prediction")
+        os.makedirs(prediction_path, exist_ok=True)
+        start = time.time()
+        georeference_path = run_prediction(
+            model,
+            download_path,
+            prediction_path,
+            confidence=confidence,
+            tile_overlap_distance=tile_overlap_distance,
+        )
+        print(f"It took {round(time.time()-start)} sec to predict")
+
+        geojson_path = os.path.join(base_path, "geojson")
+        os.makedirs(geojson_path, exist_ok=True)
+        geojson_path = vectorize(
+            georeference_path,
+            output_path=os.path.join(geojson_path, "prediction.geojson"),
+            area_threshold=area_threshold,
+            tolerance=tolerance,
+        )
+        with open(geojson_path, "r") as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
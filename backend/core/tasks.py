@@ -16,10 +16,11 @@ from django.contrib.gis.db.models.aggregates import Extent
 from django.contrib.gis.geos import GEOSGeometry
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from hot_fair_utilities import preprocess, train
+from hot_fair_utilities import train
 from hot_fair_utilities.training import run_feedback
-from predictor import download_imagery, get_start_end_download_coords
 
+from core.dataset_build import DatasetBuilder
+from core.imagery import tile_cache
 from core.models import AOI, Feedback, FeedbackAOI, FeedbackLabel, Label, Training
 from core.serializers import (
     AOISerializer,
@@ -28,30 +29,36 @@ from core.serializers import (
     FeedbackLabelFileSerializer,
     LabelFileSerializer,
 )
-from core.utils import bbox, is_dir_empty
+from core.utils import process_rawdata, request_rawdata
 
 logger = logging.getLogger(__name__)
 
 # from core.serializers import LabelFileSerializer
 
 
-DEFAULT_TILE_SIZE = 256
-
-def xz_folder(folder_path, output_filename, remove_original=False):
+def tar_folder(folder_path, output_filename, members=None, remove_original=False):
     """
-    Compresses a folder and its contents into a .tar.xz file and optionally removes the original folder.
+    Archives a folder or some of its entries into an uncompressed .tar file and optionally removes the original folder.
 
     Parameters:
-    - folder_path: The path to the folder to compress.
-    - output_filename: The name of the output .tar.xz file.
-    - remove_original: If True, the original folder is removed after compression.
+    - folder_path: The path to the folder to archive.
+    - output_filename: The name of the output .tar file.
+    - members: Names of the entries of the folder to archive, all of it if None.
+    - remove_original: If True, the original folder is removed after archiving.
     """
 
-    if not output_filename.endswith('.tar.xz'):
-        output_filename += '.tar.xz'
-
-    with tarfile.open(output_filename, "w:xz") as tar:
-        tar.add(folder_path, arcname=os.path.basename(folder_path))
+    if not output_filename.endswith(".tar"):
+        output_filename += ".tar"
+
+    arcname = os.path.basename(folder_path)
+    with tarfile.open(output_filename, "w") as tar:
+        if members is None:
+            tar.add(folder_path, arcname=arcname)
+        else:
+            for name in members:
+                tar.add(
+                    os.path.join(folder_path, name), arcname=os.path.join(arcname, name)
+                )
 
     if remove_original:
         shutil.rmtree(folder_path)
@@ -88,12 +95,6 @@ def train_model(
             training_input_base_path = os.path.join(
                 settings.TRAINING_WORKSPACE, f"dataset_{dataset_id}"
             )
-            training_input_image_source = os.path.join(
-                training_input_base_path, "input"
-            )
-            if os.path.exists(training_input_image_source):  # always build dataset
-                shutil.rmtree(training_input_image_source)
-            os.makedirs(training_input_image_source)
             if feedback:
                 try:
                     aois = FeedbackAOI.objects.filter(training=feedback)
@@ -113,33 +114,6 @@ def train_model(
                     raise ValueError(
                         f"No AOI is attached with supplied dataset id:{dataset_id}, Create AOI first",
                     )
-            for obj in aois:
-                bbox_coords = bbox(obj.geom.coords[0])
-                for z in zoom_level:
-                    zm_level = z
-                    print(
-                        f"""Running Download process for
-                            aoi : {obj.id} - dataset : {dataset_id} , zoom : {zm_level}"""
-                    )
-                    try:
-                        tile_size = DEFAULT_TILE_SIZE  # by default
-
-                        start, end = get_start_end_download_coords(
-                            bbox_coords, zm_level, tile_size
-                        )
-                        # start downloading
-                        download_imagery(
-                            start,
-                            end,
-                            zm_level,
-                            base_path=training_input_image_source,
-                            source=source_imagery,
-                        )
-
-                    except Exception as ex:
-                        raise ex
-                if is_dir_empty(training_input_image_source):
-                    raise ValueError("No images found in the area")
 
             ## -----------LABEL GENERATOR---------
             logging.info("Label Generator started")
@@ -155,40 +129,29 @@ def train_model(
                 label = Label.objects.filter(aoi__in=aoi_list)
                 serialized_field = LabelFileSerializer(label, many=True)
 
-            with open(
-                os.path.join(training_input_image_source, "labels.geojson"),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                f.write(json.dumps(serialized_field.data))
-
             ## --------- Data Preparation ----------
+            # feedback aois differ from dataset aois so they get their own build
+            build_path = (
+                os.path.join(training_input_base_path, f"feedback_{feedback}")
+                if feedback
+                else training_input_base_path
+            )
+            builder = DatasetBuilder(
+                build_path,
+                source_imagery,
+                zoom_level,
+                aois,
+                serialized_field.data,
+            )
+            builder.build()
+            print(f"Tile cache : {tile_cache.stats()}")
+            preprocess_output = builder.preprocessed_path
+
             base_path = os.path.join(settings.RAMP_HOME, "ramp-data", str(dataset_id))
             # Check if the path exists
             if os.path.exists(base_path):
                 # Delete the directory and its contents
                 rmtree(base_path)
-            destination_image_input = os.path.join(base_path, "input")
-
-            logging.info(training_input_image_source)
-            if not os.path.exists(training_input_image_source):
-                raise ValueError(
-                    "Training folder has not been created at , Build the dataset first /dataset/build/"
-                )
-            if os.path.exists(destination_image_input):
-                shutil.rmtree(destination_image_input)
-            shutil.copytree(training_input_image_source, destination_image_input)
-
-            # preprocess
-            model_input_image_path = f"{base_path}/input"
-            preprocess_output = f"/{base_path}/preprocessed"
-            preprocess(
-                input_path=model_input_image_path,
-                output_path=preprocess_output,
-                rasterize=True,
-                rasterize_options=["binary"],
-                georeference_images=True,
-            )
 
             # train
 
@@ -274,9 +237,15 @@ def train_model(
             # copy aois and labels to preprocess output before compressing it to tar
             shutil.copyfile(os.path.join(output_path, "aois.geojson"), os.path.join(preprocess_output,'aois.geojson'))
             shutil.copyfile(os.path.join(output_path, "labels.geojson"), os.path.join(preprocess_output,'labels.geojson'))
-            xz_folder(preprocess_output, os.path.join(output_path, "preprocessed.tar.xz"), remove_original=True)
+            # the shard holds the chips and masks as packed arrays , they are
+            # archived as they are instead of recompressing every chip file
+            tar_folder(
+                preprocess_output,
+                os.path.join(output_path, "preprocessed.tar"),
+                members=["shard", "labels", "aois.geojson", "labels.geojson"],
+            )
 
-            # now remove the ramp-data all our outputs are copied to our training workspace
+            # now remove the ramp-data all our outputs are copied to our training workspace , preprocessed data is kept for next build
             shutil.rmtree(base_path)
             training_instance.accuracy = float(final_accuracy)
             training_instance.finished_at = timezone.now()
@@ -296,3 +265,51 @@ def train_model(
         training_instance.finished_at = timezone.now()
         training_instance.save()
         raise ex
+
+
+@shared_task(bind=True)
+def fetch_osm_labels(self, aoi_id, feedback=False):
+    """Downloads available osm data as labels within given aoi / feedback aoi,
+    reports phase and feature count as PROGRESS state meta for run_task_status
+
+    Args:
+        aoi_id (int): AOI id , FeedbackAOI id if feedback
+        feedback (bool, optional): Defaults to False.
+
+    Returns:
+        dict: aoi_id and no of labels written
+    """
+    aoi_model = FeedbackAOI if feedback else AOI
+    obj = aoi_model.objects.get(id=aoi_id)
+    obj.label_status = aoi_model.DownloadStatus.RUNNING
+    obj.save()
+
+    def progress(phase, processed=0, total=None, **info):
+        self.update_state(
+            state="PROGRESS",
+            meta={
+                "aoi_id": aoi_id,
+                "feedback": feedback,
+                "phase": phase,
+                "processed": processed,
+                "total": total,
+                **info,
+            },
+        )
+
+    try:
+        progress("requesting")
+        file_download_url = request_rawdata(obj.geom.geojson, progress=progress)
+        written = process_rawdata(
+            file_download_url, aoi_id, feedback=feedback, progress=progress
+        )
+        obj.label_status = aoi_model.DownloadStatus.DOWNLOADED
+        obj.label_fetched = timezone.now()
+        obj.save()
+    except Exception as ex:
+        obj.label_status = aoi_model.DownloadStatus.NOT_DOWNLOADED
+        obj.save()
+        logger.error(f"OSM label fetch failed for aoi {aoi_id} : {ex}")
+        raise ex
+    logger.info(f"Fetched {written} osm labels for aoi {aoi_id}")
+    return {"aoi_id": aoi_id, "feedback": feedback, "labels": written}
@@ -1,3 +1,832 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from xml.dom import ValidationErr
 
-# Create your tests here.
+from django.contrib.gis.geos import GEOSGeometry, Point, Polygon
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from login.models import OsmUser
+
+from .dataset_build import DatasetBuilder
+from .imagery import TileCache, TileDownloader, download_imagery, tile_url
+from .label_query import feedback_label_query, label_query
+from .models import AOI, Dataset, Label
+from .prediction import ModelCache
+from .tasks import fetch_osm_labels
+from .utils import (
+    build_label,
+    bulk_process_features,
+    find_geojson_member,
+    iter_geojson_features,
+    process_geojson,
+)
+
+AOI_BOUNDS = (32.5885, 0.3481, 32.5889, 0.3487)
+
+
+def building(osm_id, x, y, size=0.00002):
+    return {
+        "type": "Feature",
+        "properties": {"osm_id": osm_id, "tags": {"building": "yes"}},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [
+                [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+            ],
+        },
+    }
+
+
+class RawDataAPIStandIn(BaseHTTPRequestHandler):
+    """Local Raw Data API : snapshot request , task status and zip download"""
+
+    features = []
+    task_status = "SUCCESS"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_json({"track_link": "/tasks/status/snapshot-1/"})
+
+    def do_GET(self):
+        host = f"http://{self.server.server_address[0]}:{self.server.server_port}"
+        if self.path.startswith("/tasks/status/"):
+            self.send_json(
+                {
+                    "status": self.task_status,
+                    "result": {"download_url": f"{host}/download/snapshot-1.zip"},
+                }
+            )
+            return
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            zf.writestr(
+                "clipping_boundary.geojson",
+                json.dumps({"type": "FeatureCollection", "features": []}),
+            )
+            zf.writestr(
+                "snapshot-1.geojson",
+                json.dumps({"type": "FeatureCollection", "features": self.features}),
+            )
+        body = buffer.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BulkLabelIngestTest(TestCase):
+    def setUp(self):
+        user = OsmUser.objects.create(osm_id=1, username="tester")
+        dataset = Dataset.objects.create(name="test dataset", created_by=user)
+        other_dataset = Dataset.objects.create(name="other dataset", created_by=user)
+        self.aoi = AOI.objects.create(
+            dataset=dataset, geom=Polygon.from_bbox(AOI_BOUNDS)
+        )
+        self.sibling_aoi = AOI.objects.create(
+            dataset=dataset, geom=Polygon.from_bbox(AOI_BOUNDS)
+        )
+        self.other_aoi = AOI.objects.create(
+            dataset=other_dataset, geom=Polygon.from_bbox(AOI_BOUNDS)
+        )
+
+    def features(self, osm_ids, offset=0):
+        return [
+            building(i, AOI_BOUNDS[0] + i * 0.00003, AOI_BOUNDS[1] + offset)
+            for i in osm_ids
+        ]
+
+    def ingest(self, features, aoi=None):
+        geojson = {"type": "FeatureCollection", "features": features}
+        return process_geojson(
+            io.BytesIO(json.dumps(geojson).encode()), (aoi or self.aoi).id
+        )
+
+    def osm_ids(self, aoi):
+        return sorted(Label.objects.filter(aoi=aoi).values_list("osm_id", flat=True))
+
+    def test_replaces_aoi_labels_and_upserts_by_osm_id(self):
+        self.ingest(self.features(range(1, 6)))
+        self.ingest(self.features([6, 7]), aoi=self.sibling_aoi)
+        self.ingest(self.features([3]), aoi=self.other_aoi)
+
+        self.assertEqual(self.ingest(self.features(range(3, 7))), 4)
+        # labels of the aoi missing from the snapshot are removed , osm_id 6
+        # moves from the other aoi of the dataset , other datasets are untouched
+        self.assertEqual(self.osm_ids(self.aoi), [3, 4, 5, 6])
+        self.assertEqual(self.osm_ids(self.sibling_aoi), [7])
+        self.assertEqual(self.osm_ids(self.other_aoi), [3])
+
+    def test_batch_boundaries(self):
+        progress = mock.Mock()
+        features = self.features([1, 2, 3, 4])
+        moved = self.features([3], offset=0.0001)[0]
+        features += [moved] + self.features([5, 6])
+        written = bulk_process_features(
+            features,
+            self.aoi.id,
+            self.aoi.dataset,
+            batch_size=3,
+            progress=progress,
+            total=len(features),
+        )
+
+        self.assertEqual(written, 7)
+        self.assertEqual(
+            [call.kwargs["processed"] for call in progress.call_args_list], [3, 6, 7]
+        )
+        self.assertEqual(self.osm_ids(self.aoi), [1, 2, 3, 4, 5, 6])
+        # duplicate osm_id in a later batch keeps the last feature
+        self.assertTrue(
+            Label.objects.get(osm_id=3).geom.equals_exact(
+                GEOSGeometry(json.dumps(moved["geometry"])), 1e-9
+            )
+        )
+
+        progress.reset_mock()
+        written = bulk_process_features(
+            self.features(range(1, 7)),
+            self.aoi.id,
+            self.aoi.dataset,
+            batch_size=3,
+            progress=progress,
+        )
+        self.assertEqual(written, 6)
+        self.assertEqual(progress.call_count, 2)
+        self.assertEqual(self.osm_ids(self.aoi), [1, 2, 3, 4, 5, 6])
+
+    def test_keeps_multipolygons_and_invalid_polygons(self):
+        multipolygon = {
+            "type": "Feature",
+            "properties": {"osm_id": 3, "tags": {"building": "yes"}},
+            "geometry": {
+                "type": "MultiPolygon",
+                "coordinates": [
+                    f["geometry"]["coordinates"] for f in self.features([10, 11])
+                ],
+            },
+        }
+        bowtie = {
+            "type": "Feature",
+            "properties": {"osm_id": 4, "tags": {"building": "yes"}},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]],
+            },
+        }
+
+        written = self.ingest(self.features([1, 2]) + [multipolygon, bowtie])
+        self.assertEqual(written, 4)
+        self.assertEqual(self.osm_ids(self.aoi), [1, 2, 3, 4])
+        self.assertEqual(Label.objects.get(osm_id=3).geom.geom_type, "MultiPolygon")
+        self.assertFalse(Label.objects.get(osm_id=4).geom.valid)
+
+        # FeedbackLabel.geom is a PolygonField
+        with self.assertRaises(ValidationErr):
+            build_label(multipolygon, self.aoi.id, feedback=True)
+        self.assertEqual(
+            build_label(bowtie, self.aoi.id, feedback=True).geom.geom_type, "Polygon"
+        )
+
+    def test_rejects_unparsable_geometries(self):
+        self.ingest(self.features([1, 2]))
+        unparsable = {
+            "type": "Feature",
+            "properties": {"osm_id": 3, "tags": {}},
+            "geometry": {"type": "Polygon", "coordinates": [[1]]},
+        }
+        with self.assertRaises(ValidationErr):
+            build_label(unparsable, self.aoi.id)
+        with self.assertRaises(ValidationErr):
+            self.ingest(self.features([4]) + [unparsable])
+        # the transaction is rolled back , existing labels are kept
+        self.assertEqual(self.osm_ids(self.aoi), [1, 2])
+
+
+class FetchOSMLabelsTaskTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RawDataAPIStandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = f"http://127.0.0.1:{self.server.server_port}"
+        RawDataAPIStandIn.task_status = "SUCCESS"
+        RawDataAPIStandIn.features = [
+            building(i, AOI_BOUNDS[0] + i * 0.00003, AOI_BOUNDS[1])
+            for i in range(1, 11)
+        ]
+        user = OsmUser.objects.create(osm_id=1, username="tester")
+        dataset = Dataset.objects.create(name="test dataset", created_by=user)
+        self.aoi = AOI.objects.create(
+            dataset=dataset, geom=Polygon.from_bbox(AOI_BOUNDS)
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_task(self):
+        with override_settings(
+            EXPORT_TOOL_API_URL=self.api_url, LABEL_INGEST_BATCH_SIZE=4
+        ), mock.patch.object(fetch_osm_labels, "update_state") as update_state:
+            result = fetch_osm_labels.apply(args=(self.aoi.id,))
+        return result, [call.kwargs["meta"] for call in update_state.call_args_list]
+
+    def test_fetch_reports_progress_and_updates_aoi(self):
+        result, progress = self.run_task()
+
+        self.assertTrue(result.successful())
+        self.assertEqual(result.result["labels"], 10)
+        self.assertEqual(Label.objects.filter(aoi=self.aoi).count(), 10)
+        phases = [meta["phase"] for meta in progress]
+        self.assertEqual(phases[0], "requesting")
+        self.assertIn("snapshot", phases)
+        self.assertIn("downloading", phases)
+        processed = [
+            meta["processed"] for meta in progress if meta["phase"] == "processing"
+        ]
+        self.assertEqual(processed, [4, 8, 10])
+        self.aoi.refresh_from_db()
+        self.assertEqual(self.aoi.label_status, AOI.DownloadStatus.DOWNLOADED)
+        self.assertIsNotNone(self.aoi.label_fetched)
+
+    def test_refetch_upserts_by_osm_id(self):
+        self.run_task()
+        RawDataAPIStandIn.features = RawDataAPIStandIn.features[:5]
+        result, _ = self.run_task()
+
+        self.assertEqual(result.result["labels"], 5)
+        self.assertEqual(
+            sorted(Label.objects.filter(aoi=self.aoi).values_list("osm_id", flat=True)),
+            [1, 2, 3, 4, 5],
+        )
+
+    def test_failed_snapshot_resets_label_status(self):
+        RawDataAPIStandIn.task_status = "FAILED"
+        result, _ = self.run_task()
+
+        self.assertTrue(result.failed())
+        self.aoi.refresh_from_db()
+        self.assertEqual(self.aoi.label_status, AOI.DownloadStatus.NOT_DOWNLOADED)
+        self.assertFalse(Label.objects.filter(aoi=self.aoi).exists())
+
+
+class LabelBBoxQueryTest(TestCase):
+    def setUp(self):
+        user = OsmUser.objects.create(osm_id=1, username="tester")
+        dataset = Dataset.objects.create(name="test dataset", created_by=user)
+        other_dataset = Dataset.objects.create(name="other dataset", created_by=user)
+        self.aoi = AOI.objects.create(
+            dataset=dataset, geom=Polygon.from_bbox(AOI_BOUNDS)
+        )
+        other_aoi = AOI.objects.create(
+            dataset=other_dataset, geom=Polygon.from_bbox(AOI_BOUNDS)
+        )
+        self.dataset = dataset
+        features = [
+            building(i, AOI_BOUNDS[0] + i * 0.00005, AOI_BOUNDS[1] + 0.0001)
+            for i in range(5)
+        ]
+        labels = [
+            Label(
+                aoi=self.aoi,
+                osm_id=f["properties"]["osm_id"],
+                geom=GEOSGeometry(json.dumps(f["geometry"])),
+            )
+            for f in features
+        ]
+        labels.append(
+            Label(aoi=self.aoi, osm_id=10, geom=Point(32.6, 0.36).buffer(0.0001))
+        )
+        labels.append(Label(aoi=other_aoi, osm_id=11, geom=labels[0].geom))
+        Label.objects.bulk_create(labels)
+
+    def get(self, **params):
+        response = self.client.get(reverse("label-bbox"), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_keyset_pages_within_bbox(self):
+        in_bbox = ",".join(str(v) for v in AOI_BOUNDS)
+        osm_ids, after, pages = [], 0, 0
+        while True:
+            data = self.get(
+                in_bbox=in_bbox, aoi__dataset=self.dataset.id, limit=2, after=after
+            )
+            pages += 1
+            osm_ids.extend(f["properties"]["osm_id"] for f in data["features"])
+            self.assertTrue(
+                all(f["properties"]["aoi"] == self.aoi.id for f in data["features"])
+            )
+            if data["next"] is None:
+                break
+            after = data["features"][-1]["id"]
+            self.assertIn(f"after={after}", data["next"])
+        self.assertEqual(osm_ids, [0, 1, 2, 3, 4])
+        self.assertEqual(pages, 3)
+
+    def test_simplifies_relative_to_bbox(self):
+        def vertices(in_bbox, simplify="true"):
+            data = self.get(in_bbox=in_bbox, aoi=self.aoi.id, simplify=simplify)
+            circle = [f for f in data["features"] if f["properties"]["osm_id"] == 10]
+            return len(circle[0]["geometry"]["coordinates"][0])
+
+        close = vertices("32.5998,0.3598,32.6002,0.3602")
+        far = vertices("32.4,0.2,32.8,0.6")
+        self.assertLess(far, close)
+        self.assertGreater(vertices("32.4,0.2,32.8,0.6", simplify="false"), far)
+
+    def test_invalid_bbox(self):
+        response = self.client.get(reverse("label-bbox"), {"in_bbox": "1,2,3"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bbox_lookup_uses_gist_index(self):
+        small_bbox = (32.5885, 0.3481, 32.5886, 0.3482)
+        for query in (label_query, feedback_label_query):
+            plan = query.explain(query.sql(small_bbox, {}, 0, 2, 0.0001))
+            self.assertIn(query.gist_index(), plan)
+
+    def test_invalid_filter(self):
+        in_bbox = ",".join(str(v) for v in AOI_BOUNDS)
+        for name in ("label-bbox", "feedbacklabel-bbox"):
+            response = self.client.get(
+                reverse(name),
+                {
+                    "in_bbox": in_bbox,
+                    "aoi__dataset": "abc",
+                    "feedback_aoi__training": "abc",
+                },
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.streaming)
+
+    @override_settings(LABEL_QUERY_MAX_PAGE_SIZE=10)
+    def test_invalid_limit(self):
+        in_bbox = ",".join(str(v) for v in AOI_BOUNDS)
+        for limit in ("0", "-1", "11", "abc"):
+            response = self.client.get(
+                reverse("label-bbox"), {"in_bbox": in_bbox, "limit": limit}
+            )
+            self.assertEqual(response.status_code, 400, limit)
+        self.assertEqual(len(self.get(in_bbox=in_bbox, limit=10)["features"]), 6)
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "vector_tiles": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+)
+class VectorTileTest(TestCase):
+    tile = {"z": 16, "x": 38700, "y": 32704}  # contains AOI_BOUNDS
+
+    def setUp(self):
+        user = OsmUser.objects.create(osm_id=1, username="tester")
+        self.dataset = Dataset.objects.create(name="test dataset", created_by=user)
+        self.aoi = AOI.objects.create(
+            dataset=self.dataset, geom=Polygon.from_bbox(AOI_BOUNDS)
+        )
+        feature = building(1, AOI_BOUNDS[0] + 0.0001, AOI_BOUNDS[1] + 0.0001)
+        self.label = Label.objects.create(
+            aoi=self.aoi, osm_id=1, geom=GEOSGeometry(json.dumps(feature["geometry"]))
+        )
+
+    def get(self, layer="label-tiles", tile=None, **headers):
+        return self.client.get(
+            reverse(layer, kwargs=tile or self.tile),
+            {"dataset": self.dataset.id},
+            **headers,
+        )
+
+    def test_tiles_with_etag(self):
+        for layer in ("label-tiles", "aoi-tiles"):
+            response = self.get(layer)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response["Content-Type"], "application/vnd.mapbox-vector-tile"
+            )
+            self.assertGreater(len(response.content), 0)
+
+        empty = self.get(tile={"z": 16, "x": 0, "y": 0})
+        self.assertEqual((empty.status_code, empty.content), (200, b""))
+
+        response = self.get()
+        cached = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_if_none_match_lists(self):
+        etag = self.get()["ETag"]
+        for header in (f'"other", {etag}', f"W/{etag}", "*"):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=header).status_code, 304)
+        for header in (f'"{etag[1:-1]}0"', f'"0{etag[1:-1]}"', '"other"'):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=header).status_code, 200)
+
+    def test_renders_without_cache_backend(self):
+        with mock.patch(
+            "core.vector_tiles.tile_cache", side_effect=ConnectionError("redis down")
+        ):
+            response = self.get()
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(len(response.content), 0)
+            self.assertFalse(response.has_header("ETag"))
+
+            response = self.client.delete(
+                reverse("label-detail", args=[self.label.id])
+            )
+            self.assertEqual(response.status_code, 204)
+
+    def test_label_writes_invalidate_tiles(self):
+        etag = self.get()["ETag"]
+        response = self.client.delete(reverse("label-detail", args=[self.label.id]))
+        self.assertEqual(response.status_code, 204)
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_filter_is_required(self):
+        response = self.client.get(reverse("label-tiles", kwargs=self.tile))
+        self.assertEqual(response.status_code, 400)
+
+
+class WorkspaceDownloadTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dataset_dir = os.path.join(self.tmp_dir.name, "dataset_1")
+        os.makedirs(os.path.join(self.dataset_dir, "output", "training_1"))
+        os.makedirs(os.path.join(self.dataset_dir, "input"))
+        self.checkpoint = os.urandom(3 * 1024 * 1024)
+        with open(
+            os.path.join(self.dataset_dir, "output", "training_1", "checkpoint.h5"),
+            "wb",
+        ) as f:
+            f.write(self.checkpoint)
+        with open(os.path.join(self.dataset_dir, "input", "labels.geojson"), "w") as f:
+            f.write('{"type": "FeatureCollection", "features": []}' * 1000)
+        self.settings = override_settings(TRAINING_WORKSPACE=self.tmp_dir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp_dir.cleanup()
+
+    def download(self, lookup_dir, **headers):
+        return self.client.get(f"/api/v1/workspace/download/{lookup_dir}/", **headers)
+
+    def test_directory_is_streamed_as_zip(self):
+        response = self.download("dataset_1")
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(
+                zf.read("output/training_1/checkpoint.h5"), self.checkpoint
+            )
+            self.assertIn("input/labels.geojson", zf.namelist())
+
+    def test_file_range_requests(self):
+        path = "dataset_1/output/training_1/checkpoint.h5"
+        response = self.download(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response = self.download(path, HTTP_RANGE="bytes=1048576-")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"],
+            f"bytes 1048576-{len(self.checkpoint) - 1}/{len(self.checkpoint)}",
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content), self.checkpoint[1048576:]
+        )
+
+        response = self.download(path, HTTP_RANGE=f"bytes={len(self.checkpoint)}-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_outside_workspace_is_not_served(self):
+        self.assertEqual(self.download("..%2F..%2Fetc").status_code, 404)
+
+
+class StreamingGeojsonParserTest(SimpleTestCase):
+    """Parsing memory should stay flat regardless of snapshot size"""
+
+    n_features = 250_000  # ~300 MB of uncompressed geojson
+    note = "x" * 1000  # padding , keeps feature count and test time down
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp_dir.name, "snapshot.zip")
+        with zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("clipping_boundary.geojson", "{}")
+            with zf.open("snapshot.geojson", "w", force_zip64=True) as f:
+                f.write(b'{"type": "FeatureCollection", "features": [')
+                for i in range(self.n_features):
+                    if i:
+                        f.write(b",")
+                    feature = building(i + 1, 85.3 + i * 1e-7, 27.7 + i * 1e-7)
+                    feature["properties"]["tags"]["note"] = self.note
+                    f.write(json.dumps(feature).encode())
+                f.write(b"]}")
+            self.uncompressed_size = zf.getinfo("snapshot.geojson").file_size
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_memory_stays_constant(self):
+        self.assertGreater(self.uncompressed_size, 200 * 1024**2)
+        with zipfile.ZipFile(self.zip_path) as zf:
+            self.assertEqual(find_geojson_member(zf), "snapshot.geojson")
+            with zf.open("snapshot.geojson") as f:
+                tracemalloc.start()
+                count = 0
+                for feature in iter_geojson_features(f):
+                    count += 1
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+        self.assertEqual(count, self.n_features)
+        self.assertEqual(feature["properties"]["osm_id"], self.n_features)
+        self.assertIsInstance(feature["geometry"]["coordinates"][0][0][0], float)
+        self.assertLess(peak, 16 * 1024**2)
+
+
+class ModelCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.loaded = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def checkpoint(self, name):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(b"0" * 10)
+        return path
+
+    def loader(self, model_path):
+        self.loaded.append(model_path)
+        return object()
+
+    def test_hit_miss_and_lru_eviction(self):
+        cache = ModelCache(max_bytes=20, loader=self.loader)
+        first, second, third = (self.checkpoint(f"{i}.tflite") for i in range(3))
+
+        model = cache.get(1, first)
+        self.assertIs(cache.get(1, first), model)
+        cache.get(2, second)
+        cache.get(1, first)  # 2 becomes least recently used
+        cache.get(3, third)
+
+        stats = cache.stats()
+        self.assertEqual(stats["models"], [1, 3])
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 3))
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["loads"], 3)
+        self.assertEqual(self.loaded, [first, second, third])
+
+    def test_reloads_when_checkpoint_changes(self):
+        cache = ModelCache(max_bytes=100, loader=self.loader)
+        path = self.checkpoint("checkpoint.tflite")
+        model = cache.get(1, path)
+        os.utime(path, (0, os.path.getmtime(path) + 10))
+
+        self.assertIsNot(cache.get(1, path), model)
+        self.assertEqual(cache.stats()["models"], [1])
+
+
+class TileCacheTest(SimpleTestCase):
+    source = "https://tiles.example.org/{z}/{x}/{y}"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = TileCache(os.path.join(self.tmp_dir.name, "cache"), max_bytes=30)
+        self.fetched = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fetch(self, content=b"0" * 10):
+        self.fetched.append(content)
+        return content
+
+    def test_hit_after_miss(self):
+        first = self.cache.get(self.source, 19, 1, 2, self.fetch)
+        second = self.cache.get(self.source, 19, 1, 2, self.fetch)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.fetched), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertNotEqual(first, self.cache.path(self.source, 19, 2, 1))
+
+    def test_unavailable_tile_is_not_cached(self):
+        self.assertIsNone(self.cache.get(self.source, 19, 1, 2, lambda: None))
+        self.assertFalse(os.path.exists(self.cache.path(self.source, 19, 1, 2)))
+
+    def test_evicts_least_recently_used(self):
+        paths = [self.cache.get(self.source, 19, x, 0, self.fetch) for x in range(3)]
+        for i, path in enumerate(paths):
+            os.utime(path, (i, i))
+        self.cache.get(self.source, 19, 0, 0, self.fetch)  # touch oldest
+        self.cache.get(self.source, 19, 3, 0, self.fetch)
+
+        # trimmed to 90% of max size , oldest first
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertFalse(os.path.exists(paths[2]))
+        self.assertEqual(self.cache.evictions, 2)
+        self.assertEqual(self.cache.scan_size(), 20)
+
+    def test_download_imagery_reads_through_cache(self):
+        base_path = os.path.join(self.tmp_dir.name, "input")
+        os.makedirs(base_path)
+        with mock.patch("core.imagery.fetch_tile", return_value=b"png") as fetch_tile:
+            download_imagery([10, 21], [11, 20], 19, base_path, self.source, self.cache)
+            download_imagery([10, 21], [11, 20], 19, base_path, self.source, self.cache)
+
+        self.assertEqual(fetch_tile.call_count, 4)
+        self.assertEqual(
+            sorted(os.listdir(base_path)),
+            [
+                "OAM-10-20-19.png",
+                "OAM-10-21-19.png",
+                "OAM-11-20-19.png",
+                "OAM-11-21-19.png",
+            ],
+        )
+
+    def test_tile_url_negative_tms(self):
+        url, name = tile_url("https://tiles.example.org/{z}/{x}/{-y}", 1, 0, 2)
+        self.assertEqual(url, "https://tiles.example.org/2/1/3")
+        self.assertEqual(name, "OAM-1-3-2")
+
+
+class FlakyTileServer(BaseHTTPRequestHandler):
+    """Fails first request of every tile and tracks concurrent requests"""
+
+    lock = threading.Lock()
+    seen = set()
+    active = 0
+    max_active = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+            first = self.path not in cls.seen
+            cls.seen.add(self.path)
+        time.sleep(0.01)
+        with cls.lock:
+            cls.active -= 1
+        self.send_response(503 if first else 200)
+        self.send_header("Content-Length", "3")
+        self.end_headers()
+        self.wfile.write(b"png")
+
+
+class TileDownloaderTest(SimpleTestCase):
+    def setUp(self):
+        FlakyTileServer.seen = set()
+        FlakyTileServer.max_active = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyTileServer)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.source = f"http://127.0.0.1:{self.server.server_port}/{{z}}/{{x}}/{{y}}"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = TileCache(os.path.join(self.tmp_dir.name, "cache"), 1024**2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_retries_limits_per_host_and_skips_existing(self):
+        base_path = self.tmp_dir.name
+        jobs = [
+            ([0, 3], [3, 0], 19, base_path, self.source),
+            ([0, 3], [3, 0], 20, base_path, self.source),
+        ]
+        downloader = TileDownloader(
+            cache=self.cache, max_workers=8, per_host=2, retries=2, backoff=0
+        )
+        report = downloader.download(jobs)
+
+        self.assertEqual((report["downloaded"], report["failed"]), (32, 0))
+        self.assertEqual(len(report["paths"]), 32)
+        self.assertLessEqual(FlakyTileServer.max_active, 2)
+
+        report = downloader.download(jobs)
+        self.assertEqual((report["downloaded"], report["skipped"]), (0, 32))
+
+
+class DatasetBuilderTest(SimpleTestCase):
+    source = "https://tiles.example.org/{z}/{x}/{y}"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.build_path = os.path.join(self.tmp_dir.name, "dataset_1")
+        self.cache = TileCache(os.path.join(self.tmp_dir.name, "cache"), 1024**2)
+        self.aois = [AOI(id=1, geom=Polygon.from_bbox(AOI_BOUNDS))]
+        self.features = [building(1, 32.5886, 0.3482), building(2, 32.5887, 0.3485)]
+        self.georeferenced = []
+        self.rasterized = []
+        patches = [
+            mock.patch("core.imagery.fetch_tile", return_value=b"png"),
+            mock.patch("core.dataset_build.georeference", self.georeference),
+            mock.patch("core.dataset_build.preprocess", self.preprocess),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def staged(self, input_path):
+        return sorted(
+            name[:-4] for name in os.listdir(input_path) if name.endswith(".png")
+        )
+
+    def georeference(self, input_path, output_path):
+        os.makedirs(output_path)
+        for name in self.staged(input_path):
+            self.georeferenced.append(name)
+            open(os.path.join(output_path, f"{name}.tif"), "w").close()
+
+    def preprocess(self, input_path, output_path, **kwargs):
+        self.assertFalse(kwargs["georeference_images"])
+        for sub_dir in ("labels", "binarymasks"):
+            os.makedirs(os.path.join(output_path, sub_dir))
+        for name in self.staged(input_path):
+            self.rasterized.append(name)
+            open(os.path.join(output_path, "labels", f"{name}.geojson"), "w").close()
+            open(
+                os.path.join(output_path, "binarymasks", f"{name}.mask.tif"), "w"
+            ).close()
+
+    def build(self):
+        self.georeferenced, self.rasterized = [], []
+        labels = {"type": "FeatureCollection", "features": self.features}
+        builder = DatasetBuilder(
+            self.build_path,
+            self.source,
+            [19, 20],
+            self.aois,
+            labels,
+            downloader=TileDownloader(cache=self.cache),
+        )
+        return builder, builder.build()
+
+    def test_rebuilds_only_changed_tiles(self):
+        builder, report = self.build()
+        tiles = sorted(os.listdir(os.path.join(builder.preprocessed_path, "chips")))
+        self.assertEqual(report["downloaded"], len(tiles))
+        self.assertEqual((report["chips"], report["masks"]), (len(tiles), len(tiles)))
+
+        _, report = self.build()
+        self.assertTrue(report["unchanged"])
+        self.assertEqual((self.georeferenced, self.rasterized), ([], []))
+
+        # moving one label only rasterizes the tiles it left and entered again
+        self.features[1] = building(2, 32.58885, 0.34865)
+        _, report = self.build()
+        self.assertFalse(report["unchanged"])
+        self.assertEqual((report["downloaded"], report["chips"]), (0, 0))
+        self.assertGreater(len(self.rasterized), 0)
+        self.assertLess(len(self.rasterized), len(tiles))
+
+        # shrinking aoi removes tiles outside of it
+        self.aois[0].geom = Polygon.from_bbox((32.5885, 0.3481, 32.5886, 0.3482))
+        builder, report = self.build()
+        self.assertGreater(report["removed"], 0)
+        self.assertEqual(report["downloaded"], 0)
+        for sub_dir in ("chips", "binarymasks", "labels"):
+            self.assertEqual(
+                len(os.listdir(os.path.join(builder.preprocessed_path, sub_dir))),
+                len(tiles) - report["removed"],
+            )
+        self.assertEqual(
+            len(os.listdir(builder.input_path)), len(tiles) - report["removed"] + 1
+        )
@@ -22,6 +22,7 @@ from .views import (
     TrainingViewSet,
     TrainingWorkspaceDownloadView,
     TrainingWorkspaceView,
+    VectorTileView,
     download_training_data,
     geojson2osmconverter,
     publish_training,
@@ -42,6 +43,21 @@ router.register(r"feedback-label", FeedbackLabelViewset)
 
 urlpatterns = [
     path("", include(router.urls)),
+    path(
+        "label/tiles/<int:z>/<int:x>/<int:y>.pbf",
+        VectorTileView.as_view(layer="label"),
+        name="label-tiles",
+    ),
+    path(
+        "aoi/tiles/<int:z>/<int:x>/<int:y>.pbf",
+        VectorTileView.as_view(layer="aoi"),
+        name="aoi-tiles",
+    ),
+    path(
+        "feedback-label/tiles/<int:z>/<int:x>/<int:y>.pbf",
+        VectorTileView.as_view(layer="feedback-label"),
+        name="feedback-label-tiles",
+    ),
     path("label/osm/fetch/<int:aoi_id>/", RawdataApiAOIView.as_view()),
     path(
         "label/feedback/osm/fetch/<int:feedbackaoi_id>/",
@@ -11,13 +11,21 @@ from uuid import uuid4
 from xml.dom import ValidationErr
 from zipfile import ZipFile
 
+import ijson
 import requests
 from django.conf import settings
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry
+from django.db import transaction
 from gpxpy.gpx import GPX, GPXTrack, GPXTrackSegment, GPXWaypoint
 from tqdm import tqdm
 
 from .models import AOI, FeedbackAOI, FeedbackLabel, Label
 from .serializers import FeedbackLabelSerializer, LabelSerializer
+from .vector_tiles import invalidate_vector_tiles
+
+
+RAWDATA_CHUNK_SIZE = 1024 * 1024  # stream raw data api downloads to disk 1 MB at a time
 
 
 def get_dir_size(directory):
@@ -77,12 +85,14 @@ class RawDataAPI:
         response.raise_for_status()
         return response.json()
 
-    def poll_task_status(self, task_link):
+    def poll_task_status(self, task_link, progress=None):
         stop_loop = False
         while not stop_loop:
             check_result = requests.get(url=f"{self.BASE_API_URL}{task_link}")
             check_result.raise_for_status()
             res = check_result.json()
+            if progress:
+                progress("snapshot", status=res["status"])
             if res["status"] == "SUCCESS" or res["status"] == "FAILED":
                 stop_loop = True
             time.sleep(1)
@@ -92,11 +102,12 @@ class RawDataAPI:
 import logging
 
 
-def request_rawdata(geometry):
+def request_rawdata(geometry, progress=None):
     """will make call to Raw Data API & provides response as json
 
     Args:
         geometry (dict): geometry to request
+        progress (callable, optional): called as progress(phase, **info) while polling
 
     Raises:
         ImportError: If raw data api url is not exists
@@ -110,7 +121,7 @@ def request_rawdata(geometry):
     snapshot_data = api.request_snapshot(geometry)
     task_link = snapshot_data["track_link"]
     logging.info("Fetching latest OSM snapshot")
-    task_result = api.poll_task_status(task_link)
+    task_result = api.poll_task_status(task_link, progress=progress)
     logging.info(f"Fetch Task result: {task_result['status']}")
     if task_result["status"] != "SUCCESS":
         raise RuntimeError(
@@ -120,14 +131,48 @@ def request_rawdata(geometry):
     return snapshot_url
 
 
-def process_rawdata(file_download_url, aoi_id, feedback=False):
-    """This will create temp directory , Downloads file from URL provided,
-    Unzips it Finds a geojson file , Process it and finally removes
-    processed Geojson file and downloaded zip file from Directory"""
+def find_geojson_member(zip_obj):
+    """Finds osm data geojson inside raw data api zip , skipping clipping boundary
+
+    Raises:
+        ValueError: If zip doesn't contain any geojson
+    """
+    for file_name in zip_obj.namelist():
+        if (
+            file_name.endswith(".geojson")
+            and os.path.basename(file_name) != "clipping_boundary.geojson"
+        ):
+            return file_name
+    raise ValueError("No geojson found in Raw Data API response")
+
+
+def iter_geojson_features(geojson_file):
+    """Yields features one by one from geojson file object without loading
+    whole file into memory
+
+    Args:
+        geojson_file (file): binary file object of geojson featurecollection
+
+    Yields:
+        dict: geojson feature
+    """
+    # use_float keeps coordinates as float instead of Decimal so they can be dumped back to json
+    yield from ijson.items(geojson_file, "features.item", use_float=True)
+
+
+def process_rawdata(file_download_url, aoi_id, feedback=False, progress=None):
+    """This will create temp directory , Streams file from URL provided
+    to disk , Finds a geojson file inside zip and processes it feature by feature
+    without extracting it , finally removes downloaded zip file from Directory
+
+    Returns:
+        int: No of labels written
+    """
+    if progress:
+        progress("downloading")
     headers = {
         'Referer': 'https://fair-dev.hotosm.org/' # TODO : Use request uri 
     }
-    r = requests.get(file_download_url, headers=headers)
     # Check whether the export path exists or not
     path = "temp/"
     isExist = os.path.exists(path)
@@ -135,25 +180,23 @@ def process_rawdata(file_download_url, aoi_id, feedback=False):
         # Create a exports directory because it does not exist
         os.makedirs(path)
     file_temp_path = os.path.join(path, f"{str(uuid4())}.zip")  # unique
-    open(file_temp_path, "wb").write(r.content)
-    with ZipFile(file_temp_path, "r") as zipObj:
-        # Get a list of all archived file names from the zip
-        listOfFileNames = zipObj.namelist()
-        # Iterate over the file names
-        geojson_file_path = f"""{path}/geojson/"""
-
-        for fileName in listOfFileNames:
-            # Check filename endswith csv
-            if fileName.endswith(".geojson"):
-                if fileName != "clipping_boundary.geojson":
-                    # Extract a single file from zip
-                    zipObj.extract(fileName, geojson_file_path)
-                    print(f"""Geojson file{fileName} from API wrote to disk""")
-                    break
-        geojson_file = f"""{geojson_file_path}{fileName}"""
-        process_geojson(geojson_file, aoi_id, feedback)
-    remove_file(file_temp_path)
-    remove_file(geojson_file)
+    try:
+        with requests.get(file_download_url, headers=headers, stream=True) as r:
+            r.raise_for_status()
+            with open(file_temp_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=RAWDATA_CHUNK_SIZE):
+                    f.write(chunk)
+        with ZipFile(file_temp_path, "r") as zipObj:
+            file_name = find_geojson_member(zipObj)
+            print(f"""Processing Geojson file {file_name} from API""")
+            with zipObj.open(file_name) as geojson_file:
+                written = process_geojson(
+                    geojson_file, aoi_id, feedback, progress=progress
+                )
+    finally:
+        if os.path.exists(file_temp_path):
+            remove_file(file_temp_path)
+    return written
 
 
 def remove_file(path: str) -> None:
@@ -228,14 +271,137 @@ def process_feature(feature, aoi_id, foreign_key_id, feedback=False):
         raise ValidationErr(label.errors)
 
 
-def process_geojson(geojson_file_path, aoi_id, feedback=False):
+def build_label(feature, aoi_id, feedback=False):
+    """Builds unsaved Label / FeedbackLabel instance from raw data api feature
+
+    Args:
+        feature (dict): geojson feature with osm_id and tags in properties
+        aoi_id (int): AOI / FeedbackAOI id label belongs to
+        feedback (bool, optional): Build FeedbackLabel instead. Defaults to False.
+
+    Label.geom takes any geometry , like multipolygon building relations of
+    snapshots , and invalid geometries such as self intersecting ways are kept as
+    is , same as the serializer saves accepted them
+
+    Raises:
+        ValidationErr: If geometry can't be parsed , or is not a Polygon for
+            FeedbackLabel whose geom is a PolygonField
+
+    Returns:
+        Label | FeedbackLabel: unsaved instance
+    """
+    properties = feature["properties"]
+    try:
+        geom = GEOSGeometry(json.dumps(feature["geometry"]), srid=4326)
+    except (ValueError, TypeError, GDALException, GEOSException) as ex:
+        raise ValidationErr(f"Invalid geometry for osm_id {properties['osm_id']}: {ex}")
+    if feedback:
+        if geom.geom_type != "Polygon":
+            raise ValidationErr(
+                f"Expected Polygon for osm_id {properties['osm_id']}, got {geom.geom_type}"
+            )
+        return FeedbackLabel(
+            osm_id=int(properties["osm_id"]),
+            tags=properties["tags"],
+            geom=geom,
+            feedback_aoi_id=aoi_id,
+        )
+    return Label(
+        osm_id=int(properties["osm_id"]),
+        tags=properties["tags"],
+        geom=geom,
+        aoi_id=aoi_id,
+    )
+
+
+def write_label_batch(labels, foreign_key_id, feedback=False):
+    """Upserts batch of labels by osm_id , Removes existing rows with same osm_id
+    on the dataset / training and inserts the batch in one statement
+
+    Args:
+        labels (dict): {osm_id: unsaved label instance}
+        foreign_key_id : Dataset for labels / Training for feedback labels
+
+    Returns:
+        int: rows written
+    """
+    osm_ids = list(labels.keys())
+    if feedback:
+        FeedbackLabel.objects.filter(
+            osm_id__in=osm_ids, feedback_aoi__training=foreign_key_id
+        ).delete()
+        FeedbackLabel.objects.bulk_create(labels.values(), batch_size=len(labels))
+    else:
+        Label.objects.filter(osm_id__in=osm_ids, aoi__dataset=foreign_key_id).delete()
+        Label.objects.bulk_create(labels.values(), batch_size=len(labels))
+    return len(labels)
+
+
+def bulk_process_features(
+    features,
+    aoi_id,
+    foreign_key_id,
+    feedback=False,
+    batch_size=None,
+    progress=None,
+    total=None,
+):
+    """Writes features to database in batches instead of one serializer save
+    per feature , Duplicate osm_id keeps the last feature like per feature path
+
+    Args:
+        features (iterable): geojson features
+        aoi_id (int): AOI / FeedbackAOI id
+        foreign_key_id : Dataset for labels / Training for feedback labels
+        feedback (bool, optional): Defaults to False.
+        batch_size (int, optional): Defaults to settings.LABEL_INGEST_BATCH_SIZE
+        progress (callable, optional): called as progress("processing", processed=, total=)
+            after every batch
+        total (int, optional): No of features if known , only used for progress
+
+    Returns:
+        int: rows written
+    """
+    batch_size = batch_size or settings.LABEL_INGEST_BATCH_SIZE
+    written = 0
+    batch = {}
+    for feature in features:
+        label = build_label(feature, aoi_id, feedback)
+        batch[label.osm_id] = label
+        if len(batch) >= batch_size:
+            written += write_label_batch(batch, foreign_key_id, feedback)
+            batch = {}
+            if progress:
+                progress("processing", processed=written, total=total)
+    if batch:
+        written += write_label_batch(batch, foreign_key_id, feedback)
+        if progress:
+            progress("processing", processed=written, total=total)
+    return written
+
+
+def invalidate_tile_scope(foreign_key_id, feedback=False):
+    """Drops cached vector tiles of dataset / training labels were written to"""
+    if feedback:
+        invalidate_vector_tiles(training_id=foreign_key_id.id)
+    else:
+        invalidate_vector_tiles(dataset_id=foreign_key_id.id)
+
+
+def process_geojson(
+    geojson_file_path, aoi_id, feedback=False, bulk=True, progress=None
+):
     """Responsible for Processing Geojson file from directory ,
         Opens the file reads the record , Checks either record
         present or not if not inserts into database
 
     Args:
-        geojson_file_path (_type_): _description_
+        geojson_file_path (str | file): path or binary file object of geojson ,
+            bulk mode streams features from it
         aoi_id (_type_): _description_
+        bulk (bool, optional): Write labels in batches inside one transaction,
+            False falls back to per feature serializer saves. Defaults to True.
+        progress (callable, optional): progress callback for bulk mode
 
     Raises:
         ValidationErr: _description_
@@ -245,6 +411,33 @@ def process_geojson(geojson_file_path, aoi_id, feedback=False):
         foreign_key_id = FeedbackAOI.objects.get(id=aoi_id).training
     else:
         foreign_key_id = AOI.objects.get(id=aoi_id).dataset
+
+    if bulk:
+        geojson_file = (
+            open(geojson_file_path, "rb")
+            if isinstance(geojson_file_path, (str, os.PathLike))
+            else geojson_file_path
+        )
+        try:
+            with transaction.atomic():
+                if feedback:
+                    FeedbackLabel.objects.filter(feedback_aoi__id=aoi_id).delete()
+                else:
+                    Label.objects.filter(aoi__id=aoi_id).delete()
+                written = bulk_process_features(
+                    iter_geojson_features(geojson_file),
+                    aoi_id,
+                    foreign_key_id,
+                    feedback,
+                    progress=progress,
+                )
+        finally:
+            if geojson_file is not geojson_file_path:
+                geojson_file.close()
+        invalidate_tile_scope(foreign_key_id, feedback)
+        print(f"writing to database finished , {written} labels written")
+        return written
+
     max_workers = (
         (os.cpu_count() - 1) if os.cpu_count() != 1 else 1
     )  # leave one cpu free always
@@ -266,4 +459,6 @@ def process_geojson(geojson_file_path, aoi_id, feedback=False):
             for f in tqdm(futures, total=len(data["features"])):
                 f.result()
 
+    invalidate_tile_scope(foreign_key_id, feedback)
     print("writing to database finished")
+    return len(data["features"])
@@ -0,0 +1,217 @@
+"""Mapbox vector tiles of labels , aois and feedback labels rendered in PostGIS
+
+Rendered tiles are kept in the vector_tiles cache under a generation of the dataset
+( or training for feedback labels ) they belong to. Writing labels or aois replaces
+the generation so cached tiles and ETags of that dataset / training go stale at once.
+When the cache backend is unavailable tiles are rendered on every request without
+an ETag
+"""
+
+import hashlib
+import logging
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils.http import parse_etags
+from rest_framework.exceptions import ValidationError
+
+from .models import AOI, FeedbackAOI, FeedbackLabel, Label
+
+logger = logging.getLogger(__name__)
+
+EXTENT = 4096
+BUFFER = 64
+MAX_ZOOM = 24
+
+
+def tile_cache():
+    return caches["vector_tiles"]
+
+
+def generation(scope):
+    """Current generation of scope like dataset:1 , created on first use , None
+    when the cache backend is unavailable"""
+    key = f"vector-tiles:{scope}"
+    try:
+        cache = tile_cache()
+        value = cache.get(key)
+        if value is None:
+            cache.add(key, uuid4().hex, None)
+            value = cache.get(key)
+    except Exception as ex:  # a stale generation could give wrong 304s , don't cache
+        logger.warning(f"Vector tile generation of {scope} unavailable : {ex}")
+        return None
+    return value
+
+
+def etag_matches(etag, if_none_match):
+    """Whether If-None-Match header lists etag , weak comparison as RFC 9110
+    asks for If-None-Match"""
+    etags = parse_etags(if_none_match)
+    if etags == ["*"]:
+        return True
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in etags)
+
+
+def invalidate_vector_tiles(dataset_id=None, training_id=None):
+    """Drops cached tiles of dataset and / or training , call after writing
+    labels , feedback labels or aois"""
+    scopes = []
+    if dataset_id is not None:
+        scopes.append(f"dataset:{dataset_id}")
+    if training_id is not None:
+        scopes.append(f"training:{training_id}")
+    for scope in scopes:
+        try:
+            tile_cache().set(f"vector-tiles:{scope}", uuid4().hex, None)
+        except Exception as ex:  # data is already written , tiles expire on timeout
+            logger.error(f"Vector tile invalidation of {scope} failed : {ex}")
+
+
+class VectorTileLayer:
+    """One MVT layer of a table
+
+    Args:
+        name (str): layer name inside the tile
+        model: model of the table
+        columns (str): sql select list of feature properties , id is the feature id
+        filters (dict): query param -> (sql condition , scope lookup) where scope
+            lookup gives dataset:id / training:id tiles are cached under
+    """
+
+    def __init__(self, name, model, columns, filters):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.filters = filters
+
+    def params(self, z, x, y, query_params):
+        """Validates tile address and gives filters of request as ints"""
+        if z > MAX_ZOOM or x >= 2**z or y >= 2**z:
+            raise ValidationError(f"Tile {z}/{x}/{y} is out of range")
+        params = {}
+        for name in self.filters:
+            value = query_params.get(name)
+            if value in (None, ""):
+                continue
+            try:
+                params[name] = int(value)
+            except ValueError:
+                raise ValidationError({name: "Expected an integer"})
+        if not params:
+            raise ValidationError(
+                f"Filter by one of {', '.join(self.filters)} is required"
+            )
+        return params
+
+    def scope(self, params):
+        name = sorted(params)[0]
+        return self.filters[name][1](params[name])
+
+    def cache_key(self, z, x, y, params):
+        """Key of tile under current generation of its scope , None when tiles
+        can't be cached"""
+        filters = "&".join(f"{name}={params[name]}" for name in sorted(params))
+        scope = self.scope(params)
+        current = generation(scope)
+        if current is None:
+            return None
+        return f"vector-tiles:{self.name}:{scope}:{current}:{z}/{x}/{y}?{filters}"
+
+    def etag(self, cache_key):
+        return f'"{hashlib.sha1(cache_key.encode()).hexdigest()}"'
+
+    def render(self, z, x, y, params):
+        conditions = [self.filters[name][0] for name in sorted(params)]
+        args = [z, x, y, EXTENT, BUFFER]
+        args.extend(params[name] for name in sorted(params))
+        args.extend([self.name, EXTENT])
+        query = f"""
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(%s, %s, %s) AS geom
+            ),
+            features AS (
+                SELECT ST_AsMVTGeom(ST_Transform(t.geom, 3857), bounds.geom, %s, %s, true) AS geom,
+                    {self.columns}
+                FROM {self.model._meta.db_table} t, bounds
+                WHERE t.geom && ST_Transform(bounds.geom, 4326)
+                    AND {" AND ".join(conditions)}
+            )
+            SELECT ST_AsMVT(features.*, %s, %s, 'geom', 'id') FROM features
+            WHERE geom IS NOT NULL
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(query, args)
+            tile = cursor.fetchone()[0]
+        return bytes(tile) if tile is not None else b""
+
+    def tile(self, z, x, y, params, cache_key=None):
+        """Gives tile as bytes from cache , renders it on miss or when the cache
+        backend is unavailable"""
+        cache_key = cache_key or self.cache_key(z, x, y, params)
+        if cache_key is None:
+            return self.render(z, x, y, params)
+        try:
+            tile = tile_cache().get(cache_key)
+        except Exception as ex:
+            logger.warning(f"Vector tile cache read failed : {ex}")
+            return self.render(z, x, y, params)
+        if tile is None:
+            tile = self.render(z, x, y, params)
+            try:
+                tile_cache().set(cache_key, tile, settings.VECTOR_TILE_CACHE_TIMEOUT)
+            except Exception as ex:
+                logger.warning(f"Vector tile cache write failed : {ex}")
+        return tile
+
+
+def aoi_scope(aoi_id):
+    dataset_id = (
+        AOI.objects.filter(id=aoi_id).values_list("dataset_id", flat=True).first()
+    )
+    return f"dataset:{dataset_id}"
+
+
+def feedback_aoi_scope(feedback_aoi_id):
+    training_id = (
+        FeedbackAOI.objects.filter(id=feedback_aoi_id)
+        .values_list("training_id", flat=True)
+        .first()
+    )
+    return f"training:{training_id}"
+
+
+vector_tile_layers = {
+    "label": VectorTileLayer(
+        "label",
+        Label,
+        "t.id, t.osm_id, t.aoi_id AS aoi, t.tags",
+        {
+            "aoi": ("t.aoi_id = %s", aoi_scope),
+            "dataset": (
+                f"t.aoi_id IN (SELECT id FROM {AOI._meta.db_table} WHERE dataset_id = %s)",
+                lambda dataset_id: f"dataset:{dataset_id}",
+            ),
+        },
+    ),
+    "aoi": VectorTileLayer(
+        "aoi",
+        AOI,
+        "t.id, t.dataset_id AS dataset",
+        {"dataset": ("t.dataset_id = %s", lambda dataset_id: f"dataset:{dataset_id}")},
+    ),
+    "feedback-label": VectorTileLayer(
+        "feedback-label",
+        FeedbackLabel,
+        "t.id, t.osm_id, t.feedback_aoi_id AS feedback_aoi, t.tags",
+        {
+            "feedback_aoi": ("t.feedback_aoi_id = %s", feedback_aoi_scope),
+            "training": (
+                f"t.feedback_aoi_id IN (SELECT id FROM {FeedbackAOI._meta.db_table} WHERE training_id = %s)",
+                lambda training_id: f"training:{training_id}",
+            ),
+        },
+    ),
+}
@@ -1,28 +1,24 @@
 from __future__ import absolute_import
 
 import json
-import logging
 import os
-import pathlib
-import shutil
 import subprocess
 import sys
 import time
-import zipfile
-from datetime import datetime
-from tempfile import NamedTemporaryFile
+from operator import attrgetter
 
 import tensorflow as tf
 from celery import current_app
 from celery.result import AsyncResult
 from django.conf import settings
 from django.http import (
-    FileResponse,
     HttpResponse,
     HttpResponseBadRequest,
+    HttpResponseNotModified,
     StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from geojson2osm import geojson2osm
@@ -30,7 +26,6 @@ from login.authentication import OsmAuthentication
 from login.permissions import IsOsmAuthenticated
 from orthogonalizer import othogonalize_poly
 from osmconflator import conflate_geojson
-from predictor import predict
 from rest_framework import decorators, serializers, status, viewsets
 from rest_framework.decorators import api_view
 from rest_framework.exceptions import ValidationError
@@ -38,6 +33,12 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_gis.filters import InBBoxFilter, TMSTileFilter
 
+from .label_query import (
+    feedback_label_query,
+    label_query,
+    parse_bbox,
+    simplify_tolerance,
+)
 from .models import (
     AOI,
     Dataset,
@@ -60,8 +61,12 @@ from .serializers import (
     ModelSerializer,
     PredictionParamSerializer,
 )
-from .tasks import train_model
-from .utils import get_dir_size, gpx_generator, process_rawdata, request_rawdata
+from .downloads import file_response, zip_response
+from .imagery import tile_cache
+from .prediction import get_checkpoint_path, model_cache, predict
+from .tasks import fetch_osm_labels, train_model
+from .utils import get_dir_size, gpx_generator
+from .vector_tiles import etag_matches, invalidate_vector_tiles, vector_tile_layers
 
 
 def home(request):
@@ -169,7 +174,44 @@ class FeedbackViewset(viewsets.ModelViewSet):
     filterset_fields = ["training", "user", "feedback_type"]
 
 
-class FeedbackAOIViewset(viewsets.ModelViewSet):
+class InvalidateVectorTilesMixin:
+    """Invalidates cached vector tiles of dataset / training written objects belong to
+
+    Subclasses set tile_scope to {"dataset_id" | "training_id": attribute path on the
+    instance} , like {"dataset_id": "aoi.dataset_id"} for labels
+    """
+
+    tile_scope = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not cls.tile_scope or set(cls.tile_scope) - {"dataset_id", "training_id"}:
+            raise TypeError(
+                f"{cls.__name__} should set tile_scope to dataset_id and / or training_id"
+            )
+
+    def scope_of(self, instance):
+        return {
+            name: attrgetter(path)(instance) for name, path in self.tile_scope.items()
+        }
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_vector_tiles(**self.scope_of(serializer.instance))
+
+    def perform_update(self, serializer):
+        previous = self.scope_of(serializer.instance)
+        super().perform_update(serializer)
+        invalidate_vector_tiles(**previous)
+        invalidate_vector_tiles(**self.scope_of(serializer.instance))
+
+    def perform_destroy(self, instance):
+        scope = self.scope_of(instance)
+        super().perform_destroy(instance)
+        invalidate_vector_tiles(**scope)
+
+
+class FeedbackAOIViewset(InvalidateVectorTilesMixin, viewsets.ModelViewSet):
     authentication_classes = [OsmAuthentication]
     permission_classes = [IsOsmAuthenticated]
     permission_allowed_methods = ["GET"]
@@ -180,9 +222,43 @@ class FeedbackAOIViewset(viewsets.ModelViewSet):
         "training",
         "user",
     ]
+    tile_scope = {"training_id": "training_id"}
 
 
-class FeedbackLabelViewset(viewsets.ModelViewSet):
+def stream_labels(request, query):
+    bbox = parse_bbox(request.query_params.get("in_bbox"))
+    try:
+        after = int(request.query_params.get("after", 0))
+        limit = int(request.query_params.get("limit", settings.LABEL_QUERY_PAGE_SIZE))
+    except ValueError:
+        raise ValidationError("after and limit should be integers")
+    if not 1 <= limit <= settings.LABEL_QUERY_MAX_PAGE_SIZE:
+        raise ValidationError(
+            {"limit": f"Expected 1 to {settings.LABEL_QUERY_MAX_PAGE_SIZE}"}
+        )
+    simplify = request.query_params.get("simplify", "true").lower() != "false"
+    # built before the response starts , so bad filters are a 400 and not a
+    # truncated 200
+    sql = query.sql(
+        bbox,
+        request.query_params,
+        after,
+        limit,
+        simplify_tolerance(bbox) if simplify else 0,
+    )
+
+    def next_url(last_id):
+        params = request.query_params.copy()
+        params["after"] = last_id
+        return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+    return StreamingHttpResponse(
+        query.stream(sql, limit, next_url=next_url),
+        content_type="application/json",
+    )
+
+
+class FeedbackLabelViewset(InvalidateVectorTilesMixin, viewsets.ModelViewSet):
     authentication_classes = [OsmAuthentication]
     permission_classes = [IsOsmAuthenticated]
     permission_allowed_methods = ["GET"]
@@ -196,6 +272,13 @@ class FeedbackLabelViewset(viewsets.ModelViewSet):
     )
     bbox_filter_include_overlapping = True
     filterset_fields = ["feedback_aoi", "feedback_aoi__training"]
+    tile_scope = {"training_id": "feedback_aoi.training_id"}
+
+    @swagger_auto_schema(responses={status.HTTP_200_OK: "GeoJSON FeatureCollection"})
+    @decorators.action(detail=False, methods=["get"])
+    def bbox(self, request, *args, **kwargs):
+        """Streams feedback labels in ?in_bbox= keyset paginated with simplified geometries , same filters as list"""
+        return stream_labels(request, feedback_label_query)
 
 
 class ModelViewSet(
@@ -209,7 +292,7 @@ class ModelViewSet(
     filterset_fields = ["status"]
 
 
-class AOIViewSet(viewsets.ModelViewSet):
+class AOIViewSet(InvalidateVectorTilesMixin, viewsets.ModelViewSet):
     authentication_classes = [OsmAuthentication]
     permission_classes = [IsOsmAuthenticated]
     permission_allowed_methods = ["GET"]
@@ -217,9 +300,10 @@ class AOIViewSet(viewsets.ModelViewSet):
     serializer_class = AOISerializer  # connecting serializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["dataset"]
+    tile_scope = {"dataset_id": "dataset_id"}
 
 
-class LabelViewSet(viewsets.ModelViewSet):
+class LabelViewSet(InvalidateVectorTilesMixin, viewsets.ModelViewSet):
     authentication_classes = [OsmAuthentication]
     permission_classes = [IsOsmAuthenticated]
     permission_allowed_methods = ["GET"]
@@ -235,6 +319,17 @@ class LabelViewSet(viewsets.ModelViewSet):
         True  # Optional to include overlapping labels in the tile served
     )
     filterset_fields = ["aoi", "aoi__dataset"]
+    tile_scope = {"dataset_id": "aoi.dataset_id"}
+
+    @swagger_auto_schema(responses={status.HTTP_200_OK: "GeoJSON FeatureCollection"})
+    @decorators.action(detail=False, methods=["get"])
+    def bbox(self, request, *args, **kwargs):
+        """Streams labels in ?in_bbox= keyset paginated with simplified geometries , same filters as list
+
+        Use ?after= with id of last label ( given as next url ) for next page , ?limit= for page size
+        and ?simplify=false for full geometries
+        """
+        return stream_labels(request, label_query)
 
     def create(self, request, *args, **kwargs):
         aoi_id = request.data.get("aoi")
@@ -252,12 +347,50 @@ class LabelViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()
+            invalidate_vector_tiles(**self.scope_of(serializer.instance))
             return Response(
                 serializer.data, status=status.HTTP_200_OK
             )  # 200 for update, 201 for create
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class VectorTileView(APIView):
+    """Serves labels , aois or feedback labels as Mapbox vector tiles ,
+    filtered like /label/tiles/{z}/{x}/{y}.pbf?dataset=1
+
+    Filters : label - aoi or dataset , aoi - dataset , feedback-label - feedback_aoi or training.
+    Tiles carry an ETag , send it back as If-None-Match to get 304 until data changes
+    """
+
+    authentication_classes = [OsmAuthentication]
+    permission_classes = [IsOsmAuthenticated]
+    permission_allowed_methods = ["GET"]
+    layer = None
+
+    def get(self, request, z, x, y, *args, **kwargs):
+        layer = vector_tile_layers[self.layer]
+        params = layer.params(z, x, y, request.query_params)
+        cache_key = layer.cache_key(z, x, y, params)
+        if cache_key is None:  # cache backend is down , render without ETag
+            response = HttpResponse(
+                layer.render(z, x, y, params),
+                content_type="application/vnd.mapbox-vector-tile",
+            )
+            patch_cache_control(response, no_cache=True)
+            return response
+        etag = layer.etag(cache_key)
+        if etag_matches(etag, request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                layer.tile(z, x, y, params, cache_key=cache_key),
+                content_type="application/vnd.mapbox-vector-tile",
+            )
+        response["ETag"] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
 class RawdataApiFeedbackView(APIView):
     authentication_classes = [OsmAuthentication]
     permission_classes = [IsOsmAuthenticated]
@@ -270,24 +403,13 @@ class RawdataApiFeedbackView(APIView):
             feedbackaoi_id (_type_): _description_
 
         Returns:
-            status: Success/Failed
+            task_id: poll progress on /training/status/<task_id>/
         """
         obj = get_object_or_404(FeedbackAOI, id=feedbackaoi_id)
-        try:
-            obj.label_status = 0
-            obj.save()
-            file_download_url = request_rawdata(obj.geom.geojson)
-            process_rawdata(file_download_url, feedbackaoi_id, feedback=True)
-            obj.label_status = 1
-            obj.label_fetched = datetime.utcnow()
-            obj.save()
-            return Response("Success", status=status.HTTP_201_CREATED)
-        except Exception as ex:
-            obj.label_status = -1
-            obj.save()
-            # raise ex
-            logging.error(ex)
-            return Response("OSM Fetch Failed", status=500)
+        obj.label_status = FeedbackAOI.DownloadStatus.RUNNING
+        obj.save()
+        task = fetch_osm_labels.delay(aoi_id=obj.id, feedback=True)
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
 
 
 class RawdataApiAOIView(APIView):
@@ -302,23 +424,13 @@ class RawdataApiAOIView(APIView):
             aoi_id (_type_): _description_
 
         Returns:
-            status: Success/Failed
+            task_id: poll progress on /training/status/<task_id>/
         """
         obj = get_object_or_404(AOI, id=aoi_id)
-        try:
-            obj.label_status = 0
-            obj.save()
-            file_download_url = request_rawdata(obj.geom.geojson)
-            process_rawdata(file_download_url, aoi_id)
-            obj.label_status = 1
-            obj.label_fetched = datetime.utcnow()
-            obj.save()
-            return Response("Success", status=status.HTTP_201_CREATED)
-        except Exception as ex:
-            obj.label_status = -1
-            obj.save()
-            # raise ex
-            return Response("OSM Fetch Failed", status=500)
+        obj.label_status = AOI.DownloadStatus.RUNNING
+        obj.save()
+        task = fetch_osm_labels.delay(aoi_id=obj.id)
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
 
 
 @api_view(["GET"])
@@ -330,30 +442,10 @@ def download_training_data(request, dataset_id: int):
     file_path = os.path.join(
         settings.TRAINING_WORKSPACE, f"dataset_{dataset_id}", "input"
     )
-    zip_temp_path = os.path.join(
-        settings.TRAINING_WORKSPACE, f"dataset_{dataset_id}.zip"
-    )
-    directory = pathlib.Path(file_path)
-    if os.path.exists(directory):
-        zf = zipfile.ZipFile(zip_temp_path, "w", zipfile.ZIP_DEFLATED)
-        for file_path in directory.iterdir():
-            zf.write(file_path, arcname=file_path.name)
-        zf.close()
-        if os.path.exists(zip_temp_path):
-            response = HttpResponse(open(zip_temp_path, "rb"))
-            response.headers["Content-Type"] = "application/x-zip-compressed"
-
-            response.headers[
-                "Content-Disposition"
-            ] = f"attachment; filename=training_{dataset_id}_all_data.zip"
-            return response
-        else:
-            # "error": "File Doesn't Exist or has been cleared up from system",
-            return HttpResponse(status=204)
-
-    else:
-        # "error": "Dataset haven't been downloaded or doesn't exist",
-        return HttpResponse(status=204)
+    if os.path.isdir(file_path):
+        return zip_response(file_path, f"training_{dataset_id}_all_data.zip")
+    # "error": "Dataset haven't been downloaded or doesn't exist",
+    return HttpResponse(status=204)
 
 
 @api_view(["POST"])
@@ -523,32 +615,12 @@ class PredictionView(APIView):
             zoom_level = deserialized_data["zoom_level"]
             try:
                 start_time = time.time()
-                model_path = os.path.join(
-                    settings.TRAINING_WORKSPACE,
-                    f"dataset_{model_instance.dataset.id}",
-                    "output",
-                    f"training_{training_instance.id}",
-                    "checkpoint.tflite",
+                model_path = get_checkpoint_path(
+                    model_instance.dataset.id, training_instance.id
                 )
-                # give high priority to tflite model format if not avilable fall back to .h5 if not use default .tf
-                if not os.path.exists(model_path):
-                    model_path = os.path.join(
-                        settings.TRAINING_WORKSPACE,
-                        f"dataset_{model_instance.dataset.id}",
-                        "output",
-                        f"training_{training_instance.id}",
-                        "checkpoint.h5",
-                    )
-                    if not os.path.exists(model_path):
-                        model_path = os.path.join(
-                            settings.TRAINING_WORKSPACE,
-                            f"dataset_{model_instance.dataset.id}",
-                            "output",
-                            f"training_{training_instance.id}",
-                            "checkpoint.tf",
-                        )
                 geojson_data = predict(
                     bbox=bbox,
+                    training_id=training_instance.id,
                     model_path=model_path,
                     zoom_level=zoom_level,
                     tms_url=source,
@@ -620,6 +692,8 @@ class APIStatus(APIView):
                 tf.config.experimental.list_physical_devices("GPU")
             ),
             "API Status": "Healthy",  # static for now should be dynamic TODO
+            "Model Cache": model_cache.stats(),
+            "Tile Cache": tile_cache.stats(),
         }
         return Response(res, status=status.HTTP_200_OK)
 
@@ -679,35 +753,14 @@ class TrainingWorkspaceDownloadView(APIView):
     # permission_classes = [IsOsmAuthenticated]
 
     def get(self, request, lookup_dir):
-        base_dir = os.path.join(settings.TRAINING_WORKSPACE, lookup_dir)
+        workspace = os.path.realpath(settings.TRAINING_WORKSPACE)
+        base_dir = os.path.realpath(os.path.join(workspace, lookup_dir))
+        if os.path.commonpath([workspace, base_dir]) != workspace:
+            return Response({"Errr: File/Dir not found"}, status=404)
         if not os.path.exists(base_dir):
             return Response({"Errr: File/Dir not found"}, status=404)
-        size = (
-            get_dir_size(base_dir)
-            if os.path.isdir(base_dir)
-            else os.path.getsize(base_dir)
-        ) / (1024**2)
-        if size > 200:  # if file is greater than 200 mb exit
-            return Response(
-                {f"Errr: File Size {size} MB Exceed More than 200 MB"}, status=403
-            )
 
         if os.path.isfile(base_dir):
-            response = FileResponse(open(base_dir, "rb"))
-            response["Content-Disposition"] = 'attachment; filename="{}"'.format(
-                os.path.basename(base_dir)
-            )
-            return response
-        else:
-            # TODO : This will take time to zip also based on the reading/writing speed of the dir
-            temp = NamedTemporaryFile()
-            shutil.make_archive(temp.name, "zip", base_dir)
-            # rewind the file so it can be read from the beginning
-            temp.seek(0)
-            response = StreamingHttpResponse(
-                open(temp.name + ".zip", "rb").read(), content_type="application/zip"
-            )
-            response["Content-Disposition"] = 'attachment; filename="{}.zip"'.format(
-                os.path.basename(base_dir)
-            )
-            return response
+            return file_response(request, base_dir)
+        # zip is generated while it is sent , no size limit
+        return zip_response(base_dir, f"{os.path.basename(base_dir)}.zip")
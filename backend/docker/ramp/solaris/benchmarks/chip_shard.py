@@ -0,0 +1,141 @@
+"""Benchmark reading training chips from a :class:`solaris.utils.data.ChipShard`.
+
+Writes a directory of synthetic georeferenced image chips and binary masks
+like the ones preprocessing writes, packs them into a shard with
+:func:`solaris.utils.data.make_chip_shard`, and reads a few epochs with
+:class:`solaris.nets.datagen.KerasSegmentationSequence` from the files and
+from the shard, checking both give the same batches. Also times archiving
+the chips and masks as a ``.tar.xz`` against the shard as a plain ``.tar``.
+
+Usage::
+
+    python benchmarks/chip_shard.py --chips 2000 --size 256
+
+"""
+import argparse
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+
+from solaris.nets.datagen import KerasSegmentationSequence
+from solaris.utils.data import ChipShard, make_chip_shard
+
+
+def make_chips(chip_dir, n_chips, size, seed=0):
+    """Write RGB chips and binary masks as GeoTIFFs, returning the reference
+    df."""
+    os.makedirs(os.path.join(chip_dir, 'chips'))
+    os.makedirs(os.path.join(chip_dir, 'binarymasks'))
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_chips):
+        # smooth noise, so that the chips compress like imagery
+        image = np.repeat(np.repeat(rng.integers(
+            0, 256, (3, size // 4, size // 4), dtype='uint8'), 4, 1), 4, 2)
+        mask = (image[:1] > 200).astype('uint8')
+        transform = from_origin(i * size, 0, 1, 1)
+        rows.append({
+            'image': os.path.join(chip_dir, 'chips', 'OAM-{}.tif'.format(i)),
+            'label': os.path.join(chip_dir, 'binarymasks',
+                                  'OAM-{}.mask.tif'.format(i))})
+        for path, arr in [(rows[-1]['image'], image),
+                          (rows[-1]['label'], mask)]:
+            with rasterio.open(path, 'w', driver='GTiff', width=size,
+                               height=size, count=len(arr), dtype='uint8',
+                               crs='EPSG:3857', transform=transform) as dst:
+                dst.write(arr)
+    return pd.DataFrame(rows)
+
+
+def run_epochs(seq, epochs):
+    """Iterate over `seq` for `epochs` epochs, returning the seconds each
+    took and a checksum of every batch."""
+    seconds = []
+    checksums = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for index in range(len(seq)):
+            X, y = seq[index]
+            checksums.append((X.sum(dtype='float64'),
+                              y.sum(dtype='float64')))
+        seq.on_epoch_end()
+        seconds.append(time.perf_counter() - start)
+    return seconds, checksums
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def tar(path, members, root, mode):
+    with tarfile.open(path, mode) as f:
+        for name in members:
+            f.add(os.path.join(root, name), arcname=name)
+    return os.path.getsize(path) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--chips', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=256,
+                        help='Height and width of each chip')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=2)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        chip_dir = os.path.join(tmp_dir, 'preprocessed')
+        df = make_chips(chip_dir, args.chips, args.size)
+        print('{0} chips of {1}x{1}, batches of {2}'.format(
+            args.chips, args.size, args.batch_size))
+        _, seconds = timed(make_chip_shard, list(df['image']),
+                           list(df['label']),
+                           os.path.join(chip_dir, 'shard'))
+        print('packing the shard: {:.2f} s'.format(seconds))
+        shard = ChipShard(os.path.join(chip_dir, 'shard'))
+
+        n_samples = len(df) // args.batch_size * args.batch_size
+        augs = {'augmentations': {}}
+        results = {}
+        for name, kwargs in [
+                ('per-file, float64', dict(df=df)),
+                ('per-file, uint8', dict(df=df, dtype='uint8')),
+                ('shard, float64', dict(df=shard.df, shard=shard)),
+                ('shard, uint8', dict(df=shard.df, shard=shard,
+                                      dtype='uint8'))]:
+            seq = KerasSegmentationSequence(
+                height=args.size, width=args.size, input_channels=3,
+                output_channels=1, augs=augs, batch_size=args.batch_size,
+                shuffle=False, **kwargs)
+            seconds, results[name] = run_epochs(seq, args.epochs)
+            print('{}: '.format(name) + ', '.join(
+                'epoch {} {:.0f} samples/s'.format(epoch + 1,
+                                                   n_samples / s)
+                for epoch, s in enumerate(seconds)))
+        checksums = list(results.values())
+        assert all(c == checksums[0] for c in checksums[1:])
+        print('same batches')
+
+        size, seconds = timed(tar, os.path.join(tmp_dir, 'files.tar.xz'),
+                              ['chips', 'binarymasks'], chip_dir, 'w:xz')
+        print('chips and masks as .tar.xz: {:.2f} s, {:.0f} MB'.format(
+            seconds, size))
+        size, seconds = timed(tar, os.path.join(tmp_dir, 'shard.tar'),
+                              ['shard'], chip_dir, 'w')
+        print('shard as .tar: {:.2f} s, {:.0f} MB'.format(seconds, size))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
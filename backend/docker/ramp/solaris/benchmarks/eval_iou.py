@@ -0,0 +1,113 @@
+"""Benchmark IoU matching of :class:`solaris.eval.base.Evaluator`.
+
+Scores synthetic proposals against synthetic ground truth with the STRtree
+matching engine and with the previous per-proposal loop over
+:func:`solaris.eval.iou.calculate_iou`, and checks both give identical scores.
+
+Usage::
+
+    python benchmarks/eval_iou.py --polygons 10000
+
+"""
+import argparse
+import time
+
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import Polygon
+
+from solaris.eval import iou
+from solaris.eval.base import Evaluator
+
+
+def random_polygons(n, rng, extent):
+    """Irregular building-sized polygons scattered over a square extent."""
+    centers = rng.uniform(0, extent, size=(n, 2))
+    polygons = []
+    for cx, cy in centers:
+        n_vertices = rng.integers(4, 9)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+        radii = rng.uniform(4, 10, n_vertices)
+        polygons.append(Polygon(np.column_stack(
+            (cx + radii * np.cos(angles), cy + radii * np.sin(angles)))))
+    return polygons
+
+
+def make_data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    extent = np.sqrt(n) * 30
+    truth = random_polygons(n, rng, extent)
+    # most proposals are jittered ground truth , the rest are false positives
+    n_hits = int(n * 0.8)
+    shifts = rng.normal(0, 2, size=(n_hits, 2))
+    proposals = [
+        Polygon(np.asarray(poly.exterior.coords) + shift)
+        for poly, shift in zip(truth[:n_hits], shifts)]
+    proposals += random_polygons(n - n_hits, rng, extent)
+    conf = rng.uniform(size=n)
+    truth_gdf = gpd.GeoDataFrame(geometry=truth)
+    proposal_gdf = gpd.GeoDataFrame({'conf': conf}, geometry=proposals)
+    proposal_gdf['__total_conf'] = conf
+    proposal_gdf['__max_conf_class'] = 'conf'
+    proposal_gdf = proposal_gdf.sort_values(by='__total_conf',
+                                            ascending=False)
+    return truth_gdf, proposal_gdf
+
+
+def reference_eval(truth_gdf, proposal_gdf, miniou):
+    """The per-proposal matching loop ``Evaluator.eval_iou`` used before."""
+    truth_edit = truth_gdf.copy(deep=True)
+    proposal_gdf = proposal_gdf.copy()
+    for _, pred_row in proposal_gdf.iterrows():
+        iou_GDF = iou.calculate_iou(pred_row.geometry, truth_edit)
+        if not iou_GDF.empty:
+            max_iou_row = iou_GDF.loc[iou_GDF['iou_score'].idxmax(
+                axis=0, skipna=True)]
+            if max_iou_row['iou_score'] > miniou:
+                proposal_gdf.loc[pred_row.name, 'iou_score_all'] \
+                    = max_iou_row['iou_score']
+                truth_edit = truth_edit.drop(max_iou_row.name, axis=0)
+            else:
+                proposal_gdf.loc[pred_row.name, 'iou_score_all'] = 0
+        else:
+            proposal_gdf.loc[pred_row.name, 'iou_score_all'] = 0
+    return proposal_gdf['iou_score_all'], truth_edit.index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--polygons', type=int, default=10000,
+                        help='Number of ground truth and of proposal polygons')
+    parser.add_argument('--miniou', type=float, default=0.5)
+    parser.add_argument('--skip-reference', action='store_true',
+                        help='Only time the STRtree matching engine')
+    args = parser.parse_args()
+
+    truth_gdf, proposal_gdf = make_data(args.polygons)
+    print('{} ground truth x {} proposals'.format(len(truth_gdf),
+                                                  len(proposal_gdf)))
+
+    evaluator = Evaluator(truth_gdf)
+    evaluator.proposal_GDF = proposal_gdf.copy()
+    start = time.perf_counter()
+    scores = evaluator.eval_iou(miniou=args.miniou,
+                                calculate_class_scores=False)
+    engine_time = time.perf_counter() - start
+    print('STRtree matching: {:.2f} s {}'.format(engine_time, scores[0]))
+    if args.skip_reference:
+        return
+
+    start = time.perf_counter()
+    reference_iou, reference_fn = reference_eval(truth_gdf, proposal_gdf,
+                                                 args.miniou)
+    reference_time = time.perf_counter() - start
+    print('per-proposal loop: {:.2f} s'.format(reference_time))
+    print('speedup: {:.1f}x'.format(reference_time / engine_time))
+
+    assert evaluator.proposal_GDF['iou_score_all'].equals(reference_iou)
+    assert evaluator.ground_truth_GDF_Edit.index.equals(reference_fn)
+    print('scores identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark :func:`solaris.eval.pixel.relaxed_f1`.
+
+Scores synthetic road masks with the dilation based implementation, which
+dilates each mask once with ``cv2.dilate`` and a ``2 * radius`` square kernel
+anchored at ``(radius, radius)``, one mask at a time and as one
+``[N, H, W]`` batch, and with the previous per-pixel neighborhood loop, and
+checks all give the same scores.
+
+Usage::
+
+    python benchmarks/eval_relaxed_f1.py --size 1300 --batch 16
+
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from solaris.eval.pixel import relaxed_f1
+
+
+def road_mask(size, rng, n_roads=12, width=12):
+    """Random straight roads drawn across a square mask."""
+    mask = np.zeros((size, size), dtype=np.uint8)
+    for _ in range(n_roads):
+        start = tuple(int(v) for v in rng.integers(0, size, 2))
+        end = tuple(int(v) for v in rng.integers(0, size, 2))
+        cv2.line(mask, start, end, 1, width)
+    return mask
+
+
+def make_batch(n, size, seed=0):
+    rng = np.random.default_rng(seed)
+    truth = np.stack([road_mask(size, rng) for _ in range(n)])
+    # proposals: shifted truth with dropped and spurious road segments
+    prop = np.roll(truth, rng.integers(-4, 5, 2), axis=(1, 2)).copy()
+    prop[:, :, size // 3:size // 3 + 40] = 0
+    prop |= np.stack([road_mask(size, rng, n_roads=3) for _ in range(n)])
+    return truth.astype(float), prop.astype(float)
+
+
+def reference_relaxed_f1(truth_mask, prop_mask, radius=3):
+    """The per-pixel neighborhood loop ``relaxed_f1`` used before."""
+    truth_mask_clip = np.clip(truth_mask, 0, 1).astype(float)
+    prop_mask_clip = np.clip(prop_mask, 0, 1).astype(float)
+    n_truth = len(np.where(truth_mask_clip == 1)[0])
+    n_prop = len(np.where(prop_mask_clip == 1)[0])
+    precision_count = 0
+    recall_count = 0
+    h, w = truth_mask.shape
+    for row in range(h):
+        for col in range(w):
+            rowmin, rowmax = max(0, row - radius), min(h, row + radius)
+            colmin, colmax = max(0, col - radius), min(w, col + radius)
+            truth_win = truth_mask_clip[rowmin:rowmax, colmin:colmax]
+            prop_win = prop_mask_clip[rowmin:rowmax, colmin:colmax]
+            if prop_mask_clip[row][col] == 1:
+                if np.max(truth_win) > 0:
+                    precision_count += 1
+            if truth_mask_clip[row][col] == 1:
+                if np.max(prop_win) > 0:
+                    recall_count += 1
+    relaxed_recall = 1. * recall_count / n_truth if n_truth else 0
+    relaxed_precision = 1. * precision_count / n_prop if n_prop else 0
+    if (relaxed_recall > 0) and (relaxed_precision > 0):
+        f1 = 2 * relaxed_precision * relaxed_recall \
+            / (relaxed_precision + relaxed_recall)
+    else:
+        f1 = 0
+    return f1, relaxed_precision, relaxed_recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1300,
+                        help='Height and width of the masks')
+    parser.add_argument('--batch', type=int, default=16,
+                        help='Number of masks in the batch')
+    parser.add_argument('--radius', type=int, default=3)
+    parser.add_argument('--reference-masks', type=int, default=1,
+                        help='Number of masks scored with the per-pixel '
+                             'loop, 0 to skip it')
+    args = parser.parse_args()
+
+    truth, prop = make_batch(args.batch, args.size)
+    print('{} masks of {}x{}, radius {}'.format(args.batch, args.size,
+                                                args.size, args.radius))
+
+    start = time.perf_counter()
+    single = [relaxed_f1(t, p, radius=args.radius)
+              for t, p in zip(truth, prop)]
+    single_time = (time.perf_counter() - start) / args.batch
+    print('one mask at a time: {:.4f} s / mask'.format(single_time))
+
+    start = time.perf_counter()
+    batched = relaxed_f1(truth, prop, radius=args.radius)
+    batch_time = (time.perf_counter() - start) / args.batch
+    print('[N, H, W] batch: {:.4f} s / mask'.format(batch_time))
+    assert all(np.array_equal(np.array(single)[:, i], batched[i])
+               for i in range(3))
+
+    for i in range(args.reference_masks):
+        start = time.perf_counter()
+        reference = reference_relaxed_f1(truth[i], prop[i],
+                                         radius=args.radius)
+        reference_time = time.perf_counter() - start
+        print('per-pixel loop: {:.2f} s / mask, {:.0f}x slower than '
+              'batch'.format(reference_time, reference_time / batch_time))
+        assert reference == single[i], (reference, single[i])
+    print('scores identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Benchmark :class:`solaris.nets.infer.Inferer` on several images.
+
+Runs a small Keras segmentation model over a directory of synthetic GeoTIFFs
+with the pipelined ``Inferer``, with one worker and with several, and with
+the previous route, which tiled, predicted, stitched and wrote one image at a
+time, and checks all write the same predictions. Prints the seconds spent in
+each stage of the pipeline.
+
+Usage::
+
+    python benchmarks/inference.py --images 16 --size 1536 --workers 4
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import rasterio
+from osgeo import gdal
+from rasterio.transform import from_origin
+from tensorflow import keras
+
+from solaris.nets.datagen import InferenceTiler
+from solaris.nets.infer import Inferer
+from solaris.raster.image import create_multiband_geotiff, stitch_images
+
+
+def make_images(image_dir, n_images, size, seed=0):
+    """Write `n_images` 3-band ``uint8`` GeoTIFFs of noise."""
+    os.makedirs(image_dir)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(n_images):
+        paths.append(os.path.join(image_dir, 'image_{}.tif'.format(i)))
+        with rasterio.open(paths[-1], 'w', driver='GTiff', width=size,
+                           height=size, count=3, dtype='uint8',
+                           crs='EPSG:32633', tiled=True, blockxsize=256,
+                           blockysize=256, transform=from_origin(
+                               500000 + i * size * 0.3, 4000000, 0.3,
+                               0.3)) as dst:
+            dst.write(rng.integers(0, 256, (3, size, size), dtype='uint8'))
+    return paths
+
+
+def make_model(tile_size):
+    """A three-layer fully convolutional model with fixed weights."""
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input((tile_size, tile_size, 3))
+    x = keras.layers.Conv2D(16, 3, padding='same', activation='relu')(inputs)
+    x = keras.layers.Conv2D(16, 3, padding='same', activation='relu')(x)
+    outputs = keras.layers.Conv2D(1, 1, activation='sigmoid')(x)
+    return keras.Model(inputs, outputs)
+
+
+def reference_infer(inferer, infer_df, tile_size, step):
+    """``Inferer.__call__`` as it was, one image at a time."""
+    inf_tiler = InferenceTiler('keras', width=tile_size, height=tile_size,
+                               x_step=step, y_step=step)
+    for im_path in infer_df['image']:
+        temp_im = gdal.Open(im_path)
+        proj = temp_im.GetProjection()
+        gt = temp_im.GetGeoTransform()
+        inf_input, idx_refs, (
+            src_im_height, src_im_width) = inf_tiler(im_path)
+        subarr_preds = inferer.model.predict(inf_input,
+                                             batch_size=inferer.batch_size,
+                                             verbose=0)
+        stitched_result = stitch_images(subarr_preds, idx_refs=idx_refs,
+                                        out_width=src_im_width,
+                                        out_height=src_im_height,
+                                        method=inferer.stitching_method)
+        stitched_result = np.swapaxes(stitched_result, 1, 0)
+        stitched_result = np.swapaxes(stitched_result, 2, 0)
+        create_multiband_geotiff(stitched_result,
+                                 os.path.join(inferer.output_dir,
+                                              os.path.split(im_path)[1]),
+                                 proj=proj, geo=gt, nodata=np.nan,
+                                 out_format=gdal.GDT_Float32)
+
+
+def read(path):
+    with rasterio.open(path) as src:
+        return src.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--images', type=int, default=16)
+    parser.add_argument('--size', type=int, default=1536,
+                        help='Height and width of each image')
+    parser.add_argument('--tile-size', type=int, default=256)
+    parser.add_argument('--step', type=int, default=192)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Processes reading tiles and threads writing '
+                             'predictions')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        infer_df = pd.DataFrame({'image': make_images(
+            os.path.join(tmp_dir, 'images'), args.images, args.size)})
+        weight_path = os.path.join(tmp_dir, 'model.h5')
+        make_model(args.tile_size).save_weights(weight_path)
+        custom_model_dict = {
+            'arch': lambda pretrained: make_model(args.tile_size),
+            'weight_path': weight_path}
+        n_tiles = len(InferenceTiler(
+            'keras', args.tile_size, args.tile_size, args.step,
+            args.step).tile_indexes(args.size, args.size)) * args.images
+        print('{0} images of {1}x{1}, {2} tiles of {3}x{3}, batches of '
+              '{4}'.format(args.images, args.size, n_tiles, args.tile_size,
+                           args.batch_size))
+
+        output_dirs = {}
+        seconds = {}
+        for workers in ['reference'] + sorted({1, args.workers}):
+            output_dirs[workers] = os.path.join(tmp_dir, 'out_{}'.format(
+                workers))
+            config = {
+                'batch_size': args.batch_size, 'nn_framework': 'keras',
+                'model_name': 'benchmark', 'train': False,
+                'model_path': weight_path, 'inference_augmentation': None,
+                'data_specs': {'width': args.tile_size,
+                               'height': args.tile_size},
+                'inference': {'window_step_size_x': args.step,
+                              'window_step_size_y': args.step,
+                              'output_dir': output_dirs[workers],
+                              'workers': 1 if workers == 'reference'
+                              else workers}}
+            inferer = Inferer(config, custom_model_dict=custom_model_dict)
+            start = time.perf_counter()
+            if workers == 'reference':
+                reference_infer(inferer, infer_df, args.tile_size, args.step)
+            else:
+                inferer(infer_df)
+            seconds[workers] = time.perf_counter() - start
+
+            if workers == 'reference':
+                print('one image at a time: {:.2f} s, {:.0f} tiles/s'.format(
+                    seconds[workers], n_tiles / seconds[workers]))
+                continue
+            print('pipelined, {} workers: {:.2f} s, {:.0f} tiles/s, {:.2f}x '
+                  'faster; '.format(workers, seconds[workers],
+                                    n_tiles / seconds[workers],
+                                    seconds['reference'] / seconds[workers])
+                  + ', '.join('{} {:.2f} s'.format(stage, stage_seconds)
+                              for stage, stage_seconds
+                              in inferer.timings.items()))
+            for im_path in infer_df['image']:
+                name = os.path.split(im_path)[1]
+                assert np.allclose(
+                    read(os.path.join(output_dirs[workers], name)),
+                    read(os.path.join(output_dirs['reference'], name)),
+                    rtol=0, atol=1e-6), name
+        print('same predictions')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark :meth:`solaris.nets.datagen.InferenceTiler.iter_batches`.
+
+Tiles a synthetic GeoTIFF for inference with the previous route, loading the
+image and stacking every tile into one ``float32`` array before the first
+batch, and batch by batch with ``iter_batches`` from windowed reads, with and
+without a prefetch thread. A stand-in model sleeps for a fixed time per
+batch, as a GPU would keep the host waiting. Checks all give the same
+batches. Peak memory is what tracemalloc, which numpy reports its arrays to,
+sees allocated during each run.
+
+Usage::
+
+    python benchmarks/inference_tiler.py --size 8192 --tile-size 512 \\
+        --batch-size 16 --model-seconds 0.05
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from solaris.nets.datagen import InferenceTiler
+
+
+def make_image(path, size, bands, strip=1024, seed=0):
+    """Write a tiled ``uint8`` GeoTIFF of noise, one strip of rows at a
+    time."""
+    rng = np.random.default_rng(seed)
+    with rasterio.open(path, 'w', driver='GTiff', width=size, height=size,
+                       count=bands, dtype='uint8', crs='EPSG:32633',
+                       transform=from_origin(500000, 4000000, 0.3, 0.3),
+                       tiled=True, blockxsize=512, blockysize=512) as dst:
+        for row_off in range(0, size, strip):
+            height = min(strip, size - row_off)
+            dst.write(rng.integers(0, 256, (bands, height, size),
+                                   dtype='uint8'),
+                      window=rasterio.windows.Window(0, row_off, size,
+                                                     height))
+
+
+def predict_all(inf_tiler, path, batch_size, model_seconds):
+    """The previous route: tile the whole image, then predict in batches."""
+    inf_input, idx_refs, _ = inf_tiler(path)
+    checksums = []
+    for start in range(0, len(inf_input), batch_size):
+        batch = inf_input[start:start + batch_size]
+        time.sleep(model_seconds)
+        checksums.append(batch.sum(dtype='float64'))
+    return checksums
+
+
+def predict_batches(inf_tiler, path, batch_size, model_seconds, prefetch):
+    checksums = []
+    for batch, _ in inf_tiler.iter_batches(path, batch_size,
+                                           prefetch=prefetch):
+        time.sleep(model_seconds)
+        checksums.append(batch.sum(dtype='float64'))
+    return checksums
+
+
+def run(func, *args, **kwargs):
+    """Run `func`, returning its result, seconds and peak traced MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=8192,
+                        help='Height and width of the image')
+    parser.add_argument('--bands', type=int, default=3)
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--model-seconds', type=float, default=0.05,
+                        help='Time the stand-in model takes per batch')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'image.tif')
+        make_image(path, args.size, args.bands)
+        inf_tiler = InferenceTiler('keras', args.tile_size, args.tile_size)
+        n_tiles = len(inf_tiler.tile_indexes(args.size, args.size))
+        n_batches = -(-n_tiles // args.batch_size)
+        print('{0}x{0}x{1} image, {2} tiles in {3} batches, model {4:.2f} s '
+              'per batch'.format(args.size, args.bands, n_tiles, n_batches,
+                                 args.model_seconds))
+
+        results = {}
+        for prefetch in [0, 1]:
+            results[prefetch], seconds, peak = run(
+                predict_batches, inf_tiler, path, args.batch_size,
+                args.model_seconds, prefetch)
+            print('iter_batches, prefetch {}: {:.2f} s, peak {:.0f} MB'.format(
+                prefetch, seconds, peak))
+        expected, reference_time, peak = run(
+            predict_all, inf_tiler, path, args.batch_size, args.model_seconds)
+        print('whole image: {:.2f} s, peak {:.0f} MB, {:.1f}x slower than '
+              'prefetching'.format(reference_time, peak,
+                                   reference_time / seconds))
+        assert results[0] == results[1] == expected
+        print('same batches')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
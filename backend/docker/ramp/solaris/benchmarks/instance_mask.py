@@ -0,0 +1,96 @@
+"""Benchmark :func:`solaris.vector.mask.instance_mask`.
+
+Rasterizes synthetic building footprints into a compact
+:class:`solaris.vector.mask.InstanceMask` and with the previous one full-size
+``rasterize`` per building, checks both give the same ``(H, W, N)`` array and
+derives contact and boundary masks from the compact form.
+
+Usage::
+
+    python benchmarks/instance_mask.py --size 1024 --buildings 1000
+
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio import features
+
+from solaris.vector.mask import boundary_mask, contact_mask, instance_mask
+
+
+def make_buildings(n_buildings, size, seed=0):
+    """Rotated rectangles of 6 to 40 px scattered over a `size` px square."""
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(20, size - 20, (2, n_buildings))
+    half_w, half_h = rng.uniform(3, 20, (2, n_buildings))
+    angle = rng.uniform(0, np.pi, n_buildings)
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=float)
+    dx = corners[:, 0] * half_w[:, np.newaxis]
+    dy = corners[:, 1] * half_h[:, np.newaxis]
+    cos, sin = np.cos(angle)[:, np.newaxis], np.sin(angle)[:, np.newaxis]
+    coords = np.stack([x[:, np.newaxis] + dx * cos - dy * sin,
+                       y[:, np.newaxis] + dx * sin + dy * cos], axis=-1)
+    return pd.DataFrame({'geometry': shapely.polygons(coords)})
+
+
+def reference_instance_mask(df, shape, burn_value=255):
+    """``instance_mask`` as it was for pixel coordinates, one full-size
+    array per building."""
+    im_list = []
+    for geom in df['geometry']:
+        mask = features.rasterize([(geom, burn_value)], out_shape=shape,
+                                  transform=[1, 0, 0, 0, 1, 0])
+        im_list.append(mask)
+    return np.stack(im_list, axis=-1).astype('uint8')
+
+
+def measure(func, *args, **kwargs):
+    """Run `func`, returning its result, seconds and peak traced MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1024,
+                        help='Height and width of the mask')
+    parser.add_argument('--buildings', type=int, default=1000)
+    args = parser.parse_args()
+
+    shape = (args.size, args.size)
+    df = make_buildings(args.buildings, args.size)
+    print('{} buildings on a {}x{} mask'.format(len(df), *shape))
+
+    expected, reference_time, reference_peak = measure(
+        reference_instance_mask, df, shape)
+    print('rasterize per building: {:.2f} s, peak {:.0f} MB'.format(
+        reference_time, reference_peak))
+
+    instances, compact_time, compact_peak = measure(
+        instance_mask, df.copy(), shape=shape, compact=True)
+    print('compact: {:.2f} s, peak {:.1f} MB, {:.1f}x faster'.format(
+        compact_time, compact_peak, reference_time / compact_time))
+
+    assert np.array_equal(instances.to_dense(), expected)
+    print('{} identical instance bands'.format(len(instances)))
+
+    for name, func, kwargs in [
+            ('contact', contact_mask, dict(contact_spacing=10)),
+            ('outer boundary', boundary_mask,
+             dict(boundary_type='outer', boundary_width=3))]:
+        _, seconds, peak = measure(func, instances, **kwargs)
+        print('{} from compact: {:.2f} s, peak {:.1f} MB'.format(
+            name, seconds, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark :class:`solaris.nets.datagen.KerasSegmentationSequence`.
+
+Reads a directory of synthetic PNG image and mask chips for a few epochs
+with the sequence as before, decoding one sample after another into
+``float64`` batches, and with a thread pool, prefetching, ``float32`` output
+and a cache of decoded arrays, and checks both give the same batches. A
+stand-in training step sleeps for a fixed time per batch. Reports samples/s
+per epoch; with the cache, the first epoch decodes and fills it and the
+later ones memory-map it.
+
+Usage::
+
+    python benchmarks/keras_sequence.py --samples 256 --size 512 \\
+        --workers 4 --prefetch 2
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import skimage.io
+
+from solaris.nets.datagen import KerasSegmentationSequence
+
+
+def make_chips(chip_dir, n_samples, size, seed=0):
+    """Write RGB image and binary mask PNGs, returning the reference df."""
+    os.makedirs(chip_dir)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_samples):
+        # smooth noise, so that the PNGs compress like imagery
+        image = np.repeat(np.repeat(rng.integers(
+            0, 256, (size // 4, size // 4, 3), dtype='uint8'), 4, 0), 4, 1)
+        mask = (image[:, :, 0] > 200).astype('uint8') * 255
+        rows.append({'image': os.path.join(chip_dir, 'image_{}.png'.format(i)),
+                     'label': os.path.join(chip_dir, 'mask_{}.png'.format(i))})
+        skimage.io.imsave(rows[-1]['image'], image, check_contrast=False)
+        skimage.io.imsave(rows[-1]['label'], mask, check_contrast=False)
+    return pd.DataFrame(rows)
+
+
+def run_epochs(seq, epochs, step_seconds):
+    """Iterate over `seq` for `epochs` epochs, returning the seconds each
+    took and a checksum of every batch."""
+    seconds = []
+    checksums = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for index in range(len(seq)):
+            X, y = seq[index]
+            time.sleep(step_seconds)
+            checksums.append((X.sum(dtype='float64'),
+                              y.sum(dtype='float64')))
+        seq.on_epoch_end()
+        seconds.append(time.perf_counter() - start)
+    return seconds, checksums
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--samples', type=int, default=256)
+    parser.add_argument('--size', type=int, default=512,
+                        help='Height and width of each chip')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Threads loading samples')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='Batches loaded ahead')
+    parser.add_argument('--step-seconds', type=float, default=0.05,
+                        help='Time the stand-in training step takes per '
+                             'batch')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        df = make_chips(os.path.join(tmp_dir, 'chips'), args.samples,
+                        args.size)
+        print('{0} chips of {1}x{1}, batches of {2}, training step {3:.2f} '
+              's'.format(args.samples, args.size, args.batch_size,
+                         args.step_seconds))
+        n_samples = len(df) // args.batch_size * args.batch_size
+        augs = {'augmentations': {}}
+
+        results = {}
+        for name, kwargs in [
+                ('one at a time, float64', {}),
+                ('{} workers, prefetch {}, float32'.format(
+                    args.workers, args.prefetch),
+                 dict(dtype='float32', workers=args.workers,
+                      prefetch=args.prefetch)),
+                ('{} workers, prefetch {}, float32, cache'.format(
+                    args.workers, args.prefetch),
+                 dict(dtype='float32', workers=args.workers,
+                      prefetch=args.prefetch,
+                      cache_dir=os.path.join(tmp_dir, 'cache')))]:
+            seq = KerasSegmentationSequence(
+                df, args.size, args.size, 3, 1, augs, args.batch_size,
+                shuffle=False, **kwargs)
+            seconds, results[name] = run_epochs(seq, args.epochs,
+                                                args.step_seconds)
+            print('{}: '.format(name) + ', '.join(
+                'epoch {} {:.0f} samples/s'.format(epoch + 1,
+                                                   n_samples / s)
+                for epoch, s in enumerate(seconds)))
+        checksums = list(results.values())
+        assert all(c == checksums[0] for c in checksums[1:])
+        print('same batches')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
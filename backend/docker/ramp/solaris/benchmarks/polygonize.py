@@ -0,0 +1,150 @@
+"""Benchmark :func:`solaris.vector.mask.mask_to_poly_geojson`.
+
+Polygonizes a synthetic building mask GeoTIFF in windows, reading each window
+from the file in a process pool, and as before in one pass over the whole
+mask, and checks both give the same polygons. Peak memory is the growth of
+the largest resident set size of this process, so the windowed runs go
+first, and leaves out the pool workers, which hold a window each.
+
+Usage::
+
+    python benchmarks/polygonize.py --size 10000 --window-size 2048 --workers 4
+    python benchmarks/polygonize.py --size 30000 --skip-reference
+
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import shapely
+from rasterio import features
+from rasterio.transform import from_origin
+from shapely.geometry import shape
+
+from solaris.utils.core import _check_skimage_im_load
+from solaris.vector.mask import mask_to_poly_geojson, preds_to_binary
+
+
+def make_mask(path, size, spacing=40, strip=1024, seed=0):
+    """Write a tiled ``uint8`` GeoTIFF with a rectangle of 20 to 35 px in
+    every `spacing` px grid cell, one strip of rows at a time."""
+    rng = np.random.default_rng(seed)
+    n_side = size // spacing
+    rows, cols = [(c.ravel() * spacing) for c in np.mgrid[:n_side, :n_side]]
+    heights, widths = rng.integers(20, 36, (2, n_side ** 2))
+    rows = rows + rng.integers(0, spacing - heights)
+    cols = cols + rng.integers(0, spacing - widths)
+    profile = dict(driver='GTiff', width=size, height=size, count=1,
+                   dtype='uint8', crs='EPSG:32633', compress='deflate',
+                   transform=from_origin(500000, 4000000, 0.3, 0.3),
+                   tiled=True, blockxsize=512, blockysize=512)
+    with rasterio.open(path, 'w', **profile) as dst:
+        for row_off in range(0, size, strip):
+            data = np.zeros((min(strip, size - row_off), size), dtype='uint8')
+            in_strip = (rows < row_off + strip) & (rows + heights > row_off)
+            for row, col, height, width in zip(
+                    rows[in_strip], cols[in_strip], heights[in_strip],
+                    widths[in_strip]):
+                data[max(row - row_off, 0):row + height - row_off,
+                     col:col + width] = 255
+            dst.write(data, 1, window=rasterio.windows.Window(
+                0, row_off, size, data.shape[0]))
+    return n_side ** 2
+
+
+def reference_mask_to_poly_geojson(pred_arr, reference_im, min_area=40):
+    """``mask_to_poly_geojson`` as it was, with ``do_transform=True``."""
+    mask_arr = preds_to_binary(_check_skimage_im_load(pred_arr))
+    with rasterio.open(reference_im) as ref:
+        transform = ref.transform
+        crs = ref.crs
+    mask = (mask_arr > 0).astype('uint8')
+    polygons = []
+    values = []
+    for polygon, value in features.shapes(mask_arr, transform=transform,
+                                          mask=mask):
+        p = shape(polygon).buffer(0.0)
+        if p.area >= min_area:
+            polygons.append(shape(polygon).buffer(0.0))
+            values.append(value)
+    return gpd.GeoDataFrame({'geometry': polygons, 'value': values},
+                            crs=crs.to_wkt())
+
+
+def peak_rss_mb():
+    """Largest resident set size of this process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def run(func, *args, **kwargs):
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    return result, seconds, peak_rss_mb() - before
+
+
+def same_polygons(gdf, expected):
+    """Whether each polygon in `gdf` is one in `expected` and vice versa."""
+    if len(gdf) != len(expected):
+        return False
+    geoms = gdf.geometry.values
+    left, right = shapely.STRtree(expected.geometry.values).query(
+        geoms, predicate='covered_by')
+    equal = shapely.equals(geoms[left], expected.geometry.values[right])
+    return len(np.unique(left[equal])) == len(np.unique(right[equal])) == \
+        len(gdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=10000,
+                        help='Height and width of the mask')
+    parser.add_argument('--window-size', type=int, default=2048)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Processes polygonizing windows')
+    parser.add_argument('--skip-reference', action='store_true',
+                        help='Skip the single pass, which holds several '
+                             'copies of the whole mask in memory')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        mask_path = os.path.join(tmp_dir, 'mask.tif')
+        n_rects = make_mask(mask_path, args.size)
+        print('{0}x{0} mask, {1} rectangles'.format(args.size, n_rects))
+
+        results = {}
+        for workers in sorted({1, args.workers}):
+            gdf, seconds, peak = run(
+                mask_to_poly_geojson, mask_path, reference_im=mask_path,
+                do_transform=True, window_size=args.window_size,
+                workers=workers)
+            results[workers] = gdf, seconds
+            print('{} px windows, {} workers: {:.2f} s, {} polygons, peak '
+                  '+{:.0f} MB'.format(args.window_size, workers, seconds,
+                                     len(gdf), peak))
+        assert same_polygons(results[args.workers][0], results[1][0])
+
+        if not args.skip_reference:
+            expected, reference_time, peak = run(
+                reference_mask_to_poly_geojson, mask_path, mask_path)
+            print('single pass: {:.2f} s, {} polygons, peak +{:.0f} MB, '
+                  '{:.1f}x slower than {} workers'.format(
+                      reference_time, len(expected), peak,
+                      reference_time / results[args.workers][1],
+                      args.workers))
+            assert same_polygons(results[1][0], expected)
+            print('same polygons')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark :func:`solaris.utils.geo.split_geom`.
+
+Splits a synthetic AOI with a ragged outline into tiles with the vectorized
+``split_geom``, whole and in chunks, and with the previous one intersection
+per grid cell, and checks all three return the same tile bounds.
+
+Usage::
+
+    python benchmarks/split_geom.py --extent 100000 --vertices 2000
+
+"""
+import argparse
+import time
+
+import numpy as np
+from shapely.geometry import Polygon, box
+
+from solaris.utils.geo import split_geom
+
+
+def make_aoi(extent, n_vertices, seed=0):
+    """A star-shaped polygon with a noisy radius, about `extent` m across."""
+    rng = np.random.default_rng(seed)
+    angle = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    noise = np.convolve(rng.normal(0, 1, n_vertices), np.ones(25) / 25,
+                        mode='same')
+    radius = extent / 2 * (0.75 + 0.2 * np.sin(5 * angle) + 0.1 * noise)
+    return Polygon(np.column_stack([500000 + radius * np.cos(angle),
+                                    4000000 + radius * np.sin(angle)]))
+
+
+def reference_split_geom(geometry, tile_size):
+    """``split_geom`` as it was, with `tile_size` in projection units."""
+    bounds = geometry.bounds
+    xmin, ymin, xmax, ymax = bounds
+    x_steps = np.ceil((xmax - xmin)/tile_size[1])
+    y_steps = np.ceil((ymax - ymin)/tile_size[0])
+    x_mins = np.arange(xmin, xmin + tile_size[1]*x_steps, tile_size[1])
+    y_mins = np.arange(ymin, ymin + tile_size[0]*y_steps, tile_size[0])
+    return [
+        (i, j, i+tile_size[1], j+tile_size[0])
+        for i in x_mins for j in y_mins if not geometry.intersection(
+            box(*(i, j, i+tile_size[1], j+tile_size[0]))).is_empty
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--extent', type=float, default=100000,
+                        help='Width of the AOI in m')
+    parser.add_argument('--vertices', type=int, default=2000)
+    parser.add_argument('--tile-size', type=float, default=153.6,
+                        help='Tile size in m, 512 px at 0.3 m by default')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    aoi = make_aoi(args.extent, args.vertices)
+    tile_size = (args.tile_size, args.tile_size)
+    xmin, ymin, xmax, ymax = aoi.bounds
+    print('{} vertices, {:.0f} grid cells'.format(
+        len(aoi.exterior.coords),
+        np.ceil((xmax - xmin) / args.tile_size)
+        * np.ceil((ymax - ymin) / args.tile_size)))
+
+    start = time.perf_counter()
+    expected = reference_split_geom(aoi, tile_size)
+    reference_time = time.perf_counter() - start
+    print('intersection per cell: {:.2f} s, {} tiles'.format(
+        reference_time, len(expected)))
+
+    start = time.perf_counter()
+    tile_bounds = split_geom(aoi, tile_size, use_projection_units=True)
+    tile_time = time.perf_counter() - start
+    print('vectorized: {:.2f} s, {:.1f}x faster'.format(
+        tile_time, reference_time / tile_time))
+
+    start = time.perf_counter()
+    n_tiles = 0
+    for chunk in split_geom(aoi, tile_size, use_projection_units=True,
+                            chunk_size=args.chunk_size):
+        assert np.array_equal(chunk, tile_bounds[n_tiles:n_tiles + len(chunk)])
+        n_tiles += len(chunk)
+    print('vectorized in chunks of {} cells: {:.2f} s'.format(
+        args.chunk_size, time.perf_counter() - start))
+
+    assert n_tiles == len(tile_bounds)
+    assert np.array_equal(tile_bounds, np.array(expected).reshape(-1, 4))
+    print('{} identical tile bounds'.format(len(tile_bounds)))
+
+
+if __name__ == '__main__':
+    main()
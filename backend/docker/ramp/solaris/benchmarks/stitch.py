@@ -0,0 +1,125 @@
+"""Benchmark :func:`solaris.raster.image.stitch_images`.
+
+Stitches overlapping synthetic prediction tiles with the output-sized
+buffers of :class:`solaris.raster.image.Stitcher`, from an array of tiles and
+from a generator, and with the previous NaN-filled ``[N, Y, X, C]`` stack,
+and checks all give the same output. Peak memory is what tracemalloc,
+which numpy reports its arrays to, sees allocated during each run.
+
+Usage::
+
+    python benchmarks/stitch.py --size 1000 --tile-size 250 --step 125
+    python benchmarks/stitch.py --size 10000 --tile-size 250 --step 250 \\
+        --skip-reference
+
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from solaris.raster.image import stitch_images
+
+
+def make_tiles(size, tile_size, step, channels, seed=0):
+    """Overlapping ``float32`` tiles of random probabilities, one at a time,
+    with their index references."""
+    rng = np.random.default_rng(seed)
+    for y in range(0, size - tile_size + 1, step):
+        for x in range(0, size - tile_size + 1, step):
+            yield (rng.random((tile_size, tile_size, channels),
+                              dtype=np.float32), (y, x))
+
+
+def reference_stitch_images(im_arr, idx_refs, out_width, out_height,
+                            method='average'):
+    """``stitch_images`` as it was, for ``[N, Y, X, C]`` arrays."""
+    stitching_arr = np.empty(shape=(im_arr.shape[0], out_height, out_width,
+                                    im_arr.shape[3]))
+    stitching_arr[:] = np.nan
+    for idx in range(len(idx_refs)):
+        stitching_arr[
+            idx,
+            idx_refs[idx][0]:idx_refs[idx][0] + im_arr.shape[1],
+            idx_refs[idx][1]:idx_refs[idx][1] + im_arr.shape[2],
+            :] = im_arr[idx, :, :, :]
+    if method == 'average':
+        output_arr = np.nanmean(stitching_arr, axis=0)
+    elif method == 'first':
+        first_non_nan = np.invert(np.isnan(stitching_arr)).argmax(axis=0)
+        output_arr = np.take_along_axis(stitching_arr,
+                                        np.expand_dims(first_non_nan, axis=0),
+                                        axis=0)[0, :, :, :]
+    elif method == 'confidence':
+        conf_scale = np.abs(stitching_arr - 0.5)
+        conf_scale[np.isnan(conf_scale)] = -1
+        max_conf_ind = conf_scale.argmax(axis=0)
+        output_arr = np.take_along_axis(stitching_arr,
+                                        np.expand_dims(max_conf_ind, axis=0),
+                                        axis=0)[0, :, :, :]
+    return output_arr.astype(im_arr.dtype)
+
+
+def run(func, *args, **kwargs):
+    """Run `func`, returning its result, seconds and peak traced MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1000,
+                        help='Height and width of the output')
+    parser.add_argument('--tile-size', type=int, default=250)
+    parser.add_argument('--step', type=int, default=125)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--skip-reference', action='store_true',
+                        help='Only stitch from a generator, without holding '
+                             'all of the tiles or the stack in memory')
+    args = parser.parse_args()
+
+    n_tiles = len(range(0, args.size - args.tile_size + 1, args.step)) ** 2
+    print('{0}x{0}x{1} output, {2} tiles of {3}x{3}, step {4}, stack of '
+          '{5:.0f} MB'.format(args.size, args.channels, n_tiles,
+                              args.tile_size, args.step,
+                              n_tiles * args.size ** 2 * args.channels
+                              * 8 / 1e6))
+    for method in ['average', 'first', 'confidence']:
+        tiles = make_tiles(args.size, args.tile_size, args.step,
+                           args.channels)
+        from_generator, seconds, peak = run(
+            stitch_images, tiles, out_width=args.size, out_height=args.size,
+            method=method)
+        print('{}: generator {:.2f} s, peak {:.0f} MB'.format(
+            method, seconds, peak))
+        if args.skip_reference:
+            continue
+
+        tiles, idx_refs = zip(*make_tiles(args.size, args.tile_size,
+                                          args.step, args.channels))
+        tiles = np.stack(tiles)
+        result, seconds, peak = run(
+            stitch_images, tiles, idx_refs=idx_refs, out_width=args.size,
+            out_height=args.size, method=method)
+        print('{}: array {:.2f} s, peak {:.0f} MB'.format(
+            method, seconds, peak))
+        expected, reference_time, peak = run(
+            reference_stitch_images, tiles, idx_refs, args.size, args.size,
+            method=method)
+        print('{}: NaN stack {:.2f} s, peak {:.0f} MB, {:.1f}x slower than '
+              'the array'.format(method, reference_time, peak,
+                                 reference_time / seconds))
+        assert np.array_equal(result, expected, equal_nan=True)
+        assert np.array_equal(from_generator, expected, equal_nan=True)
+    if not args.skip_reference:
+        print('same output for every method')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark :func:`solaris.vector.mask.tile_masks`.
+
+Creates footprint and boundary masks for a directory of synthetic tiles from
+one label file with ``tile_masks`` and with the previous ``make_masks --batch``
+route, one ``df_to_px_mask`` call per tile that loads the label file and
+rasterizes all of the labels against the tile, and checks both write the
+same masks.
+
+Usage::
+
+    python benchmarks/tile_masks.py --tiles 64 --spacing 25 --workers 4
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import shapely
+from rasterio.transform import from_origin
+
+from solaris.vector.mask import df_to_px_mask, tile_masks, tile_mask_path
+
+
+def make_tiles(tile_dir, n_tiles, tile_size, res=0.3):
+    """Write a square grid of blank single-band UTM tiles."""
+    os.makedirs(tile_dir)
+    n_side = int(np.ceil(np.sqrt(n_tiles)))
+    extent = n_side * tile_size * res
+    tile_paths = []
+    for row in range(n_side):
+        for col in range(n_side):
+            transform = from_origin(500000 + col * tile_size * res,
+                                    4000000 - row * tile_size * res, res, res)
+            tile_paths.append(os.path.join(
+                tile_dir, 'tile_{}_{}.tif'.format(row, col)))
+            with rasterio.open(tile_paths[-1], 'w', driver='GTiff',
+                               width=tile_size, height=tile_size, count=1,
+                               dtype='uint8', crs='EPSG:32633',
+                               transform=transform) as dst:
+                dst.write(np.zeros((1, tile_size, tile_size), dtype='uint8'))
+    return tile_paths[:n_tiles], extent
+
+
+def make_labels(path, extent, spacing=25., seed=0):
+    """A rotated rectangle of 4 to 16 m in every `spacing` m grid cell over
+    the tiles, so that neighbours come close but never touch, written to
+    `path`."""
+    rng = np.random.default_rng(seed)
+    centers = np.arange(spacing / 2, extent, spacing)
+    x, y = [c.ravel() for c in np.meshgrid(centers, centers)]
+    n_labels = len(x)
+    x, y = np.array([x, y]) + rng.uniform(-1, 1, (2, n_labels))
+    half_w, half_h = rng.uniform(2, 8, (2, n_labels))
+    angle = rng.uniform(0, np.pi, n_labels)
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=float)
+    dx = corners[:, 0] * half_w[:, np.newaxis]
+    dy = corners[:, 1] * half_h[:, np.newaxis]
+    cos, sin = np.cos(angle)[:, np.newaxis], np.sin(angle)[:, np.newaxis]
+    coords = np.stack([500000 + x[:, np.newaxis] + dx * cos - dy * sin,
+                       4000000 - extent + y[:, np.newaxis] + dx * sin
+                       + dy * cos], axis=-1)
+    gpd.GeoDataFrame({'building_id': np.arange(n_labels)},
+                     geometry=shapely.polygons(coords),
+                     crs='EPSG:32633').to_file(path, driver='GeoJSON')
+    return n_labels
+
+
+def reference_tile_masks(tile_paths, labels_path, dest_dir, channels):
+    """What ``make_masks --batch`` did, one ``df_to_px_mask`` per tile."""
+    os.makedirs(dest_dir)
+    for tile_path in tile_paths:
+        df_to_px_mask(labels_path, channels=channels,
+                      out_file=tile_mask_path(tile_path, dest_dir),
+                      reference_im=tile_path, do_transform=True)
+
+
+def read(path):
+    with rasterio.open(path) as src:
+        return src.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tiles', type=int, default=64)
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--spacing', type=float, default=25.,
+                        help='Distance between buildings in m')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Processes creating masks')
+    args = parser.parse_args()
+
+    channels = ['footprint', 'boundary']
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tile_paths, extent = make_tiles(os.path.join(tmp_dir, 'tiles'),
+                                        args.tiles, args.tile_size)
+        labels_path = os.path.join(tmp_dir, 'labels.geojson')
+        n_labels = make_labels(labels_path, extent, args.spacing)
+        print('{} labels, {} tiles of {}x{}'.format(
+            n_labels, len(tile_paths), args.tile_size, args.tile_size))
+
+        reference_dir = os.path.join(tmp_dir, 'reference')
+        start = time.perf_counter()
+        reference_tile_masks(tile_paths, labels_path, reference_dir, channels)
+        reference_time = time.perf_counter() - start
+        print('df_to_px_mask per tile: {:.2f} s, {:.1f} tiles/s'.format(
+            reference_time, len(tile_paths) / reference_time))
+
+        for workers in sorted({1, args.workers}):
+            dest_dir = os.path.join(tmp_dir, 'workers_{}'.format(workers))
+            start = time.perf_counter()
+            mask_paths = tile_masks(tile_paths, labels_path, dest_dir,
+                                    channels=channels, workers=workers)
+            tile_time = time.perf_counter() - start
+            print('tile_masks, {} workers: {:.2f} s, {:.1f} tiles/s, '
+                  '{:.1f}x faster'.format(workers, tile_time,
+                                          len(tile_paths) / tile_time,
+                                          reference_time / tile_time))
+
+            for mask_path in mask_paths:
+                assert np.array_equal(
+                    read(mask_path),
+                    read(mask_path.replace(dest_dir, reference_dir))), \
+                    mask_path
+        print('{} identical masks'.format(len(tile_paths)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Benchmark :class:`solaris.tile.raster_tile.RasterTiler`.
+
+Tiles a synthetic tiled GeoTIFF with the chunked reads, cached transforms and
+threaded writes of ``RasterTiler.tile`` and with the previous one boundless
+read, one transform and one write per band per tile, and checks both write
+byte-identical tiles.
+
+Usage::
+
+    python benchmarks/tile_raster.py --size 20000 --tile-size 512 --workers 4
+
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import calculate_default_transform
+
+from solaris.tile.raster_tile import RasterTiler
+from solaris.utils.core import _check_crs, _check_rasterio_im_load
+from solaris.utils.geo import raster_get_projection_unit
+
+
+def make_raster(path, size, block_size=512, seed=0):
+    """Write a 3-band UTM GeoTIFF with a nodata border along its top."""
+    profile = dict(driver='GTiff', width=size, height=size, count=3,
+                   dtype='uint8', crs='EPSG:32633', nodata=0,
+                   transform=from_origin(500000, 4000000, 0.3, 0.3),
+                   tiled=True, blockxsize=block_size, blockysize=block_size)
+    rng = np.random.default_rng(seed)
+    with rasterio.open(path, 'w', **profile) as dest:
+        for (row, col), window in dest.block_windows(1):
+            data = rng.integers(1, 256, (3, window.height, window.width),
+                                dtype=np.uint8)
+            if row < 2:
+                data[:] = 0
+            dest.write(data, window=window)
+
+
+class ReferenceRasterTiler(RasterTiler):
+    """``RasterTiler`` with the per-tile reads and writes it used before."""
+
+    def tile_generator(self, src, dest_dir=None, channel_idxs=None,
+                       nodata=None, alpha=None, aoi_boundary=None,
+                       restrict_to_aoi=False, skip_nodata=False):
+        self.src = _check_rasterio_im_load(src)
+        if channel_idxs is None:
+            channel_idxs = list(range(1, self.src.count + 1))
+        self.src_crs = _check_crs(self.src.crs, return_rasterio=True)
+        if self.dest_crs is None:
+            self.dest_crs = self.src_crs
+        self.src_path = self.src.name
+        self.proj_unit = raster_get_projection_unit(self.src)
+        if nodata is None and self.nodata is None:
+            self.nodata = self.src.nodata
+        elif nodata is not None:
+            self.nodata = nodata
+        self.alpha = None
+        if getattr(self, 'tile_bounds', None) is None:
+            self.get_tile_bounds()
+        for tb in self.tile_bounds:
+            window = rasterio.windows.from_bounds(
+                *tb, transform=self.src.transform,
+                width=self.src_tile_size[1], height=self.src_tile_size[0])
+            if self.src.count != 1:
+                src_data = self.src.read(window=window, indexes=channel_idxs,
+                                         boundless=True,
+                                         fill_value=self.nodata)
+            else:
+                src_data = self.src.read(window=window, boundless=True,
+                                         fill_value=self.nodata)
+            dst_transform, width, height = calculate_default_transform(
+                self.src.crs, self.dest_crs,
+                self.src.width, self.src.height, *tb,
+                dst_height=self.dest_tile_size[0],
+                dst_width=self.dest_tile_size[1])
+            tile_data = src_data
+            if self.nodata:
+                mask = np.all(tile_data != nodata,
+                              axis=0).astype(np.uint8) * 255
+            else:
+                mask = None
+            profile = self.src.profile
+            profile.update(width=self.dest_tile_size[1],
+                           height=self.dest_tile_size[0],
+                           crs=self.dest_crs, transform=dst_transform,
+                           nodata=self.nodata, count=tile_data.shape[0])
+            yield tile_data, mask, profile, tb
+
+    def save_tile(self, tile_data, mask, profile, dest_fname_base=None):
+        dest_fname_root = os.path.splitext(os.path.split(self.src_path)[1])[0]
+        if self.proj_unit not in ['meter', 'metre']:
+            dest_fname = '{}_{}_{}.tif'.format(
+                dest_fname_root, np.round(profile['transform'][2], 6),
+                np.round(profile['transform'][5], 6))
+        else:
+            dest_fname = '{}_{}_{}.tif'.format(
+                dest_fname_root, int(profile['transform'][2]),
+                int(profile['transform'][5]))
+        dest_path = os.path.join(self.dest_dir, dest_fname)
+        with rasterio.open(dest_path, 'w', **profile) as dest:
+            if profile['count'] == 1:
+                dest.write(tile_data[0, :, :], 1)
+            else:
+                for band in range(1, profile['count'] + 1):
+                    dest.write(tile_data[band-1, :, :], band)
+        return dest_path
+
+
+def run(tiler_class, src_path, dest_dir, tile_size, **kwargs):
+    tiler = tiler_class(dest_dir, src_tile_size=(tile_size, tile_size))
+    start = time.perf_counter()
+    tiler.tile(src_path, **kwargs)
+    return tiler, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=20000,
+                        help='Height and width of the synthetic GeoTIFF')
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Threads writing tiles')
+    parser.add_argument('--gdal-cachemax', type=int, default=512,
+                        help='GDAL block cache in MB')
+    parser.add_argument('--nodata-threshold', type=float, default=None,
+                        help='Also drop tiles with this share of nodata')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src_path = os.path.join(tmp_dir, 'src.tif')
+        make_raster(src_path, args.size)
+        print('{0}x{0} GeoTIFF, {1}x{1} tiles'.format(args.size,
+                                                     args.tile_size))
+        kwargs = dict(nodata_threshold=args.nodata_threshold)
+
+        reference, reference_time = run(
+            ReferenceRasterTiler, src_path,
+            os.path.join(tmp_dir, 'reference'), args.tile_size, **kwargs)
+        n_tiles = len(reference.tile_paths)
+        print('per-tile reads and writes: {:.2f} s, {:.0f} tiles/s'.format(
+            reference_time, n_tiles / reference_time))
+
+        for workers in sorted({1, args.workers}):
+            dest_dir = os.path.join(tmp_dir, 'workers_{}'.format(workers))
+            tiler, tile_time = run(RasterTiler, src_path, dest_dir,
+                                   args.tile_size, workers=workers,
+                                   gdal_cachemax=args.gdal_cachemax,
+                                   **kwargs)
+            print('chunked reads, {} workers: {:.2f} s, {:.0f} tiles/s, '
+                  '{:.1f}x faster'.format(workers, tile_time,
+                                          n_tiles / tile_time,
+                                          reference_time / tile_time))
+            assert [os.path.basename(p) for p in tiler.tile_paths] == \
+                [os.path.basename(p) for p in reference.tile_paths]
+            for path in reference.tile_paths:
+                assert filecmp.cmp(
+                    path, os.path.join(dest_dir, os.path.basename(path)),
+                    shallow=False), path
+        print('{} tiles byte-identical'.format(n_tiles))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Benchmark reprojected tiling of :class:`solaris.tile.raster_tile.RasterTiler`.
+
+Tiles a synthetic UTM GeoTIFF into WGS84 tiles three ways: reprojecting every
+tile separately, reprojecting the whole source to a temporary GeoTIFF first
+(what ``project_to_meters`` does) and through a shared
+:class:`rasterio.vrt.WarpedVRT` (``use_vrt=True``). Each WarpedVRT tile is
+checked against the tile of the temporary GeoTIFF on the same grid and
+against a separate :func:`rasterio.warp.reproject` of the source window under
+it, away from the source edges.
+
+Usage::
+
+    python benchmarks/tile_raster_vrt.py --size 8000 --tile-size 512
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from scipy.ndimage import binary_erosion
+from rasterio.transform import from_origin
+from rasterio.warp import Resampling, reproject, transform_bounds
+
+from solaris.tile.raster_tile import RasterTiler
+from solaris.utils.geo import reproject as reproject_raster
+
+
+def make_raster(path, size, nodata=None, block_size=512):
+    """Write a smooth 3-band UTM GeoTIFF, so resampling differences stay
+    small where both reprojections cover a pixel."""
+    profile = dict(driver='GTiff', width=size, height=size, count=3,
+                   dtype='uint8', crs='EPSG:32633', nodata=nodata,
+                   transform=from_origin(500000, 4000000, 0.3, 0.3),
+                   tiled=True, blockxsize=block_size, blockysize=block_size)
+    with rasterio.open(path, 'w', **profile) as dest:
+        for _, window in dest.block_windows(1):
+            rows, cols = np.mgrid[
+                window.row_off:window.row_off + window.height,
+                window.col_off:window.col_off + window.width]
+            data = np.stack([
+                128 + 120 * np.sin(rows / (40. * (band + 1)))
+                * np.cos(cols / (55. * (band + 1))) for band in range(3)])
+            dest.write(data.astype(np.uint8), window=window)
+
+
+def reference_tile(src, path, resampling):
+    """Reproject the source window under the tile at `path` on its own."""
+    with rasterio.open(path) as tile:
+        shape, crs = (tile.count, tile.height, tile.width), tile.crs
+        dst_transform, bounds = tile.transform, tile.bounds
+    window = rasterio.windows.from_bounds(
+        *transform_bounds(crs, src.crs, *bounds), transform=src.transform)
+    col_off, row_off = int(window.col_off) - 2, int(window.row_off) - 2
+    window = rasterio.windows.Window(col_off, row_off,
+                                     int(np.ceil(window.width)) + 5,
+                                     int(np.ceil(window.height)) + 5)
+    src_data = src.read(window=window, boundless=True, fill_value=src.nodata)
+    tile_data = np.zeros(shape, dtype=src_data.dtype)
+    reproject(source=src_data, destination=tile_data,
+              src_transform=src.window_transform(window), src_crs=src.crs,
+              dst_transform=dst_transform, dst_crs=crs,
+              src_nodata=src.nodata, dst_nodata=src.nodata or 0,
+              resampling=getattr(Resampling, resampling))
+    return tile_data
+
+
+def read(path):
+    with rasterio.open(path) as tile:
+        return tile.read()
+
+
+class Difference(object):
+    """Largest and mean absolute difference of pixels seen so far."""
+
+    def __init__(self):
+        self.max, self.total, self.count = 0, 0, 0
+
+    def update(self, data, expected, valid):
+        diff = np.abs(data.astype(int) - expected)[
+            np.broadcast_to(valid, data.shape)]
+        if diff.size:
+            self.max = max(self.max, int(diff.max()))
+            self.total += int(diff.sum())
+            self.count += diff.size
+
+    def __str__(self):
+        return 'max difference {}, mean {:.4f} over {} pixels'.format(
+            self.max, self.total / max(self.count, 1), self.count)
+
+
+def report(name, tiler, seconds):
+    print('{}: {} tiles in {:.2f} s, {:.0f} tiles/s'.format(
+        name, len(tiler.tile_paths), seconds,
+        len(tiler.tile_paths) / seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=8000,
+                        help='Height and width of the synthetic GeoTIFF')
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--resampling', default='bilinear')
+    parser.add_argument('--nodata', type=int, default=None,
+                        help='Nodata value of the source. The WarpedVRT '
+                             'masks it out while warping, the per-tile '
+                             'reprojection does not')
+    parser.add_argument('--tolerance', type=float, default=2,
+                        help='Largest difference allowed between the two '
+                             'reprojections of a pixel')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src_path = os.path.join(tmp_dir, 'src.tif')
+        make_raster(src_path, args.size, nodata=args.nodata)
+        print('{0}x{0} GeoTIFF, {1}x{1} tiles, EPSG:32633 to EPSG:4326, '
+              'nodata {2}'.format(args.size, args.tile_size, args.nodata))
+
+        tile_size = (args.tile_size, args.tile_size)
+        start = time.perf_counter()
+        tiler = RasterTiler(os.path.join(tmp_dir, 'per_tile'), dest_crs=4326,
+                            resampling=args.resampling,
+                            src_tile_size=tile_size)
+        tiler.tile(src_path)
+        report('reproject per tile', tiler, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tmp_path = os.path.join(tmp_dir, 'tmp.tif')
+        reproject_raster(src_path, target_crs=4326, dest_path=tmp_path,
+                         resampling_method=args.resampling).close()
+        full = RasterTiler(os.path.join(tmp_dir, 'full'),
+                           src_tile_size=tile_size)
+        full.tile(tmp_path)
+        report('reproject to a temporary GeoTIFF', full,
+               time.perf_counter() - start)
+
+        start = time.perf_counter()
+        vrt = RasterTiler(os.path.join(tmp_dir, 'vrt'), dest_crs=4326,
+                          resampling=args.resampling, src_tile_size=tile_size,
+                          use_vrt=True)
+        vrt.tile(src_path)
+        report('WarpedVRT', vrt, time.perf_counter() - start)
+
+        nodata = args.nodata or 0
+        full_paths = {os.path.basename(path).split('_', 1)[1]: path
+                      for path in full.tile_paths}
+        full_diff, edge_diff = Difference(), Difference()
+        with rasterio.open(src_path) as src:
+            for path in vrt.tile_paths:
+                tile_data = read(path)
+                expected = read(full_paths[os.path.basename(path).split('_', 1)[1]])
+                full_diff.update(tile_data, expected,
+                                 (tile_data != nodata) & (expected != nodata))
+                expected = reference_tile(src, path, args.resampling)
+                # without a nodata mask the per-tile reprojection blends the
+                # fill past the source edges into the edge pixels, which may
+                # also be the edge pixels of the tile
+                valid = binary_erosion((tile_data != nodata).all(axis=0)
+                                       & (expected != nodata).all(axis=0),
+                                       iterations=2)
+                edge_diff.update(tile_data, expected, valid[np.newaxis])
+        print('WarpedVRT vs temporary GeoTIFF: {}'.format(full_diff))
+        print('WarpedVRT vs per-tile reproject: {}'.format(edge_diff))
+        assert full_diff.max <= args.tolerance
+        assert edge_diff.max <= args.tolerance
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Benchmark :class:`solaris.tile.vector_tile.VectorTiler`.
+
+Tiles synthetic building footprints with the one-pass ``VectorTiler`` and with
+the previous one ``clip_gdf`` call per tile, and checks both write the same
+features to every tile.
+
+Usage::
+
+    python benchmarks/tile_vector.py --labels 1000000 --tiles 10000 --workers 4
+
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import box, shape
+
+from solaris.tile.vector_tile import VectorTiler, clip_gdf
+from solaris.utils.core import _check_gdf_load, _check_crs
+from solaris.utils.geo import (get_projection_unit, reproject_geometry,
+                               split_multi_geometries)
+
+
+def make_labels(n_labels, extent, seed=0):
+    """Rotated rectangles of 4 to 20 m scattered over a square UTM extent."""
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(0, extent, (2, n_labels))
+    half_w, half_h = rng.uniform(2, 10, (2, n_labels))
+    angle = rng.uniform(0, np.pi, n_labels)
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=float)
+    dx = corners[:, 0] * half_w[:, np.newaxis]
+    dy = corners[:, 1] * half_h[:, np.newaxis]
+    cos, sin = np.cos(angle)[:, np.newaxis], np.sin(angle)[:, np.newaxis]
+    coords = np.stack([500000 + x[:, np.newaxis] + dx * cos - dy * sin,
+                       4000000 + y[:, np.newaxis] + dx * sin + dy * cos],
+                      axis=-1)
+    return gpd.GeoDataFrame({'building_id': np.arange(n_labels)},
+                            geometry=shapely.polygons(coords),
+                            crs='EPSG:32633')
+
+
+def make_tile_bounds(n_tiles, extent):
+    n_side = int(np.ceil(np.sqrt(n_tiles)))
+    size = extent / n_side
+    return [[500000 + col * size, 4000000 + row * size,
+             500000 + (col + 1) * size, 4000000 + (row + 1) * size]
+            for row in range(n_side) for col in range(n_side)][:n_tiles]
+
+
+class ReferenceVectorTiler(VectorTiler):
+    """``VectorTiler`` with the per-tile ``clip_gdf`` loop it used before."""
+
+    def tile_generator(self, src, tile_bounds, tile_bounds_crs=None,
+                       geom_type='Polygon', split_multi_geoms=True,
+                       min_partial_perc=0.0, obj_id_col=None):
+        self.src = _check_gdf_load(src)
+        self.src_crs = _check_crs(self.src.crs)
+        if tile_bounds_crs is not None:
+            tile_bounds_crs = _check_crs(tile_bounds_crs)
+        else:
+            tile_bounds_crs = self.src_crs
+        reproject_bounds = self.src_crs != tile_bounds_crs
+        self.proj_unit = get_projection_unit(tile_bounds_crs)
+        if getattr(self, 'dest_crs', None) is None:
+            self.dest_crs = self.src_crs
+        for tb in tile_bounds:
+            if reproject_bounds:
+                tile_gdf = clip_gdf(self.src,
+                                    reproject_geometry(box(*tb),
+                                                       tile_bounds_crs,
+                                                       self.src_crs),
+                                    min_partial_perc, geom_type)
+            else:
+                tile_gdf = clip_gdf(self.src, tb, min_partial_perc, geom_type)
+            if self.src_crs != self.dest_crs:
+                tile_gdf = tile_gdf.to_crs(crs=self.dest_crs.to_wkt())
+            if split_multi_geoms:
+                split_multi_geometries(tile_gdf, obj_id_col=obj_id_col)
+            yield tile_gdf, tb
+
+
+def read_features(path):
+    """The features of a tile as sorted ``(properties, WKB)`` pairs."""
+    with open(path) as f:
+        features = json.load(f)['features']
+    return sorted((json.dumps(feature['properties'], sort_keys=True),
+                   shapely.to_wkb(shape(feature['geometry'])))
+                  for feature in features)
+
+
+def run(tiler_class, labels, tile_bounds, dest_dir, dest_crs, **kwargs):
+    tiler = tiler_class(dest_dir, dest_crs=dest_crs)
+    start = time.perf_counter()
+    tiler.tile(labels, tile_bounds, **kwargs)
+    return tiler, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--labels', type=int, default=1000000)
+    parser.add_argument('--tiles', type=int, default=10000)
+    parser.add_argument('--extent', type=float, default=20000,
+                        help='Width and height of the labelled area in m')
+    parser.add_argument('--dest-crs', default=None,
+                        help='CRS to write the tiles in, e.g. 4326')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Processes writing tiles')
+    args = parser.parse_args()
+
+    labels = make_labels(args.labels, args.extent)
+    tile_bounds = make_tile_bounds(args.tiles, args.extent)
+    print('{} labels, {} tiles'.format(len(labels), len(tile_bounds)))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        reference, reference_time = run(
+            ReferenceVectorTiler, labels, tile_bounds,
+            os.path.join(tmp_dir, 'reference'), args.dest_crs)
+        print('clip_gdf per tile: {:.2f} s, {:.0f} tiles/s'.format(
+            reference_time, len(tile_bounds) / reference_time))
+
+        for workers in sorted({1, args.workers}):
+            dest_dir = os.path.join(tmp_dir, 'workers_{}'.format(workers))
+            tiler, tile_time = run(VectorTiler, labels, tile_bounds, dest_dir,
+                                   args.dest_crs, workers=workers)
+            print('one pass, {} workers: {:.2f} s, {:.0f} tiles/s, '
+                  '{:.1f}x faster'.format(workers, tile_time,
+                                          len(tile_bounds) / tile_time,
+                                          reference_time / tile_time))
+            assert tiler.tile_paths == [
+                path.replace(reference.dest_dir, dest_dir)
+                for path in reference.tile_paths]
+            for path, expected in zip(tiler.tile_paths,
+                                      reference.tile_paths):
+                assert read_features(path) == read_features(expected), path
+        print('{} tiles with the same features'.format(len(tile_bounds)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -77,7 +77,7 @@ else:
                  'rtree>=0.9.3',
                  'scikit-image>=0.16.2',
                  'scipy>=1.3.2',
-                 'shapely>=1.7.1dev',
+                 'shapely>=2.0',
                  'tqdm>=4.40.0',
                  'urllib3>=1.25.7',
                  ]
@@ -86,10 +86,6 @@ else:
 extra_reqs = {
     'test': ['mock', 'pytest', 'pytest-cov', 'codecov']}
 
-# workaround until new shapely release is out
-os.system('pip install  git+git://github.com/toblerity/shapely@master')
-
-
 project_name = 'solaris'
 setup(name='solaris',
       version=get_version(),
@@ -109,11 +105,11 @@ setup(name='solaris',
       include_package_data=True,
       install_requires=inst_reqs,
       extras_require=extra_reqs,
-      dependency_links=['https://github.com/toblerity/shapely/tarball/master#egg=shapely-1.7.1dev'],
       entry_points={'console_scripts': [
           'geotransform_footprints = solaris.bin.geotransform_footprints:main',
           'make_graphs = solaris.bin.make_graphs:main',
           'make_masks = solaris.bin.make_masks:main',
+          'make_tile_masks = solaris.bin.make_tile_masks:main',
           'mask_to_polygons = solaris.bin.mask_to_polygons:main',
           'spacenet_eval = solaris.bin.spacenet_eval:main',
           'solaris_run_ml = solaris.bin.solaris_run_ml:main'
@@ -0,0 +1,114 @@
+import argparse
+import glob
+import os
+import resource
+import sys
+import time
+from ..vector.mask import tile_masks, tile_mask_path
+
+
+def _peak_memory_mb(who):
+    """Largest resident set size of this process or of its children, in MB."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024.**2 if sys.platform == 'darwin' else 1024.)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Create training pixel masks for a directory of image'
+        ' tiles from one label file',
+        argument_default=None)
+
+    parser.add_argument('--tile_dir', '-d', type=str, required=True,
+                        help='Directory containing the georeferenced image'
+                        ' tiles to create masks for.')
+    parser.add_argument('--tile_ext', '-x', type=str, default='.tif',
+                        help='Extension of the image tiles in --tile_dir.'
+                        ' Defaults to .tif.')
+    parser.add_argument('--source_file', '-s', type=str, required=True,
+                        help='Full path to the vector file with the labels'
+                        ' for all of the tiles. Must have a CRS.')
+    parser.add_argument('--output_dir', '-o', type=str, required=True,
+                        help='Directory to write one mask per tile to,'
+                        ' named after the tile.')
+    parser.add_argument('--geometry_column', '-g', type=str,
+                        default='geometry', help='The column containing'
+                        ' footprint polygons. If not provided, defaults to'
+                        ' "geometry".')
+    parser.add_argument('--value', '-v', type=int, default=255,
+                        help='The value to set for labeled pixels in the'
+                        ' mask. Defaults to 255.')
+    parser.add_argument('--footprint', '-f', action='store_true',
+                        default=False, help='If this flag is set, the mask'
+                        ' will include filled-in building footprints as a'
+                        ' channel.')
+    parser.add_argument('--edge', '-e', action='store_true',
+                        default=False, help='If this flag is set, the mask'
+                        ' will include the building edges as a channel.')
+    parser.add_argument('--edge_width', '-ew', type=int, default=3,
+                        help='Pixel thickness of the edges in the edge mask.'
+                        ' Defaults to 3 if not provided.')
+    parser.add_argument('--edge_type', '-et', type=str, default='inner',
+                        help='Type of edge: either inner or outer. Defaults'
+                        ' to inner if not provided.')
+    parser.add_argument('--contact', '-c', action='store_true',
+                        default=False, help='If this flag is set, the mask'
+                        ' will include contact points between buildings as a'
+                        ' channel.')
+    parser.add_argument('--contact_spacing', '-cs', type=int, default=10,
+                        help='Sets the maximum distance between two'
+                        ' buildings, in pixels, that will be identified as a'
+                        ' contact. Defaults to 10.')
+    parser.add_argument('--overwrite', action='store_true', default=False,
+                        help='Recreate masks that already exist in'
+                        ' --output_dir instead of resuming.')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='The number of parallel processing workers to'
+                        ' use. This should not exceed the number of CPU'
+                        ' cores available.')
+
+    args = parser.parse_args()
+
+    if not args.footprint and not args.edge and not args.contact:
+        raise ValueError(
+            'You must specify --footprint, --edge, and/or --contact. See' +
+            ' make_tile_masks --help.')
+
+    channels = []
+    if args.footprint:
+        channels.append('footprint')
+    if args.edge:
+        channels.append('boundary')
+    if args.contact:
+        channels.append('contact')
+
+    tile_paths = sorted(glob.glob(os.path.join(args.tile_dir,
+                                               '*' + args.tile_ext)))
+    if args.overwrite:
+        n_done = 0
+    else:
+        n_done = sum(os.path.exists(tile_mask_path(p, args.output_dir))
+                     for p in tile_paths)
+
+    start = time.perf_counter()
+    tile_masks(tile_paths, args.source_file, args.output_dir,
+               channels=channels, geom_col=args.geometry_column,
+               burn_value=args.value, boundary_width=args.edge_width,
+               boundary_type=args.edge_type,
+               contact_spacing=args.contact_spacing,
+               resume=not args.overwrite, workers=args.workers)
+    seconds = time.perf_counter() - start
+
+    n_written = len(tile_paths) - n_done
+    print('{} masks written, {} already existed, in {:.1f} s ({:.1f} '
+          'tiles/s)'.format(n_written, n_done, seconds,
+                            n_written / seconds if seconds else 0.))
+    print('peak memory: {:.0f} MB main process, {:.0f} MB largest '
+          'worker'.format(_peak_memory_mb(resource.RUSAGE_SELF),
+                          _peak_memory_mb(resource.RUSAGE_CHILDREN)))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,8 @@ def main():
     parser.add_argument('--output_file', '-o', type=str,
                         default='Off-Nadir',
                         help='Output file To write results to CSV')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of worker processes to score images with')
     args = parser.parse_args()
 
     truth_file = args.truth_csv
@@ -28,12 +30,14 @@ def main():
 
     if args.challenge.lower() == 'off-nadir':
         evalSettings = {'miniou': 0.5,
-                        'min_area': 20}
+                        'min_area': 20,
+                        'workers': args.workers}
         results_DF, results_DF_Full = off_nadir_buildings(
             prop_csv=prop_file, truth_csv=truth_file, **evalSettings)
     elif args.challenge.lower() == 'spaceNet-buildings2'.lower():
         evalSettings = {'miniou': 0.5,
-                        'min_area': 20}
+                        'min_area': 20,
+                        'workers': args.workers}
         results_DF, results_DF_Full = spacenet_buildings_2(
                 prop_csv=prop_file, truth_csv=truth_file, **evalSettings)
 
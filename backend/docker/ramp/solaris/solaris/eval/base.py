@@ -1,4 +1,7 @@
+import csv
+from multiprocessing import Pool
 import shapely.wkt
+import numpy as np
 import geopandas as gpd
 import pandas as pd
 from tqdm.auto import tqdm
@@ -61,7 +64,8 @@ class Evaluator():
         return output_ground_truth_GDF
 
     def eval_iou_spacenet_csv(self, miniou=0.5, iou_field_prefix="iou_score",
-                              imageIDField="ImageId", debug=False, min_area=0):
+                              imageIDField="ImageId", debug=False, min_area=0,
+                              workers=1, output_csv=None):
         """Evaluate IoU between the ground truth and proposals in CSVs.
 
         Arguments
@@ -82,6 +86,13 @@ class Evaluator():
             Minimum area of a ground truth polygon to be considered during
             evaluation. Often set to ``20`` in SpaceNet competitions. Defaults
             to ``0``  (consider all ground truth polygons).
+        workers : int, optional
+            Number of worker processes to score images with. Images are split
+            into shards which are scored in parallel; scores are identical to
+            and in the same order as with a single process. Defaults to ``1``.
+        output_csv : str, optional
+            Path to a CSV file that each image's score row is written to as
+            soon as the image is scored. Nothing is written if not provided.
 
         Returns
         -------
@@ -103,65 +114,81 @@ class Evaluator():
         iou_field = iou_field_prefix
         scoring_dict_list = []
         self.ground_truth_GDF[iou_field] = 0.
-        iou_index = self.ground_truth_GDF.columns.get_loc(iou_field)
-        id_cols = 2
-        ground_truth_ids = self.ground_truth_GDF.iloc[:, :id_cols]
 
-        for imageID in tqdm(imageIDList):
-            self.ground_truth_GDF_Edit = self.ground_truth_GDF[
-                self.ground_truth_GDF[imageIDField] == imageID
+        if workers > 1 and len(imageIDList) > 1:
+            scores = self._eval_spacenet_shards(
+                imageIDList, workers, imageIDField, miniou=miniou,
+                iou_field=iou_field, min_area=min_area, debug=debug)
+        else:
+            scores = self._iter_eval_spacenet(
+                imageIDList, imageIDField, miniou=miniou, iou_field=iou_field,
+                min_area=min_area, debug=debug)
+
+        csv_file = open(output_csv, 'w', newline='') if output_csv else None
+        try:
+            writer = None
+            for score_calc in tqdm(scores, total=len(imageIDList)):
+                scoring_dict_list.append(score_calc)
+                if csv_file is not None:
+                    if writer is None:
+                        writer = csv.DictWriter(csv_file,
+                                                fieldnames=list(score_calc))
+                        writer.writeheader()
+                    writer.writerow(score_calc)
+                    csv_file.flush()
+        finally:
+            if csv_file is not None:
+                csv_file.close()
+
+        return scoring_dict_list
+
+    def _iter_eval_spacenet(self, imageIDList, imageIDField, miniou,
+                            iou_field, min_area, debug=False):
+        """Score images one by one, yielding the score dict of each image.
+
+        Used by :meth:`eval_iou_spacenet_csv` in the main process and in each
+        worker process. Writes proposal IoUs to `iou_field` of
+        ``self.proposal_GDF`` and per-building IoUs to `iou_field` of
+        ``self.ground_truth_GDF``.
+        """
+        truth_groups = self.ground_truth_GDF.groupby(imageIDField).indices
+        if self.proposal_GDF.empty:
+            proposal_groups = {}
+            proposal_areas = np.zeros(len(self.proposal_GDF))
+        else:
+            proposal_groups = self.proposal_GDF.groupby(imageIDField).indices
+            proposal_areas = np.asarray(self.proposal_GDF.area)
+        truth_ious = self.ground_truth_GDF[iou_field].to_numpy(dtype=float,
+                                                               copy=True)
+        no_rows = np.array([], dtype=int)
+
+        for imageID in imageIDList:
+            self.ground_truth_GDF_Edit = self.ground_truth_GDF.iloc[
+                truth_groups.get(imageID, no_rows)
                 ].copy(deep=True)
             self.ground_truth_GDF_Edit = self.ground_truth_GDF_Edit[
                 self.ground_truth_GDF_Edit.area >= min_area
                 ]
-            proposal_GDF_copy = self.proposal_GDF[self.proposal_GDF[
-                imageIDField] == imageID].copy(deep=True)
-            proposal_GDF_copy = proposal_GDF_copy[proposal_GDF_copy.area
-                                                  > min_area]
+            proposal_mask = np.zeros(len(self.proposal_GDF), dtype=bool)
+            proposal_rows = proposal_groups.get(imageID, no_rows)
+            proposal_mask[proposal_rows] = \
+                proposal_areas[proposal_rows] > min_area
             if debug:
                 print(iou_field)
-            for _, pred_row in proposal_GDF_copy.iterrows():
-                if debug:
-                    print(pred_row.name)
-                if pred_row.geometry.area > 0:
-                    pred_poly = pred_row.geometry
-                    iou_GDF = iou.calculate_iou(pred_poly,
-                                                self.ground_truth_GDF_Edit)
-                    # Get max iou
-                    if not iou_GDF.empty:
-                        max_index = iou_GDF['iou_score'].idxmax(axis=0,
-                                                                skipna=True)
-                        max_iou_row = iou_GDF.loc[max_index]
-                        # Update entry in full ground truth table
-                        previous_iou = self.ground_truth_GDF.iloc[
-                            max_index, iou_index]
-                        new_iou = max_iou_row[iou_field]
-                        if new_iou > previous_iou:
-                            self.ground_truth_GDF.iloc[max_index, iou_index] \
-                                = new_iou
-                        if max_iou_row['iou_score'] > miniou:
-                            self.proposal_GDF.loc[pred_row.name, iou_field] \
-                                = max_iou_row['iou_score']
-                            self.ground_truth_GDF_Edit \
-                                = self.ground_truth_GDF_Edit.drop(
-                                    max_iou_row.name, axis=0)
-                        else:
-                            self.proposal_GDF.loc[pred_row.name, iou_field] = 0
-                    else:
-                        self.proposal_GDF.loc[pred_row.name, iou_field] = 0
-                else:
-                    self.proposal_GDF.loc[pred_row.name, iou_field] = 0
-                if debug:
-                    print(self.proposal_GDF.loc[pred_row.name])
+            truth_labels, truth_iou = self._match_proposals(
+                proposal_mask, iou_field, miniou)
+            # Update entries in full ground truth table
+            np.maximum.at(truth_ious,
+                          self.ground_truth_GDF.index.get_indexer(truth_labels),
+                          truth_iou)
+            if debug:
+                print(self.proposal_GDF[proposal_mask])
 
             if self.proposal_GDF.empty:
                 TruePos = 0
                 FalsePos = 0
             else:
-                proposal_GDF_copy = self.proposal_GDF[
-                    self.proposal_GDF[imageIDField] == imageID].copy(deep=True)
-                proposal_GDF_copy = proposal_GDF_copy[
-                    proposal_GDF_copy.area > min_area]
+                proposal_GDF_copy = self.proposal_GDF[proposal_mask]
                 if not proposal_GDF_copy.empty:
                     if iou_field in proposal_GDF_copy.columns:
                         TruePos = proposal_GDF_copy[
@@ -203,9 +230,53 @@ class Evaluator():
                           'Recall':  Recall,
                           'F1Score': F1Score
                           }
-            scoring_dict_list.append(score_calc)
+            yield score_calc
 
-        return scoring_dict_list
+        self.ground_truth_GDF[iou_field] = truth_ious
+
+    def _eval_spacenet_shards(self, imageIDList, workers, imageIDField,
+                              **kwargs):
+        """Score shards of `imageIDList` in a process pool.
+
+        Each worker gets only the ground truth and proposal rows of its
+        shard. Score dicts are yielded in `imageIDList` order and the IoU
+        columns each worker computed are merged back into
+        ``self.proposal_GDF`` and ``self.ground_truth_GDF``.
+        """
+        iou_field = kwargs['iou_field']
+        n_shards = min(len(imageIDList), workers * 4)
+        shards = [list(shard) for shard in
+                  np.array_split(np.array(imageIDList, dtype=object),
+                                 n_shards)]
+        truth_ids = self.ground_truth_GDF[imageIDField]
+        if self.proposal_GDF.empty:
+            proposal_ids = None
+        else:
+            proposal_ids = self.proposal_GDF[imageIDField]
+
+        def shard_args():
+            for shard in shards:
+                if proposal_ids is None:
+                    proposals = self.proposal_GDF
+                else:
+                    proposals = self.proposal_GDF[proposal_ids.isin(shard)]
+                yield (self.ground_truth_GDF[truth_ids.isin(shard)],
+                       proposals, shard, imageIDField, kwargs)
+
+        truth_ious = self.ground_truth_GDF[iou_field].to_numpy(dtype=float,
+                                                               copy=True)
+        with Pool(processes=workers) as pool:
+            for scores, proposal_ious, shard_truth_ious in pool.imap(
+                    _eval_spacenet_shard, shard_args()):
+                if proposal_ious is not None:
+                    if iou_field not in self.proposal_GDF.columns:
+                        self.proposal_GDF[iou_field] = np.nan
+                    self.proposal_GDF.loc[proposal_ious.index, iou_field] \
+                        = proposal_ious
+                truth_ious[self.ground_truth_GDF.index.get_indexer(
+                    shard_truth_ious.index)] = shard_truth_ious.values
+                yield from scores
+        self.ground_truth_GDF[iou_field] = truth_ious
 
     def eval_iou(self, miniou=0.5, iou_field_prefix='iou_score',
                  ground_truth_class_field='', calculate_class_scores=True,
@@ -265,26 +336,8 @@ class Evaluator():
                 self.ground_truth_GDF_Edit = self.ground_truth_GDF.copy(
                     deep=True)
 
-            for _, pred_row in tqdm(self.proposal_GDF.iterrows()):
-                if pred_row['__max_conf_class'] == class_id \
-                   or class_id == 'all':
-                    pred_poly = pred_row.geometry
-                    iou_GDF = iou.calculate_iou(pred_poly,
-                                                self.ground_truth_GDF_Edit)
-                    # Get max iou
-                    if not iou_GDF.empty:
-                        max_iou_row = iou_GDF.loc[iou_GDF['iou_score'].idxmax(
-                            axis=0, skipna=True)]
-                        if max_iou_row['iou_score'] > miniou:
-                            self.proposal_GDF.loc[pred_row.name, iou_field] \
-                                = max_iou_row['iou_score']
-                            self.ground_truth_GDF_Edit \
-                                = self.ground_truth_GDF_Edit.drop(
-                                    max_iou_row.name, axis=0)
-                        else:
-                            self.proposal_GDF.loc[pred_row.name, iou_field] = 0
-                    else:
-                        self.proposal_GDF.loc[pred_row.name, iou_field] = 0
+            self._match_proposals(self._class_mask(class_id), iou_field,
+                                  miniou)
 
             if self.proposal_GDF.empty:
                 TruePos = 0
@@ -388,22 +441,8 @@ class Evaluator():
                 self.ground_truth_GDF_Edit = self.ground_truth_GDF.copy(
                     deep=True)
 
-            for _, pred_row in tqdm(self.proposal_GDF.iterrows()):
-                if pred_row['__max_conf_class'] == class_id or class_id == 'all':
-                    pred_poly = pred_row.geometry
-                    iou_GDF = iou.calculate_iou(pred_poly,
-                                                self.ground_truth_GDF_Edit)
-                    # Get max iou
-                    if not iou_GDF.empty:
-                        max_iou_row = iou_GDF.loc[iou_GDF['iou_score'].idxmax(
-                            axis=0, skipna=True)]
-                        if max_iou_row['iou_score'] > miniou:
-                            self.proposal_GDF.loc[pred_row.name, iou_field] = max_iou_row['iou_score']
-                            self.ground_truth_GDF_Edit = self.ground_truth_GDF_Edit.drop(max_iou_row.name, axis=0)
-                        else:
-                            self.proposal_GDF.loc[pred_row.name, iou_field] = 0
-                    else:
-                        self.proposal_GDF.loc[pred_row.name, iou_field] = 0
+            self._match_proposals(self._class_mask(class_id), iou_field,
+                                  miniou)
 
             if self.proposal_GDF.empty:
                 TruePos = 0
@@ -459,6 +498,51 @@ class Evaluator():
 
         return scoring_dict_list, True_Pos_gdf, False_Neg_gdf, False_Pos_gdf
 
+    def _class_mask(self, class_id):
+        """Boolean mask of proposals scored for `class_id`."""
+        if self.proposal_GDF.empty:
+            return np.zeros(len(self.proposal_GDF), dtype=bool)
+        if class_id == 'all':
+            return np.ones(len(self.proposal_GDF), dtype=bool)
+        return (self.proposal_GDF['__max_conf_class'] == class_id).values
+
+    def _match_proposals(self, proposal_mask, iou_field, miniou):
+        """Match proposals against ``self.ground_truth_GDF_Edit``.
+
+        The IoU of each proposal selected by `proposal_mask` is written to
+        `iou_field` of ``self.proposal_GDF`` (``0`` where it is not above
+        `miniou`) and matched polygons are removed from
+        ``self.ground_truth_GDF_Edit``. See :func:`solaris.eval.iou.match_proposals`.
+
+        Returns
+        -------
+        truth_labels : :class:`numpy.ndarray`
+            ``self.ground_truth_GDF_Edit`` index labels of the best scoring
+            ground truth polygon of each proposal which overlapped any.
+        truth_iou : :class:`numpy.ndarray`
+            The corresponding IoU scores.
+
+        """
+        proposal_mask = np.asarray(proposal_mask, dtype=bool)
+        if not proposal_mask.any():
+            return np.array([]), np.array([])
+        best_iou, best_truth, consumed = iou.match_proposals(
+            self.proposal_GDF.geometry.values[proposal_mask],
+            self.ground_truth_GDF_Edit.geometry.values, miniou=miniou)
+
+        if iou_field not in self.proposal_GDF.columns:
+            self.proposal_GDF[iou_field] = np.nan
+        self.proposal_GDF.iloc[
+            np.flatnonzero(proposal_mask),
+            self.proposal_GDF.columns.get_loc(iou_field)] = np.where(
+                best_iou > miniou, best_iou, 0)
+
+        found = best_truth >= 0
+        truth_labels = self.ground_truth_GDF_Edit.index.values[
+            best_truth[found]]
+        self.ground_truth_GDF_Edit = self.ground_truth_GDF_Edit[~consumed]
+        return truth_labels, best_iou[found]
+
     def load_proposal(self, proposal_vector_file, conf_field_list=['conf'],
                       proposalCSV=False, pred_row_geo_value='PolygonWKT_Pix',
                       conf_field_mapping=None):
@@ -589,3 +673,17 @@ def eval_base(ground_truth_vector_file, csvFile=False,
         Use :class:`Evaluator` instead."""
 
     return Evaluator(ground_truth_vector_file)
+
+
+def _eval_spacenet_shard(args):
+    """Score one shard of images in a worker process.
+
+    See :meth:`Evaluator.eval_iou_spacenet_csv`.
+    """
+    ground_truth_GDF, proposal_GDF, imageIDList, imageIDField, kwargs = args
+    evaluator = Evaluator(ground_truth_GDF)
+    evaluator.proposal_GDF = proposal_GDF
+    scores = list(evaluator._iter_eval_spacenet(imageIDList, imageIDField,
+                                                **kwargs))
+    return (scores, evaluator.proposal_GDF.get(kwargs['iou_field']),
+            evaluator.ground_truth_GDF[kwargs['iou_field']])
@@ -5,7 +5,8 @@ from .scot import scot_multi_aoi
 import re
 
 
-def spacenet_buildings_2(prop_csv, truth_csv, miniou=0.5, min_area=20, challenge='spacenet_2'):
+def spacenet_buildings_2(prop_csv, truth_csv, miniou=0.5, min_area=20, challenge='spacenet_2',
+                         workers=1, output_csv=None):
     """Evaluate a SpaceNet building footprint competition proposal csv.
 
     Uses :class:`Evaluator` to evaluate SpaceNet challenge proposals.
@@ -28,6 +29,11 @@ def spacenet_buildings_2(prop_csv, truth_csv, miniou=0.5, min_area=20, challenge
         ``['spacenet_2', 'spacenet_3', 'spacenet_off_nadir', 'spacenet_6']``.
         The name of the challenge that `chip_name` came from. Defaults to
         ``'spacenet_2'``.
+    workers : int, optional
+        Number of worker processes to score images with. Defaults to ``1``.
+    output_csv : str, optional
+        Path to a CSV file that per-image scores are streamed to while images
+        are scored, see :meth:`Evaluator.eval_iou_spacenet_csv`.
 
     Returns
     -------
@@ -52,7 +58,9 @@ def spacenet_buildings_2(prop_csv, truth_csv, miniou=0.5, min_area=20, challenge
     results = evaluator.eval_iou_spacenet_csv(miniou=miniou,
                                               iou_field_prefix="iou_score",
                                               imageIDField="ImageId",
-                                              min_area=min_area
+                                              min_area=min_area,
+                                              workers=workers,
+                                              output_csv=output_csv
                                               )
     results_DF_Full = pd.DataFrame(results)
 
@@ -89,7 +97,8 @@ def spacenet_buildings_2(prop_csv, truth_csv, miniou=0.5, min_area=20, challenge
 
 
 def off_nadir_buildings(prop_csv, truth_csv, image_columns={}, miniou=0.5,
-                        min_area=20, verbose=False):
+                        min_area=20, verbose=False, workers=1,
+                        output_csv=None):
     """Evaluate an off-nadir competition proposal csv.
 
     Uses :class:`Evaluator` to evaluate off-nadir challenge proposals. See
@@ -113,6 +122,13 @@ def off_nadir_buildings(prop_csv, truth_csv, image_columns={}, miniou=0.5,
     min_area : float or int, optional
         Minimum area of ground truth regions to include in scoring calculation.
         Defaults to ``20``.
+    verbose : bool, optional
+        Print each nadir angle bin while summarizing. Defaults to ``False``.
+    workers : int, optional
+        Number of worker processes to score images with. Defaults to ``1``.
+    output_csv : str, optional
+        Path to a CSV file that per-image scores are streamed to while images
+        are scored, see :meth:`Evaluator.eval_iou_spacenet_csv`.
 
     Returns
     -------
@@ -137,7 +153,9 @@ def off_nadir_buildings(prop_csv, truth_csv, image_columns={}, miniou=0.5,
     results = evaluator.eval_iou_spacenet_csv(miniou=miniou,
                                               iou_field_prefix="iou_score",
                                               imageIDField="ImageId",
-                                              min_area=min_area
+                                              min_area=min_area,
+                                              workers=workers,
+                                              output_csv=output_csv
                                               )
     results_DF_Full = pd.DataFrame(results)
 
@@ -1,4 +1,6 @@
+import numpy as np
 import geopandas as gpd
+import shapely
 
 
 def calculate_iou(pred_poly, test_data_GDF):
@@ -78,3 +80,84 @@ def process_iou(pred_poly, test_data_GDF, remove_matching_element=True):
     #     # Remove ground truth polygon from tree
     #     test_tree.delete(max_iou_idx, Polygon(test_data[max_iou_idx]['geometry']['coordinates'][0]).bounds)
     #     return max_iou_row['iou_score'], iou_GDF, test_data_DF
+
+
+def match_proposals(proposals, ground_truth, miniou=0.5):
+    """Greedily match proposals to ground truth polygons one-to-one.
+
+    Gives the same matches as calling :func:`calculate_iou` for each proposal
+    in order and dropping the best scoring ground truth polygon from
+    ``ground_truth`` whenever its IoU exceeds `miniou`. All overlapping
+    proposal/ground truth pairs are found with a single
+    :class:`shapely.STRtree` query and scored with vectorized shapely
+    operations; matched ground truth is tracked in a boolean array.
+
+    Arguments
+    ---------
+    proposals : array-like of :py:class:`shapely.geometry.Polygon`
+        Proposal polygons in the order they should be matched, usually sorted
+        by descending confidence.
+    ground_truth : array-like of :py:class:`shapely.geometry.Polygon`
+        Ground truth polygons. Ties between equally scoring ground truth
+        polygons are broken by their order here.
+    miniou : float, optional
+        A proposal is matched to (and consumes) its best ground truth polygon
+        if their IoU is greater than `miniou`. Defaults to ``0.5``.
+
+    Returns
+    -------
+    best_iou : :class:`numpy.ndarray`
+        For each proposal, the IoU with the best scoring ground truth polygon
+        that was still unmatched when the proposal was evaluated. ``0`` for
+        proposals that overlap no unmatched ground truth.
+    best_truth : :class:`numpy.ndarray`
+        Position of that ground truth polygon in `ground_truth`, ``-1`` if
+        there was none.
+    consumed : :class:`numpy.ndarray`
+        Boolean array which is ``True`` for ground truth polygons matched by
+        a proposal.
+
+    """
+    proposals = np.array(proposals, dtype=object)
+    ground_truth = np.array(ground_truth, dtype=object)
+    best_iou = np.zeros(len(proposals))
+    best_truth = np.full(len(proposals), -1)
+    consumed = np.zeros(len(ground_truth), dtype=bool)
+    if not len(proposals) or not len(ground_truth):
+        return best_iou, best_truth, consumed
+
+    # Fix bowties and self-intersections
+    invalid = ~shapely.is_valid(proposals)
+    proposals[invalid] = shapely.buffer(proposals[invalid], 0.0)
+
+    tree = shapely.STRtree(ground_truth)
+    pred_idx, truth_idx = tree.query(proposals, predicate='intersects')
+    # candidates of each proposal in ground truth order, like calculate_iou
+    order = np.lexsort((truth_idx, pred_idx))
+    pred_idx, truth_idx = pred_idx[order], truth_idx[order]
+
+    pred_polys = proposals[pred_idx]
+    truth_polys = ground_truth[truth_idx]
+    # Ignore invalid polygons for now
+    valid = shapely.is_valid(pred_polys) & shapely.is_valid(truth_polys)
+    iou_scores = np.zeros(len(pred_idx))
+    intersection = shapely.area(
+        shapely.intersection(pred_polys[valid], truth_polys[valid]))
+    union = shapely.area(shapely.union(pred_polys[valid], truth_polys[valid]))
+    iou_scores[valid] = intersection / union
+
+    bounds = np.searchsorted(pred_idx, np.arange(len(proposals) + 1))
+    for pred, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if start == stop:
+            continue
+        candidates = truth_idx[start:stop]
+        scores = np.where(consumed[candidates], -1., iou_scores[start:stop])
+        best = scores.argmax()
+        if scores[best] < 0:  # every overlapping polygon is already matched
+            continue
+        best_iou[pred] = scores[best]
+        best_truth[pred] = candidates[best]
+        if scores[best] > miniou:
+            consumed[candidates[best]] = True
+
+    return best_iou, best_truth, consumed
@@ -201,15 +201,22 @@ def f1(truth_mask, prop_mask, prop_threshold=0.5, show_plot=False, im_file='',
     return f1, precision, recall
 
 
-def _get_neighborhood_limits(row, col, h, w, rho=3):
-    '''Get neighbors of point p with pixel coords row, col'''
-
-    rowmin = max(0, row-rho)
-    rowmax = min(h, row + rho)
-    colmin = max(0, col-rho)
-    colmax = min(w, col + rho)
-
-    return rowmin, rowmax, colmin, colmax
+def _within_radius(mask, radius):
+    """Find pixels with a positive pixel of `mask` in their neighborhood.
+
+    The neighborhood of the pixel at ``row, col`` spans rows
+    ``row - radius`` to ``row + radius - 1`` and the same columns, cut off at
+    the mask edges. It's found for all pixels at once by dilating the
+    positive pixels with a ``2 * radius`` square anchored at
+    ``(radius, radius)``. `mask` may be 2-D or a 3-D ``[N, H, W]`` batch.
+    """
+    kernel = np.ones((2 * radius, 2 * radius), dtype=np.uint8)
+    positive = (mask > 0).astype(np.uint8).reshape((-1,) + mask.shape[-2:])
+    dilated = np.stack([
+        cv2.dilate(m, kernel, anchor=(radius, radius),
+                   borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        for m in positive])
+    return dilated.reshape(mask.shape) > 0
 
 
 def relaxed_f1(truth_mask, prop_mask, radius=3, verbose=False):
@@ -236,18 +243,20 @@ def relaxed_f1(truth_mask, prop_mask, radius=3, verbose=False):
     Arguments
     ---------
     truth_mask : np array
-        2-D array of ground truth.
+        2-D array of ground truth, or a 3-D ``[N, H, W]`` batch of them.
     prop_mask : np array
-        2-D array of proposals.
+        2-D array of proposals, or a 3-D ``[N, H, W]`` batch of them.
     radius : int
-        Radius in pixels to use for relaxed f1.
+        Radius in pixels to use for relaxed f1. Must be at least ``1``.
     verbose : bool
         Switch to print relevant values
 
     Returns
     -------
     output : tuple
-        Tuple containing [relaxed_f1, relaxed_precision, relaxed_recall]
+        Tuple containing [relaxed_f1, relaxed_precision, relaxed_recall].
+        For a batch of masks each item is an array with the score of every
+        mask in the batch.
 
     Examples
     --------
@@ -285,60 +294,48 @@ def relaxed_f1(truth_mask, prop_mask, radius=3, verbose=False):
     >>> relaxed_f1(truth_mask, prop_mask, radius=3)
     (0.8571428571428571, 0.75, 1.0)
     """
-
-    truth_mask_clip = np.clip(truth_mask, 0, 1).astype(float)
-    prop_mask_clip = np.clip(prop_mask, 0, 1).astype(float)
-
-    # true pos = 1, false_pos = 2, true_neg = 0, false_neg = -1
-    n_truth = len(np.where(truth_mask_clip == 1)[0])
-    n_prop = len(np.where(prop_mask_clip == 1)[0])
-
-    # iterate through truth pixels
-    precision_count = 0
-    recall_count = 0
-    h, w = truth_mask.shape
-    for row in range(h):
-        for col in range(w):
-            truth_val = truth_mask_clip[row][col]
-            prop_val = prop_mask_clip[row][col]
-            # get window limits
-            rowmin, rowmax, colmin, colmax = _get_neighborhood_limits(
-                row, col, h, w, rho=radius)
-            # get windows
-            truth_win = truth_mask_clip[rowmin:rowmax, colmin:colmax]
-            prop_win = prop_mask_clip[rowmin:rowmax, colmin:colmax]
-
-            # add precision_count if proposal is within the radius of a gt node
-            if prop_val == 1:
-                if np.max(truth_win) > 0:
-                    precision_count += 1
-
-            if truth_val == 1:
-                if np.max(prop_win) > 0:
-                    recall_count += 1
+    if np.shape(truth_mask) != np.shape(prop_mask):
+        raise ValueError("The shape of `truth_mask` and `prop_mask` must "
+                         "be the same.")
+    if radius < 1:
+        raise ValueError("`radius` must be at least 1.")
+    truth_mask = np.asarray(truth_mask)
+    prop_mask = np.asarray(prop_mask)
+    axes = (-2, -1)
+
+    # pixels that are 1 once clipped to [0, 1]
+    truth_pos = truth_mask >= 1
+    prop_pos = prop_mask >= 1
+    n_truth = truth_pos.sum(axis=axes)
+    n_prop = prop_pos.sum(axis=axes)
+
+    # count proposal pixels within the radius of a gt pixel and vice versa
+    precision_count = np.logical_and(
+        prop_pos, _within_radius(truth_mask, radius)).sum(axis=axes)
+    recall_count = np.logical_and(
+        truth_pos, _within_radius(prop_mask, radius)).sum(axis=axes)
 
     # get fractions
-    if n_truth == 0:
-        relaxed_recall = 0
-    else:
-        relaxed_recall = 1. * recall_count / n_truth
-    if n_prop == 0:
-        relaxed_precision = 0
-    else:
-        relaxed_precision = 1. * precision_count / n_prop
-
-    if (relaxed_recall > 0) and (relaxed_precision > 0):
-        relaxed_f1 = 2 * relaxed_precision * relaxed_recall \
-            / (relaxed_precision + relaxed_recall)
-    else:
-        relaxed_f1 = 0
+    relaxed_recall = np.where(
+        n_truth == 0, 0., 1. * recall_count / np.maximum(n_truth, 1))
+    relaxed_precision = np.where(
+        n_prop == 0, 0., 1. * precision_count / np.maximum(n_prop, 1))
+    scored = (relaxed_recall > 0) & (relaxed_precision > 0)
+    relaxed_f1 = np.zeros(np.shape(scored))
+    relaxed_f1[scored] = 2 * relaxed_precision[scored] \
+        * relaxed_recall[scored] \
+        / (relaxed_precision[scored] + relaxed_recall[scored])
 
     if verbose:
         print("mask.shape:\t", truth_mask.shape)
         print("num pixels:\t", truth_mask.size)
         print("precision:\t", relaxed_precision)
         print("recall:\t\t", relaxed_recall)
-        print("rF1 score:\t", f1)
+        print("rF1 score:\t", relaxed_f1)
 
-    output = (relaxed_f1, relaxed_precision, relaxed_recall)
+    if truth_mask.ndim == 2:
+        output = (float(relaxed_f1), float(relaxed_precision),
+                  float(relaxed_recall))
+    else:
+        output = (relaxed_f1, relaxed_precision, relaxed_recall)
     return output
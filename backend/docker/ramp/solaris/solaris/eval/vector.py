@@ -1,5 +1,7 @@
 import os
+import csv
 import glob
+from multiprocessing import Pool
 from tqdm import tqdm
 import numpy as np
 import geopandas as gpd
@@ -35,9 +37,37 @@ def average_score_by_class(ious, threshold=0.5):
     return average_by_class
 
 
+def _sorted_objects(objs):
+    """Sort unique class values so scores don't depend on set ordering."""
+    objs = set(objs)
+    try:
+        return sorted(objs)
+    except TypeError:  # mixed types
+        return sorted(objs, key=str)
+
+
+def _list_files(polygons_dir, file_format):
+    return sorted(os.path.basename(path) for path in glob.glob(
+        os.path.join(polygons_dir, "*" + file_format)))
+
+
+def _map_images(func, args, workers=1):
+    """Map `func` over `args` in a process pool, yielding results in order."""
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            yield from pool.imap(func, args)
+    else:
+        yield from map(func, args)
+
+
+def _read_objects(args):
+    path, cat_attrib = args
+    return list(gpd.read_file(path, ignore_geometry=True)[cat_attrib])
+
+
 def get_all_objects(proposal_polygons_dir, gt_polygons_dir,
                     prediction_cat_attrib="class", gt_cat_attrib='make',
-                    file_format="geojson"):
+                    file_format="geojson", workers=1):
     """ Using the proposal and ground truth polygons, calculate the total.
     Filenames of predictions and ground-truth must be identical.
     unique classes present in each
@@ -55,47 +85,214 @@ def get_all_objects(proposal_polygons_dir, gt_polygons_dir,
             specifies unique classes
         file_format : str
             The extension or file format for predictions
+        workers : int
+            Number of worker processes to read files with. Defaults to 1.
     Returns
     ---------
             prop_objs : list
-                All unique objects that exist in the proposals
+                All unique objects that exist in the proposals, sorted
             gt_obj : list
-                All unique objects that exist in the ground truth
+                All unique objects that exist in the ground truth, sorted
             all_objs : list
-                A union of the prop_objs and gt_objs lists
+                A union of the prop_objs and gt_objs lists, sorted
     """
-    objs = []
-    os.chdir(proposal_polygons_dir)
-    search = "*" + file_format
-    proposal_geojsons = glob.glob(search)
-    for geojson in tqdm(proposal_geojsons):
-        ground_truth_poly = os.path.join(gt_polygons_dir, geojson)
-        if os.path.exists(ground_truth_poly):
-            ground_truth_gdf = gpd.read_file(ground_truth_poly)
-            proposal_gdf = gpd.read_file(geojson)
-            for index, row in (proposal_gdf.iterrows()):
-                objs.append(row[prediction_cat_attrib])
-    prop_objs = list(set(objs))
-    os.chdir(gt_polygons_dir)
-    search = "*" + file_format
-    objs = []
-    gt_geojsons = glob.glob(search)
-    for geojson in tqdm(gt_geojsons):
-        proposal_poly = os.path.join(proposal_polygons_dir, geojson)
-        if os.path.exists(proposal_poly):
-            proposal_gdf = gpd.read_file(proposal_poly)
-            ground_truth_gdf = gpd.read_file(geojson)
-            for index, row in (ground_truth_gdf.iterrows()):
-                objs.append(row[gt_cat_attrib])
-    gt_objs = list(set(objs))
-    all_objs = gt_objs + prop_objs
-    all_objs = list(set(all_objs))
+    # only images with both proposals and ground truth count , and only the
+    # attribute tables are read
+    names = sorted(set(_list_files(proposal_polygons_dir, file_format)) &
+                   set(_list_files(gt_polygons_dir, file_format)))
+    args = [(os.path.join(proposal_polygons_dir, name), prediction_cat_attrib)
+            for name in names]
+    args += [(os.path.join(gt_polygons_dir, name), gt_cat_attrib)
+             for name in names]
+    objs = list(tqdm(_map_images(_read_objects, args, workers=workers),
+                     total=len(args)))
+    prop_objs = _sorted_objects(obj for objs_ in objs[:len(names)]
+                                for obj in objs_)
+    gt_objs = _sorted_objects(obj for objs_ in objs[len(names):]
+                              for obj in objs_)
+    all_objs = _sorted_objects(gt_objs + prop_objs)
     return prop_objs, gt_objs, all_objs
 
 
+def _object_ious(gdf, other_gdf, object_subset, cat_attrib, other_cat_attrib,
+                 confidence_attrib=None):
+    """ Greedily match objects of `gdf` to `other_gdf` class by class.
+
+    Each object gets the IoU of its best overlapping object in `other_gdf`
+    if the classes of both agree, otherwise 0. Matched objects are dropped
+    from `other_gdf` in place. `other_gdf` may be ``None`` if there is
+    nothing to match against, in which case every object scores 0.
+
+    Returns
+    ---------
+        ious : list of lists
+            IoU of each object per class
+        confidences : list of lists
+            `confidence_attrib` of each object per class, empty lists if
+            `confidence_attrib` is ``None``
+    """
+    ious_by_class = []
+    confidences_by_class = []
+    for obj in object_subset:
+        ious = []
+        confidences = []
+        gdf2 = gdf[gdf[cat_attrib] == obj]
+        for index, row in (gdf2.iterrows()):
+            if confidence_attrib is not None:
+                confidences.append(row[confidence_attrib])
+            if other_gdf is None:
+                ious.append(0)
+                continue
+            iou_GDF = calculate_iou(row.geometry, other_gdf)
+            if 'iou_score' in iou_GDF.columns:
+                iou = iou_GDF.iou_score.max()
+                max_iou_row = iou_GDF.loc[iou_GDF['iou_score'].idxmax(axis=0, skipna=True)]
+                id_1 = row[cat_attrib]
+                id_2 = other_gdf.loc[max_iou_row.name][other_cat_attrib]
+                if id_1 == id_2:
+                    ious.append(iou)
+                    other_gdf.drop(max_iou_row.name, axis=0, inplace=True)
+                else:
+                    iou = 0
+                    ious.append(iou)
+            else:
+                iou = 0
+                ious.append(iou)
+        ious_by_class.append(ious)
+        confidences_by_class.append(confidences)
+    return ious_by_class, confidences_by_class
+
+
+def _score_image(args):
+    """ Score one image: loads its proposal and ground truth files once and
+    returns per-class precision IoUs, confidences and recall IoUs (``None``
+    where not requested or the file doesn't exist)."""
+    (name, proposal_polygons_dir, gt_polygons_dir, object_subset,
+     prediction_cat_attrib, gt_cat_attrib, confidence_attrib, precision,
+     recall) = args
+    proposal_poly = os.path.join(proposal_polygons_dir, name)
+    ground_truth_poly = os.path.join(gt_polygons_dir, name)
+    proposal_gdf = None
+    ground_truth_gdf = None
+    if os.path.exists(proposal_poly):
+        proposal_gdf = gpd.read_file(proposal_poly)
+    if os.path.exists(ground_truth_poly):
+        ground_truth_gdf = gpd.read_file(ground_truth_poly)
+
+    precision_ious, confidences, recall_ious = None, None, None
+    if precision and proposal_gdf is not None:
+        if ground_truth_gdf is None:
+            print("Warning- No ground truth for:", name)
+        precision_ious, confidences = _object_ious(
+            proposal_gdf,
+            None if ground_truth_gdf is None else ground_truth_gdf.copy(),
+            object_subset, prediction_cat_attrib, gt_cat_attrib,
+            confidence_attrib=confidence_attrib)
+    if recall and ground_truth_gdf is not None:
+        recall_ious, _ = _object_ious(
+            ground_truth_gdf,
+            None if proposal_gdf is None else proposal_gdf.copy(),
+            object_subset, gt_cat_attrib, prediction_cat_attrib)
+    return precision_ious, confidences, recall_ious
+
+
+def score_images(proposal_polygons_dir, gt_polygons_dir, object_subset,
+                 prediction_cat_attrib="class", gt_cat_attrib='make',
+                 confidence_attrib=None, threshold=0.5, file_format="geojson",
+                 precision=True, recall=True, workers=1, output_csv=None):
+    """ Score all images of a directory pair, sharding images across
+    processes. Each proposal and ground truth file is loaded once; per-image
+    results are reduced in filename order so scores are the same for any
+    number of workers.
+    Arguments
+    ---------
+        proposal_polygons_dir : str
+            The path that contains any model proposal polygons
+        gt_polygons_dir : str
+            The path that contains the ground truth polygons
+        object_subset : list
+            The classes to score
+        prediction_cat_attrib : str
+            The column or attribute within the predictions that specifies
+            unique classes
+        gt_cat_attrib : str
+            The column or attribute within the ground truth that
+            specifies unique classes
+        confidence_attrib : str
+            The column or attribute within the proposal polygons that
+            specifies model confidence for each prediction
+        threshold : float
+            A value between 0.0 and 1.0 that determines the IOU threshold for a
+            true positve.
+        file_format : str
+            The extension or file format for predictions
+        precision : bool
+            Score proposals (every proposal file). Defaults to ``True``.
+        recall : bool
+            Score ground truth (every ground truth file). Defaults to
+            ``True``.
+        workers : int
+            Number of worker processes. Defaults to 1.
+        output_csv : str
+            Path to a CSV file that per-image, per-class counts are written
+            to as images are scored: proposals with an IoU at or above
+            `threshold` (``TruePos``) or below (``FalsePos``) and ground
+            truth objects below it (``FalseNeg``). Nothing is written if not
+            provided.
+    Returns
+    ---------
+        precision_iou_by_obj : list of lists
+            An iou score for each object per class (precision specific)
+        confidences : list of lists
+            All confidences for each object for each class
+        recall_iou_by_obj : list of lists
+            An iou score for each object per class (recall specific)
+    """
+    names = set()
+    if precision:
+        names.update(_list_files(proposal_polygons_dir, file_format))
+    if recall:
+        names.update(_list_files(gt_polygons_dir, file_format))
+    names = sorted(names)
+    args = [(name, proposal_polygons_dir, gt_polygons_dir, object_subset,
+             prediction_cat_attrib, gt_cat_attrib, confidence_attrib,
+             precision, recall) for name in names]
+
+    precision_iou_by_obj = [[] for obj in object_subset]
+    confidences = [[] for obj in object_subset]
+    recall_iou_by_obj = [[] for obj in object_subset]
+    csv_file = open(output_csv, 'w', newline='') if output_csv else None
+    try:
+        if csv_file is not None:
+            writer = csv.writer(csv_file)
+            writer.writerow(['image', 'class', 'TruePos', 'FalsePos',
+                             'FalseNeg'])
+        results = _map_images(_score_image, args, workers=workers)
+        for name, (precision_ious, image_confidences, recall_ious) in zip(
+                names, tqdm(results, total=len(names))):
+            for i, obj in enumerate(object_subset):
+                counts = [0, 0, 0]
+                if precision_ious is not None:
+                    precision_iou_by_obj[i].extend(precision_ious[i])
+                    confidences[i].extend(image_confidences[i])
+                    counts[0] = sum(iou >= threshold
+                                    for iou in precision_ious[i])
+                    counts[1] = len(precision_ious[i]) - counts[0]
+                if recall_ious is not None:
+                    recall_iou_by_obj[i].extend(recall_ious[i])
+                    counts[2] = sum(iou < threshold for iou in recall_ious[i])
+                if csv_file is not None and any(counts):
+                    writer.writerow([name, obj] + counts)
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+    return precision_iou_by_obj, confidences, recall_iou_by_obj
+
+
 def precision_calc(proposal_polygons_dir, gt_polygons_dir,
                    prediction_cat_attrib="class", gt_cat_attrib='make', confidence_attrib=None,
-                   object_subset=[], threshold=0.5, file_format="geojson"):
+                   object_subset=[], threshold=0.5, file_format="geojson",
+                   workers=1):
     """ Using the proposal and ground truth polygons, calculate precision metrics.
     Filenames of predictions and ground-truth must be identical.  Will only
     calculate metric for classes that exist in the ground truth.
@@ -123,6 +320,8 @@ def precision_calc(proposal_polygons_dir, gt_polygons_dir,
             true positve.
         file_format : str
             The extension or file format for predictions
+        workers : int
+            Number of worker processes to score images with. Defaults to 1.
     Returns
     ---------
         iou_holder : list of lists
@@ -134,71 +333,18 @@ def precision_calc(proposal_polygons_dir, gt_polygons_dir,
         confidences : list of lists
             All confidences for each object for each class
     """
-    ious = []
-    os.chdir(proposal_polygons_dir)
-    search = "*" + file_format
-    proposal_geojsons = glob.glob(search)
-    iou_holder = []
-    confidences = []
     if len(object_subset) == 0:
         prop_objs, object_subset, all_objs = get_all_objects(
             proposal_polygons_dir, gt_polygons_dir,
             prediction_cat_attrib=prediction_cat_attrib,
-            gt_cat_attrib=gt_cat_attrib, file_format=file_format)
-    for i in range(len(object_subset)):
-        iou_holder.append([])
-        confidences.append([])
-
-    for geojson in tqdm(proposal_geojsons):
-        ground_truth_poly = os.path.join(gt_polygons_dir, geojson)
-        if os.path.exists(ground_truth_poly):
-            ground_truth_gdf = gpd.read_file(ground_truth_poly)
-            proposal_gdf = gpd.read_file(geojson)
-            i = 0
-            for obj in object_subset:
-                conf_holder = []
-                proposal_gdf2 = proposal_gdf[proposal_gdf[prediction_cat_attrib] == obj]
-                for index, row in (proposal_gdf2.iterrows()):
-                    if confidence_attrib is not None:
-                        conf_holder.append(row[confidence_attrib])
-                    iou_GDF = calculate_iou(row.geometry, ground_truth_gdf)
-                    if 'iou_score' in iou_GDF.columns:
-                        iou = iou_GDF.iou_score.max()
-                        max_iou_row = iou_GDF.loc[iou_GDF['iou_score'].idxmax(axis=0, skipna=True)]
-                        id_1 = row[prediction_cat_attrib]
-                        id_2 = ground_truth_gdf.loc[max_iou_row.name][gt_cat_attrib]
-                        if id_1 == id_2:
-                            ious.append(iou)
-                            ground_truth_gdf.drop(max_iou_row.name, axis=0, inplace=True)
-                        else:
-                            iou = 0
-                            ious.append(iou)
-                    else:
-                        iou = 0
-                        ious.append(iou)
-                for item in ious:
-                    iou_holder[i].append(item)
-                if confidence_attrib is not None:
-                    for conf in conf_holder:
-                        confidences[i].append(conf)
-                ious = []
-                i += 1
-        else:
-            print("Warning- No ground truth for:", geojson)
-            proposal_gdf = gpd.read_file(geojson)
-            i = 0
-
-            for obj in object_subset:
-                proposal_gdf2 = proposal_gdf[proposal_gdf[gt_cat_attrib] == obj]
-                for z in range(len(proposal_gdf2)):
-                    ious.append(0)
-                for item in ious:
-                    iou_holder[i].append(item)
-                if confidence_attrib is not None:
-                    for conf in conf_holder:
-                        confidences[i].append(conf)
-                i += 1
-                ious = []
+            gt_cat_attrib=gt_cat_attrib, file_format=file_format,
+            workers=workers)
+    iou_holder, confidences, _ = score_images(
+        proposal_polygons_dir, gt_polygons_dir, object_subset,
+        prediction_cat_attrib=prediction_cat_attrib,
+        gt_cat_attrib=gt_cat_attrib, confidence_attrib=confidence_attrib,
+        threshold=threshold, file_format=file_format, recall=False,
+        workers=workers)
     precision_by_class = average_score_by_class(iou_holder, threshold=threshold)
     precision_by_class = list(np.nan_to_num(precision_by_class))
     mPrecision = np.nanmean(precision_by_class)
@@ -209,7 +355,8 @@ def precision_calc(proposal_polygons_dir, gt_polygons_dir,
 
 def recall_calc(proposal_polygons_dir, gt_polygons_dir,
                 prediction_cat_attrib="class", gt_cat_attrib='make',
-                object_subset=[], threshold=0.5, file_format="geojson"):
+                object_subset=[], threshold=0.5, file_format="geojson",
+                workers=1):
     """ Using the proposal and ground truth polygons, calculate recall metrics.
     Filenames of predictions and ground-truth must be identical. Will only
     calculate metric for classes that exist in the ground truth.
@@ -234,6 +381,8 @@ def recall_calc(proposal_polygons_dir, gt_polygons_dir,
             true positve.
         file_format : str
             The extension or file format for predictions
+        workers : int
+            Number of worker processes to score images with. Defaults to 1.
     Returns
     ---------
         iou_holder : list of lists
@@ -243,58 +392,17 @@ def recall_calc(proposal_polygons_dir, gt_polygons_dir,
         mRecall : float
             The mean recall score of recall_by_class
     """
-    ious = []
-    os.chdir(gt_polygons_dir)
-    search = "*" + file_format
-    gt_geojsons = glob.glob(search)
-    iou_holder = []
     if len(object_subset) == 0:
         prop_objs, object_subset, all_objs = get_all_objects(
             proposal_polygons_dir, gt_polygons_dir,
             prediction_cat_attrib=prediction_cat_attrib,
-            gt_cat_attrib=gt_cat_attrib, file_format=file_format)
-    for i in range(len(object_subset)):
-        iou_holder.append([])
-    for geojson in tqdm(gt_geojsons):
-        proposal_poly = os.path.join(proposal_polygons_dir, geojson)
-        if os.path.exists(proposal_poly):
-            proposal_gdf = gpd.read_file(proposal_poly)
-            ground_truth_gdf = gpd.read_file(geojson)
-            i = 0
-            for obj in object_subset:
-                ground_truth_gdf2 = ground_truth_gdf[ground_truth_gdf[gt_cat_attrib] == obj]
-                for index, row in (ground_truth_gdf2.iterrows()):
-                    iou_GDF = calculate_iou(row.geometry, proposal_gdf)
-                    if 'iou_score' in iou_GDF.columns:
-                        iou = iou_GDF.iou_score.max()
-                        max_iou_row = iou_GDF.loc[iou_GDF['iou_score'].idxmax(axis=0, skipna=True)]
-                        id_1 = row[gt_cat_attrib]
-                        id_2 = proposal_gdf.loc[max_iou_row.name][prediction_cat_attrib]
-                        if id_1 == id_2:
-                            ious.append(iou)
-                            proposal_gdf.drop(max_iou_row.name, axis=0, inplace=True)
-                        else:
-                            iou = 0
-                            ious.append(iou)
-                    else:
-                        iou = 0
-                        ious.append(iou)
-                for item in ious:
-                    iou_holder[i].append(item)
-                i += 1
-                ious = []
-        else:
-            ground_truth_gdf = gpd.read_file(geojson)
-            i = 0
-            for obj in object_subset:
-                ground_truth_gdf2 = ground_truth_gdf[ground_truth_gdf[gt_cat_attrib] == obj]
-                for z in range(len(ground_truth_gdf2)):
-                    ious.append(0)
-                for item in ious:
-                    iou_holder[i].append(item)
-                i += 1
-                ious = []
-
+            gt_cat_attrib=gt_cat_attrib, file_format=file_format,
+            workers=workers)
+    _, _, iou_holder = score_images(
+        proposal_polygons_dir, gt_polygons_dir, object_subset,
+        prediction_cat_attrib=prediction_cat_attrib,
+        gt_cat_attrib=gt_cat_attrib, threshold=threshold,
+        file_format=file_format, precision=False, workers=workers)
     recall_by_class = average_score_by_class(iou_holder, threshold=threshold)
     recall_by_class = list(np.nan_to_num(recall_by_class))
     mRecall = np.nanmean(recall_by_class)
@@ -304,7 +412,7 @@ def recall_calc(proposal_polygons_dir, gt_polygons_dir,
 
 def mF1(proposal_polygons_dir, gt_polygons_dir, prediction_cat_attrib="class",
         gt_cat_attrib='make', object_subset=[], threshold=0.5, confidence_attrib=None,
-        file_format="geojson", all_outputs=False):
+        file_format="geojson", all_outputs=False, workers=1, output_csv=None):
     """ Using the proposal and ground truth polygons, calculate F1 and mF1
     metrics. Filenames of predictions and ground-truth must be identical.  Will
     only calculate metric for classes that exist in the ground truth.
@@ -335,6 +443,11 @@ def mF1(proposal_polygons_dir, gt_polygons_dir, prediction_cat_attrib="class",
             The extension or file format for predictions
         all_outputs : bool
             `True` or `False`.  If `True` returns an expanded output.
+        workers : int
+            Number of worker processes to score images with. Defaults to 1.
+        output_csv : str
+            Path to a CSV file to stream per-image, per-class TruePos,
+            FalsePos and FalseNeg counts to, see :func:`score_images`.
     Returns
     ---------
         if all_outputs is `True`:
@@ -370,19 +483,25 @@ def mF1(proposal_polygons_dir, gt_polygons_dir, prediction_cat_attrib="class",
         prop_objs, object_subset, all_objs = get_all_objects(
             proposal_polygons_dir, gt_polygons_dir,
             prediction_cat_attrib=prediction_cat_attrib,
-            gt_cat_attrib=gt_cat_attrib, file_format=file_format)
-    print("calculating recall...")
-    recall_iou_by_obj, recall_by_class, mRecall = recall_calc(
-        proposal_polygons_dir, gt_polygons_dir,
+            gt_cat_attrib=gt_cat_attrib, file_format=file_format,
+            workers=workers)
+    print("scoring images...")
+    precision_iou_by_obj, confidences, recall_iou_by_obj = score_images(
+        proposal_polygons_dir, gt_polygons_dir, object_subset,
         prediction_cat_attrib=prediction_cat_attrib,
-        gt_cat_attrib=gt_cat_attrib, object_subset=object_subset,
-        threshold=threshold, file_format=file_format)
-    print("calculating precision...")
-    precision_iou_by_obj, precision_by_class, mPrecision, confidences = precision_calc(
-        proposal_polygons_dir, gt_polygons_dir,
-        prediction_cat_attrib=prediction_cat_attrib,
-        gt_cat_attrib=gt_cat_attrib, object_subset=object_subset,
-        threshold=threshold, confidence_attrib=confidence_attrib, file_format=file_format)
+        gt_cat_attrib=gt_cat_attrib, confidence_attrib=confidence_attrib,
+        threshold=threshold, file_format=file_format, workers=workers,
+        output_csv=output_csv)
+    recall_by_class = average_score_by_class(recall_iou_by_obj,
+                                             threshold=threshold)
+    recall_by_class = list(np.nan_to_num(recall_by_class))
+    mRecall = np.nanmean(recall_by_class)
+    print("mRecall:", mRecall)
+    precision_by_class = average_score_by_class(precision_iou_by_obj,
+                                                threshold=threshold)
+    precision_by_class = list(np.nan_to_num(precision_by_class))
+    mPrecision = np.nanmean(precision_by_class)
+    print("mPrecision:", mPrecision)
     print("calculating F1 scores...")
     f1s_by_class = []
     for recall, precision in zip(recall_by_class, precision_by_class):
@@ -400,7 +519,7 @@ def mF1(proposal_polygons_dir, gt_polygons_dir, prediction_cat_attrib="class",
 def mAP_score(proposal_polygons_dir, gt_polygons_dir,
               prediction_cat_attrib="class", gt_cat_attrib='make',
               object_subset=[], threshold=0.5, confidence_attrib="confidence",
-              file_format="geojson"):
+              file_format="geojson", workers=1, output_csv=None):
     """ Using the proposal and ground truth polygons calculate the Mean Average
     Precision (mAP) and  mF1 metrics. Filenames of predictions and ground-truth
     must be identical.  Will only calculate metric for classes that exist in
@@ -431,6 +550,11 @@ def mAP_score(proposal_polygons_dir, gt_polygons_dir,
             specifies model confidence for each prediction
         file_format : str
             The extension or file format for predictions
+        workers : int
+            Number of worker processes to score images with. Defaults to 1.
+        output_csv : str
+            Path to a CSV file to stream per-image, per-class TruePos,
+            FalsePos and FalseNeg counts to, see :func:`score_images`.
     Returns
     ---------
         mAP : float
@@ -464,7 +588,8 @@ def mAP_score(proposal_polygons_dir, gt_polygons_dir,
         prediction_cat_attrib=prediction_cat_attrib,
         gt_cat_attrib=gt_cat_attrib, object_subset=object_subset,
         threshold=threshold, confidence_attrib=confidence_attrib,
-        file_format=file_format, all_outputs=True)
+        file_format=file_format, all_outputs=True, workers=workers,
+        output_csv=output_csv)
 
     recall_thresholds = np.arange(0, 1.01, 0.01).tolist()
     APs_by_class = []
@@ -1,9 +1,17 @@
+import hashlib
+import os
+import tempfile
 from tensorflow import keras
 import numpy as np
 import rasterio
+import threading
+from multiprocessing.pool import ThreadPool
+from queue import Empty, Queue
+from rasterio.windows import Window
 from torch.utils.data import Dataset, DataLoader
 from .transform import _check_augs, process_aug_dict
 from ..utils.core import _check_df_load
+from ..utils.data import ChipShard
 from ..utils.geo import split_geom
 from ..utils.io import imread, _check_channel_order
 
@@ -25,10 +33,12 @@ def make_data_generator(framework, config, df, stage='train'):
         learning framework used for the model to be used.
     config : dict
         The config dictionary for the entire pipeline.
-    df : :class:`pandas.DataFrame` or :class:`str`
+    df : :class:`pandas.DataFrame`, :class:`str` or :class:`solaris.utils.data.ChipShard`
         A :class:`pandas.DataFrame` containing two columns: ``'image'``, with
         the path to images for training, and ``'label'``, with the path to the
-        label file corresponding to each image.
+        label file corresponding to each image. Alternatively, a
+        :class:`solaris.utils.data.ChipShard` or the path to one to read the
+        images and labels from.
     stage : str, optional
         Either ``'train'`` or ``'validate'``, indicates whether the object
         created is being used for training or validation. This determines which
@@ -53,7 +63,14 @@ def make_data_generator(framework, config, df, stage='train'):
             framework))
 
     # make sure the df is loaded
-    df = _check_df_load(df)
+    if ChipShard.is_shard(df):
+        df = ChipShard(df)
+    if isinstance(df, ChipShard):
+        shard = df
+        df = shard.df
+    else:
+        shard = None
+        df = _check_df_load(df)
 
     if stage == 'train':
         augs = config['training_augmentation']
@@ -78,7 +95,12 @@ def make_data_generator(framework, config, df, stage='train'):
             label_type=config['data_specs']['label_type'],
             is_categorical=config['data_specs']['is_categorical'],
             num_classes=num_classes,
-            shuffle=shuffle)
+            shuffle=shuffle,
+            dtype=config['data_specs'].get('dtype'),
+            workers=config['data_specs'].get('data_workers') or 1,
+            prefetch=config['data_specs'].get('data_prefetch') or 0,
+            cache_dir=config['data_specs'].get('data_cache_dir'),
+            shard=shard)
 
     elif framework in ['torch', 'pytorch']:
         dataset = TorchDataset(
@@ -88,7 +110,8 @@ def make_data_generator(framework, config, df, stage='train'):
             label_type=config['data_specs']['label_type'],
             is_categorical=config['data_specs']['is_categorical'],
             num_classes=num_classes,
-            dtype=config['data_specs']['dtype'])
+            dtype=config['data_specs']['dtype'],
+            shard=shard)
         # set up workers for DataLoader for pytorch
         data_workers = config['data_specs'].get('data_workers')
         if data_workers == 1 or data_workers is None:
@@ -136,11 +159,22 @@ class KerasSegmentationSequence(keras.utils.Sequence):
         Indicates the number of classes in the dataset
     shuffle : bool
         Indicates whether or not input order is shuffled for each epoch.
+    dtype : class:`numpy.dtype`
+        The data type of the generated images and masks.
+    workers : int
+        The number of threads loading and augmenting samples.
+    prefetch : int
+        The number of batches loaded ahead of the one requested.
+    cache_dir : str
+        The directory of the cache of decoded images and labels, if any.
+    shard : :class:`solaris.utils.data.ChipShard`
+        The shard images and labels are read from, if any.
     """
 
     def __init__(self, df, height, width, input_channels, output_channels,
                  augs, batch_size, label_type='mask', is_categorical=False,
-                 num_classes=1, shuffle=True):
+                 num_classes=1, shuffle=True, dtype=None, workers=1,
+                 prefetch=0, cache_dir=None, shard=None):
         """Create an instance of KerasSegmentationSequence.
 
         Arguments
@@ -171,9 +205,31 @@ class KerasSegmentationSequence(keras.utils.Sequence):
             Indicates the number of classes in the dataset
         shuffle : bool, optional
             Should image order be shuffled in each epoch?
+        dtype : str, optional
+            The dtype of the generated images and masks, e.g. ``"float32"``
+            or ``"uint8"``. If not provided, defaults to ``"float64"``. Must
+            be one of the `numpy dtype options`_.
+        workers : int, optional
+            The number of threads loading and augmenting the samples of a
+            batch in parallel. Defaults to ``1``, loading them one after
+            another in the calling thread.
+        prefetch : int, optional
+            The number of batches to start loading ahead of the one
+            requested, in index order. Defaults to ``0``.
+        cache_dir : str, optional
+            A directory to cache decoded images and labels in as ``.npy``
+            files. Each file is decoded once; later epochs memory-map the
+            cached array instead. If not provided, files are decoded every
+            time they are used.
+        shard : :class:`solaris.utils.data.ChipShard`, optional
+            A shard to read the images and labels from instead of the files
+            in `df`, which then only needs a row per chip, like
+            :attr:`solaris.utils.data.ChipShard.df`. Samples are views of the
+            shard's memory-mapped arrays until they are copied into a batch.
 
 
         .. _the reference file creation tutorial: https://solaris.readthedocs.io/en/latest/tutorials/notebooks/creating_im_reference_csvs.html
+        .. _numpy dtype options: https://docs.scipy.org/doc/numpy/user/basics.types.html
         """
 
         # TODO: IMPLEMENT GETTING INPUT FILE LISTS HERE!
@@ -189,6 +245,29 @@ class KerasSegmentationSequence(keras.utils.Sequence):
         self.is_categorical = is_categorical
         self.num_classes = num_classes
         self.shuffle = shuffle
+        if dtype is None:
+            self.dtype = np.float64  # default
+        # if it's a string, get the appropriate object
+        elif isinstance(dtype, str):
+            try:
+                self.dtype = getattr(np, dtype)
+            except AttributeError:
+                raise ValueError(
+                    'The data type {} is not supported'.format(dtype))
+        # lastly, check if it's already defined in the right format for use
+        elif issubclass(dtype, np.number) or isinstance(dtype, np.dtype):
+            self.dtype = dtype
+        self.workers = workers
+        self.prefetch = prefetch
+        self.cache_dir = cache_dir
+        self.shard = shard
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        if self.workers > 1 or self.prefetch > 0:
+            self._pool = ThreadPool(self.workers)
+        else:
+            self._pool = None
+        self._pending = {}  # batch index: the samples being loaded
         self.on_epoch_end()
 
     def on_epoch_end(self):
@@ -197,38 +276,64 @@ class KerasSegmentationSequence(keras.utils.Sequence):
         self.image_indexes = np.arange(len(self.df))
         if self.shuffle:
             np.random.shuffle(self.image_indexes)
+        # batches loaded ahead for the last epoch no longer apply
+        self._pending = {}
+        for index in range(min(self.prefetch, self.n_batches)):
+            self._pending[index] = self._load_async(index)
+
+    def _load_sample(self, image_idx):
+        """Load and augment the image and mask at `image_idx` in `df`."""
+        if self.shard is not None:
+            im, label = self.shard[image_idx]
+        else:
+            im = _cached_imread(self.df['image'].iloc[image_idx],
+                                self.cache_dir)
+            im = _check_channel_order(im, 'keras')
+        if self.label_type == 'mask':
+            if self.shard is None:
+                label = _cached_imread(self.df['label'].iloc[image_idx],
+                                       self.cache_dir)
+            if not self.is_categorical:
+                label = (label != 0).astype(label.dtype)
+            aug_result = self.aug(image=im, mask=label)
+            # if image shape is 2D, convert to 3D
+            if len(aug_result['image'].shape) == 2:
+                aug_result['image'] = aug_result['image'][:, :, np.newaxis]
+            if len(aug_result['mask'].shape) == 2:
+                aug_result['mask'] = aug_result['mask'][:, :, np.newaxis]
+            return aug_result['image'], aug_result['mask']
+        else:
+            raise NotImplementedError(
+                'Usage of non-mask labels is not implemented yet.')
+
+    def _load_async(self, index):
+        """Start loading the samples of batch `index` in the thread pool."""
+        im_inds = self.image_indexes[index*self.batch_size:
+                                     (index+1)*self.batch_size]
+        return [self._pool.apply_async(self._load_sample, (image_idx,))
+                for image_idx in im_inds]
 
-    def _data_generation(self, image_idxs):
+    def _data_generation(self, image_idxs=None, samples=None):
+        """Build a batch from `image_idxs`, or from the ``(image, mask)``
+        pairs of `samples` if they are already loaded."""
         # initialize the output array
         X = np.empty((self.batch_size,
                       self.height,
                       self.width,
-                      self.input_channels))
+                      self.input_channels), dtype=self.dtype)
         if self.label_type == 'mask':
             y = np.empty((self.batch_size,
                           self.height,
                           self.width,
-                          self.output_channels))
+                          self.output_channels), dtype=self.dtype)
         else:
             pass  # TODO: IMPLEMENT BBOX LABEL SETUP HERE!
-        for i in range(self.batch_size):
-            im = imread(self.df['image'].iloc[image_idxs[i]])
-            im = _check_channel_order(im, 'keras')
-            if self.label_type == 'mask':
-                label = imread(self.df['label'].iloc[image_idxs[i]])
-                if not self.is_categorical:
-                    label[label != 0] = 1
-                aug_result = self.aug(image=im, mask=label)
-                # if image shape is 2D, convert to 3D
-                if len(aug_result['image'].shape) == 2:
-                    aug_result['image'] = aug_result['image'][:, :, np.newaxis]
-                X[i, :, :, :] = aug_result['image']
-                if len(aug_result['mask'].shape) == 2:
-                    aug_result['mask'] = aug_result['mask'][:, :, np.newaxis]
-                y[i, :, :, :] = aug_result['mask']
-            else:
-                raise NotImplementedError(
-                    'Usage of non-mask labels is not implemented yet.')
+        if samples is None:
+            samples = (self._load_sample(image_idx)
+                       for image_idx in image_idxs)
+        for i, (im, mask) in enumerate(samples):
+            X[i, :, :, :] = im
+            y[i, :, :, :] = mask
 
         return X, y
 
@@ -241,12 +346,24 @@ class KerasSegmentationSequence(keras.utils.Sequence):
 
     def __getitem__(self, index):
         """Generate one batch of data."""
-        # Generate indexes of the batch
-        im_inds = self.image_indexes[index*self.batch_size:
-                                     (index+1)*self.batch_size]
-
-        # Generate data
-        X, y = self._data_generation(image_idxs=im_inds)
+        if self._pool is None:
+            # Generate indexes of the batch
+            im_inds = self.image_indexes[index*self.batch_size:
+                                         (index+1)*self.batch_size]
+
+            # Generate data
+            X, y = self._data_generation(image_idxs=im_inds)
+            return X, y
+
+        pending = self._pending.pop(index, None)
+        if pending is None:
+            pending = self._load_async(index)
+        for next_index in range(index + 1, min(index + 1 + self.prefetch,
+                                               self.n_batches)):
+            if next_index not in self._pending:
+                self._pending[next_index] = self._load_async(next_index)
+        X, y = self._data_generation(
+            samples=(result.get() for result in pending))
         return X, y
 
 
@@ -279,10 +396,12 @@ class TorchDataset(Dataset):
     dtype : class:`numpy.dtype`
         The data type images should be converted to before being passed to
         neural nets.
+    shard : :class:`solaris.utils.data.ChipShard`
+        The shard images and labels are read from, if any.
     """
 
     def __init__(self, df, augs, batch_size, label_type='mask',
-                 is_categorical=False, num_classes=1, dtype=None):
+                 is_categorical=False, num_classes=1, dtype=None, shard=None):
         """
         Create an instance of TorchDataset for use in model training.
 
@@ -308,6 +427,10 @@ class TorchDataset(Dataset):
             The dtype that image arrays should be converted to before being
             passed to the neural net. If not provided, defaults to
             ``"float32"``. Must be one of the `numpy dtype options`_.
+        shard : :class:`solaris.utils.data.ChipShard`, optional
+            A shard to read the images and labels from instead of the files
+            in `df`, which then only needs a row per chip, like
+            :attr:`solaris.utils.data.ChipShard.df`.
 
         .. _numpy dtype options: https://docs.scipy.org/doc/numpy/user/basics.types.html
         """
@@ -319,6 +442,7 @@ class TorchDataset(Dataset):
         self.aug = _check_augs(augs)
         self.is_categorical = is_categorical
         self.num_classes = num_classes
+        self.shard = shard
 
         if dtype is None:
             self.dtype = np.float32  # default
@@ -339,10 +463,13 @@ class TorchDataset(Dataset):
     def __getitem__(self, idx):
         """Get one image, mask pair"""
         # Generate indexes of the batch
-        image = imread(self.df['image'].iloc[idx])
-        mask = imread(self.df['label'].iloc[idx])
+        if self.shard is not None:
+            image, mask = self.shard[idx]
+        else:
+            image = imread(self.df['image'].iloc[idx])
+            mask = imread(self.df['label'].iloc[idx])
         if not self.is_categorical:
-            mask[mask != 0] = 1
+            mask = (mask != 0).astype(mask.dtype)
         if len(mask.shape) == 2:
             mask = mask[:, :, np.newaxis]
         if len(image.shape) == 2:
@@ -459,6 +586,10 @@ class InferenceTiler(object):
                 top left corner indices of each sample along the first axis of
                 ``inference_arr`` . These values can be used to stitch the
                 inferencing result back together.
+
+        See Also
+        --------
+        :meth:`iter_batches`
         """
         # read in the image if it's a path
         if isinstance(im, str):
@@ -466,32 +597,222 @@ class InferenceTiler(object):
         # determine how many samples will be generated with the sliding window
         src_im_height = im.shape[0]
         src_im_width = im.shape[1]
-        y_steps = int(1+np.ceil((src_im_height-self.height)/self.y_step))
-        x_steps = int(1+np.ceil((src_im_width-self.width)/self.x_step))
         if len(im.shape) == 2:  # if there's no channel axis
             im = im[:, :, np.newaxis]  # create one - will be needed for model
-        top_left_corner_idxs = []
+        top_left_corner_idxs = self.tile_indexes(src_im_height, src_im_width)
         output_arr = []
+        for y_min, x_min in top_left_corner_idxs:
+            subarr = im[y_min:y_min + self.height,
+                        x_min:x_min + self.width,
+                        :]
+            if self.aug is not None:
+                subarr = self.aug(image=subarr)['image']
+            output_arr.append(subarr)
+        output_arr = np.stack(output_arr).astype(np.float32)
+        if self.framework in ['torch', 'pytorch']:
+            output_arr = np.moveaxis(output_arr, 3, 1)
+        return output_arr, top_left_corner_idxs, (src_im_height, src_im_width)
+
+    def tile_indexes(self, src_im_height, src_im_width):
+        """Get the top left corner of each tile of an image.
+
+        Arguments
+        ---------
+        src_im_height : int
+            The height of the image in pixels.
+        src_im_width : int
+            The width of the image in pixels.
+
+        Returns
+        -------
+        top_left_corner_idxs : :class:`list` of :class:`tuple` s of :class:`int` s
+            ``(top, left)`` tuples, row by row, in the order that
+            :meth:`__call__` and :meth:`iter_batches` produce the tiles.
+        """
+        y_steps = int(1+np.ceil((src_im_height-self.height)/self.y_step))
+        x_steps = int(1+np.ceil((src_im_width-self.width)/self.x_step))
+        top_left_corner_idxs = []
         for y in range(y_steps):
-            if self.y_step*y + self.height > im.shape[0]:
-                y_min = im.shape[0] - self.height
+            if self.y_step*y + self.height > src_im_height:
+                y_min = src_im_height - self.height
             else:
                 y_min = self.y_step*y
 
             for x in range(x_steps):
-                if self.x_step*x + self.width > im.shape[1]:
-                    x_min = im.shape[1] - self.width
+                if self.x_step*x + self.width > src_im_width:
+                    x_min = src_im_width - self.width
                 else:
                     x_min = self.x_step*x
+                top_left_corner_idxs.append((y_min, x_min))
+        return top_left_corner_idxs
+
+    def iter_batches(self, im, batch_size, prefetch=1):
+        """Yield inference batches of an image one at a time.
+
+        The tiles are the same as those from calling the tiler, but only the
+        batches in flight are held in memory. If `im` is a path, each tile is
+        read from the file with a windowed :mod:`rasterio` read, so the image
+        is never loaded whole; otherwise the tiles are views of `im`. Batches
+        are made on a background thread, up to `prefetch` ahead of the one
+        being used, so that reading overlaps with running the model.
+
+        This is a helper for running a model over one image yourself;
+        :class:`solaris.nets.infer.Inferer` does not use it, as it batches
+        tiles across images with :meth:`read_tiles` instead.
+
+        Arguments
+        ---------
+        im : :class:`str` or :class:`numpy.array`
+            An image to perform inference on.
+        batch_size : int
+            The number of tiles per batch. The last batch may be smaller.
+        prefetch : int, optional
+            The number of batches to make ahead of the one being used.
+            Defaults to ``1``. If ``0``, batches are made on demand in the
+            calling thread.
+
+        Yields
+        ------
+        batch, top_left_corner_idxs
+            batch : ``[N, Y, X, C]`` :class:`numpy.array`
+                ``float32`` tiles, ``[N, C, Y, X]`` for PyTorch.
+            top_left_corner_idxs : :class:`list` of :class:`tuple` s of :class:`int` s
+                The ``(top, left)`` corner of each tile in `batch`.
+        """
+        batches = self._make_batches(im, batch_size)
+        if prefetch > 0:
+            batches = _prefetch(batches, prefetch)
+        for batch in batches:
+            yield batch
 
+    def read_tiles(self, im, top_left_corner_idxs):
+        """Read tiles of an image into one inference array.
+
+        Arguments
+        ---------
+        im : :class:`str`, :class:`numpy.array` or :class:`rasterio.DatasetReader`
+            The image to read the tiles from. Tiles of a path or an open
+            dataset are read with windowed reads.
+        top_left_corner_idxs : :class:`list` of :class:`tuple` s of :class:`int` s
+            The ``(top, left)`` corner of each tile to read, from
+            :meth:`tile_indexes`.
+
+        Returns
+        -------
+        output_arr : :class:`numpy.array`
+            ``float32`` tiles, ``[N, Y, X, C]`` or ``[N, C, Y, X]`` for
+            PyTorch.
+        """
+        if isinstance(im, str):
+            with rasterio.open(im) as src:
+                return self.read_tiles(src, top_left_corner_idxs)
+        if isinstance(im, np.ndarray) and len(im.shape) == 2:
+            im = im[:, :, np.newaxis]  # create a channel axis
+        output_arr = None
+        for i, (y_min, x_min) in enumerate(top_left_corner_idxs):
+            if isinstance(im, np.ndarray):
                 subarr = im[y_min:y_min + self.height,
                             x_min:x_min + self.width,
                             :]
-                if self.aug is not None:
-                    subarr = self.aug(image=subarr)['image']
-                output_arr.append(subarr)
-                top_left_corner_idxs.append((y_min, x_min))
-        output_arr = np.stack(output_arr).astype(np.float32)
+            else:
+                subarr = np.moveaxis(im.read(window=Window(
+                    x_min, y_min, self.width, self.height)), 0, -1)
+            if self.aug is not None:
+                subarr = self.aug(image=subarr)['image']
+            if output_arr is None:
+                output_arr = np.empty(
+                    (len(top_left_corner_idxs),) + subarr.shape,
+                    dtype=np.float32)
+            output_arr[i] = subarr
         if self.framework in ['torch', 'pytorch']:
             output_arr = np.moveaxis(output_arr, 3, 1)
-        return output_arr, top_left_corner_idxs, (src_im_height, src_im_width)
+        return output_arr
+
+    def _make_batches(self, im, batch_size):
+        """Make the batches yielded by :meth:`iter_batches`, in order."""
+        if isinstance(im, str):
+            im = rasterio.open(im)
+            src_im_height, src_im_width = im.height, im.width
+        else:
+            src_im_height, src_im_width = im.shape[:2]
+        try:
+            top_left_corner_idxs = self.tile_indexes(src_im_height,
+                                                     src_im_width)
+            for start in range(0, len(top_left_corner_idxs), batch_size):
+                batch_idxs = top_left_corner_idxs[start:start + batch_size]
+                yield self.read_tiles(im, batch_idxs), batch_idxs
+        finally:
+            if not isinstance(im, np.ndarray):
+                im.close()
+
+
+def _cached_imread(path, cache_dir=None):
+    """Read an image with :func:`solaris.utils.io.imread`, through a cache of
+    decoded arrays in `cache_dir` if one is given.
+
+    Cached arrays are ``.npy`` files named after the path, size and
+    modification time of the file they were decoded from, and are returned
+    as read-only memory maps.
+    """
+    if cache_dir is None:
+        return imread(path)
+    stat = os.stat(path)
+    key = '{}:{}:{}'.format(os.path.abspath(path), stat.st_size,
+                            stat.st_mtime_ns)
+    cache_path = os.path.join(
+        cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+    try:
+        return np.load(cache_path, mmap_mode='r')
+    except FileNotFoundError:
+        pass
+    arr = imread(path)
+    # write to a temporary file first, so that no reader sees a partial array
+    fd, part_path = tempfile.mkstemp(suffix='.part', dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, arr)
+    os.replace(part_path, cache_path)
+    return arr
+
+
+def _prefetch(iterable, size):
+    """Iterate over `iterable` on a background thread, `size` items ahead.
+
+    Exceptions raised while iterating are re-raised in the calling thread.
+    Closing the returned generator early stops the background thread.
+    """
+    queue = Queue(maxsize=size)
+    stop = threading.Event()
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                queue.put((True, item))
+        except Exception as e:
+            queue.put((False, e))
+            return
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+        queue.put((False, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            is_item, item = queue.get()
+            if not is_item:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        # unblock the background thread if it is waiting for room
+        while thread.is_alive():
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
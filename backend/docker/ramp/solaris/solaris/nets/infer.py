@@ -1,12 +1,16 @@
 import os
+import time
 import torch
 import gdal
 import numpy as np
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from warnings import warn
 from .model_io import get_model
 from .transform import process_aug_dict
-from .datagen import InferenceTiler
-from ..raster.image import stitch_images, create_multiband_geotiff
+from .datagen import InferenceTiler, _prefetch
+from ..raster.image import Stitcher, create_multiband_geotiff
 from ..utils.core import get_data_paths
 
 
@@ -46,9 +50,26 @@ class Inferer(object):
         self.output_dir = self.config['inference']['output_dir']
         if not os.path.isdir(self.output_dir):
             os.makedirs(self.output_dir)
+        self.workers = self.config['inference'].get('workers', 1)
+        self.verbose = self.config['inference'].get('verbose', False)
+        self.timings = {}
 
     def __call__(self, infer_df=None):
         """Run inference.
+
+        The images are processed as a pipeline. Tiles are read from the
+        images ahead of the model, in ``inference: workers`` processes or, with
+        one worker, on a background thread. The main process predicts them in
+        batches of ``batch_size``, which can span images, and stitches the
+        predictions as they are made. Each finished image is written out by a
+        pool of writer threads, or in the main process with one worker. At
+        most ``2 * workers`` reads and writes are pending at a time.
+
+        Seconds spent in each stage are stored in :attr:`timings` and printed
+        if ``inference: verbose`` is set. ``'read'`` and ``'write'`` are summed
+        over the workers, and ``'read_wait'`` and ``'write_wait'`` are how long
+        the main process waited for them.
+
         Arguments
         ---------
         infer_df : :class:`pandas.DataFrame` or `str`
@@ -70,48 +91,218 @@ class Inferer(object):
             y_step=self.window_step_y,
             augmentations=process_aug_dict(
                 self.config['inference_augmentation']))
-        for idx, im_path in enumerate(infer_df['image']):
-            temp_im = gdal.Open(im_path)
-            proj = temp_im.GetProjection()
-            gt = temp_im.GetGeoTransform()
-            inf_input, idx_refs, (
-                src_im_height, src_im_width) = inf_tiler(im_path)
-
-            if self.framework == 'keras':
-                subarr_preds = self.model.predict(inf_input,
-                                                  batch_size=self.batch_size)
-
-            elif self.framework in ['torch', 'pytorch']:
-                with torch.no_grad():
-                    self.model.eval()
-                if torch.cuda.is_available():
-                    device = torch.device('cuda')
-                    self.model = self.model.cuda()
-                else:
-                    device = torch.device('cpu')
-                inf_input = torch.from_numpy(inf_input).float().to(device)
-                # add additional input data, if applicable
-                if self.config['data_specs'].get('additional_inputs',
-                                                 None) is not None:
-                    inf_input = [inf_input]
-                    for i in self.config['data_specs']['additional_inputs']:
-                        inf_input.append(
-                            infer_df[i].iloc[idx].to(device))
-
-                subarr_preds = self.model(inf_input)
-                subarr_preds = subarr_preds.cpu().data.numpy()
-            stitched_result = stitch_images(subarr_preds,
-                                            idx_refs=idx_refs,
-                                            out_width=src_im_width,
-                                            out_height=src_im_height,
-                                            method=self.stitching_method)
-            stitched_result = np.swapaxes(stitched_result, 1, 0)
-            stitched_result = np.swapaxes(stitched_result, 2, 0)
-            create_multiband_geotiff(stitched_result,
-                                     os.path.join(self.output_dir,
-                                                  os.path.split(im_path)[1]),
-                                     proj=proj, geo=gt, nodata=np.nan,
-                                     out_format=gdal.GDT_Float32)
+        self.timings = dict.fromkeys(['read', 'read_wait', 'predict',
+                                      'stitch', 'write', 'write_wait'], 0.)
+        start = time.perf_counter()
+        if self.framework in ['torch', 'pytorch']:
+            self.model.eval()
+            if torch.cuda.is_available():
+                device = torch.device('cuda')
+                self.model = self.model.cuda()
+            else:
+                device = torch.device('cpu')
+        else:
+            device = None
+        # additional inputs are per image, so batches can't span images
+        batch_across_images = self.config['data_specs'].get(
+            'additional_inputs', None) is None
+
+        read_pool = Pool(self.workers) if self.workers > 1 else None
+        write_pool = ThreadPool(self.workers) if self.workers > 1 else None
+        images = {}
+        pending_writes = deque()
+        try:
+            buffered = deque()
+            n_buffered = 0
+            for chunk in self._read_chunks(infer_df, inf_tiler, read_pool,
+                                           images):
+                if buffered and buffered[-1][0] != chunk[0] and \
+                        not batch_across_images:
+                    self._predict_buffered(buffered, n_buffered, infer_df,
+                                           device, images, write_pool,
+                                           pending_writes)
+                    n_buffered = 0
+                buffered.append(chunk)
+                n_buffered += len(chunk[1])
+                while n_buffered >= self.batch_size:
+                    n_buffered -= self._predict_buffered(
+                        buffered, self.batch_size, infer_df, device, images,
+                        write_pool, pending_writes)
+            while n_buffered:
+                n_buffered -= self._predict_buffered(
+                    buffered, self.batch_size, infer_df, device, images,
+                    write_pool, pending_writes)
+            wait_start = time.perf_counter()
+            for result in pending_writes:
+                self.timings['write'] += result.get()
+            self.timings['write_wait'] += time.perf_counter() - wait_start
+        finally:
+            for pool in [read_pool, write_pool]:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+        self.timings['total'] = time.perf_counter() - start
+        if self.verbose:
+            print('Inference on {} images took {:.1f} s: '.format(
+                len(infer_df), self.timings['total']) + ', '.join(
+                    '{} {:.1f} s'.format(stage.replace('_', ' '), seconds)
+                    for stage, seconds in self.timings.items()
+                    if stage != 'total'))
+
+    def _read_chunks(self, infer_df, inf_tiler, read_pool, images):
+        """Read the tiles of each image in `infer_df` in chunks of up to
+        ``batch_size``, yielding ``(idx, top_left_corner_idxs, tiles)`` in
+        order.
+
+        Each image is added to `images` as ``idx: [stitcher, tiles left,
+        output path, projection, geotransform]`` before its first chunk.
+        """
+        def tasks():
+            for idx, im_path in enumerate(infer_df['image']):
+                temp_im = gdal.Open(im_path)
+                src_im_height = temp_im.RasterYSize
+                src_im_width = temp_im.RasterXSize
+                top_left_corner_idxs = inf_tiler.tile_indexes(src_im_height,
+                                                              src_im_width)
+                images[idx] = [
+                    Stitcher(src_im_height, src_im_width,
+                             method=self.stitching_method),
+                    len(top_left_corner_idxs),
+                    os.path.join(self.output_dir, os.path.split(im_path)[1]),
+                    temp_im.GetProjection(), temp_im.GetGeoTransform()]
+                for i in range(0, len(top_left_corner_idxs), self.batch_size):
+                    yield idx, im_path, top_left_corner_idxs[
+                        i:i + self.batch_size]
+
+        if read_pool is None:
+            reads = _prefetch(
+                ((idx, chunk_idxs, _timed(inf_tiler.read_tiles, im_path,
+                                          chunk_idxs))
+                 for idx, im_path, chunk_idxs in tasks()), 2)
+        else:
+            reads = _in_order((
+                (idx, chunk_idxs, read_pool.apply_async(
+                    _timed, (inf_tiler.read_tiles, im_path, chunk_idxs)))
+                for idx, im_path, chunk_idxs in tasks()), 2 * self.workers)
+        while True:
+            wait_start = time.perf_counter()
+            try:
+                idx, chunk_idxs, (tiles, seconds) = next(reads)
+            except StopIteration:
+                return
+            self.timings['read_wait'] += time.perf_counter() - wait_start
+            self.timings['read'] += seconds
+            yield idx, chunk_idxs, tiles
+
+    def _predict_buffered(self, buffered, batch_size, infer_df, device,
+                          images, write_pool, pending_writes):
+        """Predict up to `batch_size` tiles from the front of `buffered`, stitch
+        the predictions and write out any images they finish.
+
+        Returns the number of tiles predicted.
+        """
+        parts = []
+        n_tiles = 0
+        while buffered and n_tiles < batch_size:
+            idx, chunk_idxs, tiles = buffered.popleft()
+            n_take = min(batch_size - n_tiles, len(chunk_idxs))
+            if n_take < len(chunk_idxs):
+                buffered.appendleft((idx, chunk_idxs[n_take:],
+                                     tiles[n_take:]))
+            parts.append((idx, chunk_idxs[:n_take], tiles[:n_take]))
+            n_tiles += n_take
+        if len(parts) == 1:
+            batch = parts[0][2]
+        else:
+            batch = np.concatenate([tiles for _, _, tiles in parts])
+
+        predict_start = time.perf_counter()
+        subarr_preds = self._predict_batch(batch, infer_df, parts[0][0],
+                                           device)
+        self.timings['predict'] += time.perf_counter() - predict_start
+
+        stitch_start = time.perf_counter()
+        if self.framework in ['torch', 'pytorch']:
+            subarr_preds = np.moveaxis(subarr_preds, 1, -1)
+        offset = 0
+        finished = []
+        for idx, chunk_idxs, _ in parts:
+            stitcher = images[idx][0]
+            for tile, idx_ref in zip(
+                    subarr_preds[offset:offset + len(chunk_idxs)],
+                    chunk_idxs):
+                stitcher.add(tile, idx_ref)
+            offset += len(chunk_idxs)
+            images[idx][1] -= len(chunk_idxs)
+            if images[idx][1] == 0:
+                finished.append(images.pop(idx))
+        self.timings['stitch'] += time.perf_counter() - stitch_start
+
+        for stitcher, _, out_path, proj, gt in finished:
+            if write_pool is None:
+                self.timings['write'] += _write_prediction(stitcher, out_path,
+                                                           proj, gt)
+                continue
+            pending_writes.append(write_pool.apply_async(
+                _write_prediction, (stitcher, out_path, proj, gt)))
+            # keep a bounded number of stitched images in memory
+            if len(pending_writes) > 2 * self.workers:
+                wait_start = time.perf_counter()
+                self.timings['write'] += pending_writes.popleft().get()
+                self.timings['write_wait'] += time.perf_counter() - wait_start
+        return n_tiles
+
+    def _predict_batch(self, batch, infer_df, idx, device):
+        """Predict a batch of tiles, with the additional inputs of the image
+        at `idx` in `infer_df` if there are any."""
+        if self.framework == 'keras':
+            # predict() builds a new input pipeline on every call, which
+            # costs more than running the model on a single batch
+            return np.asarray(self.model.predict_on_batch(batch))
+
+        batch = torch.from_numpy(batch).float().to(device)
+        # add additional input data, if applicable
+        if self.config['data_specs'].get('additional_inputs',
+                                         None) is not None:
+            batch = [batch]
+            for i in self.config['data_specs']['additional_inputs']:
+                batch.append(infer_df[i].iloc[idx].to(device))
+        with torch.no_grad():
+            subarr_preds = self.model(batch)
+        return subarr_preds.cpu().data.numpy()
+
+
+def _timed(func, *args):
+    """Call `func` with `args`, returning its result and the seconds taken."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _in_order(tasks, limit):
+    """Yield ``(idx, top_left_corner_idxs, result)`` for each
+    ``(idx, top_left_corner_idxs, async_result)`` in `tasks`, in order,
+    submitting at most `limit` tasks ahead."""
+    pending = deque()
+    for task in tasks:
+        pending.append(task)
+        if len(pending) > limit:
+            idx, chunk_idxs, result = pending.popleft()
+            yield idx, chunk_idxs, result.get()
+    for idx, chunk_idxs, result in pending:
+        yield idx, chunk_idxs, result.get()
+
+
+def _write_prediction(stitcher, out_path, proj, gt):
+    """Write the prediction stitched by `stitcher` to a GeoTIFF at
+    `out_path`, returning the seconds taken."""
+    start = time.perf_counter()
+    stitched_result = stitcher.result()
+    stitched_result = np.swapaxes(stitched_result, 1, 0)
+    stitched_result = np.swapaxes(stitched_result, 2, 0)
+    create_multiband_geotiff(stitched_result, out_path, proj=proj, geo=gt,
+                             nodata=np.nan, out_format=gdal.GDT_Float32)
+    return time.perf_counter() - start
 
 
 def get_infer_df(config):
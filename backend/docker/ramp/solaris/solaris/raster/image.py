@@ -51,7 +51,10 @@ def stitch_images(im_arr, idx_refs=None, out_width=None,
         A 3- or 4-D :class:`numpy.array` with shape ``[N, Y, X(, C)]`` or a
         list of length N made up of 2- or 3-D tensors with shape
         ``[Y, X(, C)]``. These array(s) will be stitched together to produce a
-        single output of shape ``[Y, X(, C)]`` .
+        single output of shape ``[Y, X(, C)]`` . Can also be an iterable,
+        e.g. a generator, of ``(tile, (Y, X))`` pairs, where ``(Y, X)`` is the
+        index reference of the tile (see `idx_refs`), which are stitched as
+        they are produced. `out_width` and `out_height` must then be provided.
     idx_refs : list, optional
         A list of ``(Y, X)`` indices for each sub-array to define the location
         of the first corner in the final output. Used for stitching together
@@ -86,72 +89,133 @@ def stitch_images(im_arr, idx_refs=None, out_width=None,
     output_arr : a :class:`numpy.array` with shape ``[Y, X(, C)]`` .
     """
     # determine what shape the input is and stitch together accordingly
-    if isinstance(im_arr, list):
-        im_arr = np.stack(im_arr)  # stack along a new 1st axis
-
-    im_arr = reorder_axes(im_arr, 'tensorflow')
-
-    if idx_refs is not None:
-        if len(idx_refs) != im_arr.shape[0]:
-            raise ValueError('len(idx_refs) must be equal to the number of '
-                             'images being stitched.')
-    if idx_refs is not None and (out_width is None or out_height is None):
-        raise ValueError('If idx_refs are provided, the desired '
-                         'out_height and out_width must be provided as well.')
-    if len(im_arr.shape) == 4:
-        has_channels = True
-    elif len(im_arr.shape) == 3:
-        has_channels = False
-
-    if idx_refs is not None:  # proxy for whether dims were provided as args
-        if has_channels:
-            stitching_arr = np.empty(shape=(im_arr.shape[0],
-                                            out_height, out_width,
-                                            im_arr.shape[3]))
+    if isinstance(im_arr, (np.ndarray, list)):
+        if isinstance(im_arr, list):
+            im_arr = np.stack(im_arr)  # stack along a new 1st axis
+
+        im_arr = reorder_axes(im_arr, 'tensorflow')
+
+        if idx_refs is not None:
+            if len(idx_refs) != im_arr.shape[0]:
+                raise ValueError('len(idx_refs) must be equal to the number '
+                                 'of images being stitched.')
+        if idx_refs is not None and (out_width is None or out_height is None):
+            raise ValueError('If idx_refs are provided, the desired '
+                             'out_height and out_width must be provided as '
+                             'well.')
+        if idx_refs is None:  # just stitching across images with no offset
+            out_height, out_width = im_arr.shape[1:3]
+            idx_refs = [(0, 0)] * im_arr.shape[0]
+        tiles = zip(im_arr, idx_refs)
+    else:
+        if out_width is None or out_height is None:
+            raise ValueError('If (tile, (Y, X)) pairs are provided, the '
+                             'desired out_height and out_width must be '
+                             'provided as well.')
+        # tiles are reordered as they would be stacked
+        tiles = ((reorder_axes(tile[np.newaxis], 'tensorflow')[0]
+                  if tile.ndim == 3 else tile, idx_ref)
+                 for tile, idx_ref in im_arr)
+
+    stitcher = Stitcher(out_height, out_width, method=method)
+    for tile, idx_ref in tiles:
+        stitcher.add(tile, idx_ref)
+
+    return stitcher.result()
+
+
+class Stitcher(object):
+    """Stitch tiles into a single array as they are added.
+
+    Only output-sized buffers are kept, whatever the number of tiles: the sum
+    and the count of the values at each pixel for ``'average'``, and the
+    value picked so far, plus its confidence for ``'confidence'``, for
+    ``'first'`` and ``'confidence'``. The result is the same as stacking the
+    tiles in output-sized planes filled with NaN and reducing along the
+    stack, which is how :func:`stitch_images` used to work. NaN values in the
+    tiles are skipped.
+
+    Arguments
+    ---------
+    out_height : int
+        The height of the output array in pixels.
+    out_width : int
+        The width of the output array in pixels.
+    method : str, optional
+        ``'average'`` (default), ``'first'`` or ``'confidence'``. See
+        :func:`stitch_images`.
+
+    Attributes
+    ----------
+    n_tiles : int
+        The number of tiles added so far.
+    """
+
+    def __init__(self, out_height, out_width, method='average'):
+        if method not in ['average', 'first', 'confidence']:
+            raise ValueError('method must be one of "average", "first" and '
+                             '"confidence".')
+        self.out_height = out_height
+        self.out_width = out_width
+        self.method = method
+        self.n_tiles = 0
+        self.dtype = None
+
+    def _allocate(self, tile):
+        """Create the buffers, with the channels of the first tile."""
+        shape = (self.out_height, self.out_width) + tile.shape[2:]
+        self.dtype = tile.dtype
+        if self.method == 'average':
+            self._sum = np.zeros(shape)
+            self._count = np.zeros(shape, dtype='uint32')
         else:
-            stitching_arr = np.empty(shape=(im_arr.shape[0],
-                                            out_height, out_width))
-        stitching_arr[:] = np.nan
-        for idx in range(len(idx_refs)):
-            if has_channels:
-                stitching_arr[
-                    idx,
-                    idx_refs[idx][0]:idx_refs[idx][0] + im_arr.shape[1],
-                    idx_refs[idx][1]:idx_refs[idx][1] + im_arr.shape[2],
-                    :] = im_arr[idx, :, :, :]
+            self._value = np.full(shape, np.nan)
+        if self.method == 'confidence':
+            # never beaten by NaN, which is given a confidence of -1
+            self._confidence = np.full(shape, -1.)
+
+    def add(self, tile, idx_ref=(0, 0)):
+        """Add a ``[Y, X(, C)]`` tile with its top left corner at `idx_ref`.
+        """
+        tile = np.asarray(tile)
+        if self.dtype is None:
+            self._allocate(tile)
+        window = (slice(idx_ref[0], idx_ref[0] + tile.shape[0]),
+                  slice(idx_ref[1], idx_ref[1] + tile.shape[1]))
+        valid = ~np.isnan(tile)
+        if self.method == 'average':
+            out_sum, out_count = self._sum[window], self._count[window]
+            if valid.all():
+                out_sum += tile
+                out_count += 1
             else:
-                stitching_arr[
-                    idx,
-                    idx_refs[idx][0]:idx_refs[idx][0] + im_arr.shape[1],
-                    idx_refs[idx][1]:idx_refs[idx][1] + im_arr.shape[2]] = im_arr[idx, :, :]
-    else:
-        stitching_arr = im_arr  # just stitching across images with no offset
-
-    if method == 'average':
-        output_arr = np.nanmean(stitching_arr, axis=0)
-
-    elif method == 'first':
-        # get index along 1st axis of the first non-NaN value
-        first_non_nan = np.invert(np.isnan(stitching_arr)).argmax(axis=0)
-        # subset along 1st axis for only the first non-NaN value
-        output_arr = np.take_along_axis(stitching_arr,
-                                        np.expand_dims(first_non_nan, axis=0),
-                                        axis=0)[0, :, :, :]  # drop extra axis
-
-    elif method == 'confidence':
-        # convert from 0-1 to 0-0.5, values originally 0.5 become 0
-        conf_scale = np.abs(stitching_arr - 0.5)
-        # set NaN values to -1 so they're never selected
-        conf_scale[np.isnan(conf_scale)] = -1
-        # get highest conf slice at each [Y, X, C] position
-        max_conf_ind = conf_scale.argmax(axis=0)
-        # subset to take only the highest-conf value
-        output_arr = np.take_along_axis(stitching_arr,
-                                        np.expand_dims(max_conf_ind, axis=0),
-                                        axis=0)[0, :, :, :]  # drop extra axis
-    output_arr = output_arr.astype(im_arr.dtype)
-
-    return output_arr
+                out_sum[valid] += tile[valid]
+                out_count += valid
+        elif self.method == 'first':
+            out_value = self._value[window]
+            take = np.isnan(out_value) & valid
+            out_value[take] = tile[take]
+        elif self.method == 'confidence':
+            out_value = self._value[window]
+            out_confidence = self._confidence[window]
+            confidence = np.abs(tile.astype('float64') - 0.5)
+            confidence[~valid] = -1
+            # the first tile keeps a pixel on ties, like argmax
+            take = confidence > out_confidence
+            out_value[take] = tile[take]
+            out_confidence[take] = confidence[take]
+        self.n_tiles += 1
+
+    def result(self):
+        """Get the stitched array, in the dtype of the tiles."""
+        if self.dtype is None:
+            raise ValueError('No tiles have been added.')
+        if self.method == 'average':
+            with np.errstate(invalid='ignore'):  # pixels without tiles
+                output_arr = self._sum / self._count
+        else:
+            output_arr = self._value
+        return output_arr.astype(self.dtype)
 
 
 def create_multiband_geotiff(array, out_name, proj, geo, nodata=0,
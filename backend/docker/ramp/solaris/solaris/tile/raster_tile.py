@@ -1,5 +1,8 @@
 import os
+from collections import deque
+from multiprocessing.pool import ThreadPool
 import rasterio
+from rasterio.transform import Affine
 from rasterio.warp import Resampling, calculate_default_transform
 from rasterio.vrt import WarpedVRT
 from rasterio.mask import mask as rasterio_mask
@@ -7,7 +10,8 @@ from rasterio.mask import mask as rasterio_mask
 from ..utils.core import _check_crs, _check_rasterio_im_load
 # removing the following until COG functionality is implemented
 # from ..utils.tile import read_cog_tile
-from ..utils.geo import reproject, split_geom, raster_get_projection_unit
+from ..utils.geo import reproject, split_geom, raster_get_projection_unit, \
+    get_bounds, get_projection_unit, latlon_to_utm_epsg
 import numpy as np
 from shapely.geometry import box
 from tqdm.auto import tqdm
@@ -57,6 +61,14 @@ class RasterTiler(object):
         A `list`-like of ``[left, bottom, right, top]`` lists of coordinates
         defining the boundaries of the tiles to create. If not provided, they
         will be generated from the `aoi_boundary` based on `src_tile_size`.
+    use_vrt : bool, optional
+        Read tiles in a different destination CRS out of a
+        :class:`rasterio.vrt.WarpedVRT` of `src`, which reprojects only the
+        chunks being tiled, instead of reprojecting each tile separately (or
+        the whole source to a temporary file for `project_to_meters`). In
+        this mode `tile_bounds` and `aoi_boundary` are in the destination
+        CRS and `src_tile_size` is in destination pixels. Defaults to
+        ``False``.
     verbose : bool, optional
         Verbose text output. By default, verbose text is not printed.
 
@@ -88,9 +100,9 @@ class RasterTiler(object):
     alpha : `int`
         The band index corresponding to an alpha channel (if one exists).
         ``None`` if there is no alpha channel.
-    tile_bounds : list
-        A :class:`list` containing ``[left, bottom, right, top]`` bounds
-        sublists for each tile created.
+    tile_bounds : :class:`numpy.ndarray` or list
+        ``[left, bottom, right, top]`` bounds of each tile created, one row
+        or sublist per tile.
     resampling : str
         The resampling method for any resizing. Possible values are
         ``['bilinear', 'cubic', 'nearest', 'lanczos', 'average']`` (or any
@@ -103,12 +115,17 @@ class RasterTiler(object):
         loaded.
     """
 
+    # source rows read at once when tiles are read in chunks
+    CHUNK_ROWS = 2048
+    # tiles whose source windows are built at once
+    WINDOW_CHUNK = 65536
+
     def __init__(self, dest_dir=None, dest_crs=None, project_to_meters=False,
                  channel_idxs=None, src_tile_size=(900, 900), use_src_metric_size=False,
                  dest_tile_size=None, dest_metric_size=False,
                  aoi_boundary=None, nodata=None, alpha=None,
                  force_load_cog=False, resampling=None, tile_bounds=None,
-                 verbose=False):
+                 use_vrt=False, verbose=False):
         # set up attributes
         if verbose:
             print("Initializing Tiler...")
@@ -132,6 +149,7 @@ class RasterTiler(object):
         self.aoi_boundary = aoi_boundary
         self.tile_bounds = tile_bounds
         self.project_to_meters = project_to_meters
+        self.use_vrt = use_vrt
         self.tile_paths = []  # retains the paths of the last call to .tile()
 #        self.cog_output = cog_output
         self.verbose = verbose
@@ -151,7 +169,8 @@ class RasterTiler(object):
 
     def tile(self, src, dest_dir=None, channel_idxs=None, nodata=None,
              alpha=None, restrict_to_aoi=False,
-             dest_fname_base=None, nodata_threshold = None):
+             dest_fname_base=None, nodata_threshold = None, workers=1,
+             gdal_cachemax=None):
         """An object to tile geospatial image strips into smaller pieces.
 
         Arguments
@@ -160,8 +179,15 @@ class RasterTiler(object):
             The source dataset to tile.
         nodata_threshold : float, optional
             Nodata percentages greater than this threshold will not be saved as tiles.
+            Tiles that are entirely nodata are dropped before they are built.
         restrict_to_aoi : bool, optional
             Requires aoi_boundary. Sets all pixel values outside the aoi_boundary to the nodata value of the src image.
+        workers : int, optional
+            Number of threads writing tiles while the next ones are read.
+            Defaults to ``1``, which writes each tile before reading the next.
+        gdal_cachemax : int, optional
+            Size of the GDAL block cache in MB while tiling. Defaults to the
+            GDAL default.
         """
         src = _check_rasterio_im_load(src)
         restricted_im_path = os.path.join(self.dest_dir, "aoi_restricted_"+ os.path.basename(src.name))
@@ -180,35 +206,54 @@ class RasterTiler(object):
                 src.close()
             src = _check_rasterio_im_load(restricted_im_path) #if restrict_to_aoi, we overwrite the src to be the masked raster
 
-        tile_gen = self.tile_generator(src, dest_dir, channel_idxs, nodata,
-                                       alpha, self.aoi_boundary, restrict_to_aoi)
+        if nodata_threshold is not None and nodata_threshold > 1:
+            raise ValueError("nodata_threshold should be expressed as a float less than 1.")
+        env_options = {}
+        if gdal_cachemax is not None:
+            env_options['GDAL_CACHEMAX'] = gdal_cachemax
+        with rasterio.Env(**env_options):
+            tile_gen = self.tile_generator(
+                src, dest_dir, channel_idxs, nodata, alpha, self.aoi_boundary,
+                restrict_to_aoi, skip_nodata=nodata_threshold is not None)
 
-        if self.verbose:
-            print('Beginning tiling...')
-        self.tile_paths = []
-        if nodata_threshold is not None:
-            if nodata_threshold > 1:
-                raise ValueError("nodata_threshold should be expressed as a float less than 1.")
-            print("nodata value threshold supplied, filtering based on this percentage.")
+            if self.verbose:
+                print('Beginning tiling...')
+            self.tile_paths = []
+            if nodata_threshold is not None:
+                print("nodata value threshold supplied, filtering based on this percentage.")
             new_tile_bounds = []
-            for tile_data, mask, profile, tb in tqdm(tile_gen):
-                nodata_count = np.logical_or.reduce((tile_data == profile['nodata']), axis=0).sum()
-                nodata_perc = nodata_count / (tile_data.shape[1] * tile_data.shape[2])
-                if nodata_perc < nodata_threshold:
-                    dest_path = self.save_tile(
-                        tile_data, mask, profile, dest_fname_base)
-                    self.tile_paths.append(dest_path)
+            pool = ThreadPool(workers) if workers > 1 else None
+            pending = deque()
+            try:
+                for tile_data, mask, profile, tb in tqdm(tile_gen):
+                    if nodata_threshold is not None:
+                        nodata_count = np.logical_or.reduce((tile_data == profile['nodata']), axis=0).sum()
+                        nodata_perc = nodata_count / (tile_data.shape[1] * tile_data.shape[2])
+                        if nodata_perc >= nodata_threshold:
+                            print("{} of nodata is over the nodata_threshold, tile not saved.".format(nodata_perc))
+                            continue
                     new_tile_bounds.append(tb)
-                else:
-                    print("{} of nodata is over the nodata_threshold, tile not saved.".format(nodata_perc))
+                    if pool is None:
+                        self.tile_paths.append(self.save_tile(
+                            tile_data, mask, profile, dest_fname_base))
+                    else:
+                        pending.append(pool.apply_async(
+                            self.save_tile,
+                            (tile_data, mask, profile, dest_fname_base)))
+                        # keep a bounded number of tiles in memory
+                        if len(pending) > 2 * workers:
+                            self.tile_paths.append(pending.popleft().get())
+                self.tile_paths.extend(result.get() for result in pending)
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+        if nodata_threshold is not None:
             self.tile_bounds = new_tile_bounds # only keep the tile bounds that make it past the nodata threshold
-        else:
-            for tile_data, mask, profile, tb in tqdm(tile_gen):
-                dest_path = self.save_tile(
-                    tile_data, mask, profile, dest_fname_base)
-                self.tile_paths.append(dest_path)
         if self.verbose:
             print('Tiling complete. Cleaning up...')
+        if isinstance(self.src, WarpedVRT):
+            self.src.src_dataset.close()
         self.src.close()
         if os.path.exists(os.path.join(self.dest_dir, 'tmp.tif')):
             os.remove(os.path.join(self.dest_dir, 'tmp.tif'))
@@ -220,13 +265,17 @@ class RasterTiler(object):
 
     def tile_generator(self, src, dest_dir=None, channel_idxs=None,
                        nodata=None, alpha=None, aoi_boundary=None,
-                       restrict_to_aoi=False):
+                       restrict_to_aoi=False, skip_nodata=False):
         """Create the tiled output imagery from input tiles.
 
         Uses the arguments provided at initialization to generate output tiles.
         First, tile locations are generated based on `Tiler.tile_size` and
         `Tiler.size_in_meters` given the bounds of the input image.
 
+        When the tiles fall on whole source pixels, consecutive tiles of a
+        column are read from the source in one block-aligned chunk instead of
+        one boundless read per tile.
+
         Arguments
         ---------
         src : `str` or :class:`Rasterio.DatasetReader`
@@ -260,6 +309,8 @@ class RasterTiler(object):
             AOI will not be returned. This is the inverse of the ``boundless``
             argument for :class:`rasterio.io.DatasetReader` 's ``.read()``
             method.
+        skip_nodata : bool, optional
+            Skip tiles in which every pixel is nodata. Defaults to ``False``.
 
         Yields
         ------
@@ -283,7 +334,8 @@ class RasterTiler(object):
         self.src = _check_rasterio_im_load(src)
         if channel_idxs is None:  # if not provided, include them all
             channel_idxs = list(range(1, self.src.count + 1))
-            print(channel_idxs)
+            if self.verbose:
+                print(channel_idxs)
         self.src_crs = _check_crs(self.src.crs, return_rasterio=True) # necessary to use rasterio crs for reproject
         if self.verbose:
             print('Source CRS: EPSG:{}'.format(self.src_crs.to_epsg()))
@@ -298,7 +350,13 @@ class RasterTiler(object):
         if self.use_src_metric_size:
             if self.verbose:
                 print("Checking if inputs are in metric units...")
-            if self.project_to_meters:
+            if self.project_to_meters and self.use_vrt:
+                # warped into the UTM zone below, while tiling
+                bounds = get_bounds(self.src, crs=_check_crs(4326))
+                self.dest_crs = _check_crs(latlon_to_utm_epsg(
+                    (bounds[1] + bounds[3]) / 2., (bounds[0] + bounds[2]) / 2.),
+                    return_rasterio=True)
+            elif self.project_to_meters:
                 if self.verbose:
                     print("Input CRS is not metric. "
                           "Reprojecting the input to UTM.")
@@ -324,54 +382,31 @@ class RasterTiler(object):
         else:
             self.alpha = alpha
 
+        src_profile = self.src.profile
+        if self.use_vrt and self.dest_crs != self.src_crs:
+            if self.verbose:
+                print('Reprojecting tiles through a WarpedVRT.')
+            self.src = self.load_src_vrt()
+            self.src_crs = self.dest_crs
+            self.proj_unit = get_projection_unit(self.dest_crs)
+
         if getattr(self, 'tile_bounds', None) is None:
             self.get_tile_bounds()
 
-        for tb in self.tile_bounds:
+        transform_cache = {}
+        for tb, window, src_data in self._iter_tile_windows(channel_idxs):
             # removing the following line until COG functionality implemented
             if True:  # not self.is_cog or self.force_load_cog:
-                window = rasterio.windows.from_bounds(
-                    *tb, transform=self.src.transform,
-                    width=self.src_tile_size[1],
-                    height=self.src_tile_size[0])
-                print('reading data from window')
-                print(self.nodata)
-                if self.src.count != 1:
-                    src_data = self.src.read(
-                        window=window,
-                        indexes=channel_idxs,
-                        boundless=True,
-                        fill_value=self.nodata)
-                else:
-                    src_data = self.src.read(
-                        window=window,
-                        boundless=True,
-                        fill_value=self.nodata)
-
-                dst_transform, width, height = calculate_default_transform(
-                    self.src.crs, self.dest_crs,
-                    self.src.width, self.src.height, *tb,
-                    dst_height=self.dest_tile_size[0],
-                    dst_width=self.dest_tile_size[1])
-
-                if self.dest_crs != self.src_crs and self.resampling_method is not None:
-                    tile_data = np.zeros(shape=(src_data.shape[0], height, width), dtype=src_data.dtype)
-                    rasterio.warp.reproject(
-                        source=src_data,
-                        destination=tile_data,
-                        src_transform=self.src.window_transform(window),
-                        src_crs=self.src.crs,
-                        dst_transform=dst_transform,
-                        dst_crs=self.dest_crs,
-                        dst_nodata=self.nodata,
-                        resampling=getattr(Resampling, self.resampling))
-
-                elif self.dest_crs != self.src_crs and self.resampling_method is None:
-                    print("Warning: You've set resampling to None but your "
-                          "destination projection differs from the source "
-                          "projection. Using bilinear resampling by default.")
-                    tile_data = np.zeros(shape=(src_data.shape[0], height, width),
-                                         dtype=src_data.dtype)
+                if self.dest_crs != self.src_crs:
+                    if self.resampling is None:
+                        print("Warning: You've set resampling to None but your "
+                              "destination projection differs from the source "
+                              "projection. Using bilinear resampling by default.")
+                    dst_transform, width, height = calculate_default_transform(
+                        self.src.crs, self.dest_crs,
+                        self.src.width, self.src.height, *tb,
+                        dst_height=self.dest_tile_size[0],
+                        dst_width=self.dest_tile_size[1])
                     tile_data = np.zeros(shape=(src_data.shape[0], height, width), dtype=src_data.dtype)
                     rasterio.warp.reproject(
                         source=src_data,
@@ -381,12 +416,17 @@ class RasterTiler(object):
                         dst_transform=dst_transform,
                         dst_crs=self.dest_crs,
                         dst_nodata=self.nodata,
-                        resampling=getattr(Resampling, "bilinear"))
+                        resampling=getattr(Resampling,
+                                           self.resampling or "bilinear"))
 
                 else:  # for the case where there is no resampling and no dest_crs specified, no need to reproject or resample
 
+                    dst_transform = self._tile_transform(tb, transform_cache)
                     tile_data = src_data
 
+                if skip_nodata and self.nodata is not None and np.logical_or.reduce(
+                        tile_data == self.nodata, axis=0).all():
+                    continue
 
                 if self.nodata:
                     mask = np.all(tile_data != nodata,
@@ -405,7 +445,7 @@ class RasterTiler(object):
             #         nodata=self.nodata,
             #         resampling_method=self.resampling
             #         )
-            profile = self.src.profile
+            profile = src_profile.copy()
 
             ## bugfix CJ 20220726
             ## added 'nodata' to the list of profile items to update,
@@ -422,6 +462,97 @@ class RasterTiler(object):
 
             yield tile_data, mask, profile, tb
 
+    def _iter_tile_windows(self, channel_idxs):
+        """Yield the bounds, source window and source data of each tile.
+
+        Windows are built for :attr:`WINDOW_CHUNK` tiles at a time and read
+        with :meth:`_read_windows`.
+        """
+        for start in range(0, len(self.tile_bounds), self.WINDOW_CHUNK):
+            tile_bounds = self.tile_bounds[start:start + self.WINDOW_CHUNK]
+            windows = [rasterio.windows.from_bounds(
+                *tb, transform=self.src.transform,
+                width=self.src_tile_size[1], height=self.src_tile_size[0])
+                for tb in tile_bounds]
+            yield from zip(tile_bounds, windows,
+                           self._read_windows(windows, channel_idxs))
+
+    def _read_windows(self, windows, channel_idxs):
+        """Yield the source data of each window in `windows`, in order.
+
+        Windows on whole pixels are grouped into runs of consecutive windows
+        in the same column that start in the same chunk of
+        :attr:`CHUNK_ROWS` rows (rounded up to the source block height), and
+        each run is read from the source once and the tiles of the run are
+        views into it. Other windows are read one by one with a boundless
+        read. Pixels outside of the source are filled with the nodata value
+        either way.
+        """
+        if self.src.count != 1:
+            indexes = channel_idxs
+        else:
+            indexes = list(range(1, self.src.count + 1))
+        offsets = np.array([[w.col_off, w.row_off, w.width, w.height]
+                            for w in windows], dtype=float).reshape(-1, 4)
+        if not np.allclose(offsets, np.round(offsets), rtol=0, atol=1e-6):
+            for window in windows:
+                yield self.src.read(indexes, window=window, boundless=True,
+                                    fill_value=self.nodata)
+            return
+
+        offsets = np.round(offsets).astype(int)
+        block_height = self.src.block_shapes[0][0]
+        chunk_rows = block_height * int(np.ceil(self.CHUNK_ROWS / block_height))
+        chunk_ids = np.floor_divide(offsets[:, 1], chunk_rows)
+        start = 0
+        for stop in range(1, len(windows) + 1):
+            if stop < len(windows) and chunk_ids[stop] == chunk_ids[start] \
+                    and np.array_equal(offsets[stop, [0, 2]],
+                                       offsets[start, [0, 2]]):
+                continue
+            run = offsets[start:stop]
+            col_off, width = run[0, 0], run[0, 2]
+            row_off = run[:, 1].min()
+            height = (run[:, 1] + run[:, 3]).max() - row_off
+            chunk = self._read_chunk(indexes, col_off, row_off, width, height)
+            for row, h in run[:, [1, 3]]:
+                yield chunk[:, row - row_off:row - row_off + h, :]
+            start = stop
+
+    def _read_chunk(self, indexes, col_off, row_off, width, height):
+        """Read a pixel window of the source, nodata filled past its edges."""
+        fill_value = self.nodata if self.nodata is not None else 0
+        chunk = np.full((len(indexes), height, width), fill_value,
+                        dtype=self.src.dtypes[indexes[0] - 1])
+        cols = slice(max(col_off, 0), min(col_off + width, self.src.width))
+        rows = slice(max(row_off, 0), min(row_off + height, self.src.height))
+        if cols.start < cols.stop and rows.start < rows.stop:
+            chunk[:, rows.start - row_off:rows.stop - row_off,
+                  cols.start - col_off:cols.stop - col_off] = self.src.read(
+                indexes, window=rasterio.windows.Window.from_slices(rows, cols))
+        return chunk
+
+    def _tile_transform(self, tb, cache):
+        """Get the transform of the tile with bounds `tb` in the source CRS.
+
+        The transform of a tile only differs from the one of an equally sized
+        tile by its origin, so it is calculated once per tile size and `cache`
+        keeps it for the others.
+        """
+        key = (tb[2] - tb[0], tb[3] - tb[1])
+        if key in cache:
+            a, b, d, e = cache[key]
+            return Affine(a, b, tb[0], d, e, tb[3])
+        dst_transform, width, height = calculate_default_transform(
+            self.src.crs, self.dest_crs,
+            self.src.width, self.src.height, *tb,
+            dst_height=self.dest_tile_size[0],
+            dst_width=self.dest_tile_size[1])
+        if dst_transform.c == tb[0] and dst_transform.f == tb[3]:
+            cache[key] = (dst_transform.a, dst_transform.b,
+                          dst_transform.d, dst_transform.e)
+        return dst_transform
+
     def save_tile(self, tile_data, mask, profile, dest_fname_base=None):
         """Save a tile created by ``Tiler.tile_generator()``."""
         if dest_fname_base is None:
@@ -446,12 +577,8 @@ class RasterTiler(object):
 
         with rasterio.open(dest_path, 'w',
                            **profile) as dest:
-            if profile['count'] == 1:
-                dest.write(tile_data[0, :, :], 1)
-            else:
-                for band in range(1, profile['count'] + 1):
-                    # base-1 vs. base-0 indexing...bleh
-                    dest.write(tile_data[band-1, :, :], band)
+            dest.write(tile_data[:profile['count']],
+                       list(range(1, profile['count'] + 1)))
             if self.alpha:
                 # write the mask if there's an alpha band
                 dest.write(mask, profile['count'] + 1)
@@ -515,8 +642,23 @@ class RasterTiler(object):
                       resampling=self.resampling,
                       latitude_adjustment=False)
 
-    def get_tile_bounds(self):
-        """Get tile bounds for each tile to be created in the input CRS."""
+    def get_tile_bounds(self, chunk_size=None):
+        """Get tile bounds for each tile to be created in the input CRS.
+
+        Arguments
+        ---------
+        chunk_size : int, optional
+            If provided, return a generator of tile bounds arrays covering at
+            most `chunk_size` grid cells each instead of setting
+            :attr:`tile_bounds`, so the tile grid of a very large source is
+            never held in memory at once.
+
+        Returns
+        -------
+        tile_bounds : :class:`numpy.ndarray` or generator
+            A ``(N, 4)`` array of ``[left, bottom, right, top]`` tile bounds,
+            or a generator of such arrays if `chunk_size` is provided.
+        """
         if not self.aoi_boundary:
             if not self.src:
                 raise ValueError('aoi_boundary and/or a source file must be '
@@ -526,12 +668,17 @@ class RasterTiler(object):
                 # split_geom can take a list
                 self.aoi_boundary = list(self.src.bounds)
 
-        self.tile_bounds = split_geom(geometry=self.aoi_boundary, tile_size=self.src_tile_size, resolution=(
-            self.src.transform[0], -self.src.transform[4]), use_projection_units=self.use_src_metric_size, src_img=self.src)
+        tile_bounds = split_geom(geometry=self.aoi_boundary, tile_size=self.src_tile_size, resolution=(
+            self.src.transform[0], -self.src.transform[4]), use_projection_units=self.use_src_metric_size, src_img=self.src,
+            chunk_size=chunk_size)
+        if chunk_size is None:
+            self.tile_bounds = tile_bounds
+        return tile_bounds
 
     def load_src_vrt(self):
         """Load a source dataset's VRT into the destination CRS."""
-        vrt_params = dict(crs=self.dest_crs,
-                          resampling=getattr(Resampling, self.resampling),
-                          src_nodata=self.nodata, dst_nodata=self.nodata)
+        vrt_params = dict(crs=_check_crs(self.dest_crs, return_rasterio=True),
+                          resampling=getattr(Resampling,
+                                             self.resampling or 'bilinear'),
+                          src_nodata=self.nodata, nodata=self.nodata)
         return WarpedVRT(self.src, **vrt_params)
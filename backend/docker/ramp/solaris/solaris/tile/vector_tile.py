@@ -1,12 +1,20 @@
 import os
+from collections import deque
+from multiprocessing import Pool
 import numpy as np
+import shapely
 from shapely.geometry import box, Polygon
 import geopandas as gpd
 from ..utils.core import _check_gdf_load, _check_crs
 from ..utils.tile import save_empty_geojson
-from ..utils.geo import get_projection_unit, split_multi_geometries
-from ..utils.geo import reproject_geometry
+from ..utils.geo import get_projection_unit
 from tqdm.auto import tqdm
+try:
+    import pyogrio  # noqa: F401
+    # writes whole tiles through GDAL instead of feature by feature
+    _WRITE_ENGINE = 'pyogrio'
+except ImportError:
+    _WRITE_ENGINE = 'fiona'
 
 
 class VectorTiler(object):
@@ -39,7 +47,7 @@ class VectorTiler(object):
     def tile(self, src, tile_bounds, tile_bounds_crs=None, geom_type='Polygon',
              split_multi_geoms=True, min_partial_perc=0.0,
              dest_fname_base='geoms', obj_id_col=None,
-             output_ext='.geojson'):
+             output_ext='.geojson', workers=1):
         """Tile `src` into vector data tiles bounded by `tile_bounds`.
 
         Arguments
@@ -78,10 +86,13 @@ class VectorTiler(object):
         obj_id_col : str, optional (default: None)
             If ``split_multi_geoms=True``, the name of a column that specifies
             a unique identifier for each geometry (e.g. the ``"BuildingId"``
-            column in many SpaceNet datasets.) See
-            :func:`solaris.utils.geo.split_multi_geometries` for more.
+            column in many SpaceNet datasets.) It is renumbered from ``1``
+            within each tile after the geometries are split.
         output_ext : str, optional, (default: geojson)
             Extension of output files, can be 'geojson' or 'json'.
+        workers : int, optional
+            Number of processes writing tiles while the next ones are
+            prepared. Defaults to ``1``, which writes the tiles one by one.
         """
 
         if isinstance(src, gpd.GeoDataFrame) and src.crs is None:
@@ -92,30 +103,49 @@ class VectorTiler(object):
                                        min_partial_perc,
                                        obj_id_col=obj_id_col)
         self.tile_paths = []
-        for tile_gdf, tb in tqdm(tile_gen):
-            if self.proj_unit not in ['meter', 'metre']:
-                dest_path = os.path.join(
-                    self.dest_dir, '{}_{}_{}{}'.format(dest_fname_base,
-                                                       np.round(tb[0], 6),
-                                                       np.round(tb[3], 6),
-                                                       output_ext))
-            else:
-                dest_path = os.path.join(
-                    self.dest_dir, '{}_{}_{}{}'.format(dest_fname_base,
-                                                       int(tb[0]),
-                                                       int(tb[3]),
-                                                       output_ext))
-            self.tile_paths.append(dest_path)
-            if len(tile_gdf) > 0:
-                tile_gdf.to_file(dest_path, driver='GeoJSON')
-            else:
-                save_empty_geojson(dest_path, self.dest_crs)
+        pool = Pool(workers) if workers > 1 else None
+        pending = deque()
+        try:
+            for tile_gdf, tb in tqdm(tile_gen, total=len(tile_bounds)):
+                if self.proj_unit not in ['meter', 'metre']:
+                    dest_path = os.path.join(
+                        self.dest_dir, '{}_{}_{}{}'.format(dest_fname_base,
+                                                           np.round(tb[0], 6),
+                                                           np.round(tb[3], 6),
+                                                           output_ext))
+                else:
+                    dest_path = os.path.join(
+                        self.dest_dir, '{}_{}_{}{}'.format(dest_fname_base,
+                                                           int(tb[0]),
+                                                           int(tb[3]),
+                                                           output_ext))
+                self.tile_paths.append(dest_path)
+                if pool is None:
+                    save_tile(tile_gdf, dest_path, self.dest_crs)
+                else:
+                    pending.append(pool.apply_async(
+                        save_tile, (tile_gdf, dest_path, self.dest_crs)))
+                    # keep a bounded number of tiles in memory
+                    if len(pending) > 2 * workers:
+                        pending.popleft().get()
+            for result in pending:
+                result.get()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
     def tile_generator(self, src, tile_bounds, tile_bounds_crs=None,
                        geom_type='Polygon', split_multi_geoms=True,
                        min_partial_perc=0.0, obj_id_col=None):
         """Generate `src` vector data tiles bounded by `tile_bounds`.
 
+        All tiles are cut in one pass: the tile boxes are queried against a
+        :class:`shapely.STRtree` of `src` at once, every overlapping
+        geometry is clipped by a single vectorized intersection and the
+        clipped geometries are reprojected to `dest_crs` together before
+        the tiles are yielded.
+
         Arguments
         ---------
         src : `str` or :class:`geopandas.GeoDataFrame`
@@ -146,8 +176,8 @@ class VectorTiler(object):
         obj_id_col : str, optional (default: None)
             If ``split_multi_geoms=True``, the name of a column that specifies
             a unique identifier for each geometry (e.g. the ``"BuildingId"``
-            column in many SpaceNet datasets.) See
-            :func:`solaris.utils.geo.split_multi_geometries` for more.
+            column in many SpaceNet datasets.) It is renumbered from ``1``
+            within each tile after the geometries are split.
 
         Yields
         ------
@@ -168,7 +198,7 @@ class VectorTiler(object):
         else:
             tile_bounds_crs = self.src_crs
         if self.src_crs != tile_bounds_crs:
-            reproject_bounds = True  # used to transform tb for clip_gdf()
+            reproject_bounds = True  # used to transform the tile boxes
         else:
             reproject_bounds = False
 
@@ -183,27 +213,143 @@ class VectorTiler(object):
         # self.proj_unit = get_projection_unit(self.src_crs)
         
         
-        print(f'VectorTiler projection unit: {self.proj_unit}')
+        if self.verbose:
+            print(f'VectorTiler projection unit: {self.proj_unit}')
         if getattr(self, 'dest_crs', None) is None:
             self.dest_crs = self.src_crs
+
+        tile_boxes = _tile_boxes(tile_bounds)
+        if reproject_bounds:
+            tile_boxes = np.asarray(gpd.GeoSeries(
+                tile_boxes, crs=tile_bounds_crs.to_wkt()).to_crs(
+                    self.src_crs.to_wkt()).values)
+        tiles_gdf, tile_idx = clip_gdf_to_tiles(
+            self.src, tile_boxes, min_partial_perc, geom_type)
+        if self.src_crs != self.dest_crs:
+            tiles_gdf = tiles_gdf.to_crs(crs=self.dest_crs.to_wkt())
+        if split_multi_geoms:
+            tiles_gdf, tile_idx = _split_tile_geometries(tiles_gdf, tile_idx)
+            if obj_id_col:
+                tiles_gdf[obj_id_col] = tiles_gdf.groupby(
+                    tile_idx).cumcount().values + 1
+
+        # tile_idx is sorted, so each tile is one contiguous block of rows
+        starts = np.searchsorted(tile_idx, np.arange(len(tile_bounds) + 1))
         for i, tb in enumerate(tile_bounds):
             if self.super_verbose:
                 print("\n", i, "/", len(tile_bounds))
-            if reproject_bounds:
-                tile_gdf = clip_gdf(self.src,
-                                    reproject_geometry(box(*tb),
-                                                       tile_bounds_crs,
-                                                       self.src_crs),
-                                    min_partial_perc,
-                                    geom_type, verbose=self.super_verbose)
-            else:
-                tile_gdf = clip_gdf(self.src, tb, min_partial_perc, geom_type,
-                                    verbose=self.super_verbose)
-            if self.src_crs != self.dest_crs:
-                tile_gdf = tile_gdf.to_crs(crs=self.dest_crs.to_wkt())
-            if split_multi_geoms:
-                split_multi_geometries(tile_gdf, obj_id_col=obj_id_col)
-            yield tile_gdf, tb
+            yield tiles_gdf.iloc[starts[i]:starts[i + 1]].copy(), tb
+
+
+def save_tile(tile_gdf, dest_path, crs):
+    """Write one vector tile to `dest_path` as GeoJSON.
+
+    Tiles are written with pyogrio if it is installed and with fiona
+    otherwise.
+
+    Arguments
+    ---------
+    tile_gdf : :class:`geopandas.GeoDataFrame`
+        The tile to save.
+    dest_path : str
+        Path to the output file.
+    crs : :class:`pyproj.crs.CRS`
+        CRS written to the file if `tile_gdf` is empty.
+    """
+    if len(tile_gdf) > 0:
+        tile_gdf.to_file(dest_path, driver='GeoJSON', engine=_WRITE_ENGINE)
+    else:
+        save_empty_geojson(dest_path, crs)
+
+
+def _tile_boxes(tile_bounds):
+    """Make an array of :class:`shapely.geometry.Polygon` boxes from a list of
+    tile bounds."""
+    tile_bounds = np.asarray(tile_bounds, dtype=float).reshape(-1, 4)
+    return shapely.box(tile_bounds[:, 0], tile_bounds[:, 1],
+                       tile_bounds[:, 2], tile_bounds[:, 3])
+
+
+def clip_gdf_to_tiles(gdf, tile_polygons, min_partial_perc=0.0,
+                      geom_type="Polygon"):
+    """Clip a GeoDataFrame to many tiles at once.
+
+    The vectorized equivalent of calling :func:`clip_gdf` once per tile: the
+    tiles are queried against one :class:`shapely.STRtree` of `gdf`, the
+    original areas are computed once and all overlapping geometries are
+    clipped by a single :func:`shapely.intersection` call. The same
+    ``origarea``, ``origlen``, ``partialDec`` and ``truncated`` columns are
+    added.
+
+    Arguments
+    ---------
+    gdf : :py:class:`geopandas.GeoDataFrame`
+        A :py:class:`geopandas.GeoDataFrame` of geometries to clip.
+    tile_polygons : array-like of :class:`shapely.geometry.Polygon`
+        The tiles to clip objects in `gdf` to.
+    min_partial_perc : float, optional
+        The minimum fraction of an object in `gdf` that must be
+        preserved. Defaults to 0.0 (include any object if any part remains
+        following clipping).
+    geom_type : str, optional
+        Type of objects in `gdf`. Can be one of
+        ``["Polygon", "LineString"]`` . Defaults to ``"Polygon"`` .
+
+    Returns
+    -------
+    cut_gdf : :py:class:`geopandas.GeoDataFrame`
+        The clipped objects of all tiles, sorted by tile and then by their
+        position in `gdf`. An object overlapping several tiles appears once
+        per tile.
+    tile_idx : :class:`numpy.ndarray`
+        The position in `tile_polygons` of the tile each row of `cut_gdf`
+        belongs to.
+    """
+    geoms = np.asarray(gdf.geometry.values)
+    tile_polygons = np.asarray(tile_polygons)
+    tile_idx, geom_idx = shapely.STRtree(geoms).query(
+        tile_polygons, predicate='intersects')
+    order = np.lexsort((geom_idx, tile_idx))
+    tile_idx, geom_idx = tile_idx[order], geom_idx[order]
+    clipped = shapely.intersection(geoms[geom_idx], tile_polygons[tile_idx])
+
+    cut_gdf = gdf.take(geom_idx)
+    if 'origarea' not in cut_gdf.columns:
+        cut_gdf['origarea'] = shapely.area(geoms)[geom_idx]
+    if 'origlen' not in cut_gdf.columns:
+        cut_gdf['origlen'] = 0
+    if geom_type == 'Polygon':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            partial = shapely.area(clipped) / cut_gdf['origarea'].values
+        keep = partial > min_partial_perc
+        truncated = (partial != 1.0).astype(int)
+    else:
+        # assume linestrings
+        partial = np.ones(len(clipped), dtype=int)
+        keep = ~shapely.is_empty(clipped)
+        truncated = np.zeros(len(clipped), dtype=int)
+    cut_gdf['partialDec'] = partial
+    cut_gdf['truncated'] = truncated
+    cut_gdf.geometry = gpd.array.from_shapely(clipped, crs=gdf.crs)
+    keep = np.flatnonzero(keep)
+    return cut_gdf.take(keep), tile_idx[keep]
+
+
+def _split_tile_geometries(gdf, tile_idx):
+    """Split the MultiPolygons and MultiLineStrings of clipped tiles into one
+    row per part, keeping the rows in tile order."""
+    geoms = np.asarray(gdf.geometry.values)
+    multi = np.isin(shapely.get_type_id(geoms), (5, 6))
+    if not multi.any():
+        return gdf, tile_idx
+    counts = np.ones(len(geoms), dtype=int)
+    counts[multi] = shapely.get_num_geometries(geoms[multi])
+    rows = np.repeat(np.arange(len(geoms)), counts)
+    split_geoms = geoms[rows]
+    split_geoms[multi[rows]] = shapely.get_parts(geoms[multi])
+    split_gdf = gdf.take(rows)
+    split_gdf.geometry = gpd.array.from_shapely(split_geoms, crs=gdf.crs)
+    return split_gdf, tile_idx[rows]
 
 
 def search_gdf_polygon(gdf, tile_polygon):
@@ -259,9 +405,11 @@ def clip_gdf(gdf, tile_bounds, min_partial_perc=0.0, geom_type="Polygon",
     ---------
     gdf : :py:class:`geopandas.GeoDataFrame`
         A :py:class:`geopandas.GeoDataFrame` of polygons to clip.
-    tile_bounds : `list` or :class:`shapely.geometry.Polygon`
+    tile_bounds : array-like or :class:`shapely.geometry.Polygon`
         The geometry to clip objects in `gdf` to. This can either be a
-        ``[left, top, right, bottom] `` bounds list or a
+        ``[left, bottom, right, top]`` bounds list, tuple or
+        :class:`numpy.ndarray` (like a row of the
+        :func:`solaris.utils.geo.split_geom` output) or a
         :class:`shapely.geometry.Polygon` object defining the area to keep.
     min_partial_perc : float, optional
         The minimum fraction of an object in `gdf` that must be
@@ -283,12 +431,10 @@ def clip_gdf(gdf, tile_bounds, min_partial_perc=0.0, geom_type="Polygon",
         See notes above for details on additional clipping columns added.
 
     """
-    if isinstance(tile_bounds, tuple):
-        tb = box(*tile_bounds)
-    elif isinstance(tile_bounds, list):
-        tb = box(*tile_bounds)
-    elif isinstance(tile_bounds, Polygon):
+    if isinstance(tile_bounds, Polygon):
         tb = tile_bounds
+    else:  # any length 4 sequence, like a row of split_geom's output
+        tb = box(*tile_bounds)
     if use_sindex and (geom_type == "Polygon"):
         gdf = search_gdf_polygon(gdf, tb)
 
@@ -7,6 +7,7 @@ import pandas as pd
 import geopandas as gpd
 import pyproj
 import rasterio
+from rasterio.vrt import WarpedVRT
 from distutils.version import LooseVersion
 import skimage
 from fiona._err import CPLE_OpenFailedError
@@ -18,7 +19,7 @@ def _check_rasterio_im_load(im):
     """Check if `im` is already loaded in; if not, load it in."""
     if isinstance(im, str):
         return rasterio.open(im)
-    elif isinstance(im, rasterio.DatasetReader):
+    elif isinstance(im, (rasterio.DatasetReader, WarpedVRT)):
         return im
     else:
         raise ValueError(
@@ -1,5 +1,10 @@
+import json
 import os
+import shutil
+import numpy as np
 import pandas as pd
+import rasterio
+from affine import Affine
 from .log import _get_logging_level
 from .core import get_files_recursively
 import logging
@@ -149,3 +154,154 @@ def make_dataset_csv(im_dir, im_ext='tif', label_dir=None, label_ext='json',
     output_df.to_csv(output_path, index=False)
 
     return output_df
+
+
+def make_chip_shard(image_paths, mask_paths, shard_dir, names=None,
+                    channels=None):
+    """Pack image chips and their masks into a memory-mappable shard.
+
+    A shard is a directory holding every chip in ``images.npy``, a ``uint8``
+    ``[N, Y, X, C]`` array, every mask in ``masks.npy``, a ``uint8``
+    ``[N, Y, X, M]`` array, and an ``index.json`` with the name, CRS and
+    affine transform of each chip, in the same order. Read shards with
+    :class:`ChipShard`. The arrays are written one chip at a time, and the
+    shard only replaces `shard_dir` once it is complete.
+
+    Arguments
+    ---------
+    image_paths : list of str
+        Paths to the georeferenced ``uint8`` image chips. All must have the
+        same size.
+    mask_paths : list of str
+        Paths to the ``uint8`` masks of the chips, in the same order. All
+        must have the same size as the chips.
+    shard_dir : str
+        The directory to write the shard to. Replaced if it exists.
+    names : list of str, optional
+        A name for each chip. Defaults to the file names of `image_paths`
+        without their extensions.
+    channels : int, optional
+        The number of image bands to keep. Defaults to all of the bands of
+        the first chip.
+
+    Returns
+    -------
+    shard : :class:`ChipShard`
+        The shard that was written.
+    """
+    if len(image_paths) != len(mask_paths):
+        raise ValueError('There must be one mask per image chip.')
+    if not image_paths:
+        raise ValueError('No image chips were provided.')
+    if names is None:
+        names = [os.path.splitext(os.path.basename(path))[0]
+                 for path in image_paths]
+
+    with rasterio.open(image_paths[0]) as src:
+        height, width = src.height, src.width
+        if channels is None:
+            channels = src.count
+    with rasterio.open(mask_paths[0]) as src:
+        mask_channels = src.count
+
+    part_dir = shard_dir.rstrip(os.sep) + '.part'
+    shutil.rmtree(part_dir, ignore_errors=True)
+    os.makedirs(part_dir)
+    images = np.lib.format.open_memmap(
+        os.path.join(part_dir, 'images.npy'), mode='w+', dtype='uint8',
+        shape=(len(image_paths), height, width, channels))
+    masks = np.lib.format.open_memmap(
+        os.path.join(part_dir, 'masks.npy'), mode='w+', dtype='uint8',
+        shape=(len(image_paths), height, width, mask_channels))
+    index = {'names': list(names), 'crs': [], 'transforms': []}
+    # don't list the chip directories for sidecar files on every open
+    with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'):
+        for i, (image_path, mask_path) in enumerate(zip(image_paths,
+                                                        mask_paths)):
+            with rasterio.open(image_path) as src:
+                if src.dtypes[0] != 'uint8':
+                    raise ValueError('{} is {}, not uint8.'.format(
+                        image_path, src.dtypes[0]))
+                if (src.height, src.width) != (height, width) or \
+                        src.count < channels:
+                    raise ValueError(
+                        '{} is {}x{} with {} bands, not {}x{} with at least '
+                        '{} like the first chip.'.format(
+                            image_path, src.height, src.width, src.count,
+                            height, width, channels))
+                images[i] = np.moveaxis(
+                    src.read(list(range(1, channels + 1))), 0, -1)
+                index['crs'].append(src.crs.to_string() if src.crs else None)
+                index['transforms'].append(list(src.transform)[:6])
+            with rasterio.open(mask_path) as src:
+                if src.dtypes[0] != 'uint8':
+                    raise ValueError('{} is {}, not uint8.'.format(
+                        mask_path, src.dtypes[0]))
+                if (src.height, src.width, src.count) != \
+                        (height, width, mask_channels):
+                    raise ValueError(
+                        '{} is {}x{} with {} bands, not {}x{} with {} like '
+                        'the first mask.'.format(
+                            mask_path, src.height, src.width, src.count,
+                            height, width, mask_channels))
+                masks[i] = np.moveaxis(src.read(), 0, -1)
+    images.flush()
+    masks.flush()
+    del images, masks
+    with open(os.path.join(part_dir, 'index.json'), 'w') as f:
+        json.dump(index, f)
+
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.replace(part_dir, shard_dir)
+    return ChipShard(shard_dir)
+
+
+class ChipShard(object):
+    """A shard of image chips and masks written by :func:`make_chip_shard`.
+
+    The arrays are memory-mapped read-only, so indexing them reads only the
+    chips that are used and returns views rather than copies.
+
+    Attributes
+    ----------
+    path : str
+        The shard directory.
+    images : :class:`numpy.memmap`
+        ``uint8`` ``[N, Y, X, C]`` image chips.
+    masks : :class:`numpy.memmap`
+        ``uint8`` ``[N, Y, X, M]`` masks of the chips.
+    names : list of str
+        The name of each chip.
+    crs : list of str
+        The CRS of each chip, as a string that :mod:`rasterio` can parse.
+    transforms : list of :class:`affine.Affine`
+        The affine transform of each chip.
+    df : :class:`pandas.DataFrame`
+        A ``'name'`` column with a row per chip, for use in place of a
+        dataset CSV with :func:`solaris.nets.datagen.make_data_generator`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        self.images = np.load(os.path.join(path, 'images.npy'),
+                              mmap_mode='r')
+        self.masks = np.load(os.path.join(path, 'masks.npy'), mmap_mode='r')
+        self.names = index['names']
+        self.crs = index['crs']
+        self.transforms = [Affine(*t) for t in index['transforms']]
+        self.df = pd.DataFrame({'name': self.names})
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, idx):
+        """Get the image chip and mask at `idx`, as views."""
+        return self.images[idx], self.masks[idx]
+
+    @staticmethod
+    def is_shard(path):
+        """Whether `path` is a shard directory."""
+        return isinstance(path, str) and os.path.isfile(
+            os.path.join(path, 'index.json'))
@@ -8,12 +8,13 @@ from affine import Affine
 import rasterio
 from rasterio.warp import calculate_default_transform, Resampling
 from rasterio.warp import transform_bounds
+import shapely
 from shapely.affinity import affine_transform
 from shapely.wkt import loads
 from shapely.geometry import Point, Polygon, LineString
 from shapely.geometry import MultiLineString, MultiPolygon, mapping, box, shape
 from shapely.geometry.collection import GeometryCollection
-from shapely.ops import cascaded_union
+from shapely.ops import unary_union as cascaded_union
 from osgeo import gdal, osr
 import json
 from warnings import warn
@@ -583,7 +584,7 @@ def _split_multigeom_row(gdf_row, geom_col):
 
 
 def _split_multigeom(multigeom):
-    return list(multigeom)
+    return list(multigeom.geoms)
 
 
 def _reduce_geom_precision(geom, precision=2):
@@ -740,16 +741,16 @@ def polygon_to_coco(polygon):
 
 
 def split_geom(geometry, tile_size, resolution=None,
-               use_projection_units=False, src_img=None):
+               use_projection_units=False, src_img=None, chunk_size=None):
     """Splits a vector into approximately equal sized tiles.
 
     Adapted from @lossyrob's Gist__
 
     .. Gist: https://gist.github.com/lossyrob/7b620e6d2193cb55fbd0bffacf27f7f2
 
-    The more complex the geometry, the slower this will run, but geometrys with
-    around 10000 coordinates run in a few seconds time. You can simplify
-    geometries with shapely.geometry.Polygon.simplify if necessary.
+    The grid cells are built in batches and kept if they intersect the
+    prepared `geometry`, which is tested for whole batches at once. If
+    `geometry` is a rectangle, every cell is kept without testing.
 
     Arguments
     ---------
@@ -773,10 +774,17 @@ def split_geom(geometry, tile_size, resolution=None,
         intersected and the result of the intersection will be tiled. Useful in cases where the extent of
         collected labels and source imagery partially overlap. The src_img must have the same projection units
         as the geometry.
+    chunk_size : int, optional
+        If provided, the tile bounds are generated lazily, at most
+        `chunk_size` grid cells at a time, instead of returned as one array.
+        Useful for very large areas.
 
     Returns
     -------
-    tile_bounds : list (containing sublists like [left, bottom, right, top])
+    tile_bounds : :class:`numpy.ndarray` or generator
+        A ``(N, 4)`` array with a ``[left, bottom, right, top]`` row per tile,
+        ordered by column from left to right and bottom to top within each
+        column. If `chunk_size` is provided, a generator of such arrays.
 
     """
     if isinstance(geometry, str):
@@ -812,25 +820,39 @@ def split_geom(geometry, tile_size, resolution=None,
     if src_img is not None:
         src_img = _check_rasterio_im_load(src_img)
         geometry = geometry.intersection(box(*src_img.bounds))
-        bounds = geometry.bounds
-    else:
-        bounds = geometry.bounds
-        
-    xmin = bounds[0]
-    xmax = bounds[2]
-    ymin = bounds[1]
-    ymax = bounds[3]
-    x_extent = xmax - xmin
-    y_extent = ymax - ymin
-    x_steps = np.ceil(x_extent/tmp_tile_size[1])
-    y_steps = np.ceil(y_extent/tmp_tile_size[0])
-    x_mins = np.arange(xmin, xmin + tmp_tile_size[1]*x_steps,
-                       tmp_tile_size[1])
-    y_mins = np.arange(ymin, ymin + tmp_tile_size[0]*y_steps,
-                       tmp_tile_size[0])
-    tile_bounds = [
-        (i, j, i+tmp_tile_size[1], j+tmp_tile_size[0])
-        for i in x_mins for j in y_mins if not geometry.intersection(
-            box(*(i, j, i+tmp_tile_size[1], j+tmp_tile_size[0]))).is_empty
-        ]
-    return tile_bounds
+
+    tile_bounds = _iter_tile_grid(geometry, tmp_tile_size,
+                                  chunk_size or _TILE_GRID_CHUNK)
+    if chunk_size is not None:
+        return tile_bounds
+    return np.concatenate([np.empty((0, 4))] + list(tile_bounds))
+
+
+# number of grid cells split_geom tests against the geometry at once
+_TILE_GRID_CHUNK = 65536
+
+
+def _iter_tile_grid(geometry, tile_size, chunk_size):
+    """Yield arrays of the bounds of the `tile_size` grid cells over the
+    bounds of `geometry` that intersect it, `chunk_size` cells at a time."""
+    xmin, ymin, xmax, ymax = geometry.bounds
+    x_steps = np.ceil((xmax - xmin)/tile_size[1])
+    y_steps = np.ceil((ymax - ymin)/tile_size[0])
+    x_mins = np.arange(xmin, xmin + tile_size[1]*x_steps, tile_size[1])
+    y_mins = np.arange(ymin, ymin + tile_size[0]*y_steps, tile_size[0])
+    n_cells = len(x_mins) * len(y_mins)
+    # every cell of the grid overlaps a rectangle
+    test_cells = not geometry.equals(box(*geometry.bounds))
+    if test_cells:
+        shapely.prepare(geometry)
+    for start in range(0, n_cells, chunk_size):
+        cells = np.arange(start, min(start + chunk_size, n_cells))
+        lefts = x_mins[cells // len(y_mins)]
+        bottoms = y_mins[cells % len(y_mins)]
+        tile_bounds = np.column_stack([lefts, bottoms, lefts + tile_size[1],
+                                       bottoms + tile_size[0]])
+        if test_cells:
+            tile_bounds = tile_bounds[shapely.intersects(
+                geometry, shapely.box(*tile_bounds.T))]
+        if len(tile_bounds):
+            yield tile_bounds
@@ -20,14 +20,16 @@ def reorder_axes(arr, target='tensorflow'):
     order.
     """
 
-    if isinstance(arr, torch.Tensor):
+    # torch is not imported, so its tensors are told apart by their module
+    is_torch = type(arr).__module__.split('.')[0] == 'torch'
+    if is_torch:
         raise RuntimeError("Pytorch not supported")
     if isinstance(arr, np.ndarray):
         axes = list(arr.shape)
     elif isinstance(arr, tf.Tensor):
         axes = arr.get_shape().as_list()
 
-    if isinstance(arr, torch.Tensor):
+    if is_torch:
         raise RuntimeError("Pytorch not supported")
         # if len(axes) == 3:
         #     if target == 'tensorflow' and axes[0] < axes[1]:
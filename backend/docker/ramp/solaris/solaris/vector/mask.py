@@ -1,10 +1,12 @@
-from ..utils.core import _check_df_load, _check_geom, _check_crs
+from ..utils.core import _check_df_load, _check_gdf_load, _check_geom
+from ..utils.core import _check_crs
 from ..utils.core import _check_skimage_im_load, _check_rasterio_im_load
 from ..utils.geo import gdf_get_projection_unit, reproject
 from ..utils.geo import geometries_internal_intersection
 from ..utils.tile import save_empty_geojson
 from .polygon import georegister_px_df, geojson_to_px_gdf, affine_transform_gdf
 import numpy as np
+import shapely
 from shapely.geometry import shape
 from shapely.geometry import Polygon
 import geopandas as gpd
@@ -13,7 +15,12 @@ import rasterio
 from rasterio import features
 from affine import Affine
 from skimage.morphology import square, erosion, dilation
+from scipy.ndimage import binary_dilation, find_objects
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 import os
+from collections import deque
+from multiprocessing import Pool
 from tqdm.auto import tqdm
 
 def df_to_px_mask(df, channels=['footprint'], out_file=None, reference_im=None,
@@ -253,11 +260,13 @@ def boundary_mask(footprint_msk=None, out_file=None, reference_im=None,
 
     Arguments
     ---------
-    footprint_msk : :class:`numpy.array`, optional
+    footprint_msk : :class:`numpy.array` or :class:`InstanceMask`, optional
         A filled in footprint mask created using :func:`footprint_mask`. If not
         provided, one will be made by calling :func:`footprint_mask` before
         creating the boundary mask, and the required arguments for that
-        function must be provided as kwargs.
+        function must be provided as kwargs. If an :class:`InstanceMask` is
+        provided, the boundary of each object is drawn, so boundaries are
+        kept where objects touch.
     out_file : str, optional
         Path to an image file to save the output to. Must be compatible with
         :class:`rasterio.DatasetReader`. If provided, a `reference_im` must be
@@ -296,14 +305,18 @@ def boundary_mask(footprint_msk=None, out_file=None, reference_im=None,
         footprint_msk = footprint_mask(reference_im=reference_im,
                                        burn_value=burn_value, **kwargs)
 
-    # perform dilation or erosion of `footprint_mask` to get the boundary
-    strel = square(boundary_width)
-    if boundary_type == 'outer':
-        boundary_mask = dilation(footprint_msk, strel)
-    elif boundary_type == 'inner':
-        boundary_mask = erosion(footprint_msk, strel)
-    # use xor operator between border and footprint mask to get _just_ boundary
-    boundary_mask = boundary_mask ^ footprint_msk
+    if isinstance(footprint_msk, InstanceMask):
+        boundary_mask = _instance_boundary_mask(footprint_msk, boundary_width,
+                                                boundary_type)
+    else:
+        # perform dilation or erosion of `footprint_mask` to get the boundary
+        strel = square(boundary_width)
+        if boundary_type == 'outer':
+            boundary_mask = dilation(footprint_msk, strel)
+        elif boundary_type == 'inner':
+            boundary_mask = erosion(footprint_msk, strel)
+        # use xor operator between border and footprint mask to get _just_ boundary
+        boundary_mask = boundary_mask ^ footprint_msk
     # scale the `True` values to burn_value and return
     boundary_mask = boundary_mask > 0  # need to binarize to get burn val right
     output_arr = boundary_mask.astype('uint8')*burn_value
@@ -318,6 +331,67 @@ def boundary_mask(footprint_msk=None, out_file=None, reference_im=None,
     return output_arr
 
 
+def _instance_boundary_mask(instances, boundary_width, boundary_type):
+    """Draw the boundary of each object of an :class:`InstanceMask`.
+
+    Each object is eroded or dilated within its crop plus a margin for the
+    structuring element, and outer boundaries are kept off all objects.
+    """
+    strel = square(boundary_width)
+    height, width = instances.shape
+    boundary_mask = np.zeros(instances.shape, dtype=bool)
+    for crop, (rows, cols) in zip(instances.crops, instances.windows()):
+        if not crop.any():
+            continue
+        row_off = max(rows.start - boundary_width, 0)
+        col_off = max(cols.start - boundary_width, 0)
+        local_window = (
+            slice(row_off, min(rows.stop + boundary_width, height)),
+            slice(col_off, min(cols.stop + boundary_width, width)))
+        local = np.zeros((local_window[0].stop - row_off,
+                          local_window[1].stop - col_off), dtype='uint8')
+        local[rows.start - row_off:rows.stop - row_off,
+              cols.start - col_off:cols.stop - col_off] = crop
+        # the same grey morphology as for footprint masks, which places even
+        # sized structuring elements like it does
+        if boundary_type == 'outer':
+            boundary_mask[local_window] |= dilation(local, strel) > local
+        elif boundary_type == 'inner':
+            boundary_mask[local_window] |= erosion(local, strel) < local
+    if boundary_type == 'outer':
+        boundary_mask &= ~instances.footprint()
+    return boundary_mask
+
+
+def _instance_contact_mask(instances, contact_spacing):
+    """Find background pixels of an :class:`InstanceMask` within
+    `contact_spacing` pixels of two or more objects.
+
+    Each object is dilated by half of `contact_spacing` within its crop plus
+    a margin, and the number of dilated objects covering each pixel is
+    counted.
+    """
+    # object outlines run up to half a pixel past the centers of their
+    # outermost pixels
+    radius = contact_spacing / 2. + 0.5
+    margin = int(np.ceil(radius))
+    offsets = np.arange(-margin, margin + 1)
+    strel = offsets[:, np.newaxis]**2 + offsets[np.newaxis, :]**2 <= radius**2
+    height, width = instances.shape
+    counts = np.zeros(instances.shape, dtype='uint16')
+    for crop, (rows, cols) in zip(instances.crops, instances.windows()):
+        if not crop.any():
+            continue
+        local = np.pad(crop, margin)
+        row_off, col_off = rows.start - margin, cols.start - margin
+        local = binary_dilation(local, strel)[
+            max(-row_off, 0):height - row_off, max(-col_off, 0):width - col_off]
+        row_off, col_off = max(row_off, 0), max(col_off, 0)
+        counts[row_off:row_off + local.shape[0],
+               col_off:col_off + local.shape[1]] += local
+    return (counts >= 2) & ~instances.footprint()
+
+
 def contact_mask(df, contact_spacing=10, meters=False, out_file=None,
                  reference_im=None, geom_col='geometry',
                  do_transform=None, affine_obj=None, shape=(900, 900),
@@ -331,11 +405,14 @@ def contact_mask(df, contact_spacing=10, meters=False, out_file=None,
 
     Arguments
     ---------
-    df : :class:`pandas.DataFrame` or :class:`geopandas.GeoDataFrame`
+    df : :class:`pandas.DataFrame`, :class:`geopandas.GeoDataFrame` or :class:`InstanceMask`
         A :class:`pandas.DataFrame` or :class:`geopandas.GeoDataFrame` instance
         with a column containing geometries (identified by `geom_col`). If the
         geometries in `df` are not in pixel coordinates, then `affine` or
         `reference_im` must be passed to provide the transformation to convert.
+        If an :class:`InstanceMask` is provided, the contact points are found
+        in pixel space by dilating each object by half of `contact_spacing`,
+        which must then be in pixel units.
     contact_spacing : `int` or `float`, optional
         The desired maximum distance between adjacent polygons to be labeled
         as contact. Will be in pixel units unless ``meters=True`` is provided.
@@ -384,6 +461,21 @@ def contact_mask(df, contact_spacing=10, meters=False, out_file=None,
     if out_file and not reference_im:
         raise ValueError(
             'If saving output to file, `reference_im` must be provided.')
+    if isinstance(df, InstanceMask):
+        if meters:
+            raise ValueError('contact_spacing must be in pixel units if df '
+                             'is an InstanceMask.')
+        output_arr = _instance_contact_mask(
+            df, contact_spacing).astype('uint8')*burn_value
+        if out_file:
+            reference_im = _check_rasterio_im_load(reference_im)
+            meta = reference_im.meta.copy()
+            meta.update(count=1)
+            if out_type == 'int':
+                meta.update(dtype='uint8')
+            with rasterio.open(out_file, 'w', **meta) as dst:
+                dst.write(output_arr, indexes=1)
+        return output_arr
     df = _check_df_load(df)
 
     if len(df) == 0 and not out_file:
@@ -702,23 +794,29 @@ def preds_to_binary(pred_arr, channel_scaling=None, bg_threshold=0):
     """
     pred_arr = _check_skimage_im_load(pred_arr).copy()
 
+    if len(pred_arr.shape) == 3 and pred_arr.shape[0] < pred_arr.shape[-1]:
+        pred_arr = np.moveaxis(pred_arr, 0, -1)
+    mask_arr = _binarize(pred_arr, channel_scaling, bg_threshold).astype('uint8')
+
+    return mask_arr*255
+
+
+def _binarize(pred_arr, channel_scaling=None, bg_threshold=0):
+    """Threshold a channels-last prediction array, see
+    :func:`preds_to_binary`."""
     if len(pred_arr.shape) == 3:
-        if pred_arr.shape[0] < pred_arr.shape[-1]:
-            pred_arr = np.moveaxis(pred_arr, 0, -1)
         if channel_scaling is None:  # if scale values weren't provided
             channel_scaling = np.ones(shape=(pred_arr.shape[-1]),
                                       dtype='float')
         pred_arr = np.sum(pred_arr*np.array(channel_scaling), axis=-1)
-
-    mask_arr = (pred_arr > bg_threshold).astype('uint8')
-
-    return mask_arr*255
+    return pred_arr > bg_threshold
 
 
 def mask_to_poly_geojson(pred_arr, channel_scaling=None, reference_im=None,
                          output_path=None, output_type='geojson', min_area=40,
                          bg_threshold=0, do_transform=None, simplify=False,
-                         tolerance=0.5, **kwargs):
+                         tolerance=0.5, window_size=None, workers=1,
+                         **kwargs):
     """Get polygons from an image mask.
 
     Arguments
@@ -726,7 +824,8 @@ def mask_to_poly_geojson(pred_arr, channel_scaling=None, reference_im=None,
     pred_arr : :class:`numpy.ndarray`
         A 2D array of integers. Multi-channel masks are not supported, and must
         be simplified before passing to this function. Can also pass an image
-        file path here.
+        file path here, which is read one window at a time if `window_size`
+        is provided.
     channel_scaling : :class:`list`-like, optional
         If `pred_arr` is a 3D array, this argument defines how each channel
         will be combined to generate a binary output. channel_scaling should
@@ -762,6 +861,15 @@ def mask_to_poly_geojson(pred_arr, channel_scaling=None, reference_im=None,
         The tolerance value to use for simplification with the Douglas-Peucker
         algorithm. Defaults to ``0.5``. Only has an effect if
         ``simplify=True``.
+    window_size : int, optional
+        Polygonize the mask in square windows of this many pixels and merge
+        the polygons that cross the edges between windows, so that large
+        masks can be polygonized in parallel and, if `pred_arr` is a file
+        path, without reading all of it into memory. Defaults to ``None``,
+        which polygonizes the whole mask at once.
+    workers : int, optional
+        Number of processes polygonizing windows. Defaults to ``1``. Only has
+        an effect if `window_size` is provided.
 
     Returns
     -------
@@ -770,8 +878,6 @@ def mask_to_poly_geojson(pred_arr, channel_scaling=None, reference_im=None,
 
     """
 
-    mask_arr = preds_to_binary(pred_arr, channel_scaling, bg_threshold)
-
     if do_transform and reference_im is None:
         raise ValueError(
             'Coordinate transformation requires a reference image.')
@@ -785,26 +891,59 @@ def mask_to_poly_geojson(pred_arr, channel_scaling=None, reference_im=None,
         transform = Affine(1, 0, 0, 0, 1, 0)  # identity transform
         crs = rasterio.crs.CRS()
 
-    mask = mask_arr > bg_threshold
-    mask = mask.astype('uint8')
-
-    polygon_generator = features.shapes(mask_arr,
-                                        transform=transform,
-                                        mask=mask)
-    polygons = []
-    values = []  # pixel values for the polygon in mask_arr
-    for polygon, value in polygon_generator:
-        p = shape(polygon).buffer(0.0)
-        if p.area >= min_area:
-            polygons.append(shape(polygon).buffer(0.0))
-            values.append(value)
-
-    polygon_gdf = gpd.GeoDataFrame({'geometry': polygons, 'value': values},
-                                   crs=crs.to_wkt())
-    if simplify:
-        polygon_gdf['geometry'] = polygon_gdf['geometry'].apply(
-            lambda x: x.simplify(tolerance=tolerance)
-        )
+    if window_size is not None and isinstance(pred_arr, str):
+        with rasterio.open(pred_arr) as src:
+            height, width = src.height, src.width
+    else:
+        pred_arr = _check_skimage_im_load(pred_arr)
+        if len(pred_arr.shape) == 3 and pred_arr.shape[0] < pred_arr.shape[-1]:
+            pred_arr = np.moveaxis(pred_arr, 0, -1)
+        height, width = pred_arr.shape[:2]
+    if window_size is None:
+        window_size = max(height, width)
+
+    tolerance = tolerance if simplify else None
+    polygons, seam_polygons = [], []
+
+    def collect(result):
+        polygons.append(result[0])
+        seam_polygons.append(result[1])
+
+    pool = Pool(workers) if workers > 1 else None
+    pending = deque()
+    try:
+        for row_off in range(0, height, window_size):
+            for col_off in range(0, width, window_size):
+                window = (row_off, col_off, min(window_size, height - row_off),
+                          min(window_size, width - col_off))
+                if isinstance(pred_arr, str):
+                    src = pred_arr
+                else:
+                    src = pred_arr[row_off:row_off + window[2],
+                                   col_off:col_off + window[3]]
+                args = (src, window, (height, width), channel_scaling,
+                        bg_threshold, transform, min_area, tolerance)
+                if pool is None:
+                    collect(_polygonize_window(*args))
+                else:
+                    pending.append(pool.apply_async(_polygonize_window, args))
+                    # keep a bounded number of windows in memory
+                    if len(pending) > 2 * workers:
+                        collect(pending.popleft().get())
+        for result in pending:
+            collect(result.get())
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    polygons.append(_clean_polygons(
+        _merge_seam_polygons(np.concatenate(seam_polygons)), transform,
+        min_area, tolerance))
+    polygons = np.concatenate(polygons)
+
+    polygon_gdf = gpd.GeoDataFrame(
+        {'geometry': polygons, 'value': np.full(len(polygons), 255.)},
+        crs=crs.to_wkt())
     # save output files
     if output_path is not None:
         if output_type.lower() == 'geojson':
@@ -818,6 +957,70 @@ def mask_to_poly_geojson(pred_arr, channel_scaling=None, reference_im=None,
     return polygon_gdf
 
 
+def _polygonize_window(src, window, mask_shape, channel_scaling,
+                       bg_threshold, transform, min_area, tolerance):
+    """Polygonize one window of a mask.
+
+    `src` is the window of the prediction array or the path to read it from.
+    Returns the polygons away from the edges shared with other windows,
+    cleaned up by :func:`_clean_polygons`, and those along the edges as they
+    are, in the pixel coordinates of the mask.
+    """
+    row_off, col_off, height, width = window
+    if isinstance(src, str):
+        with rasterio.open(src) as f:
+            src = f.read(window=rasterio.windows.Window(col_off, row_off,
+                                                        width, height))
+        src = src[0] if len(src) == 1 else np.moveaxis(src, 0, -1)
+    mask = _binarize(src, channel_scaling, bg_threshold).astype('uint8')
+    polygons = np.array(
+        [shape(polygon) for polygon, _ in features.shapes(
+            mask, mask=mask, transform=Affine.translation(col_off, row_off))],
+        dtype=object)
+    bounds = shapely.bounds(polygons).reshape(-1, 4)
+    on_seam = (((bounds[:, 0] == col_off) & (col_off > 0))
+               | ((bounds[:, 1] == row_off) & (row_off > 0))
+               | ((bounds[:, 2] == col_off + width)
+                  & (col_off + width < mask_shape[1]))
+               | ((bounds[:, 3] == row_off + height)
+                  & (row_off + height < mask_shape[0])))
+    return (_clean_polygons(polygons[~on_seam], transform, min_area,
+                            tolerance),
+            polygons[on_seam])
+
+
+def _clean_polygons(polygons, transform, min_area, tolerance):
+    """Move pixel coordinate polygons to `transform`, fix them, drop those
+    under `min_area` and simplify them with `tolerance` if it isn't None."""
+    if transform != Affine.identity():
+        polygons = shapely.transform(polygons, lambda xy: np.column_stack([
+            # in the order GDAL applies a geotransform
+            transform.c + xy[:, 0] * transform.a + xy[:, 1] * transform.b,
+            transform.f + xy[:, 0] * transform.d + xy[:, 1] * transform.e]))
+    polygons = shapely.buffer(polygons, 0.0)
+    polygons = polygons[shapely.area(polygons) >= min_area]
+    if tolerance is not None:
+        polygons = shapely.simplify(polygons, tolerance=tolerance)
+    return polygons
+
+
+def _merge_seam_polygons(polygons):
+    """Union the polygons from different windows that share an edge."""
+    if len(polygons) < 2:
+        return polygons
+    left, right = shapely.STRtree(polygons).query(polygons,
+                                                  predicate='intersects')
+    n_groups, groups = connected_components(
+        coo_matrix((np.ones(len(left)), (left, right)),
+                   shape=(len(polygons),) * 2), directed=False)
+    order = np.argsort(groups, kind='stable')
+    splits = np.flatnonzero(np.diff(groups[order])) + 1
+    merged = [group[0] if len(group) == 1 else shapely.union_all(group)
+              for group in np.split(polygons[order], splits)]
+    # parts that only touch at a corner stay separate polygons
+    return shapely.get_parts(np.array(merged, dtype=object))
+
+
 def crs_is_metric(gdf):
     """Check if a GeoDataFrame's CRS is in metric units."""
     units = str(gdf_get_projection_unit(gdf)).strip().lower()
@@ -842,11 +1045,215 @@ def _check_do_transform(df, reference_im, affine_obj):
         return True
 
 
+class InstanceMask(object):
+    """Compact pixel masks of individual objects.
+
+    Rather than as a full-size band per object, each object is stored as a
+    boolean crop covering its bounding box within the mask together with
+    the offset of the crop and the value it is burned with, so memory and
+    work scale with the area of the objects instead of the number of
+    objects times the area of the mask. Create one with
+    :func:`instance_mask` and ``compact=True``, or convert from the dense
+    and label layouts with :meth:`from_dense` and :meth:`from_labels`.
+
+    Arguments
+    ---------
+    shape : tuple
+        The ``(height, width)`` of the mask.
+    crops : list of :class:`numpy.ndarray`
+        A boolean array per object, ``True`` at the object's pixels.
+    offsets : array-like
+        The ``(row, col)`` of the top left pixel of each crop in the mask.
+    values : array-like, optional
+        The value each object is burned with in :meth:`to_dense`. Defaults to
+        ``255`` for every object.
+
+    Attributes
+    ----------
+    shape : tuple
+        The ``(height, width)`` of the mask.
+    crops : list of :class:`numpy.ndarray`
+        The boolean crop of each object.
+    offsets : :class:`numpy.ndarray`
+        An ``(N, 2)`` array with the ``(row, col)`` offset of each crop.
+    values : :class:`numpy.ndarray`
+        The burn value of each object.
+    """
+
+    def __init__(self, shape, crops, offsets, values=None):
+        self.shape = tuple(shape[:2])
+        self.crops = list(crops)
+        self.offsets = np.asarray(offsets, dtype=int).reshape(-1, 2)
+        if values is None:
+            values = np.full(len(self.crops), 255, dtype='uint8')
+        self.values = np.asarray(values)
+
+    def __len__(self):
+        return len(self.crops)
+
+    def windows(self):
+        """Yield the ``(rows, cols)`` slices of each crop within the mask."""
+        for crop, (row, col) in zip(self.crops, self.offsets):
+            yield (slice(row, row + crop.shape[0]),
+                   slice(col, col + crop.shape[1]))
+
+    def any(self):
+        """Check whether any object covers a pixel."""
+        return any(crop.any() for crop in self.crops)
+
+    def footprint(self):
+        """Get a boolean mask of the pixels covered by any object."""
+        footprint = np.zeros(self.shape, dtype=bool)
+        for crop, window in zip(self.crops, self.windows()):
+            footprint[window] |= crop
+        return footprint
+
+    def iter_bands(self, dtype=None):
+        """Yield the full-size band of each object in the dense layout.
+
+        Only one band is held in memory at a time.
+        """
+        dtype = dtype or self.values.dtype
+        band = np.zeros(self.shape, dtype=dtype)
+        for crop, window, value in zip(self.crops, self.windows(),
+                                       self.values):
+            band[window] = crop * value
+            yield band
+            band[window] = 0
+
+    def to_dense(self, dtype=None):
+        """Convert to the ``(height, width, N)`` layout of
+        :func:`instance_mask` with one band per object."""
+        dtype = dtype or self.values.dtype
+        output_arr = np.zeros(self.shape + (len(self),), dtype=dtype)
+        for idx, (crop, (rows, cols), value) in enumerate(
+                zip(self.crops, self.windows(), self.values)):
+            output_arr[rows, cols, idx] = crop * value
+        return output_arr
+
+    def to_labels(self, dtype='uint16'):
+        """Convert to a label raster with the pixels of the i-th object set
+        to ``i + 1`` and ``0`` elsewhere. Where objects overlap, the later
+        object is kept."""
+        labels = np.zeros(self.shape, dtype=dtype)
+        for idx, (crop, window) in enumerate(zip(self.crops,
+                                                 self.windows())):
+            labels[window][crop] = idx + 1
+        return labels
+
+    @classmethod
+    def from_dense(cls, arr):
+        """Create from an ``(height, width, N)`` array with one band per
+        object, such as returned by :func:`instance_mask`."""
+        crops, offsets, values = [], [], []
+        for idx in range(arr.shape[-1]):
+            band = arr[:, :, idx]
+            rows, cols = np.nonzero(band)
+            if len(rows) == 0:
+                crops.append(np.zeros((0, 0), dtype=bool))
+                offsets.append((0, 0))
+                values.append(0)
+                continue
+            window = (slice(rows.min(), rows.max() + 1),
+                      slice(cols.min(), cols.max() + 1))
+            crops.append(band[window] != 0)
+            offsets.append((rows.min(), cols.min()))
+            values.append(band[rows[0], cols[0]])
+        return cls(arr.shape[:2], crops, offsets,
+                   np.array(values, dtype=arr.dtype))
+
+    @classmethod
+    def from_labels(cls, labels, values=None):
+        """Create from a label raster with a distinct positive value per
+        object and ``0`` as background. Objects are ordered by label."""
+        crops, offsets = [], []
+        object_slices = find_objects(labels)
+        for label, window in enumerate(object_slices, start=1):
+            if window is None:
+                continue
+            crops.append(labels[window] == label)
+            offsets.append((window[0].start, window[1].start))
+        return cls(labels.shape, crops, offsets, values)
+
+    def write(self, out_file, meta):
+        """Write the dense layout to a raster with one band per object.
+
+        Bands are written one at a time, so the dense array is never held
+        in memory.
+
+        Arguments
+        ---------
+        out_file : str
+            Path to the output raster.
+        meta : dict
+            Rasterio metadata of the output, e.g. from the reference image.
+            ``count`` is set to the number of objects.
+        """
+        meta = dict(meta, count=len(self))
+        with rasterio.open(out_file, 'w', **meta) as dst:
+            for idx, band in enumerate(self.iter_bands(meta['dtype']),
+                                       start=1):
+                dst.write(band, indexes=idx)
+
+
+def _rasterize_instances(geoms, shape, affine_obj):
+    """Rasterize each geometry into a boolean crop of its bounding box.
+
+    Returns the crops and their ``(row, col)`` offsets within `shape`.
+    """
+    inverse = ~affine_obj
+    bounds = np.array([geom.bounds if geom is not None and not geom.is_empty
+                       else (np.nan,) * 4 for geom in geoms]).reshape(-1, 4)
+    xs, ys = bounds[:, [0, 2, 0, 2]], bounds[:, [1, 1, 3, 3]]
+    cols = inverse.a * xs + inverse.b * ys + inverse.c
+    rows = inverse.d * xs + inverse.e * ys + inverse.f
+    # one pixel of margin on each side for rounding in the transforms
+    col_offs = np.clip(np.floor(cols.min(axis=1)) - 1, 0, shape[1])
+    col_ends = np.clip(np.ceil(cols.max(axis=1)) + 1, 0, shape[1])
+    row_offs = np.clip(np.floor(rows.min(axis=1)) - 1, 0, shape[0])
+    row_ends = np.clip(np.ceil(rows.max(axis=1)) + 1, 0, shape[0])
+    crops, offsets = [], []
+    for geom, row_off, row_end, col_off, col_end in zip(
+            geoms, row_offs, row_ends, col_offs, col_ends):
+        if not (row_end > row_off and col_end > col_off):  # also NaN
+            crops.append(np.zeros((0, 0), dtype=bool))
+            offsets.append((0, 0))
+            continue
+        row_off, col_off = int(row_off), int(col_off)
+        crop = features.rasterize(
+            [(geom, 1)], out_shape=(int(row_end) - row_off,
+                                    int(col_end) - col_off),
+            transform=affine_obj * Affine.translation(col_off, row_off),
+            dtype='uint8')
+        crops.append(crop.astype(bool))
+        offsets.append((row_off, col_off))
+    return crops, offsets
+
+
+def _nodata_mask(reference_im, window):
+    """Find the pixels of `window` in `reference_im` that are nodata in any
+    band, reading one band at a time."""
+    bad_data_mask = None
+    for band in range(1, reference_im.count + 1):
+        band_nodata = reference_im.read(band, window=window) == \
+            reference_im.nodata
+        if bad_data_mask is None:
+            bad_data_mask = band_nodata
+        else:
+            bad_data_mask |= band_nodata
+    return bad_data_mask
+
+
 def instance_mask(df, out_file=None, reference_im=None, geom_col='geometry',
                   do_transform=None, affine_obj=None, shape=(900, 900),
-                  out_type='int', burn_value=255, burn_field=None, nodata_value=0):
+                  out_type='int', burn_value=255, burn_field=None, nodata_value=0,
+                  compact=False):
     """Convert a dataframe of geometries to a pixel mask.
 
+    Each geometry is rasterized only over its own bounding box, and if
+    `reference_im` has a nodata value, object pixels that are nodata in any
+    band of `reference_im` are removed.
+
     Arguments
     ---------
     df : :class:`pandas.DataFrame` or :class:`geopandas.GeoDataFrame`
@@ -857,7 +1264,8 @@ def instance_mask(df, out_file=None, reference_im=None, geom_col='geometry',
     out_file : str, optional
         Path to an image file to save the output to. Must be compatible with
         :class:`rasterio.DatasetReader`. If provided, a `reference_im` must be
-        provided (for metadata purposes).
+        provided (for metadata purposes). The output always has one band per
+        object; bands are written one at a time.
     reference_im : :class:`rasterio.DatasetReader` or `str`, optional
         An image to extract necessary coordinate information from: the
         affine transformation matrix, the image extent, etc. If provided,
@@ -893,16 +1301,19 @@ def instance_mask(df, out_file=None, reference_im=None, geom_col='geometry',
         Ignored if reference_im nodata value is an int or if reference_im is not used.
         Take care when visualizing these masks, the nodata value may cause labels to not
         be visualized if nodata values are automatically masked by the software.
+    compact : bool, optional
+        Return an :class:`InstanceMask` instead of the dense array. Defaults
+        to ``False``.
 
     Returns
     -------
-    mask : :class:`numpy.array`
+    mask : :class:`numpy.array` or :class:`InstanceMask`
         A pixel mask with 0s for non-object pixels and `burn_value` at object
-        pixels. `mask` dtype will coincide with `burn_value`.
+        pixels, with one band per object along the last axis. `mask` dtype
+        will coincide with `burn_value`. If `compact` is ``True``, the
+        :class:`InstanceMask` of the objects.
 
     """
-    # TODO: Refactor to remove some duplicated code here and in other mask fxns
-
     if out_file and not reference_im:
         raise ValueError(
             'If saving output to file, `reference_im` must be provided.')
@@ -911,6 +1322,8 @@ def instance_mask(df, out_file=None, reference_im=None, geom_col='geometry',
     if len(df) == 0: # for saving an empty mask.
         reference_im = _check_rasterio_im_load(reference_im)
         shape = reference_im.shape
+        if compact:
+            return InstanceMask(shape, [], [])
         return np.zeros(shape=shape, dtype='uint8')
 
     if do_transform is None:
@@ -920,6 +1333,8 @@ def instance_mask(df, out_file=None, reference_im=None, geom_col='geometry',
     df[geom_col] = df[geom_col].apply(_check_geom)  # load in geoms if wkt
     if not do_transform:
         affine_obj = Affine(1, 0, 0, 0, 1, 0)  # identity transform
+    elif isinstance(affine_obj, (list, tuple)):
+        affine_obj = Affine(*affine_obj[:6])
 
     if reference_im:
         reference_im = _check_rasterio_im_load(reference_im)
@@ -927,53 +1342,185 @@ def instance_mask(df, out_file=None, reference_im=None, geom_col='geometry',
         if do_transform:
             affine_obj = reference_im.transform
 
-    # extract geometries and pair them with burn values
-
+    # burn values of the objects
+    dtype = 'uint8' if out_type == 'int' else 'float32'
     if burn_field:
-        if out_type == 'int':
-            feature_list = list(zip(df[geom_col],
-                                    df[burn_field].astype('uint8')))
-        else:
-            feature_list = list(zip(df[geom_col],
-                                    df[burn_field].astype('float32')))
-    else:
-        feature_list = list(zip(df[geom_col], [burn_value]*len(df)))
-
-    if out_type == 'int':
-        output_arr = np.empty(shape=(shape[0], shape[1],
-                                     len(feature_list)), dtype='uint8')
+        values = df[burn_field].astype(dtype).values
     else:
-        output_arr = np.empty(shape=(shape[0], shape[1],
-                                     len(feature_list)), dtype='float32')
-    # initialize the output array
-
-    for idx, feat in enumerate(feature_list):
-        output_arr[:, :, idx] = features.rasterize([feat], out_shape=shape,
-                                                   transform=affine_obj)
-
-    if reference_im:
-        reference_im = _check_rasterio_im_load(reference_im)
-    try:
-        bad_data_mask = (reference_im.read() == reference_im.nodata).any(axis=0) # take logical and along all dims so that all pixxels not -9999 across bands
-    except AttributeError as ae:  # raise another, more verbose AttributeError
-        raise AttributeError("A nodata value is not defined for the source image. Make sure the reference_im has a nodata value defined.") from ae
-    if len(bad_data_mask.shape) > 2:
-        bad_data_mask = np.dstack([bad_data_mask]*output_arr.shape[2])
-        output_arr = np.where(bad_data_mask, 0, output_arr) # mask is broadcasted to filter labels where there are non-nan image values
+        values = np.full(len(df), burn_value).astype(dtype)
+
+    crops, offsets = _rasterize_instances(list(df[geom_col]), shape,
+                                          affine_obj)
+    instances = InstanceMask(shape, crops, offsets, values)
+
+    if reference_im and reference_im.nodata is not None and len(instances):
+        # only read the part of the image that objects cover
+        windows = [w for crop, w in zip(instances.crops, instances.windows())
+                   if crop.size]
+        if windows:
+            row_off = min(w[0].start for w in windows)
+            col_off = min(w[1].start for w in windows)
+            window = rasterio.windows.Window.from_slices(
+                (row_off, max(w[0].stop for w in windows)),
+                (col_off, max(w[1].stop for w in windows)))
+            bad_data_mask = _nodata_mask(reference_im, window)
+            for crop, (rows, cols) in zip(instances.crops,
+                                          instances.windows()):
+                crop &= ~bad_data_mask[rows.start - row_off:rows.stop - row_off,
+                                       cols.start - col_off:cols.stop - col_off]
 
     if out_file:
         meta = reference_im.meta.copy()
-        meta.update(count=output_arr.shape[-1])
         if out_type == 'int':
             meta.update(dtype='uint8')
             if isinstance(meta['nodata'], float):
                 meta.update(nodata=nodata_value)
-        with rasterio.open(out_file, 'w', **meta) as dst:
-            for c in range(1, 1 + output_arr.shape[-1]):
-                dst.write(output_arr[:, :, c-1], indexes=c)
-            dst.close()
+        instances.write(out_file, meta)
+
+    if compact:
+        return instances
+    return instances.to_dense()
+
+
+def tile_mask_path(tile_path, dest_dir):
+    """The path :func:`tile_masks` writes the mask for `tile_path` to."""
+    return os.path.join(
+        dest_dir, os.path.splitext(os.path.basename(tile_path))[0] + '.tif')
+
+
+def tile_masks(tile_paths, labels, dest_dir, channels=['footprint'],
+               geom_col='geometry', burn_value=255, boundary_width=3,
+               boundary_type='inner', contact_spacing=10, resume=True,
+               workers=1):
+    """Create footprint, boundary and contact masks for many image tiles.
+
+    `labels` is loaded and indexed once. The labels intersecting each tile
+    are looked up in the index and rasterized as a compact
+    :class:`InstanceMask`, from which all of the `channels` are drawn, so
+    each tile is read and rasterized once whatever the channels. Masks are
+    written to a temporary file and renamed when complete, so an
+    interrupted run can be resumed.
+
+    Arguments
+    ---------
+    tile_paths : list of str
+        Paths to the georeferenced image tiles to create masks for.
+    labels : str or :class:`geopandas.GeoDataFrame`
+        The labels for all of the tiles, with a CRS. Reprojected to the CRS
+        of the tiles if they differ.
+    dest_dir : str
+        Directory to write the masks to, one GeoTIFF per tile named after
+        the tile (see :func:`tile_mask_path`). Created if it doesn't exist.
+        Must not be the directory of the tiles.
+    channels : list, optional
+        The mask channels to write, any of ``"footprint"``, ``"boundary"``
+        and ``"contact"``, as in :func:`df_to_px_mask`. Defaults to
+        ``["footprint"]``.
+    geom_col : str, optional
+        The column containing geometries in `labels`. Defaults to
+        ``"geometry"``.
+    burn_value : int, optional
+        The value of labeled pixels in the masks. Defaults to ``255``.
+    boundary_width : int, optional
+        Width of the boundaries in pixels. Defaults to ``3``.
+    boundary_type : str, optional
+        ``"inner"`` or ``"outer"`` boundaries, see :func:`boundary_mask`.
+        Defaults to ``"inner"``.
+    contact_spacing : int, optional
+        Largest gap between objects, in pixels, labeled as a contact. See
+        :func:`contact_mask`. Defaults to ``10``.
+    resume : bool, optional
+        Skip tiles whose mask already exists in `dest_dir`. Defaults to
+        ``True``.
+    workers : int, optional
+        Number of processes creating masks. Defaults to ``1``, which creates
+        them one by one.
+
+    Returns
+    -------
+    mask_paths : list of str
+        The path to the mask of each tile, including the skipped ones.
+    """
+    if isinstance(channels, str):
+        channels = [channels]
+    tile_dirs = {os.path.realpath(os.path.dirname(p)) for p in tile_paths}
+    if os.path.realpath(dest_dir) in tile_dirs:
+        raise ValueError('dest_dir must not be a directory of the tiles.')
+    labels = _check_gdf_load(labels)
+    if labels.crs is None:
+        raise ValueError('labels must have a crs.')
+    labels = gpd.GeoSeries(labels[geom_col].apply(_check_geom),
+                           crs=labels.crs)
+    labels = labels[~(labels.isna() | labels.is_empty)]
+    os.makedirs(dest_dir, exist_ok=True)
+
+    # labels and their spatial index, built once per tile CRS
+    indexed = {}
+    mask_paths = []
+    pool = Pool(workers) if workers > 1 else None
+    pending = deque()
+    try:
+        for tile_path in tqdm(tile_paths):
+            mask_path = tile_mask_path(tile_path, dest_dir)
+            mask_paths.append(mask_path)
+            if resume and os.path.exists(mask_path):
+                continue
+            with rasterio.open(tile_path) as src:
+                meta = src.meta.copy()
+                bounds = src.bounds
+            crs_key = meta['crs'].to_wkt() if meta['crs'] else None
+            if crs_key not in indexed:
+                if crs_key is None or labels.crs == _check_crs(crs_key):
+                    geoms = labels.values
+                else:
+                    geoms = labels.to_crs(crs_key).values
+                geoms = np.asarray(geoms, dtype=object)
+                indexed[crs_key] = geoms, shapely.STRtree(geoms)
+            geoms, tree = indexed[crs_key]
+            tile_geoms = geoms[np.sort(tree.query(shapely.box(*bounds),
+                                                  predicate='intersects'))]
+            meta.update(count=len(channels), dtype='uint8', nodata=None)
+            args = (tile_geoms, mask_path, meta, channels, burn_value,
+                    boundary_width, boundary_type, contact_spacing)
+            if pool is None:
+                _write_tile_mask(*args)
+            else:
+                pending.append(pool.apply_async(_write_tile_mask, args))
+                # keep a bounded number of tiles in memory
+                if len(pending) > 2 * workers:
+                    pending.popleft().get()
+        for result in pending:
+            result.get()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return mask_paths
+
+
+def _write_tile_mask(geoms, mask_path, meta, channels, burn_value,
+                     boundary_width, boundary_type, contact_spacing):
+    """Rasterize `geoms` once and write the `channels` for one tile."""
+    shape = (meta['height'], meta['width'])
+    crops, offsets = _rasterize_instances(geoms, shape, meta['transform'])
+    instances = InstanceMask(shape, crops, offsets)
+    tmp_path = mask_path + '.part'
+    with rasterio.open(tmp_path, 'w', **meta) as dst:
+        for band, channel in enumerate(channels, start=1):
+            if channel == 'footprint':
+                channel_msk = instances.footprint()
+            elif channel == 'boundary':
+                channel_msk = _instance_boundary_mask(
+                    instances, boundary_width, boundary_type)
+            elif channel == 'contact':
+                channel_msk = _instance_contact_mask(instances,
+                                                     contact_spacing)
+            else:
+                raise ValueError(
+                    'Unknown mask channel {}.'.format(channel))
+            dst.write(channel_msk.astype('uint8') * burn_value, band)
+    os.replace(tmp_path, mask_path)
 
-    return output_arr
 
 def geojsons_to_masks_and_fill_nodata(rtiler, vtiler, label_tile_dir, fill_value=0):
     """
@@ -1013,10 +1560,11 @@ def geojsons_to_masks_and_fill_nodata(rtiler, vtiler, label_tile_dir, fill_value
         rasterized_label_paths.append(rasterized_label_path)
         gdf = gpd.read_file(geojson_tile)
         # gdf.crs = rtiler.raster_bounds_crs # add this because gdfs can't be saved with wkt crs
-        arr = instance_mask(gdf, out_file=rasterized_label_path, reference_im=img_tile,
+        instances = instance_mask(gdf, out_file=rasterized_label_path, reference_im=img_tile,
                                         geom_col='geometry', do_transform=None,
-                                        out_type='int', burn_value=1, burn_field=None) # this saves the file, unless it is empty in which case we deal with it below.
-        if not arr.any(): # in case no instances in a tile we save it with "empty" at the front of the basename
+                                        out_type='int', burn_value=1, burn_field=None,
+                                        compact=True) # this saves the file, unless it is empty in which case we deal with it below.
+        if not instances.any(): # in case no instances in a tile we save it with "empty" at the front of the basename
             with rasterio.open(img_tile) as reference_im:
                 meta = reference_im.meta.copy()
                 reference_im.close()
@@ -1026,7 +1574,7 @@ def geojsons_to_masks_and_fill_nodata(rtiler, vtiler, label_tile_dir, fill_value
                 meta.update(nodata=0)
             rasterized_label_path = os.path.join(label_tile_dir, "empty_" + fid + ".tif")
             with rasterio.open(rasterized_label_path, 'w', **meta) as dst:
-                dst.write(np.expand_dims(arr, axis=0))
+                dst.write(np.zeros((1,) + instances.shape, dtype='uint8'))
                 dst.close()
     rtiler.fill_all_nodata(nodata_fill=fill_value)
     return rasterized_label_paths
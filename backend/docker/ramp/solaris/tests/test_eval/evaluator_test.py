@@ -92,3 +92,23 @@ class TestEvaluator(object):
                                                       ious_expected)])
         epsilon = 1E-9
         assert maxdifference < epsilon
+
+    def test_iou_by_building_parallel(self, tmp_path):
+        """Test scoring images in worker processes matches a single one"""
+        data_folder = solaris.data.data_dir
+        path_truth = os.path.join(data_folder, 'SN2_sample_truth.csv')
+        path_pred = os.path.join(data_folder, 'SN2_sample_preds.csv')
+        evaluators = [Evaluator(path_truth), Evaluator(path_truth)]
+        scores = []
+        for eb, workers in zip(evaluators, [1, 2]):
+            eb.load_proposal(path_pred, conf_field_list=['Confidence'],
+                             proposalCSV=True)
+            scores.append(eb.eval_iou_spacenet_csv(
+                miniou=0.5, imageIDField='ImageId', min_area=20,
+                workers=workers, output_csv=str(tmp_path / 'scores.csv')))
+        assert scores[0] == scores[1]
+        assert evaluators[0].get_iou_by_building().equals(
+            evaluators[1].get_iou_by_building())
+        streamed = pd.read_csv(tmp_path / 'scores.csv')
+        assert list(streamed['imageID']) == [
+            score['imageID'] for score in scores[1]]
@@ -1,4 +1,4 @@
-from solaris.eval.iou import calculate_iou, process_iou
+from solaris.eval.iou import calculate_iou, process_iou, match_proposals
 from solaris import data
 from shapely.geometry import Polygon
 
@@ -42,3 +42,23 @@ class TestEvalFuncs(object):
         assert 21 in gt_gdf.index
         process_iou(pred_poly, gt_gdf)
         assert 21 not in gt_gdf.index
+
+    def test_match_proposals(self):
+        gt_gdf = data.gt_gdf()
+        pred_gdf = data.pred_gdf()
+        best_iou, best_truth, consumed = match_proposals(
+            pred_gdf.geometry.values, gt_gdf.geometry.values, miniou=0.5)
+        # same greedy matching as dropping matches from the gdf
+        remaining = gt_gdf.copy()
+        for i, pred_poly in enumerate(pred_gdf.geometry):
+            iou_gdf = calculate_iou(pred_poly, remaining)
+            if iou_gdf.empty:
+                assert best_iou[i] == 0 and best_truth[i] == -1
+                continue
+            max_label = iou_gdf['iou_score'].idxmax()
+            assert gt_gdf.index[best_truth[i]] == max_label
+            assert best_iou[i] == iou_gdf.loc[max_label, 'iou_score']
+            if best_iou[i] > 0.5:
+                remaining = remaining.drop(max_label)
+        assert consumed.sum() == 8
+        assert gt_gdf.index[~consumed].equals(remaining.index)
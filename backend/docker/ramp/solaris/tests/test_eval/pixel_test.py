@@ -1,6 +1,7 @@
 """Tests for ``solaris.eval.pixel_metrics`` functions."""
 
 import numpy as np
+import pytest
 from solaris.eval.pixel import iou, f1, relaxed_f1
 
 
@@ -106,3 +107,35 @@ class TestRelaxedF1(object):
         assert (rel_f1 - 0.8571428571428571) < eps
         assert rel_prec - 0.75 < eps
         assert rel_rec - 1.0 < eps
+
+    def test_relaxed_f1_batch(self):
+        truth_mask = np.zeros((10, 10))
+        truth_mask[5, :] = 1
+        prop_mask = np.zeros((10, 10))
+        prop_mask[5, :] = 1
+        prop_mask[:, 2] = 0
+        prop_mask[:, 3] = 1
+        prop_mask[6:8, :] = 0
+        truth_batch = np.stack([truth_mask, truth_mask.T, np.zeros((10, 10))])
+        prop_batch = np.stack([prop_mask, prop_mask.T, prop_mask])
+
+        rel_f1, rel_prec, rel_rec = relaxed_f1(truth_batch, prop_batch,
+                                               radius=3)
+        assert rel_f1.shape == (3,)
+        for i in range(3):
+            assert (rel_f1[i], rel_prec[i], rel_rec[i]) == relaxed_f1(
+                truth_batch[i], prop_batch[i], radius=3)
+        assert rel_f1[1] == rel_f1[0]
+        assert (rel_f1[2], rel_prec[2], rel_rec[2]) == (0, 0, 0)
+
+    def test_relaxed_f1_radius(self):
+        truth_mask = np.zeros((4, 4))
+        truth_mask[0, 0] = 1
+        prop_mask = np.zeros((4, 4))
+        prop_mask[1, 1] = 1
+        # the neighborhood spans row - radius to row + radius - 1, so with
+        # radius 1 the proposal pixel sees the truth pixel but not vice versa
+        assert relaxed_f1(truth_mask, prop_mask, radius=1) == (0, 1., 0)
+        assert relaxed_f1(truth_mask, prop_mask, radius=2) == (1., 1., 1.)
+        with pytest.raises(ValueError):
+            relaxed_f1(truth_mask, prop_mask, radius=0)
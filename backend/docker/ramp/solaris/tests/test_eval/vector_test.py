@@ -1,4 +1,5 @@
 import os
+import pandas as pd
 from solaris.data import data_dir
 from solaris.eval import vector
 
@@ -11,3 +12,24 @@ class TestVectorMetrics(object):
         gt_polygons_dir = os.path.join(data_dir, "eval_vector/gt/")
         mAP, APs_by_class, mF1_score, f1s_by_class, precision_iou_by_obj, precision_by_class, mPrecision, recall_iou_by_obj, recall_by_class, mRecall, object_subset, confidences = vector.mAP_score(proposal_polygons_dir, gt_polygons_dir, prediction_cat_attrib="class", gt_cat_attrib='make')
         assert mAP.round(2) == 0.85
+
+    def test_vector_metrics_parallel(self, tmp_path):
+        proposal_polygons_dir = os.path.join(data_dir, "eval_vector/preds/")
+        gt_polygons_dir = os.path.join(data_dir, "eval_vector/gt/")
+        serial = vector.mAP_score(proposal_polygons_dir, gt_polygons_dir,
+                                  prediction_cat_attrib="class",
+                                  gt_cat_attrib='make')
+        output_csv = str(tmp_path / 'scores.csv')
+        parallel = vector.mAP_score(proposal_polygons_dir, gt_polygons_dir,
+                                    prediction_cat_attrib="class",
+                                    gt_cat_attrib='make', workers=2,
+                                    output_csv=output_csv)
+        assert parallel[0] == serial[0]  # mAP
+        assert parallel[1] == serial[1]  # APs_by_class
+        assert parallel[2] == serial[2]  # mF1
+        assert parallel[10] == sorted(parallel[10])  # object_subset
+        counts = pd.read_csv(output_csv)
+        assert list(counts.columns) == ['image', 'class', 'TruePos',
+                                        'FalsePos', 'FalseNeg']
+        assert counts['TruePos'].sum() == sum(
+            sum(iou >= 0.5 for iou in ious) for ious in parallel[4])
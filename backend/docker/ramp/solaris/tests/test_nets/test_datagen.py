@@ -1,9 +1,11 @@
 import os
 from solaris.nets.datagen import make_data_generator, InferenceTiler
 from solaris.data import data_dir
+from solaris.utils.data import make_chip_shard
 from solaris.utils.io import _check_channel_order
 import pandas as pd
 import numpy as np
+import rasterio
 import skimage.io
 
 
@@ -48,6 +50,86 @@ class TestDataGenerator(object):
         assert np.array_equal(mask,
                               expected_mask[np.newaxis, :, :, np.newaxis])
 
+    def test_keras_sequence_workers_and_cache(self, tmp_path):
+        """Test that pooled, prefetched and cached loading gives the same
+        batches as loading one sample at a time."""
+        dataset_csv = os.path.join(data_dir, 'datagen_sample', 'sample_df.csv')
+        df = pd.read_csv(dataset_csv)
+        df = df.applymap(lambda x: os.path.join(data_dir, 'datagen_sample', x))
+        config = {'data_specs':
+                  {'height': 30,
+                   'width': 30,
+                   'channels': 1,
+                   'dtype': 'float32',
+                   'label_type': 'mask',
+                   'mask_channels': 1,
+                   'is_categorical': False
+                   },
+                  'batch_size': 1,
+                  'training_augmentation':
+                  {'shuffle': False,
+                   'augmentations': {}
+                   }
+                  }
+        expected = make_data_generator('keras', config, df, stage='train')
+        config['data_specs'].update({'data_workers': 2, 'data_prefetch': 2,
+                                     'data_cache_dir': str(tmp_path)})
+        keras_seq = make_data_generator('keras', config, df, stage='train')
+
+        for epoch in range(2):  # the second epoch reads from the cache
+            for index in range(len(keras_seq)):
+                im, mask = keras_seq[index]
+                expected_im, expected_mask = expected[index]
+                assert im.dtype == mask.dtype == np.float32
+                assert np.array_equal(im, expected_im)
+                assert np.array_equal(mask, expected_mask)
+            keras_seq.on_epoch_end()
+        assert len(list(tmp_path.glob('*.npy'))) == 2 * len(df)
+
+    def test_keras_sequence_shard(self, tmp_path):
+        """Test that reading from a chip shard gives the same batches as
+        reading the files."""
+        dataset_csv = os.path.join(data_dir, 'datagen_sample', 'sample_df.csv')
+        df = pd.read_csv(dataset_csv)
+        df = df.applymap(lambda x: os.path.join(data_dir, 'datagen_sample', x))
+        # shards hold uint8 chips, so rescale the uint16 samples
+        for i, im_path in enumerate(df['image']):
+            with rasterio.open(im_path) as src:
+                profile = src.profile
+                im_arr = src.read()
+            profile.update(dtype='uint8')
+            df.loc[i, 'image'] = str(tmp_path / os.path.basename(im_path))
+            with rasterio.open(df.loc[i, 'image'], 'w', **profile) as dst:
+                dst.write((im_arr // 32).astype('uint8'))
+        config = {'data_specs':
+                  {'height': 30,
+                   'width': 30,
+                   'channels': 1,
+                   'dtype': 'uint8',
+                   'label_type': 'mask',
+                   'mask_channels': 1,
+                   'is_categorical': False
+                   },
+                  'batch_size': 1,
+                  'training_augmentation':
+                  {'shuffle': False,
+                   'augmentations': {}
+                   }
+                  }
+        expected = make_data_generator('keras', config, df, stage='train')
+        shard_dir = str(tmp_path / 'shard')
+        make_chip_shard(list(df['image']), list(df['label']), shard_dir)
+        keras_seq = make_data_generator('keras', config, shard_dir,
+                                        stage='train')
+
+        assert len(keras_seq) == len(expected)
+        for index in range(len(keras_seq)):
+            im, mask = keras_seq[index]
+            expected_im, expected_mask = expected[index]
+            assert im.dtype == mask.dtype == np.uint8
+            assert np.array_equal(im, expected_im)
+            assert np.array_equal(mask, expected_mask)
+
     def test_torch_dataset(self):
         """Test creating a torch dataset object for data generation."""
 
@@ -121,3 +203,34 @@ class TestInferenceTiler(object):
 
         assert np.array_equal(expected_tiles, tiles)
         assert expected_tile_inds == tile_inds
+
+    def test_iter_batches(self):
+        """Test that batches from a path or an array match the full array."""
+        im_path = os.path.join(data_dir, 'sample_geotiff.tif')
+        for framework in ['keras', 'torch']:
+            inf_tiler = InferenceTiler(framework, 200, 170, x_step=90,
+                                       y_step=120)
+            tiles, tile_inds, _ = inf_tiler(im_path)
+            for im in [im_path, skimage.io.imread(im_path)]:
+                for prefetch in [0, 2]:
+                    batches = list(inf_tiler.iter_batches(
+                        im, 3, prefetch=prefetch))
+
+                    assert [len(b) for b, _ in batches[:-1]] == \
+                        [3] * (len(batches) - 1)
+                    assert all(b.dtype == np.float32 for b, _ in batches)
+                    assert np.array_equal(
+                        np.concatenate([b for b, _ in batches]), tiles)
+                    assert [i for _, inds in batches for i in inds] == \
+                        tile_inds
+
+    def test_iter_batches_close(self):
+        """Test that closing the batch generator early stops prefetching."""
+        inf_tiler = InferenceTiler('keras', 100, 100)
+        batches = inf_tiler.iter_batches(
+            os.path.join(data_dir, 'sample_geotiff.tif'), 1, prefetch=2)
+        batch, tile_inds = next(batches)
+        batches.close()
+
+        assert batch.shape == (1, 100, 100, 1)
+        assert tile_inds == [(0, 0)]
@@ -2,7 +2,7 @@ import os
 import numpy as np
 import solaris as sol
 from solaris.data import data_dir, sample_load_rasterio, sample_load_gdal
-from solaris.raster.image import get_geo_transform, stitch_images
+from solaris.raster.image import get_geo_transform, stitch_images, Stitcher
 from affine import Affine
 import skimage.io
 
@@ -76,3 +76,64 @@ class TestStitchImages(object):
                                                'stitching_conf_output.npy'))
 
         assert np.array_equal(result, expected_result)
+
+    def overlapping_tiles(self, im, size=250, step=150):
+        """Cut overlapping [Y, X, C] tiles from `im` with their idx_refs."""
+        idx_refs = [(y, x) for y in range(0, im.shape[0] - size + 1, step)
+                    for x in range(0, im.shape[1] - size + 1, step)]
+        tiles = np.stack([im[y:y + size, x:x + size] for y, x in idx_refs])
+        return tiles, idx_refs
+
+    def test_stitch_generator(self):
+        im = np.random.default_rng(0).random((550, 700, 2))
+        tiles, idx_refs = self.overlapping_tiles(im)
+        for method in ['average', 'first', 'confidence']:
+            result = stitch_images(
+                ((tile, idx_ref) for tile, idx_ref in zip(tiles, idx_refs)),
+                out_width=700, out_height=550, method=method)
+            assert np.allclose(result, im)
+            # channels-first tiles are reordered like a stack of them
+            result = stitch_images(
+                ((np.moveaxis(tile, -1, 0), idx_ref)
+                 for tile, idx_ref in zip(tiles, idx_refs)),
+                out_width=700, out_height=550, method=method)
+            assert np.allclose(result, im)
+
+    def test_stitch_methods(self):
+        """Test the methods against reducing a NaN-filled stack of tiles."""
+        rng = np.random.default_rng(0)
+        tiles, idx_refs = self.overlapping_tiles(np.zeros((550, 700, 2)))
+        # few distinct values, so confidence ties are common
+        tiles = rng.integers(0, 5, tiles.shape) / 4.
+        tiles[rng.random(tiles.shape) < 0.05] = np.nan
+        stack = np.full((len(tiles), 550, 700, 2), np.nan)
+        for tile_stack, tile, (y, x) in zip(stack, tiles, idx_refs):
+            tile_stack[y:y + 250, x:x + 250] = tile
+
+        result = stitch_images(tiles, idx_refs=idx_refs, out_width=700,
+                               out_height=550, method='average')
+        assert np.allclose(result, np.nanmean(stack, axis=0), equal_nan=True)
+        result = stitch_images(tiles, idx_refs=idx_refs, out_width=700,
+                               out_height=550, method='first')
+        first = np.invert(np.isnan(stack)).argmax(axis=0)
+        assert np.array_equal(
+            result, np.take_along_axis(stack, first[np.newaxis], axis=0)[0],
+            equal_nan=True)
+        result = stitch_images(tiles, idx_refs=idx_refs, out_width=700,
+                               out_height=550, method='confidence')
+        confidence = np.nan_to_num(np.abs(stack - 0.5), nan=-1)
+        most_confident = confidence.argmax(axis=0)
+        assert np.array_equal(
+            result,
+            np.take_along_axis(stack, most_confident[np.newaxis], axis=0)[0],
+            equal_nan=True)
+
+    def test_stitcher(self):
+        stitcher = Stitcher(4, 5)
+        stitcher.add(np.ones((2, 3), dtype='float32'), (1, 1))
+        stitcher.add(np.full((2, 3), 3, dtype='float32'), (2, 2))
+        result = stitcher.result()
+        assert stitcher.n_tiles == 2
+        assert result.dtype == np.float32
+        assert result[1, 1] == 1 and result[2, 2] == 2 and result[3, 4] == 3
+        assert np.isnan(result[0]).all()
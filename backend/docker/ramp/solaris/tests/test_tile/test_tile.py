@@ -1,14 +1,32 @@
 import os
 import skimage.io
 import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window, from_bounds
 from solaris.tile.raster_tile import RasterTiler
-from solaris.tile.vector_tile import VectorTiler
+from solaris.tile.vector_tile import VectorTiler, clip_gdf
 from solaris.data import data_dir
 from solaris.vector.mask import geojsons_to_masks_and_fill_nodata
+from solaris.utils.geo import reproject, split_geom
 import geopandas as gpd
+from shapely.geometry import Polygon, box
 from shapely.ops import cascaded_union
 
 
+def write_raster(path, width=300, height=260, nodata_rows=0, block_size=64):
+    """Write a tiled 3-band uint8 GeoTIFF with nodata 0 in its top rows."""
+    data = np.random.default_rng(0).integers(1, 256, (3, height, width),
+                                             dtype=np.uint8)
+    data[:, :nodata_rows] = 0
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height,
+                       count=3, dtype='uint8', crs='EPSG:32633', nodata=0,
+                       transform=from_origin(500000, 4000000, 0.5, 0.5),
+                       tiled=True, blockxsize=block_size,
+                       blockysize=block_size) as dest:
+        dest.write(data)
+
+
 class TestTilers(object):
     def test_tiler(self):
         raster_tiler = RasterTiler(os.path.join(data_dir,
@@ -163,3 +181,170 @@ class TestTilers(object):
             os.remove(os.path.join(data_dir, 'rastertile_test_fill_nodata_result', f))
         os.rmdir(os.path.join(data_dir, 'rastertile_test_fill_nodata_result'))
 
+
+    def test_tiler_vrt(self):
+        src = os.path.join(data_dir, 'sample_geotiff.tif')
+        result_dir = os.path.join(data_dir, 'rastertile_test_vrt_result')
+        raster_tiler = RasterTiler(result_dir, dest_crs=4326,
+                                   src_tile_size=(90, 90),
+                                   resampling='bilinear', use_vrt=True)
+        crs = raster_tiler.tile(src=src)
+        assert crs.to_epsg() == 4326
+        # same grid as reprojecting the whole image before tiling it
+        full_path = os.path.join(data_dir, 'rastertile_test_vrt_full.tif')
+        reproject(src, target_crs=4326, dest_path=full_path,
+                  resampling_method='bilinear').close()
+        full_tiler = RasterTiler(result_dir, src_tile_size=(90, 90))
+        full_tiler.tile(src=full_path)
+        assert len(raster_tiler.tile_paths) == len(full_tiler.tile_paths)
+        for path, full_path_tile in zip(raster_tiler.tile_paths,
+                                        full_tiler.tile_paths):
+            with rasterio.open(path) as tile, \
+                    rasterio.open(full_path_tile) as expected:
+                assert tile.crs.to_epsg() == 4326
+                assert tile.transform == expected.transform
+                result = tile.read().astype(int)
+                expected = expected.read().astype(int)
+            # blocks of the VRT are warped separately, which moves pixels by
+            # up to the 1/8 pixel error allowed to GDAL's approximate transform
+            valid = (result != 0) & (expected != 0)
+            if valid.any():
+                assert np.abs(result - expected)[valid].mean() \
+                    < 0.01 * expected[valid].mean()
+        os.remove(full_path)
+        for f in os.listdir(result_dir):
+            os.remove(os.path.join(result_dir, f))
+        os.rmdir(result_dir)
+
+    def test_vector_tiler_split_multi_geoms(self):
+        # a U shape is cut into its two arms by the upper tile
+        labels = gpd.GeoDataFrame(
+            {'building_id': [7, 8]},
+            geometry=[Polygon([(0, 0), (30, 0), (30, 30), (20, 30), (20, 10),
+                               (10, 10), (10, 30), (0, 30)]),
+                      box(40, 40, 45, 45)],
+            crs='EPSG:32633')
+        result_dir = os.path.join(data_dir, 'vectortile_test_split_result')
+        vector_tiler = VectorTiler(result_dir)
+        tiles = list(vector_tiler.tile_generator(
+            labels, [[0, 0, 50, 20], [0, 20, 50, 50], [100, 100, 150, 150]],
+            obj_id_col='building_id'))
+        os.rmdir(result_dir)
+
+        lower, upper, empty = [tile_gdf for tile_gdf, _ in tiles]
+        assert len(lower) == 1
+        assert lower['truncated'].tolist() == [1]
+        assert lower.geometry.iloc[0].area == 500
+        assert len(upper) == 3
+        assert upper.geom_type.tolist() == ['Polygon'] * 3
+        assert upper['building_id'].tolist() == [1, 2, 3]
+        assert np.allclose(upper['partialDec'], [200 / 700, 200 / 700, 1.])
+        assert upper['truncated'].tolist() == [1, 1, 0]
+        assert len(empty) == 0
+
+    def test_tiler_chunked_reads(self, tmp_path, monkeypatch):
+        """Tiles read in chunks match one boundless read per tile."""
+        src_path = str(tmp_path / 'src.tif')
+        write_raster(src_path)
+        # several chunks per column of tiles
+        monkeypatch.setattr(RasterTiler, 'CHUNK_ROWS', 64)
+        # an aoi past every edge of the 150 x 130 m raster
+        raster_tiler = RasterTiler(str(tmp_path / 'tiles'),
+                                   src_tile_size=(100, 100),
+                                   aoi_boundary=[499990, 3999860, 500160,
+                                                 4000010])
+        raster_tiler.tile(src=src_path)
+        assert len(raster_tiler.tile_paths) == len(raster_tiler.tile_bounds)
+        past_edge = 0
+        with rasterio.open(src_path) as src:
+            for path, tb in zip(raster_tiler.tile_paths,
+                                raster_tiler.tile_bounds):
+                window = from_bounds(*tb, transform=src.transform,
+                                     width=100, height=100)
+                expected = src.read(window=window, boundless=True,
+                                    fill_value=0)
+                with rasterio.open(path) as tile:
+                    result = tile.read()
+                    assert tile.transform == src.window_transform(window)
+                assert result.dtype == expected.dtype
+                assert result.tobytes() == expected.tobytes()
+                past_edge += (window.col_off < 0 or window.row_off < 0
+                              or round(window.col_off + window.width)
+                              > src.width
+                              or round(window.row_off + window.height)
+                              > src.height)
+        assert past_edge > 0
+
+        # windows before, past and entirely outside of the edges
+        windows = [Window(-30, -20, 100, 100), Window(-30, 80, 100, 100),
+                   Window(250, 200, 100, 100), Window(-500, 0, 100, 100),
+                   Window(0, 0, 300, 260)]
+        with rasterio.open(src_path) as src:
+            raster_tiler.src = src
+            raster_tiler.nodata = 0
+            results = list(raster_tiler._read_windows(windows, [1, 2, 3]))
+            assert len(results) == len(windows)
+            for result, window in zip(results, windows):
+                expected = src.read(window=window, boundless=True,
+                                    fill_value=0)
+                assert result.tobytes() == expected.tobytes()
+
+    def test_tiler_workers(self, tmp_path):
+        """Writing from threads keeps tile_paths and tile_bounds in order."""
+        src_path = str(tmp_path / 'src.tif')
+        write_raster(src_path)
+        tilers = {}
+        for workers in [1, 3]:
+            tilers[workers] = RasterTiler(
+                str(tmp_path / 'tiles_{}'.format(workers)),
+                src_tile_size=(50, 50))
+            tilers[workers].tile(src=src_path, workers=workers)
+        assert np.array_equal(tilers[3].tile_bounds, tilers[1].tile_bounds)
+        assert [os.path.basename(path) for path in tilers[3].tile_paths] == \
+            [os.path.basename(path) for path in tilers[1].tile_paths]
+        for path, expected_path, tb in zip(tilers[3].tile_paths,
+                                           tilers[1].tile_paths,
+                                           tilers[3].tile_bounds):
+            with rasterio.open(path) as tile, \
+                    rasterio.open(expected_path) as expected:
+                assert (tile.transform.c, tile.transform.f) == (tb[0], tb[3])
+                assert np.array_equal(tile.read(), expected.read())
+
+    def test_tiler_skip_nodata(self, tmp_path):
+        """Tiles that are entirely nodata are dropped."""
+        src_path = str(tmp_path / 'src.tif')
+        # the first row of tiles is all nodata, the second half nodata
+        write_raster(src_path, width=256, height=256, nodata_rows=96)
+        yielded = {}
+        for skip_nodata in [False, True]:
+            raster_tiler = RasterTiler(str(tmp_path / 'tiles'),
+                                       src_tile_size=(64, 64))
+            yielded[skip_nodata] = [
+                tb for _, _, _, tb in raster_tiler.tile_generator(
+                    src_path, skip_nodata=skip_nodata)]
+            raster_tiler.src.close()
+        assert len(yielded[False]) == 16
+        assert len(yielded[True]) == 12
+        assert all(tb[3] <= 4000000 - 32 for tb in yielded[True])
+
+        raster_tiler = RasterTiler(str(tmp_path / 'tiles_threshold'),
+                                   src_tile_size=(64, 64))
+        raster_tiler.tile(src=src_path, nodata_threshold=1.0)
+        assert len(raster_tiler.tile_paths) == 12
+        assert np.array_equal(raster_tiler.tile_bounds, yielded[True])
+        for path in raster_tiler.tile_paths:
+            with rasterio.open(path) as tile:
+                assert (tile.read() != 0).any()
+
+    def test_clip_gdf_split_geom_row(self):
+        """clip_gdf takes a row of the split_geom output as tile bounds."""
+        gdf = gpd.GeoDataFrame(geometry=[box(50, 20, 150, 80),
+                                         box(210, 10, 240, 40)])
+        tile_bounds = split_geom([0, 0, 250, 100], (100, 100),
+                                 use_projection_units=True)
+        clipped = clip_gdf(gdf, tile_bounds[0])
+        expected = clip_gdf(gdf, list(tile_bounds[0]))
+        assert len(clipped) == 1
+        assert clipped.geometry.iloc[0].equals(box(50, 20, 100, 80))
+        assert clipped.geometry.geom_equals(expected.geometry).all()
+        assert len(clip_gdf(gdf, tile_bounds[2])) == 1
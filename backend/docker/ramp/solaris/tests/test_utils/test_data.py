@@ -1,7 +1,11 @@
 import os
+import numpy as np
 import pandas as pd
+import pytest
+import rasterio
+from rasterio.transform import from_origin
 from solaris.data import data_dir
-from solaris.utils.data import make_dataset_csv
+from solaris.utils.data import make_dataset_csv, make_chip_shard, ChipShard
 
 
 class TestMakeDatasetCSV(object):
@@ -64,3 +68,72 @@ class TestMakeDatasetCSV(object):
         assert len(output_df) == 100
         assert len(output_df.columns) == 1
         os.remove(os.path.join(data_dir, 'tmp.csv'))
+
+
+def write_chips(tmp_path, n_chips, size=32, count=3):
+    """Write georeferenced image chips and masks, returning their paths and
+    arrays."""
+    rng = np.random.default_rng(0)
+    image_paths, mask_paths, images, masks = [], [], [], []
+    for i in range(n_chips):
+        transform = from_origin(1000 * i, 5000, 0.5, 0.5)
+        images.append(rng.integers(0, 256, (count, size, size),
+                                   dtype='uint8'))
+        masks.append((rng.random((1, size, size)) > 0.5).astype('uint8'))
+        for paths, arr in [(image_paths, images[-1]),
+                           (mask_paths, masks[-1])]:
+            paths.append(str(tmp_path / '{}_{}.tif'.format(
+                'chip' if paths is image_paths else 'mask', i)))
+            with rasterio.open(paths[-1], 'w', driver='GTiff', width=size,
+                               height=size, count=len(arr), dtype='uint8',
+                               crs='EPSG:3857', transform=transform) as dst:
+                dst.write(arr)
+    return image_paths, mask_paths, images, masks
+
+
+class TestChipShard(object):
+    """Test sol.utils.data.make_chip_shard() and ChipShard."""
+
+    def test_round_trip(self, tmp_path):
+        image_paths, mask_paths, images, masks = write_chips(tmp_path, 5)
+        shard_dir = str(tmp_path / 'shard')
+        make_chip_shard(image_paths, mask_paths, shard_dir)
+        shard = ChipShard(shard_dir)
+
+        assert ChipShard.is_shard(shard_dir)
+        assert not ChipShard.is_shard(str(tmp_path))
+        assert len(shard) == 5
+        assert shard.images.shape == (5, 32, 32, 3)
+        assert shard.masks.shape == (5, 32, 32, 1)
+        assert shard.names == ['chip_{}'.format(i) for i in range(5)]
+        assert shard.crs == ['EPSG:3857'] * 5
+        assert shard.transforms[3] == from_origin(3000, 5000, 0.5, 0.5)
+        for i in range(5):
+            image, mask = shard[i]
+            assert np.array_equal(image, np.moveaxis(images[i], 0, -1))
+            assert np.array_equal(mask, np.moveaxis(masks[i], 0, -1))
+        # chips are views of the memory-mapped arrays, which are read-only
+        assert not shard[0][0].flags.writeable
+        assert list(shard.df['name']) == shard.names
+
+    def test_channels_and_replace(self, tmp_path):
+        image_paths, mask_paths, images, _ = write_chips(tmp_path, 3, count=4)
+        shard_dir = str(tmp_path / 'shard')
+        make_chip_shard(image_paths, mask_paths, shard_dir, channels=4)
+        shard = make_chip_shard(image_paths[:2], mask_paths[:2], shard_dir,
+                                names=['a', 'b'], channels=3)
+
+        assert shard.names == ['a', 'b']
+        assert shard.images.shape == (2, 32, 32, 3)
+        assert np.array_equal(shard.images[1],
+                              np.moveaxis(images[1][:3], 0, -1))
+        assert not os.path.exists(shard_dir + '.part')
+
+    def test_mismatched_chip(self, tmp_path):
+        image_paths, mask_paths, _, _ = write_chips(tmp_path, 2)
+        (tmp_path / 'small').mkdir()
+        other_paths, _, _, _ = write_chips(tmp_path / 'small', 1, size=16)
+        with pytest.raises(ValueError):
+            make_chip_shard(image_paths + other_paths,
+                            mask_paths + mask_paths[:1],
+                            str(tmp_path / 'shard'))
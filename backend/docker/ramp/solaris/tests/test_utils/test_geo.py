@@ -1,9 +1,11 @@
 import os
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import shapely
 from affine import Affine
 from shapely.wkt import loads
+from shapely.geometry import box
 from shapely.ops import cascaded_union
 from solaris.data import data_dir
 from solaris.utils.core import _check_gdf_load
@@ -162,6 +164,27 @@ class TestSplitGeometry(object):
                                          target_crs=32611)
         split_geom_list = split_geom(reproj_poly, (1024,1024), resolution=30)
         assert len(split_geom_list) == 47
+        assert split_geom_list.shape == (47, 4)
+        for tb in split_geom_list:
+            assert reproj_poly.intersects(box(*tb))
+
+    def test_split_polygon_chunks(self):
+        poly = gpd.read_file(os.path.join(
+            data_dir, 'test_polygon_split.geojson')).iloc[0]['geometry']
+        reproj_poly = reproject_geometry(poly, input_crs=4326,
+                                         target_crs=32611)
+        tile_bounds = split_geom(reproj_poly, (256, 256), resolution=30)
+        chunks = list(split_geom(reproj_poly, (256, 256), resolution=30,
+                                 chunk_size=100))
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert np.array_equal(np.concatenate(chunks), tile_bounds)
+
+    def test_split_bounds(self):
+        tile_bounds = split_geom([0, 0, 250, 100], (100, 100),
+                                 use_projection_units=True)
+        assert np.array_equal(tile_bounds, [[0, 0, 100, 100],
+                                            [100, 0, 200, 100],
+                                            [200, 0, 300, 100]])
 
     def test_split_multigeom_gdf(self):
 
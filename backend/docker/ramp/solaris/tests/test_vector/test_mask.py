@@ -1,11 +1,17 @@
 import os
 import numpy as np
 import geopandas as gpd
+import pandas as pd
+import rasterio
+import shapely
 import skimage
+from rasterio import features
+from rasterio.transform import from_origin
+from shapely.geometry import box
 from solaris.data import data_dir
 from solaris.vector.mask import footprint_mask, boundary_mask, \
     contact_mask, df_to_px_mask, mask_to_poly_geojson, road_mask, \
-    preds_to_binary, instance_mask
+    preds_to_binary, instance_mask, InstanceMask, tile_masks
 
 
 class TestFootprintMask(object):
@@ -234,6 +240,36 @@ class TestMaskToGDF(object):
                                                'gdf_from_mask_2.geojson'))
         assert truth_gdf[['geometry', 'value']].equals(gdf)
 
+    def test_mask_to_gdf_windowed(self):
+        """Test that polygons crossing window edges are merged."""
+        kwargs = dict(
+            reference_im=os.path.join(data_dir, 'sample_geotiff.tif'),
+            do_transform=True, min_area=100)
+        gdf = mask_to_poly_geojson(
+            os.path.join(data_dir, 'sample_fp_mask_from_geojson.tif'),
+            **kwargs)
+        for window_size, workers in [(64, 1), (333, 2)]:
+            windowed_gdf = mask_to_poly_geojson(
+                os.path.join(data_dir, 'sample_fp_mask_from_geojson.tif'),
+                window_size=window_size, workers=workers, **kwargs)
+            assert windowed_gdf.crs == gdf.crs
+            assert (windowed_gdf['value'] == 255).all()
+            assert len(windowed_gdf) == len(gdf)
+            for geom in windowed_gdf.geometry:
+                assert shapely.equals(geom, gdf.geometry.values).any()
+
+    def test_mask_to_gdf_windowed_corners(self):
+        """Test pixels that touch across a window corner or edge."""
+        mask = np.zeros((8, 8), dtype='uint8')
+        mask[2:4, 2:4] = 1  # corner to corner with the next one
+        mask[4:6, 4:6] = 1
+        mask[1, 0:8] = 1  # crosses a vertical window edge
+        mask[7, 7] = 1
+        gdf = mask_to_poly_geojson(mask, min_area=0)
+        windowed_gdf = mask_to_poly_geojson(mask, min_area=0, window_size=4)
+        assert len(gdf) == len(windowed_gdf) == 3
+        assert sorted(windowed_gdf.area) == sorted(gdf.area) == [1, 4, 12]
+
     def test_flatten_multichannel_mask(self):
         anarr = np.array([[[0, 0, 0, 1],
                            [0, 0, 1, 0],
@@ -299,3 +335,141 @@ class TestInstanceMask(object):
         # clean up
         os.remove(os.path.join(data_dir, 'test_out.tif'))
         assert np.array_equal(output_mask, truth_mask)
+
+    def test_compact_mask(self):
+        """Test the compact instance mask against one rasterize per object."""
+        gdf = gpd.read_file(os.path.join(data_dir, 'geotiff_labels.geojson'))
+        reference_im = os.path.join(data_dir, 'sample_geotiff.tif')
+        instances = instance_mask(gdf, reference_im=reference_im,
+                                  do_transform=True, compact=True)
+        with rasterio.open(reference_im) as src:
+            truth_mask = np.stack([
+                features.rasterize([(geom, 255)], out_shape=src.shape,
+                                   transform=src.transform)
+                for geom in gdf.geometry], axis=-1)
+
+        assert len(instances) == len(gdf)
+        assert np.array_equal(instances.to_dense(), truth_mask)
+        assert np.array_equal(instances.footprint(), truth_mask.any(axis=-1))
+        assert np.array_equal(
+            InstanceMask.from_dense(truth_mask).to_dense(), truth_mask)
+        labels = instances.to_labels()
+        assert np.array_equal(
+            InstanceMask.from_labels(labels).to_labels(), labels)
+
+        instances.write(os.path.join(data_dir, 'test_out.tif'),
+                        dict(driver='GTiff', dtype='uint8',
+                             height=900, width=900))
+        with rasterio.open(os.path.join(data_dir, 'test_out.tif')) as src:
+            saved_output_mask = np.moveaxis(src.read(), 0, -1)
+        os.remove(os.path.join(data_dir, 'test_out.tif'))
+        assert np.array_equal(saved_output_mask, truth_mask)
+
+    def test_mask_nodata(self):
+        """Test that pixels that are nodata in the reference are removed."""
+        reference_im = os.path.join(data_dir, 'test_nodata_ref.tif')
+        data = np.ones((2, 20, 20), dtype='uint8')
+        data[1, :, 10:] = 0
+        with rasterio.open(reference_im, 'w', driver='GTiff', height=20,
+                           width=20, count=2, dtype='uint8', nodata=0,
+                           transform=from_origin(0, 20, 1, 1)) as dst:
+            dst.write(data)
+        df = pd.DataFrame({'geometry': [box(2, 2, 8, 8), box(5, 5, 15, 15)]})
+        output_mask = instance_mask(df, reference_im=reference_im)
+        os.remove(reference_im)
+
+        assert output_mask.shape == (20, 20, 2)
+        assert (output_mask[:, :, 0] > 0).sum() == 36
+        assert (output_mask[:, :, 1] > 0).sum() == 50
+        assert not output_mask[:, 10:, :].any()
+
+    def test_boundary_and_contact_from_instances(self):
+        """Test boundary and contact masks from a compact instance mask."""
+        df = pd.read_csv(os.path.join(data_dir, 'sample.csv'))
+        instances = instance_mask(df, geom_col='PolygonWKT_Pix',
+                                  shape=(900, 900), compact=True)
+        truth_mask = skimage.io.imread(os.path.join(data_dir,
+                                                    'sample_b_mask_inner.tif'))
+        assert np.array_equal(boundary_mask(instances), truth_mask)
+        truth_mask = skimage.io.imread(
+            os.path.join(data_dir, 'sample_b_mask_outer_10.tif'))
+        assert np.array_equal(boundary_mask(instances, boundary_type='outer',
+                                            boundary_width=10), truth_mask)
+
+        output_mask = contact_mask(instances, contact_spacing=10) > 0
+        truth_mask = skimage.io.imread(os.path.join(data_dir,
+                                                    'sample_c_mask.tif')) > 0
+        # drawn around rasterized objects rather than buffered polygons
+        iou = (output_mask & truth_mask).sum() / (output_mask | truth_mask).sum()
+        assert iou > 0.9
+
+
+class TestTileMasks(object):
+    """Tests for solaris.vector.mask.tile_masks."""
+
+    def make_tiles(self, tile_dir):
+        """Split sample_geotiff.tif into four 450x450 tiles."""
+        os.makedirs(tile_dir)
+        tile_paths = []
+        with rasterio.open(os.path.join(data_dir, 'sample_geotiff.tif')) as src:
+            for row_off in (0, 450):
+                for col_off in (0, 450):
+                    window = rasterio.windows.Window(col_off, row_off,
+                                                     450, 450)
+                    meta = src.meta.copy()
+                    meta.update(height=450, width=450,
+                                transform=src.window_transform(window))
+                    tile_paths.append(os.path.join(
+                        tile_dir, 'tile_{}_{}.tif'.format(row_off, col_off)))
+                    with rasterio.open(tile_paths[-1], 'w', **meta) as dst:
+                        dst.write(src.read(window=window))
+        return tile_paths
+
+    def test_tile_masks(self, tmp_path):
+        tile_paths = self.make_tiles(str(tmp_path / 'tiles'))
+        labels = gpd.read_file(os.path.join(data_dir,
+                                            'geotiff_labels.geojson'))
+        dest_dir = str(tmp_path / 'masks')
+        mask_paths = tile_masks(
+            tile_paths, labels, dest_dir,
+            channels=['footprint', 'boundary', 'contact'],
+            boundary_type='outer', workers=2)
+
+        assert mask_paths == [os.path.join(dest_dir, os.path.basename(p))
+                              for p in tile_paths]
+        full_footprint = footprint_mask(
+            labels, reference_im=os.path.join(data_dir, 'sample_geotiff.tif'),
+            do_transform=True)
+        for tile_path, mask_path in zip(tile_paths, mask_paths):
+            with rasterio.open(mask_path) as src:
+                output_mask = src.read()
+            instances = instance_mask(labels.copy(), reference_im=tile_path,
+                                      do_transform=True, compact=True)
+            assert np.array_equal(
+                output_mask[0], footprint_mask(labels, reference_im=tile_path,
+                                               do_transform=True))
+            assert np.array_equal(
+                output_mask[1], boundary_mask(instances,
+                                              boundary_type='outer'))
+            assert np.array_equal(output_mask[2], contact_mask(instances))
+            row_off, col_off = map(
+                int, os.path.splitext(mask_path)[0].split('_')[-2:])
+            assert np.array_equal(
+                output_mask[0],
+                full_footprint[row_off:row_off + 450, col_off:col_off + 450])
+
+    def test_tile_masks_resume(self, tmp_path):
+        tile_paths = self.make_tiles(str(tmp_path / 'tiles'))
+        labels = os.path.join(data_dir, 'geotiff_labels.geojson')
+        dest_dir = str(tmp_path / 'masks')
+        mask_paths = tile_masks(tile_paths[:2], labels, dest_dir)
+        first_mtime = os.path.getmtime(mask_paths[0])
+        os.utime(mask_paths[0], (0, 0))
+
+        mask_paths = tile_masks(tile_paths, labels, dest_dir)
+        assert os.path.getmtime(mask_paths[0]) == 0
+        assert sorted(os.listdir(dest_dir)) == sorted(
+            os.path.basename(p) for p in tile_paths)
+
+        tile_masks(tile_paths, labels, dest_dir, resume=False)
+        assert os.path.getmtime(mask_paths[0]) >= first_mtime
@@ -92,14 +92,14 @@ class TaskApiTest(APILiveServerTestCase):
         res = self.client.post(
             f"{API_BASE}/label/osm/fetch/1/", "", headers=headersList
         )
-        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
 
         # download labels from osm for 2
 
         res = self.client.post(
             f"{API_BASE}/label/osm/fetch/2/", "", headers=headersList
         )
-        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
 
         # build the dataset
 